@@ -8,15 +8,97 @@ Gitea Docker 镜像仓库备份系统
 import sys
 import shutil
 import subprocess
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
 import logging
-from typing import Optional, List
+from typing import Dict, Optional, List, Tuple
 import argparse
 
 # 导入配置加载器
 try:
     from src.config_loader import Config
+    from src.archive import (
+        ArchiveScheduler,
+        archive_month_stamp,
+        checksum_file_path,
+        has_archive_for_month,
+        host_bundle_command,
+        stream_command_to_file,
+        write_checksum_file,
+    )
+    from src.archive_catalog import (
+        BundleHeaderReader,
+        append_record,
+        expired_records,
+        make_record,
+        read_catalog,
+        remove_records,
+        sync_catalog,
+    )
+    from src.archive_codec import ArchiveEncoder, load_key
+    from src.anomaly import (
+        METRIC_LABELS,
+        FleetScorer,
+        load_anomalies,
+        save_anomalies,
+    )
+    from src.commit_counter import (
+        CommitCounter,
+        GitRunner,
+        command_git_runner,
+        host_git_runner,
+    )
+    from src.dedup import Deduplicator
+    from src.integrity import Verifier, build_manifest, load_verify_result
+    from src.inventory import (
+        API_CACHE_FILE_NAME,
+        ApiInventory,
+        MirrorInfo,
+        SqliteInventory,
+        inventory_key,
+    )
+    from src.lfs import (
+        LFS_OIDS_FILE_NAME,
+        LfsStore,
+        read_lfs_oids,
+        scan_pointers,
+        write_lfs_oids,
+    )
+    from src.restore import RestoreEngine, parse_point_in_time, plan_restore
+    from src.restore_drill import RestoreDrill, load_latest_drill, pick_samples
+    from src.snapshot_export import TarLayout, iter_bundle
+    from src.ref_diff import (
+        DELETED,
+        KIND_LABELS,
+        REWOUND,
+        compare_snapshots,
+        destructive_changes,
+        diff_ref_maps,
+        filter_ignored,
+        load_ref_changes,
+        save_ref_changes,
+        summarize,
+    )
+    from src.ref_index import RefIndex
+    from src.replication import Replicator, open_target
+    from src.refs import cached_ref_map, read_ref_map, ref_fingerprint
+    from src.retention import (
+        SNAPSHOT_NAME_FORMAT,
+        RetentionPolicy,
+        format_plan,
+        plan_backup_root,
+        snapshot_time,
+    )
+    from src.small_repos import (
+        PACK_DIR_NAME,
+        PackedSnapshot,
+        open_pack,
+        owner_packs,
+    )
+    from src.tiering import ColdTier, is_snapshot, snapshot_tier
+    from src.tracking import TrackingHistory, TrackingRecord, load_latest_state
+    from src.trash import TrashQueue
 except ImportError:
     print("错误: 无法导入配置加载器")
     print("请确保 src/config_loader.py 存在")
@@ -65,6 +147,10 @@ def setup_logging(config_instance: Config):
 logger = None
 config = None
 notifier = None
+archive_scheduler = None
+trash = None
+# 镜像清单 {小写 owner/repo: MirrorInfo}，为 None 时逐个仓库在容器内检查
+inventory = None
 
 
 # ============ 工具函数 ============
@@ -185,6 +271,73 @@ def is_mirror_repo(repo_path: Path) -> bool:
         return False
 
 
+def load_inventory() -> Optional[Dict[str, MirrorInfo]]:
+    """
+    按 inventory.provider 一次读取所有仓库的镜像标记和同步时间
+
+    Returns:
+        镜像清单；provider 为 exec 或读取失败时为 None（回退到逐个仓库检查）
+    """
+    loader = config.get_loader()
+    provider = str(loader.get('inventory.provider', 'exec') or 'exec').lower()
+    if provider == 'exec':
+        return None
+    if provider == 'sqlite':
+        source = SqliteInventory(
+            Path(config.GITEA_DATA_VOLUME)
+            / loader.get('inventory.sqlite_path', 'gitea/gitea.db')
+        )
+    elif provider == 'api':
+        api_url = loader.get('inventory.api_url', '')
+        if not api_url:
+            logger.warning("未配置 Gitea 地址（inventory.api_url），逐个仓库检查")
+            return None
+        source = ApiInventory(
+            api_url,
+            token=loader.get('inventory.api_token', ''),
+            cache_path=Path(config.BACKUP_ROOT) / API_CACHE_FILE_NAME,
+            page_size=loader.get('inventory.api_page_size', 50),
+            workers=loader.get('inventory.api_workers', 4),
+        )
+    else:
+        logger.warning(f"未知的镜像清单来源: {provider}，逐个仓库检查")
+        return None
+
+    started = time.monotonic()
+    try:
+        result = source.load()
+    except Exception as e:
+        logger.warning(f"读取镜像清单失败（{source.name}）: {e}，逐个仓库检查")
+        return None
+    mirrors = len([info for info in result.values() if info.is_mirror])
+    logger.info(
+        f"镜像清单（{source.name}）: {len(result)} 个仓库，其中镜像 {mirrors} 个，"
+        f"耗时 {time.monotonic() - started:.2f}s"
+    )
+    return result
+
+
+def archive_key() -> Optional[bytes]:
+    """读取归档加密密钥，未配置时返回 None"""
+    key_file = config.get_loader().get('archive.encryption_key_file', '')
+    return load_key(key_file) if key_file else None
+
+
+def build_archive_encoder() -> Optional[ArchiveEncoder]:
+    """按配置创建归档压缩/加密编码器，不压缩也不加密时返回 None"""
+    loader = config.get_loader()
+    compression = str(loader.get('archive.compression', 'none') or 'none').lower()
+    key = archive_key()
+    if compression == 'none' and key is None:
+        return None
+    return ArchiveEncoder(
+        compression=compression,
+        level=loader.get('archive.compression_level', 6),
+        workers=loader.get('archive.workers', 0),
+        key=key,
+    )
+
+
 # ============ 备份功能 ============
 class RepositoryBackup:
     def __init__(self, repo_path: Path):
@@ -195,6 +348,9 @@ class RepositoryBackup:
         self.backup_dir = Path(config.BACKUP_ROOT) / self.owner / self.repo_name
         self.snapshot_dir = self.backup_dir / "snapshots"
         self.archive_dir = self.backup_dir / "archives"
+        self.current_size_kb = 0
+        self.current_commits: Optional[int] = None
+        self.ref_map: Optional[Dict[str, str]] = None
 
     def should_backup(self) -> bool:
         """检查是否应该备份这个仓库"""
@@ -212,12 +368,34 @@ class RepositoryBackup:
                 return False
             logger.info("    ✓ 组织匹配")
 
-        # 检查是否是镜像仓库
+        # 检查是否是镜像仓库（有镜像清单时以清单为准，不在清单中的不是镜像）
         logger.info(f"    检查镜像仓库: CHECK_MIRROR_ONLY={config.CHECK_MIRROR_ONLY}")
-        if not is_mirror_repo(self.repo_path):
+        info = None
+        if inventory is not None:
+            info = inventory.get(inventory_key(self.full_name))
+        if inventory is not None and config.CHECK_MIRROR_ONLY:
+            if info is None or not info.is_mirror:
+                logger.info(f"    ❌ 跳过 {self.full_name}: 不是镜像仓库（镜像清单）")
+                return False
+            logger.info("    ✓ 是镜像仓库（镜像清单）")
+        elif not is_mirror_repo(self.repo_path):
             logger.info(f"    ❌ 跳过 {self.full_name}: 不是镜像仓库")
             return False
 
+        # 镜像自上次备份以来没有同步过（如同步间隔较长或已停止同步）
+        if (
+            info is not None
+            and info.last_sync
+            and config.get_loader().get('inventory.skip_unchanged', False)
+        ):
+            previous = load_latest_state(self.backup_dir)
+            if previous and previous.timestamp and previous.time >= info.last_sync:
+                logger.info(
+                    f"    ❌ 跳过 {self.full_name}: 上次同步 {info.last_sync} "
+                    f"早于上次备份 {previous.time}"
+                )
+                return False
+
         logger.info(f"    ✓ 将备份 {self.full_name}")
         return True
 
@@ -255,8 +433,10 @@ class RepositoryBackup:
                     logger.error(f"  错误: {result.stderr}")
                     return None
 
-            # 获取当前提交数
-            current_commits = get_commit_count(self.repo_path)
+            # 读取引用表并计算提交数（每次运行只计算一次，后续步骤复用）
+            self.ref_map = cached_ref_map(snapshot_path)
+            current_commits = self.count_commits(snapshot_path)
+            self.current_commits = current_commits
 
             # 记录元数据
             meta_file = snapshot_path / ".snapshot_meta"
@@ -267,73 +447,185 @@ class RepositoryBackup:
                 f.write(f"commit_count={current_commits}\n")
 
             logger.info(f"  ✓ 快照成功: {date_stamp} (提交数: {current_commits})")
+
+            # 记录快照引用的 LFS 对象（对象本身在 run_lfs 中复制）
+            if config.get_loader().get('lfs.enabled', False):
+                try:
+                    lfs_oids = self.scan_lfs_oids(snapshot_path)
+                    write_lfs_oids(snapshot_path, lfs_oids)
+                    if lfs_oids:
+                        logger.info(f"  LFS 对象: {len(lfs_oids)} 个")
+                except Exception as e:
+                    logger.warning(f"  扫描 LFS 指针失败: {e}")
+
+            # 生成校验清单（与上一次快照共享 inode 的文件复用哈希）
+            if config.get_loader().get('verify.manifests', True):
+                try:
+                    stats = build_manifest(
+                        snapshot_path, self.get_previous_snapshot(snapshot_path)
+                    )
+                    logger.info(
+                        f"  校验清单: {stats['files']} 个文件，"
+                        f"新哈希 {stats['hashed_bytes'] // 1024 // 1024} MB，"
+                        f"复用 {stats['reused_bytes'] // 1024 // 1024} MB"
+                    )
+                except Exception as e:
+                    logger.warning(f"  生成校验清单失败: {e}")
+
+            # 记录到引用索引
+            if config.get_loader().get('ref_index.enabled', True):
+                try:
+                    RefIndex(config.BACKUP_ROOT).add(
+                        self.full_name, snapshot_path, self.ref_map
+                    )
+                except Exception as e:
+                    logger.warning(f"  更新引用索引失败: {e}")
+
             return snapshot_path
 
         except Exception as e:
             logger.error(f"  ✗ 创建快照失败 {self.full_name}: {e}")
             return None
 
+    def git_runner(self, snapshot_path: Optional[Path] = None) -> GitRunner:
+        """在宿主机上对快照执行 git，没有 git 时在容器内对仓库执行"""
+        if snapshot_path and shutil.which('git'):
+            return host_git_runner(snapshot_path)
+        return command_git_runner(self.git_command())
+
+    def git_command(self, snapshot_path: Optional[Path] = None) -> List[str]:
+        """执行 git 的命令前缀（选择方式与 git_runner 相同）"""
+        if snapshot_path and shutil.which('git'):
+            return ['git', '-c', 'safe.directory=*', '-C', str(snapshot_path)]
+
+        container_path = (
+            f"/data/git/repositories/{self.owner}/{self.repo_path.name}"
+        )
+        return [
+            'docker',
+            'exec',
+            '-i',
+            '-u',
+            config.DOCKER_GIT_USER,
+            config.DOCKER_CONTAINER,
+            'git',
+            '-C',
+            container_path,
+        ]
+
+    def scan_lfs_oids(self, snapshot_path: Path) -> Dict[str, int]:
+        """快照引用的 LFS 对象；引用表与上一个快照相同时复用其记录"""
+        previous = self.get_previous_snapshot(snapshot_path)
+        if (
+            previous
+            and (previous / LFS_OIDS_FILE_NAME).exists()
+            and cached_ref_map(previous) == self.ref_map
+        ):
+            return read_lfs_oids(previous)
+        return scan_pointers(self.git_command(snapshot_path))
+
+    def count_commits(self, snapshot_path: Optional[Path] = None) -> int:
+        """
+        获取提交总数
+
+        基于上次记录的引用 tips 增量计数，优先在宿主机上对快照执行 git，
+        没有 git 时在容器内执行；失败时回退到完整计数
+        """
+        if not config.TRACKING_INCREMENTAL_COMMIT_COUNT:
+            return get_commit_count(self.repo_path)
+
+        if self.ref_map is None:
+            self.ref_map = read_ref_map(snapshot_path or self.repo_path)
+
+        counter = CommitCounter(
+            self.backup_dir,
+            self.git_runner(snapshot_path),
+            config.TRACKING_FULL_RECOUNT_DAYS,
+        )
+        try:
+            count = counter.count(self.ref_map)
+        except Exception as e:
+            logger.warning(f"  增量提交计数失败 {self.full_name}: {e}")
+            count = None
+
+        if count is None:
+            return get_commit_count(self.repo_path)
+        logger.debug(f"  提交计数方式: {counter.last_mode}")
+        return count
+
     def check_commit_changes(
         self, snapshot_path: Optional[Path] = None
     ) -> Optional[int]:
         """检测提交数变化，返回减少百分比。如果检测到异常，保护上一次的快照（正常状态）"""
-        commit_tracking_file = self.backup_dir / ".commit_tracking"
-        size_tracking_file = self.backup_dir / ".size_tracking"
-
-        # 获取当前提交数和大小
-        current_commits = get_commit_count(self.repo_path)
+        # 提交数和引用表在创建快照时已计算，这里直接复用
+        if self.current_commits is None:
+            self.current_commits = self.count_commits(snapshot_path)
+        current_commits = self.current_commits
         current_size = get_directory_size(self.repo_path)
-
-        # 首次备份
-        if not commit_tracking_file.exists():
-            commit_tracking_file.parent.mkdir(parents=True, exist_ok=True)
-            commit_tracking_file.write_text(str(current_commits))
-            size_tracking_file.write_text(str(current_size))
-            logger.info(f"  初始提交数: {current_commits}, 大小: {current_size}KB")
-            return None
-
-        # 读取上次的提交数和大小
-        try:
-            prev_commits = int(commit_tracking_file.read_text().strip())
-            prev_size = (
-                int(size_tracking_file.read_text().strip())
-                if size_tracking_file.exists()
-                else 0
+        self.current_size_kb = current_size
+        ref_map = self.ref_map
+
+        # 读取上一次的状态（兼容旧版 .commit_tracking/.size_tracking），再追加本次记录
+        previous = load_latest_state(self.backup_dir)
+        TrackingHistory(self.backup_dir).append(
+            TrackingRecord(
+                int(datetime.now().timestamp()),
+                current_commits,
+                current_size,
+                len(ref_map),
+                ref_fingerprint(ref_map),
             )
-        except Exception as e:
-            logger.warning(f"读取跟踪文件失败: {e}")
-            commit_tracking_file.write_text(str(current_commits))
-            size_tracking_file.write_text(str(current_size))
-            return None
+        )
 
-        # 检查提交数是否显著减少
         alert_triggered = False
         alert_messages = []
+        decrease = 0
 
-        if current_commits < prev_commits:
-            decrease_percent = ((prev_commits - current_commits) * 100) // prev_commits
+        # 引用级检测：与上一次快照比较，找出被改写或删除的引用
+        previous_snapshot = self.get_previous_snapshot(snapshot_path)
+        ref_alerts = self.check_ref_changes(snapshot_path, previous_snapshot)
+        if ref_alerts:
+            alert_triggered = True
+            alert_messages.extend(ref_alerts)
 
-            if decrease_percent > config.COMMIT_DECREASE_THRESHOLD:
-                alert_triggered = True
-                alert_messages.append(f"提交数异常减少: {decrease_percent}%")
-                alert_messages.append(
-                    f"上次: {prev_commits} commits → 当前: {current_commits} commits"
-                )
-                logger.warning(
-                    f"  ⚠️  提交数减少 {decrease_percent}% (从 {prev_commits} 到 {current_commits})"
-                )
+        # 首次备份
+        if previous is None:
+            logger.info(f"  初始提交数: {current_commits}, 大小: {current_size}KB")
+        else:
+            prev_commits = previous.commits
+            prev_size = previous.size_kb
+
+            # 检查提交数是否显著减少
+            if current_commits < prev_commits:
+                decrease_percent = (
+                    (prev_commits - current_commits) * 100
+                ) // prev_commits
+
+                if decrease_percent > config.COMMIT_DECREASE_THRESHOLD:
+                    alert_triggered = True
+                    decrease = decrease_percent
+                    alert_messages.append(f"提交数异常减少: {decrease_percent}%")
+                    alert_messages.append(
+                        f"上次: {prev_commits} commits → 当前: {current_commits} commits"
+                    )
+                    logger.warning(
+                        f"  ⚠️  提交数减少 {decrease_percent}% (从 {prev_commits} 到 {current_commits})"
+                    )
 
-        # 同时检查大小变化（辅助参考）
-        if current_size < prev_size:
-            size_decrease = ((prev_size - current_size) * 100) // prev_size
-            if size_decrease > config.SIZE_DECREASE_THRESHOLD:
-                if not alert_triggered:
-                    alert_messages.append(f"仓库大小异常减少: {size_decrease}%")
-                else:
-                    alert_messages.append(f"同时仓库大小减少: {size_decrease}%")
-                alert_messages.append(f"上次: {prev_size}KB → 当前: {current_size}KB")
-                logger.warning(f"  ⚠️  大小减少 {size_decrease}%")
-                alert_triggered = True
+            # 同时检查大小变化（辅助参考）
+            if current_size < prev_size:
+                size_decrease = ((prev_size - current_size) * 100) // prev_size
+                if size_decrease > config.SIZE_DECREASE_THRESHOLD:
+                    if not alert_triggered:
+                        alert_messages.append(f"仓库大小异常减少: {size_decrease}%")
+                    else:
+                        alert_messages.append(f"同时仓库大小减少: {size_decrease}%")
+                    alert_messages.append(
+                        f"上次: {prev_size}KB → 当前: {current_size}KB"
+                    )
+                    logger.warning(f"  ⚠️  大小减少 {size_decrease}%")
+                    alert_triggered = True
+                    decrease = decrease or size_decrease
 
         # 如果触发告警，记录到文件
         if alert_triggered:
@@ -351,32 +643,106 @@ class RepositoryBackup:
 
             # 保护上一次的快照（异常发生前的正常状态）
             if config.PROTECT_ABNORMAL_SNAPSHOTS:
-                previous_snapshot = self.get_previous_snapshot(snapshot_path)
                 if previous_snapshot:
                     self.protect_snapshot(previous_snapshot, alert_messages)
                 else:
                     logger.warning("  ⚠️  未找到上一次快照，无法自动保护")
 
-            # 更新跟踪记录
-            commit_tracking_file.write_text(str(current_commits))
-            size_tracking_file.write_text(str(current_size))
-            return decrease_percent if current_commits < prev_commits else size_decrease
+            return decrease
 
-        # 更新跟踪记录
-        commit_tracking_file.write_text(str(current_commits))
-        size_tracking_file.write_text(str(current_size))
         return None
 
+    def check_ref_changes(
+        self, snapshot_path: Optional[Path], previous_snapshot: Optional[Path]
+    ) -> List[str]:
+        """
+        比较上一次快照和当前快照的引用表
+
+        只对发生变化的引用做祖先检查，结果保存到 .ref_changes.json 供报告使用
+
+        Returns:
+            告警信息列表（被改写或删除的引用），没有异常时为空
+        """
+        if not config.ALERTS_DETECT_REF_REWRITES or not previous_snapshot:
+            return []
+
+        try:
+            old_refs = self.snapshot_refs(previous_snapshot)
+            new_refs = self.ref_map
+            if new_refs is None:
+                new_refs = read_ref_map(snapshot_path or self.repo_path)
+            changes = filter_ignored(
+                diff_ref_maps(old_refs, new_refs, self.git_runner(snapshot_path)),
+                config.ALERTS_REF_REWRITE_IGNORE,
+            )
+            save_ref_changes(
+                self.backup_dir,
+                snapshot_path.name if snapshot_path else '',
+                previous_snapshot.name,
+                changes,
+            )
+        except Exception as e:
+            logger.warning(f"  引用变化检测失败 {self.full_name}: {e}")
+            return []
+
+        summary = summarize(changes)
+        if changes:
+            logger.info(
+                "  引用变化: "
+                + ", ".join(
+                    f"{KIND_LABELS[kind]} {count}"
+                    for kind, count in summary.items()
+                    if count
+                )
+            )
+
+        destructive = destructive_changes(changes)
+        if not destructive:
+            return []
+
+        messages = [
+            f"引用被改写 {summary[REWOUND]} 个，被删除 {summary[DELETED]} 个"
+            f"（对比快照 {previous_snapshot.name}）"
+        ]
+        for change in destructive[:10]:
+            messages.append(change.describe())
+            logger.warning(f"  ⚠️  {change.describe()}")
+        if len(destructive) > 10:
+            messages.append(f"... 还有 {len(destructive) - 10} 个引用")
+        return messages
+
+    def snapshot_refs(self, snapshot: Path) -> Dict[str, str]:
+        """快照的引用表"""
+        return cached_ref_map(snapshot)
+
+    def container_bundle_command(self) -> List[str]:
+        """在容器内对在线仓库生成 bundle 的命令（输出到 stdout）"""
+        return [
+            'docker',
+            'exec',
+            '-u',
+            config.DOCKER_GIT_USER,
+            config.DOCKER_CONTAINER,
+            'git',
+            '-C',
+            f"/data/git/repositories/{self.owner}/{self.repo_name}.git",
+            'bundle',
+            'create',
+            '-',
+            '--all',
+        ]
+
     def get_previous_snapshot(self, current_snapshot: Optional[Path]) -> Optional[Path]:
         """获取上一次的快照（当前快照之前的最近快照）"""
         if not self.snapshot_dir.exists():
             return None
 
         try:
-            # 获取所有快照，按时间排序（最新的在前）
+            # 获取所有快照，按快照名中的时间排序（最新的在前）；
+            # 不用 mtime，写入 .protected 会改变旧快照的修改时间
             snapshots = sorted(
                 [s for s in self.snapshot_dir.iterdir() if s.is_dir()],
-                key=lambda x: x.stat().st_mtime,
+                key=snapshot_time,
                 reverse=True,
             )
 
@@ -435,7 +801,8 @@ class RepositoryBackup:
         protected_count = 0
 
         for snapshot in self.snapshot_dir.iterdir():
-            if not snapshot.is_dir():
+            # 跳过冷层转换中断留下的 .<快照名>.hot/.cold（由分层任务处理）
+            if not snapshot.is_dir() or snapshot.name.startswith('.'):
                 continue
 
             # 检查是否被保护
@@ -448,7 +815,11 @@ class RepositoryBackup:
             mtime = datetime.fromtimestamp(snapshot.stat().st_mtime)
             if mtime < cutoff_date:
                 try:
-                    shutil.rmtree(snapshot)
+                    # 移入回收站（O(1) rename），由后台线程删除
+                    if trash:
+                        trash.move(snapshot, f"{self.owner}-{self.repo_name}")
+                    else:
+                        shutil.rmtree(snapshot)
                     deleted_count += 1
                 except Exception as e:
                     logger.warning(f"删除旧快照失败 {snapshot}: {e}")
@@ -458,78 +829,148 @@ class RepositoryBackup:
         if protected_count > 0:
             logger.info(f"  跳过受保护快照: {protected_count} 个")
 
-    def create_monthly_archive(self):
-        """创建月度归档"""
-        month_stamp = datetime.now().strftime('%Y%m')
+    def create_monthly_archive(
+        self, snapshot_path: Optional[Path] = None, month_stamp: Optional[str] = None
+    ) -> Optional[int]:
+        """
+        创建月度归档，返回归档大小（字节），未创建时返回 None
+
+        默认在宿主机上从本次快照生成（低优先级，不占用 Gitea 容器资源）；
+        没有快照或宿主机没有 git 时回退到在容器内对在线仓库生成。
+        month_stamp 为归档月份（补做往月归档时为缺失的月份），默认本月。
+        """
+        month_stamp = month_stamp or datetime.now().strftime('%Y%m')
         archive_file = self.archive_dir / f"archive-{month_stamp}.bundle"
 
-        # 检查本月是否已创建
-        if archive_file.exists():
-            return
+        # 检查该月是否已创建（包括压缩/加密后的归档）
+        if has_archive_for_month(self.archive_dir, month_stamp):
+            return None
 
         self.archive_dir.mkdir(parents=True, exist_ok=True)
         logger.info("  创建月度归档...")
 
         try:
-            # 在容器中创建 bundle
-            container_repo_path = (
-                f"/data/git/repositories/{self.owner}/{self.repo_name}.git"
-            )
-
-            # 创建 bundle
-            run_command(
-                [
-                    'docker',
-                    'exec',
-                    '-u',
-                    config.DOCKER_GIT_USER,
-                    config.DOCKER_CONTAINER,
-                    'git',
-                    '-C',
-                    container_repo_path,
-                    'bundle',
-                    'create',
-                    '/tmp/temp.bundle',
-                    '--all',
-                ]
-            )
-
-            # 复制到宿主机
-            run_command(
-                [
-                    'docker',
-                    'cp',
-                    f"{config.DOCKER_CONTAINER}:/tmp/temp.bundle",
-                    str(archive_file),
-                ]
+            cmd, source, taken = self.archive_source(snapshot_path)
+
+            # bundle 通过标准输出直接流式写入归档文件（压缩/加密在写入前完成），
+            # 不产生中间临时文件
+            checksum = (config.ARCHIVE_CHECKSUM or '').lower()
+            if checksum in ('none', 'false', 'off'):
+                checksum = ''
+            encoder = build_archive_encoder()
+            if encoder:
+                archive_file = archive_file.with_name(
+                    archive_file.name + encoder.suffix
+                )
+            # 引用信息在写入时从 bundle 头部解析，归档目录不需要再打开 bundle
+            header = BundleHeaderReader()
+            started = time.monotonic()
+            size, digest = stream_command_to_file(
+                cmd,
+                archive_file,
+                checksum=checksum or None,
+                encoder=encoder,
+                tap=header.feed,
             )
-
-            # 删除临时文件
-            run_command(
-                [
-                    'docker',
-                    'exec',
-                    '-u',
-                    config.DOCKER_GIT_USER,
-                    config.DOCKER_CONTAINER,
-                    'rm',
-                    '/tmp/temp.bundle',
-                ]
+            seconds = time.monotonic() - started
+            if digest:
+                write_checksum_file(archive_file, digest, checksum)
+                logger.info(f"  归档校验 ({checksum}): {digest}")
+
+            raw_size = encoder.raw_bytes if encoder else size
+            ratio = raw_size / size if size else 1.0
+            mb_per_second = raw_size / 1024 / 1024 / seconds if seconds > 0 else 0.0
+            logger.info(f"  归档大小: {size // 1024}KB")
+            if encoder:
+                logger.info(
+                    f"  原始大小: {raw_size // 1024}KB，压缩比 {ratio:.2f}，"
+                    f"吞吐量 {mb_per_second:.1f}MB/s"
+                )
+            append_record(
+                self.archive_dir,
+                make_record(
+                    archive_file,
+                    header,
+                    read_catalog(self.archive_dir),
+                    month=month_stamp,
+                    time=taken.isoformat(),
+                    created=datetime.now().isoformat(),
+                    source=source,
+                    snapshot=snapshot_path.name if source == 'snapshot' else None,
+                    size=size,
+                    raw_size=raw_size,
+                    ratio=round(ratio, 3),
+                    seconds=round(seconds, 3),
+                    mb_per_second=round(mb_per_second, 2),
+                    compression=encoder.compression if encoder else 'none',
+                    encrypted=bool(encoder and encoder.aead),
+                    checksum=f"{checksum}:{digest}" if digest else None,
+                ),
             )
-
+            logger.info(f"  归档引用: {len(header.refs)} 个")
             logger.info("  ✓ 归档成功")
 
-            # 清理旧归档
-            cutoff_date = datetime.now() - timedelta(
-                days=config.ARCHIVE_RETENTION_MONTHS * 30
+            # 按归档月份清理旧归档（以归档目录为准，不依赖文件修改时间）
+            expired = expired_records(
+                read_catalog(self.archive_dir), config.ARCHIVE_RETENTION_MONTHS
             )
-            for archive in self.archive_dir.glob("*.bundle"):
-                mtime = datetime.fromtimestamp(archive.stat().st_mtime)
-                if mtime < cutoff_date:
-                    archive.unlink()
+            for record in expired:
+                archive = self.archive_dir / record['file']
+                paths = [archive]
+                if record.get('checksum'):
+                    algorithm = record['checksum'].split(':', 1)[0]
+                    paths.append(checksum_file_path(archive, algorithm))
+                for path in paths:
+                    try:
+                        path.unlink()
+                    except FileNotFoundError:
+                        pass
+            remove_records(self.archive_dir, [r['file'] for r in expired])
+
+            return size
 
         except Exception as e:
             logger.error(f"  ✗ 创建归档失败: {e}")
+            return None
+
+    def archive_source(
+        self, snapshot_path: Optional[Path]
+    ) -> Tuple[List[str], str, datetime]:
+        """
+        归档的生成命令、来源和内容时间点
+
+        Returns:
+            (输出 bundle 到 stdout 的命令, 来源 snapshot/container, 时间点)
+        """
+        if (
+            config.ARCHIVE_SOURCE == 'snapshot'
+            and snapshot_path
+            and shutil.which('git')
+        ):
+            logger.info(f"  归档来源: 快照 {snapshot_path.name}")
+            # 归档内容的时间点与快照一致
+            taken = snapshot_time(snapshot_path)
+            return host_bundle_command(snapshot_path), 'snapshot', taken
+        logger.info("  归档来源: 容器内在线仓库")
+        return self.container_bundle_command(), 'container', datetime.now()
+
+    def archive_snapshot(self, month_stamp: str, snapshot_path):
+        """
+        归档使用的快照：补做往月归档时使用该月最后一个目录快照，
+        该月没有目录快照（已清理或已转为冷层）时使用本次快照
+        """
+        if month_stamp == archive_month_stamp(datetime.now()):
+            return snapshot_path
+        if not self.snapshot_dir.exists():
+            return snapshot_path
+        in_month = [
+            s
+            for s in self.snapshot_dir.iterdir()
+            if not s.name.startswith('.')
+            and snapshot_tier(s) == 'hot'
+            and archive_month_stamp(snapshot_time(s)) == month_stamp
+        ]
+        return max(in_month, key=snapshot_time) if in_month else snapshot_path
 
     def process(self):
         """处理单个仓库的完整备份流程"""
@@ -546,12 +987,30 @@ class RepositoryBackup:
         # 2. 检测提交数和大小变化（如果异常会自动标记快照为永久保留）
         self.check_commit_changes(snapshot_path)
 
-        # 3. 清理旧快照（跳过被保护的）
-        self.cleanup_old_snapshots()
+        # 3. 清理旧快照（跳过被保护的）；启用 GFS 时在所有仓库处理完后统一执行
+        if not config.get_loader().get('backup.retention.gfs.enabled', False):
+            self.cleanup_old_snapshots()
 
-        # 4. 每月1号创建归档
-        if datetime.now().day == 1:
-            self.create_monthly_archive()
+        # 4. 按调度创建月度归档（各仓库错开到月内不同日期，受单次运行预算限制）
+        if self.archive_dir.exists():
+            # 为归档目录建立之前创建的归档补录记录（只读取 bundle 头部，只做一次）
+            try:
+                synced = sync_catalog(self.archive_dir, archive_key())
+                if synced['added']:
+                    logger.info(f"  归档目录补录 {synced['added']} 个归档")
+            except (OSError, ValueError) as e:
+                logger.warning(f"  同步归档目录失败: {e}")
+        scheduler = archive_scheduler or ArchiveScheduler('first_day')
+        month_stamp = scheduler.due_month(self.full_name, self.archive_dir)
+        if month_stamp:
+            if scheduler.has_budget(self.current_size_kb * 1024):
+                archive_size = self.create_monthly_archive(
+                    self.archive_snapshot(month_stamp, snapshot_path), month_stamp
+                )
+                if archive_size is not None:
+                    scheduler.consume(archive_size)
+            else:
+                logger.info("  本次运行归档预算已用尽，归档推迟到下次运行")
 
         # 5. 生成恢复脚本
         self.generate_restore_script()
@@ -564,11 +1023,46 @@ class RepositoryBackup:
 
 REPO_NAME="{self.full_name}"
 SNAPSHOT_DIR="{self.snapshot_dir}"
+PACK_DIR="{self.backup_dir.parent / PACK_DIR_NAME}"
 CONTAINER="{config.DOCKER_CONTAINER}"
 GIT_USER="{config.DOCKER_GIT_USER}"
 CONTAINER_REPO_PATH="/data/git/repositories/{self.owner}/{self.repo_name}.git"
 HOST_REPO_PATH="{self.repo_path}"
 
+# 冷层快照（存根目录，数据在 bundle 中）的 bundle 路径；目录树快照输出为空
+cold_bundle() {{
+    local location
+    location=$(grep '^cold_bundle=' "$1/.snapshot_meta" 2>/dev/null | cut -d= -f2-)
+    case "$location" in
+        "") ;;
+        /*) echo "$location" ;;
+        *) echo "$1/$location" ;;
+    esac
+}}
+
+# 把快照复制为裸仓库：目录树直接复制，冷层快照从 bundle 取回
+# 第三个参数为原仓库时沿用其配置和钩子
+copy_snapshot() {{
+    local bundle
+    bundle=$(cold_bundle "$1")
+    if [ -z "$bundle" ]; then
+        cp -a "$1" "$2"
+        return
+    fi
+    if ! command -v git >/dev/null 2>&1; then
+        echo "错误: 恢复冷层快照需要宿主机安装 git"
+        return 1
+    fi
+    git init -q --bare "$2" || return 1
+    git -C "$2" fetch -q "$bundle" '+refs/*:refs/*' || return 1
+    [ -f "$1/HEAD" ] && cp "$1/HEAD" "$2/HEAD"
+    if [ -n "$3" ] && [ -d "$3" ]; then
+        cp "$3/config" "$2/config"
+        rm -rf "$2/hooks" && cp -a "$3/hooks" "$2/hooks"
+    fi
+    return 0
+}}
+
 echo "=========================================="
 echo "Gitea 镜像仓库恢复工具"
 echo "=========================================="
@@ -579,7 +1073,12 @@ echo ""
 echo "可用的快照:"
 mapfile -t snapshots < <(ls -td "$SNAPSHOT_DIR"/* 2>/dev/null)
 if [ ${{#snapshots[@]}} -eq 0 ]; then
-    echo "错误: 没有找到快照"
+    if grep -qF "\"repository\": \"$REPO_NAME\"" "$PACK_DIR/index.jsonl" 2>/dev/null; then
+        echo "  该仓库的快照打包在 $PACK_DIR 中（小仓库模式），请使用:"
+        echo "  gitea_mirror_backup.py --restore $REPO_NAME --at <时间点>"
+    else
+        echo "错误: 没有找到快照"
+    fi
     exit 1
 fi
 
@@ -593,6 +1092,9 @@ for i in "${{!snapshots[@]}}"; do
     if [ -f "${{snapshots[$i]}}/.snapshot_meta" ]; then
         grep timestamp "${{snapshots[$i]}}/.snapshot_meta" | sed 's/^/         /'
     fi
+    if [ -n "$(cold_bundle "${{snapshots[$i]}}")" ]; then
+        echo "         冷层快照（从 bundle 恢复）"
+    fi
 done
 
 echo ""
@@ -647,7 +1149,13 @@ case $restore_mode in
 
         # 恢复快照
         echo "3. 恢复快照..."
-        cp -a "$SELECTED_SNAPSHOT" "$HOST_REPO_PATH"
+        if ! copy_snapshot "$SELECTED_SNAPSHOT" "$HOST_REPO_PATH" "$BACKUP_CURRENT"; then
+            echo "错误: 恢复失败，还原原仓库"
+            rm -rf "$HOST_REPO_PATH"
+            mv "$BACKUP_CURRENT" "$HOST_REPO_PATH"
+            docker start $CONTAINER
+            exit 1
+        fi
 
         # 修复权限
         echo "4. 修复文件权限..."
@@ -697,7 +1205,11 @@ case $restore_mode in
 
         # 复制快照
         echo "1. 复制仓库数据..."
-        cp -a "$SELECTED_SNAPSHOT" "$EXPORT_PATH"
+        if ! copy_snapshot "$SELECTED_SNAPSHOT" "$EXPORT_PATH"; then
+            echo "错误: 导出失败"
+            rm -rf "$EXPORT_PATH"
+            exit 1
+        fi
 
         # 修复文件权限
         echo "2. 修复文件权限..."
@@ -759,20 +1271,17 @@ case $restore_mode in
         echo ""
         echo "正在导出 Git Bundle..."
 
-        # 临时挂载快照到容器
-        TMP_MOUNT="/tmp/restore-${{RANDOM}}"
-        mkdir -p "$TMP_MOUNT"
-        cp -a "$SELECTED_SNAPSHOT" "$TMP_MOUNT/repo.git"
-
-        # 创建 bundle
-        docker exec -u $GIT_USER $CONTAINER sh -c "cd /tmp && git clone --bare $TMP_MOUNT/repo.git temp-repo.git && cd temp-repo.git && git bundle create /tmp/export.bundle --all"
-
-        # 复制 bundle 到宿主机
-        docker cp "$CONTAINER:/tmp/export.bundle" "$bundle_path"
-
-        # 清理
-        docker exec $CONTAINER rm -rf /tmp/temp-repo.git /tmp/export.bundle
-        rm -rf "$TMP_MOUNT"
+        COLD_BUNDLE=$(cold_bundle "$SELECTED_SNAPSHOT")
+        if [ -n "$COLD_BUNDLE" ]; then
+            # 冷层快照本身就是 bundle
+            cp "$COLD_BUNDLE" "$bundle_path"
+        elif ! command -v git >/dev/null 2>&1; then
+            echo "错误: 宿主机未安装 git"
+            exit 1
+        else
+            # 直接从快照生成 bundle（不复制快照）
+            git -c safe.directory='*' -C "$SELECTED_SNAPSHOT" bundle create "$bundle_path" --all
+        fi
 
         echo ""
         echo "✓ 导出完成!"
@@ -794,6 +1303,768 @@ esac
         restore_script.chmod(0o755)
 
 
+class PackedRepositoryBackup(RepositoryBackup):
+    """
+    小仓库备份：快照作为 bundle 追加到 owner 的共享打包文件（src/small_repos.py），
+    不创建快照目录；告警检测、归档和保留策略与普通仓库一致
+    """
+
+    def __init__(self, repo_path: Path):
+        super().__init__(repo_path)
+        self.pack = open_pack(self.backup_dir.parent)
+
+    def create_snapshot(self) -> Optional[PackedSnapshot]:
+        """把仓库当前状态追加到打包文件，返回打包的快照"""
+        try:
+            name = datetime.now().strftime(SNAPSHOT_NAME_FORMAT)
+            self.backup_dir.mkdir(parents=True, exist_ok=True)
+            logger.info(f"  创建快照（小仓库打包）: {self.full_name}")
+
+            self.ref_map = read_ref_map(self.repo_path)
+            self.current_commits = self.count_commits()
+            if shutil.which('git'):
+                cmd = host_bundle_command(self.repo_path)
+            else:
+                cmd = self.container_bundle_command()
+            fields = {}
+            if config.get_loader().get('lfs.enabled', False):
+                try:
+                    # 小仓库扫描很快，不复用上一个快照的记录
+                    fields['lfs_oids'] = scan_pointers(self.git_command())
+                except Exception as e:
+                    logger.warning(f"  扫描 LFS 指针失败: {e}")
+            snapshot = self.pack.add(
+                self.full_name,
+                name,
+                cmd,
+                self.ref_map,
+                source=str(self.repo_path),
+                commit_count=self.current_commits,
+                **fields,
+            )
+            logger.info(
+                f"  ✓ 快照成功: {name} (提交数: {self.current_commits}，"
+                f"{snapshot.size // 1024}KB，位于 {snapshot.pack or '无数据'})"
+            )
+
+            if config.get_loader().get('ref_index.enabled', True):
+                try:
+                    RefIndex(config.BACKUP_ROOT).add_refs(
+                        self.full_name, name, snapshot.time, snapshot.refs
+                    )
+                except Exception as e:
+                    logger.warning(f"  更新引用索引失败: {e}")
+
+            return snapshot
+
+        except Exception as e:
+            logger.error(f"  ✗ 创建快照失败 {self.full_name}: {e}")
+            return None
+
+    def git_runner(self, snapshot_path=None) -> GitRunner:
+        """打包的快照不能直接运行 git，总是在容器内对仓库执行"""
+        return super().git_runner(None)
+
+    def snapshot_refs(self, snapshot: PackedSnapshot) -> Dict[str, str]:
+        return snapshot.refs
+
+    def get_previous_snapshot(
+        self, current_snapshot: Optional[PackedSnapshot]
+    ) -> Optional[PackedSnapshot]:
+        """打包文件中当前快照之前的最近快照"""
+        snapshots = [
+            s
+            for s in self.pack.snapshots(self.full_name)
+            if current_snapshot is None or s.name < current_snapshot.name
+        ]
+        if not snapshots:
+            return None
+        logger.info(f"  找到上一次快照: {snapshots[-1].name}")
+        return snapshots[-1]
+
+    def protect_snapshot(self, snapshot_path: PackedSnapshot, reasons: List[str]):
+        """在打包索引中标记快照为永久保留"""
+        try:
+            self.pack.protect(self.full_name, snapshot_path.name, reasons)
+            logger.info(
+                f"  🔒 快照已标记为永久保留: {snapshot_path.name} （异常前的正常状态）"
+            )
+        except Exception as e:
+            logger.warning(f"标记快照保护失败: {e}")
+
+    def cleanup_old_snapshots(self):
+        """清理旧快照：打包的快照按快照时间删除，以前的快照目录照常清理"""
+        super().cleanup_old_snapshots()
+        cutoff_date = datetime.now() - timedelta(days=config.SNAPSHOT_RETENTION_DAYS)
+        snapshots = self.pack.snapshots(self.full_name)
+        expired = [
+            s.name for s in snapshots[:-1] if not s.protected and s.time < cutoff_date
+        ]
+        deleted_count = self.pack.remove(self.full_name, expired)
+        if deleted_count > 0:
+            logger.info(f"  清理旧打包快照: {deleted_count} 个")
+
+    def archive_source(self, snapshot_path) -> Tuple[List[str], str, datetime]:
+        """
+        没有快照目录：与打包快照一样在宿主机上直接从仓库生成归档；
+        archive.source 为 container 或宿主机没有 git 时在容器内生成
+        """
+        if config.ARCHIVE_SOURCE == 'snapshot' and shutil.which('git'):
+            logger.info("  归档来源: 宿主机上的仓库")
+            return host_bundle_command(self.repo_path), 'host', datetime.now()
+        return super().archive_source(None)
+
+
+# ============ 保留策略 ============
+def apply_retention(dry_run: bool = False) -> int:
+    """
+    按 GFS 策略一次性计算所有仓库的保留计划，先输出计划，再执行删除
+
+    Args:
+        dry_run: 只输出计划，不删除
+
+    Returns:
+        删除（移入回收站）的快照数
+    """
+    loader = config.get_loader()
+    policy = RetentionPolicy(
+        keep_daily=loader.get('backup.retention.gfs.keep_daily', 7),
+        keep_weekly=loader.get('backup.retention.gfs.keep_weekly', 4),
+        keep_monthly=loader.get('backup.retention.gfs.keep_monthly', 12),
+        keep_yearly=loader.get('backup.retention.gfs.keep_yearly', 0),
+        keep_within_days=loader.get('backup.retention.gfs.keep_within_days', 0),
+    )
+    dry_run = dry_run or loader.get('backup.retention.gfs.dry_run', False)
+
+    backup_root = Path(config.BACKUP_ROOT)
+    backup_root.mkdir(parents=True, exist_ok=True)
+    plans = plan_backup_root(backup_root, policy)
+    # 小仓库打包的快照按同一策略计算
+    for pack in owner_packs(backup_root):
+        for repository in pack.repositories():
+            plan = policy.plan(
+                [(s.name, s.time, bool(s.protected)) for s in pack.snapshots(repository)]
+            )
+            plan['repository'] = repository
+            plan['pack'] = pack
+            plans.append(plan)
+
+    # 先输出计划（dry-run），便于审计
+    plan_file = backup_root / ".retention_plan"
+    plan_text = format_plan(plans)
+    plan_file.write_text(plan_text, encoding='utf-8')
+    logger.info(plan_text.splitlines()[0])
+    logger.info(f"保留计划已写入: {plan_file}")
+
+    if dry_run:
+        logger.info("dry-run 模式，不执行删除")
+        return 0
+
+    deleted_count = 0
+    for plan in plans:
+        owner, repo_name = plan['repository'].split('/', 1)
+        if 'pack' in plan:
+            # 删除时重新读取保护标记（计划生成后可能被保护）
+            protected = {
+                s.name for s in plan['pack'].snapshots(plan['repository']) if s.protected
+            }
+            deleted_count += plan['pack'].remove(
+                plan['repository'], set(plan['delete']) - protected
+            )
+            continue
+        for name in plan['delete']:
+            snapshot = plan['snapshot_dir'] / name
+            try:
+                # 执行前再次检查保护标记（计划生成后可能被人工保护）
+                if (snapshot / ".protected").exists():
+                    continue
+                if trash:
+                    trash.move(snapshot, f"{owner}-{repo_name}")
+                else:
+                    shutil.rmtree(snapshot)
+                deleted_count += 1
+            except Exception as e:
+                logger.warning(f"删除旧快照失败 {snapshot}: {e}")
+
+    logger.info(f"GFS 保留策略: 删除 {deleted_count} 个快照")
+    return deleted_count
+
+
+# ============ 跨仓库去重 ============
+def run_dedup() -> Dict[str, int]:
+    """
+    对备份根目录中所有快照的 pack 文件和松散对象做跨仓库硬链接去重
+
+    Returns:
+        去重统计 {'files', 'hashed', 'relinked', 'reclaimed_bytes'}
+    """
+    backup_root = Path(config.BACKUP_ROOT)
+    backup_root.mkdir(parents=True, exist_ok=True)
+    dedup = Deduplicator(
+        backup_root, config.get_loader().get('dedup.min_size', 0)
+    )
+
+    started = time.monotonic()
+    stats = dedup.run()
+    logger.info(
+        f"跨仓库去重: 扫描 {stats['files']} 个文件，哈希 {stats['hashed']} 个，"
+        f"替换为硬链接 {stats['relinked']} 个，"
+        f"释放 {stats['reclaimed_bytes'] // 1024 // 1024} MB，"
+        f"耗时 {time.monotonic() - started:.1f}s"
+    )
+    return stats
+
+
+# ============ 完整性校验 ============
+def run_verify(full: bool = False) -> Dict:
+    """
+    重新哈希快照文件和归档，与清单/校验文件比对
+
+    Args:
+        full: 校验全部；否则按轮转游标抽检 verify.sample_percent
+
+    Returns:
+        校验结果
+    """
+    loader = config.get_loader()
+    backup_root = Path(config.BACKUP_ROOT)
+    backup_root.mkdir(parents=True, exist_ok=True)
+    verifier = Verifier(
+        backup_root,
+        workers=loader.get('verify.workers', 2),
+        sample_percent=loader.get('verify.sample_percent', 10),
+        max_mb_per_second=loader.get('verify.max_mb_per_second', 0),
+    )
+
+    result = verifier.run(full=full)
+    mismatches = result['mismatches']
+    logger.info(
+        f"完整性校验: 检查 {result['checked']} 个文件 "
+        f"({result['checked_bytes'] // 1024 // 1024} MB)，"
+        f"不一致 {len(mismatches)} 个，耗时 {result['elapsed']:.1f}s"
+    )
+
+    by_repo: Dict[str, List[Dict]] = {}
+    for mismatch in mismatches:
+        # 按校验条目记录的仓库分组（冷层 bundle 可能不在备份根目录下）
+        by_repo.setdefault(mismatch['repository'], []).append(mismatch)
+        logger.error(f"  ✗ 校验失败: {mismatch['path']}")
+
+    for repo_name, repo_mismatches in by_repo.items():
+        with open(backup_root / repo_name / ".alerts", 'a') as f:
+            f.write(f"\n[{datetime.now().isoformat()}]\n")
+            f.write(f"完整性校验失败: {len(repo_mismatches)} 个文件\n")
+            for mismatch in repo_mismatches[:10]:
+                f.write(f"{mismatch['path']}\n")
+            f.write("可能原因: 磁盘损坏（bit-rot）或文件被意外修改\n")
+        with open(backup_root / ".need_review", 'a') as f:
+            f.write(f"{repo_name}\n")
+
+    return result
+
+
+# ============ 恢复演练 ============
+def run_restore_drill(sample_size: Optional[int] = None) -> List[Dict]:
+    """
+    抽取快照恢复到临时目录并执行 git fsck，记录恢复耗时和吞吐量
+
+    Args:
+        sample_size: 演练的仓库数，None 时使用配置 restore_drill.sample_size
+
+    Returns:
+        演练结果列表
+    """
+    loader = config.get_loader()
+    backup_root = Path(config.BACKUP_ROOT)
+    if not backup_root.exists():
+        return []
+    if sample_size is None:
+        sample_size = loader.get('restore_drill.sample_size', 5)
+
+    samples = pick_samples(backup_root, sample_size)
+    if not samples:
+        logger.info("恢复演练: 没有可用的快照")
+        return []
+
+    drill = RestoreDrill(
+        backup_root,
+        scratch_dir=loader.get('restore_drill.scratch_dir') or None,
+        workers=loader.get('restore_drill.workers', 2),
+        mode=loader.get('restore_drill.mode', 'hardlink'),
+    )
+    results = drill.run(samples)
+
+    for result in results:
+        if result['ok']:
+            logger.info(
+                f"  ✓ {result['repository']} @ {result['snapshot']}: "
+                f"{result['total_seconds']:.1f}s ({result['mb_per_second']} MB/s)"
+            )
+        else:
+            logger.error(
+                f"  ✗ {result['repository']} @ {result['snapshot']}: {result['error']}"
+            )
+    failed = [r for r in results if not r['ok']]
+    logger.info(f"恢复演练: {len(results)} 个快照，失败 {len(failed)} 个")
+
+    for result in failed:
+        with open(backup_root / result['repository'] / ".alerts", 'a') as f:
+            f.write(f"\n[{datetime.now().isoformat()}]\n")
+            f.write(f"恢复演练失败: 快照 {result['snapshot']}\n")
+            f.write(f"{result['error']}\n")
+        with open(backup_root / ".need_review", 'a') as f:
+            f.write(f"{result['repository']}\n")
+
+    return results
+
+
+# ============ 异地复制 ============
+def run_replication() -> Optional[Dict]:
+    """
+    把新快照和归档增量复制到 replication.target
+
+    Returns:
+        复制统计，未配置目标或目标不可用时为 None
+    """
+    loader = config.get_loader()
+    url = loader.get('replication.target', '')
+    if not url:
+        logger.warning("未配置复制目标（replication.target），跳过异地复制")
+        return None
+
+    options = {}
+    if url.startswith('s3://'):
+        options = {
+            'endpoint_url': loader.get('replication.endpoint_url', ''),
+            'access_key': loader.get('replication.access_key', ''),
+            'secret_key': loader.get('replication.secret_key', ''),
+            'region': loader.get('replication.region', ''),
+            'part_size': int(loader.get('replication.part_size_mb', 64)) * 1024 * 1024,
+            'part_workers': loader.get('replication.workers', 4),
+        }
+    try:
+        target = open_target(url, options)
+    except RuntimeError as e:
+        logger.error(f"✗ 异地复制不可用: {e}")
+        return None
+
+    logger.info(f"异地复制: {target.name}")
+    replicator = Replicator(
+        Path(config.BACKUP_ROOT),
+        target,
+        workers=loader.get('replication.workers', 4),
+        max_mb_per_second=loader.get('replication.max_mb_per_second', 0),
+    )
+    start_time = time.time()
+    stats = replicator.run()
+    logger.info(
+        f"异地复制: {stats['items']} 个快照/归档，{stats['files']} 个文件，"
+        f"上传 {stats['uploaded']} 个 ({stats['uploaded_bytes'] // 1024 // 1024} MB)，"
+        f"目标端复用 {stats['linked']} 个，跳过 {stats['skipped']} 个，"
+        f"小仓库打包文件 {stats['pack_files']} 个，"
+        f"失败 {stats['failed']} 个，耗时 {time.time() - start_time:.1f}s"
+    )
+    return stats
+
+
+# ============ LFS 对象 ============
+def lfs_store() -> LfsStore:
+    """LFS 对象存储（lfs.path 为相对路径时相对于 Gitea 数据卷）"""
+    loader = config.get_loader()
+    return LfsStore(
+        Path(config.BACKUP_ROOT),
+        Path(config.GITEA_DATA_VOLUME) / loader.get('lfs.path', 'git/lfs'),
+        workers=loader.get('lfs.workers', 4),
+    )
+
+
+def run_lfs() -> Dict:
+    """
+    把快照引用的 LFS 对象复制到按内容寻址的存储，清理不再引用的对象
+
+    Returns:
+        复制统计（见 LfsStore.run）
+    """
+    store = lfs_store()
+    if not store.source_dir.exists():
+        logger.warning(f"LFS 目录不存在: {store.source_dir}")
+    stats = store.run()
+    logger.info(
+        f"LFS 对象: 引用 {stats['referenced']} 个，新复制 {stats['copied']} 个 "
+        f"({stats['copied_bytes'] // 1024 // 1024} MB)，已有 {stats['existing']} 个，"
+        f"源中缺失 {stats['missing']} 个，失败 {stats['failed']} 个，"
+        f"清理 {stats['removed']} 个，耗时 {stats['elapsed']:.1f}s"
+    )
+    return stats
+
+
+# ============ 快照冷层 ============
+def run_tiering() -> Dict:
+    """
+    把超过 tiering.cold_after_days 天的快照压缩为冷层 bundle
+
+    Returns:
+        分层统计（见 ColdTier.run）
+    """
+    loader = config.get_loader()
+    tier = ColdTier(
+        Path(config.BACKUP_ROOT),
+        cold_after_days=loader.get('tiering.cold_after_days', 30),
+        cold_root=loader.get('tiering.cold_root', '') or None,
+        max_per_run=loader.get('tiering.max_per_run', 0),
+        trash=trash,
+    )
+    logger.info(f"快照冷层: 转换超过 {tier.cold_after_days} 天的快照")
+    start_time = time.time()
+    stats = tier.run()
+    logger.info(
+        f"快照冷层: 转换 {stats['compacted']} 个快照 "
+        f"({stats['bundle_bytes'] // 1024 // 1024} MB)，失败 {stats['failed']} 个，"
+        f"清理孤立 bundle {stats['orphans']} 个，耗时 {time.time() - start_time:.1f}s"
+    )
+    return stats
+
+
+# ============ 引用对比 ============
+def run_ref_diff(
+    repository: str, base: Optional[str] = None, target: str = 'live'
+) -> Optional[Dict]:
+    """
+    比较同一仓库两个快照（或快照与在线仓库）的引用表
+
+    Args:
+        repository: 仓库全名 owner/repo
+        base: 基准快照名，默认为 target 之前的最近一个快照
+        target: 目标快照名，或 live 表示在线仓库
+
+    Returns:
+        对比结果（见 compare_snapshots），快照不存在时为 None
+    """
+    owner, _, repo_name = repository.partition('/')
+    snapshot_dir = Path(config.BACKUP_ROOT) / owner / repo_name / "snapshots"
+    snapshots = (
+        sorted(
+            [s for s in snapshot_dir.iterdir() if (s / "objects").is_dir()],
+            key=snapshot_time,
+        )
+        if snapshot_dir.exists()
+        else []
+    )
+
+    if target == 'live':
+        target_path = (
+            Path(config.GITEA_DATA_VOLUME)
+            / config.GITEA_REPOS_PATH
+            / owner
+            / f"{repo_name}.git"
+        )
+        candidates = snapshots
+    else:
+        target_path = snapshot_dir / target
+        candidates = [s for s in snapshots if s.name < target]
+
+    if base:
+        base_path = snapshot_dir / base
+    else:
+        base_path = candidates[-1] if candidates else None
+    for path in (base_path, target_path):
+        if path is None or not (path / "objects").is_dir():
+            logger.error(f"快照或仓库不存在: {path or repository}")
+            return None
+
+    result = compare_snapshots(base_path, target_path, target_is_live=target == 'live')
+
+    logger.info(f"引用对比: {repository} {result['base']} → {result['target']}")
+    summary = result['summary']
+    logger.info(
+        "  "
+        + ", ".join(f"{KIND_LABELS[kind]} {count}" for kind, count in summary.items())
+    )
+    for change in result['changes']:
+        line = f"  {KIND_LABELS[change['kind']]:<4} {change['ref']}"
+        line += f" {(change['old'] or '-')[:10]} → {(change['new'] or '-')[:10]}"
+        if change['lost_commits']:
+            line += f"（丢失 {change['lost_commits']} 个提交）"
+        logger.info(line)
+    if result['lost_commits']:
+        logger.warning(f"  ⚠️  共丢失 {result['lost_commits']} 个提交")
+    return result
+
+
+# ============ 引用索引查询 ============
+def run_find_oid(
+    query: str, deep: bool = False, repository: Optional[str] = None
+) -> List[Dict]:
+    """
+    查询哪些快照还包含某个提交或标签
+
+    Args:
+        query: 对象 ID 或引用名
+        deep: 是否检查可达性（不只是引用的最新提交，需要完整 ID）
+        repository: 仓库过滤（owner/repo，支持通配符）
+
+    Returns:
+        匹配的快照（按时间从新到旧）
+    """
+    index = RefIndex(config.BACKUP_ROOT)
+    index.sync()
+
+    start_time = time.time()
+    if deep:
+        try:
+            results = index.find_reachable(query, repository)
+        except ValueError as e:
+            logger.error(str(e))
+            return []
+    else:
+        results = index.find(query, repository)
+    elapsed = (time.time() - start_time) * 1000
+
+    logger.info(f"查询 {query}: {len(results)} 条结果 ({elapsed:.0f} ms)")
+    newest = {}
+    for result in results:
+        newest.setdefault(result['repository'], result)
+        refs = result.get('refs') or [result['ref']]
+        logger.info(
+            f"  {result['repository']} {result['snapshot']}  {', '.join(refs[:5])}"
+            + (f" 等 {len(refs)} 个引用" if len(refs) > 5 else "")
+        )
+    for repo, result in newest.items():
+        logger.info(f"  ✓ {repo} 最新包含的快照: {result['snapshot']}")
+    return results
+
+
+# ============ 快照导出 ============
+def run_export(
+    repository: str,
+    snapshot: Optional[str] = None,
+    fmt: str = 'tar',
+    output: Optional[str] = None,
+    resume: bool = False,
+) -> bool:
+    """
+    把快照直接流式导出为 tar 包或 git bundle（不复制快照）
+
+    Args:
+        repository: 仓库全名 owner/repo
+        snapshot: 快照名，默认为最近的快照
+        fmt: tar 或 bundle
+        output: 输出文件，- 表示标准输出（默认 owner-repo-快照名.tar/.bundle）
+        resume: 输出文件已存在时从其末尾继续写入（仅 tar）
+
+    Returns:
+        是否成功
+    """
+    owner, _, repo_name = repository.partition('/')
+    snapshot_dir = Path(config.BACKUP_ROOT) / owner / repo_name / "snapshots"
+    if snapshot:
+        snapshot_path = snapshot_dir / snapshot
+    else:
+        snapshots = (
+            [s for s in snapshot_dir.iterdir() if is_snapshot(s)]
+            if snapshot_dir.exists()
+            else []
+        )
+        snapshot_path = max(snapshots, key=snapshot_time) if snapshots else None
+    if snapshot_path is None or not is_snapshot(snapshot_path):
+        logger.error(f"快照不存在: {snapshot_path or repository}")
+        return False
+    if fmt != 'bundle' and snapshot_tier(snapshot_path) == 'cold':
+        logger.error(f"快照已转入冷层，只能导出为 bundle: {snapshot_path.name}")
+        return False
+
+    if not output:
+        output = f"{owner}-{repo_name}-{snapshot_path.name}.{fmt}"
+    # 标准输出可能已被改到标准错误（见命令行入口），数据写到原始标准输出
+    stdout = sys.__stdout__.buffer
+
+    start_time = time.time()
+    try:
+        if fmt == 'bundle':
+            out = stdout if output == '-' else open(output, 'wb')
+            written = 0
+            try:
+                for data in iter_bundle(snapshot_path):
+                    out.write(data)
+                    written += len(data)
+            finally:
+                if out is not stdout:
+                    out.close()
+        else:
+            layout = TarLayout(snapshot_path, f"{repo_name}.git")
+            offset = 0
+            if output == '-':
+                out = stdout
+            elif resume and Path(output).exists():
+                offset = min(Path(output).stat().st_size, layout.size)
+                out = open(output, 'r+b')
+                out.seek(offset)
+                out.truncate()
+            else:
+                out = open(output, 'wb')
+            if offset:
+                logger.info(f"断点续传: 从 {offset} 字节继续")
+            try:
+                written = layout.write_to(out, offset)
+            finally:
+                if out is not stdout:
+                    out.close()
+    except (OSError, RuntimeError) as e:
+        logger.error(f"✗ 导出失败: {e}")
+        return False
+
+    elapsed = time.time() - start_time
+    rate = written / 1024 / 1024 / elapsed if elapsed > 0 else 0
+    logger.info(
+        f"✓ 已导出 {repository} {snapshot_path.name} ({fmt}) -> {output}: "
+        f"{written / 1024 / 1024:.1f} MB, {elapsed:.1f} 秒, {rate:.1f} MB/s"
+    )
+    return True
+
+
+# ============ 批量恢复 ============
+def run_restore(
+    pattern: str, at: str = 'now', dry_run: bool = False, assume_yes: bool = False
+) -> List[Dict]:
+    """
+    按 owner/仓库 模式把匹配的仓库批量恢复到指定时间点
+
+    Args:
+        pattern: 仓库模式，如 org、org/*、org/repo-*
+        at: 时间点（now、20260101-120000、2026-01-01、2026-01-01T12:00）
+        dry_run: 只输出恢复计划
+        assume_yes: 不询问确认
+
+    Returns:
+        每个仓库的恢复结果（dry_run 或取消时为空）
+    """
+    loader = config.get_loader()
+    point_in_time = parse_point_in_time(at)
+    repos_path = Path(config.GITEA_DATA_VOLUME) / config.GITEA_REPOS_PATH
+    plan = plan_restore(Path(config.BACKUP_ROOT), repos_path, pattern, point_in_time)
+
+    logger.info(f"恢复计划: {pattern} @ {point_in_time:%Y-%m-%d %H:%M:%S}")
+    for item in plan:
+        logger.info(f"  {item.describe()}")
+    restorable = [item for item in plan if item.source]
+    logger.info(f"共 {len(plan)} 个仓库，可恢复 {len(restorable)} 个")
+
+    if dry_run or not restorable:
+        return []
+    if not assume_yes:
+        print("⚠️  警告: 将停止 Docker 容器并覆盖以上仓库（原仓库改名为 .backup-时间戳）")
+        if input("确认继续? (yes/NO): ").strip() != 'yes':
+            logger.info("已取消")
+            return []
+
+    owner = None
+    owner_value = str(loader.get('restore.owner', '') or '')
+    if owner_value:
+        uid, _, gid = owner_value.partition(':')
+        owner = (int(uid), int(gid or uid))
+
+    def stop_container():
+        logger.info("停止 Docker 容器...")
+        run_command(['docker', 'stop', config.DOCKER_CONTAINER])
+
+    def start_container():
+        logger.info("启动 Docker 容器...")
+        run_command(['docker', 'start', config.DOCKER_CONTAINER], check=False)
+
+    engine = RestoreEngine(
+        Path(config.BACKUP_ROOT),
+        workers=loader.get('restore.workers', 4),
+        mode=loader.get('restore.mode', 'hardlink'),
+        owner=owner,
+        stop_container=stop_container,
+        start_container=start_container,
+        archive_key=archive_key(),
+    )
+    results = engine.run(plan)
+
+    for result in results:
+        if result['ok']:
+            logger.info(f"  ✓ {result['repository']} ({result['mode']})")
+        elif result['source']:
+            logger.error(f"  ✗ {result['repository']}: {result['error']}")
+    restored = [r for r in results if r['ok']]
+    logger.info(f"批量恢复: 成功 {len(restored)} 个，失败 {len(restorable) - len(restored)} 个")
+
+    # 把恢复的快照引用的 LFS 对象复制回 Gitea（已存在的跳过）
+    if loader.get('lfs.enabled', False):
+        items = {item.repository: item for item in plan}
+        lfs_oids: Dict[str, int] = {}
+        for result in restored:
+            item = items[result['repository']]
+            if item.kind == 'snapshot':
+                lfs_oids.update(read_lfs_oids(item.source))
+            elif item.kind == 'packed':
+                packed = open_pack(item.source.parent).find(
+                    item.repository, item.source_time.strftime(SNAPSHOT_NAME_FORMAT)
+                )
+                lfs_oids.update(packed.lfs_oids if packed else {})
+        if lfs_oids:
+            stats = lfs_store().restore(lfs_oids, owner)
+            logger.info(
+                f"LFS 对象: 恢复 {stats['restored']} 个，已存在 {stats['existing']} 个，"
+                f"备份中缺失 {stats['missing']} 个，失败 {stats['failed']} 个"
+            )
+    return results
+
+
+# ============ 全局异常评分 ============
+def score_fleet() -> int:
+    """
+    所有仓库处理完后，一次性读取跟踪历史做整体异常评分
+
+    新出现的异常写入对应仓库的 .alerts 并加入待审核列表，
+    完整结果保存到 BACKUP_ROOT/.fleet_anomalies.json 供报告使用
+
+    Returns:
+        新出现的异常数
+    """
+    loader = config.get_loader()
+    backup_root = Path(config.BACKUP_ROOT)
+    scorer = FleetScorer(
+        window_days=loader.get('alerts.fleet_scoring.window_days', 30),
+        min_history=loader.get('alerts.fleet_scoring.min_history', 5),
+        threshold=loader.get('alerts.fleet_scoring.threshold', 3.5),
+    )
+
+    started = time.monotonic()
+    histories = scorer.load(backup_root)
+    anomalies = scorer.score(histories)
+    elapsed = time.monotonic() - started
+
+    # 只对新出现的异常告警，持续存在的回撤不重复写入
+    previous = {(a.repository, a.metric) for a in load_anomalies(backup_root)}
+    save_anomalies(backup_root, anomalies, elapsed)
+    new_anomalies = [a for a in anomalies if (a.repository, a.metric) not in previous]
+
+    logger.info(
+        f"全局异常评分: {len(histories)} 个仓库，{len(anomalies)} 个异常"
+        f"（新增 {len(new_anomalies)} 个），耗时 {elapsed:.3f}s"
+    )
+
+    by_repo: Dict[str, List] = {}
+    for anomaly in new_anomalies:
+        by_repo.setdefault(anomaly.repository, []).append(anomaly)
+        logger.warning(f"  ⚠️  {anomaly.repository}: {anomaly.describe()}")
+
+    for repo_name, repo_anomalies in by_repo.items():
+        alert_file = backup_root / repo_name / ".alerts"
+        with open(alert_file, 'a') as f:
+            f.write(f"\n[{datetime.now().isoformat()}]\n")
+            for anomaly in repo_anomalies:
+                f.write(f"统计{anomaly.describe()}\n")
+            f.write("与自身历史或其他仓库相比明显偏离，请确认是否正常\n")
+
+        with open(backup_root / ".need_review", 'a') as f:
+            f.write(f"{repo_name}\n")
+
+    return len(new_anomalies)
+
+
 # ============ 报告生成 ============
 def send_backup_notification(processed_count: int, skipped_count: int):
     """发送备份通知"""
@@ -814,8 +2085,13 @@ def send_backup_notification(processed_count: int, skipped_count: int):
     for org_dir in backup_root.iterdir():
         if not org_dir.is_dir() or org_dir.name.startswith('.'):
             continue
+        # 小仓库打包的快照
+        pack = open_pack(org_dir)
+        total_snapshots += len(pack.snapshots())
+        if pack.exists():
+            total_size_kb += get_directory_size(pack.path)
         for repo_dir in org_dir.iterdir():
-            if not repo_dir.is_dir():
+            if not repo_dir.is_dir() or repo_dir.name.startswith('.'):
                 continue
             total_repos += 1
 
@@ -827,13 +2103,9 @@ def send_backup_notification(processed_count: int, skipped_count: int):
                 )
 
             # 统计提交数
-            commit_file = repo_dir / ".commit_tracking"
-            if commit_file.exists():
-                try:
-                    commits = int(commit_file.read_text().strip())
-                    total_commits += commits
-                except Exception:
-                    pass
+            state = load_latest_state(repo_dir)
+            if state:
+                total_commits += state.commits
 
             # 统计大小
             dir_size = get_directory_size(repo_dir)
@@ -845,6 +2117,10 @@ def send_backup_notification(processed_count: int, skipped_count: int):
                 repo_name = f"{org_dir.name}/{repo_dir.name}"
                 alert_repos.append(repo_name)
 
+    # 回收站单独统计（不计入仓库占用）
+    _, trash_size_kb = TrashQueue(config.BACKUP_ROOT).usage()
+    verify_result = load_verify_result(backup_root)
+
     # 构建报告数据
     report_data = {
         'total_repos': total_repos,
@@ -855,6 +2131,8 @@ def send_backup_notification(processed_count: int, skipped_count: int):
         'has_alerts': has_alerts,
         'alert_repos': alert_repos,
         'total_size_mb': total_size_kb // 1024,  # 转换为 MB
+        'trash_size_mb': trash_size_kb // 1024,
+        'verify_mismatches': len(verify_result['mismatches']) if verify_result else 0,
     }
 
     # 发送通知
@@ -910,6 +2188,7 @@ def generate_report():
     total_repos = 0
     total_snapshots = 0
     total_archives = 0
+    total_archive_bytes = 0
     total_size = 0
     total_commits = 0
     repo_details = []
@@ -919,8 +2198,12 @@ def generate_report():
         if not org_dir.is_dir() or org_dir.name.startswith('.'):
             continue
 
+        pack = open_pack(org_dir)
+        if pack.exists():
+            total_size += get_directory_size(pack.path)
+
         for repo_dir in org_dir.iterdir():
-            if not repo_dir.is_dir():
+            if not repo_dir.is_dir() or repo_dir.name.startswith('.'):
                 continue
 
             repo_name = f"{org_dir.name}/{repo_dir.name}"
@@ -934,7 +2217,7 @@ def generate_report():
             if snapshot_dir.exists():
                 snapshots = sorted(
                     snapshot_dir.iterdir(),
-                    key=lambda x: x.stat().st_mtime,
+                    key=snapshot_time,
                     reverse=True,
                 )
                 all_snapshots = [s for s in snapshots if s.is_dir()]
@@ -947,12 +2230,20 @@ def generate_report():
                     latest_snapshot = snapshots[0].name
                 total_snapshots += snapshot_count
 
-            # 统计归档
-            archive_count = 0
-            archive_dir = repo_dir / "archives"
-            if archive_dir.exists():
-                archive_count = len(list(archive_dir.glob("*.bundle")))
-                total_archives += archive_count
+            # 小仓库打包的快照
+            packed = pack.snapshots(repo_name)
+            if packed:
+                snapshot_count += len(packed)
+                protected_snapshot_count += len([s for s in packed if s.protected])
+                if latest_snapshot == "无" or packed[-1].name > latest_snapshot:
+                    latest_snapshot = packed[-1].name
+                total_snapshots += len(packed)
+
+            # 统计归档（读取归档目录，不访问 bundle 文件）
+            archive_records = read_catalog(repo_dir / "archives")
+            archive_count = len(archive_records)
+            total_archives += archive_count
+            total_archive_bytes += sum(r.get('size') or 0 for r in archive_records)
 
             # 计算大小
             dir_size = get_directory_size(repo_dir)
@@ -961,14 +2252,10 @@ def generate_report():
             # 读取提交数和历史变化
             commit_count = "N/A"
             commit_change = None
-            commit_tracking_file = repo_dir / ".commit_tracking"
-            if commit_tracking_file.exists():
-                try:
-                    commit_count = commit_tracking_file.read_text().strip()
-                    if commit_count.isdigit():
-                        total_commits += int(commit_count)
-                except Exception:
-                    pass
+            state = load_latest_state(repo_dir)
+            if state:
+                commit_count = str(state.commits)
+                total_commits += state.commits
 
             # 检查是否有提交数变化告警
             alert_file = repo_dir / ".alerts"
@@ -998,6 +2285,9 @@ def generate_report():
                 }
             )
 
+    # 回收站单独统计（不计入仓库占用）
+    trash_entries, trash_size_kb = TrashQueue(config.BACKUP_ROOT).usage()
+
     # 检查是否有异常
     need_review_file = backup_root / ".need_review"
     has_alerts = need_review_file.exists() and need_review_file.stat().st_size > 0
@@ -1019,14 +2309,29 @@ def generate_report():
         f.write(f"- **备份仓库数**: {total_repos}\n")
         f.write(f"- **总提交数**: {total_commits:,} commits\n")
         f.write(f"- **快照总数**: {total_snapshots}\n")
-        f.write(f"- **归档总数**: {total_archives}\n")
-        f.write(f"- **占用空间**: {total_size // 1024} MB\n\n")
+        f.write(
+            f"- **归档总数**: {total_archives}"
+            f"（{total_archive_bytes // 1024 // 1024} MB）\n"
+        )
+        f.write(f"- **占用空间**: {total_size // 1024} MB\n")
+        f.write(
+            f"- **回收站（待删除）**: {trash_entries} 个条目，"
+            f"{trash_size_kb // 1024} MB\n"
+        )
+        dedup_run = Deduplicator(backup_root).last_run()
+        if dedup_run:
+            f.write(
+                f"- **跨仓库去重**: 上次替换 {dedup_run['relinked']} 个重复文件，"
+                f"释放 {dedup_run['reclaimed_bytes'] // 1024 // 1024} MB\n"
+            )
+        f.write("\n")
 
         # 异常报告
         if has_alerts:
             f.write("## ⚠️ 需要关注的仓库\n\n")
             f.write(
-                "以下仓库检测到提交数或大小异常减少，可能发生了 force push 或历史重写：\n\n"
+                "以下仓库检测到引用被改写/删除，或提交数、大小异常减少，"
+                "可能发生了 force push 或历史重写：\n\n"
             )
 
             reviewed_repos = set()
@@ -1046,33 +2351,37 @@ def generate_report():
                     f.write("\n```\n\n")
 
                     # 显示当前状态
-                    commit_tracking_file = backup_root / repo_name / ".commit_tracking"
-                    size_tracking_file = backup_root / repo_name / ".size_tracking"
-
                     current_info = []
-                    if commit_tracking_file.exists():
-                        try:
-                            commits = commit_tracking_file.read_text().strip()
-                            current_info.append(f"当前提交数: {commits}")
-                        except Exception:
-                            pass
-                    if size_tracking_file.exists():
-                        try:
-                            size_kb = int(size_tracking_file.read_text().strip())
-                            size_mb = size_kb // 1024
-                            current_info.append(f"当前大小: {size_mb}MB")
-                        except Exception:
-                            pass
+                    state = load_latest_state(backup_root / repo_name)
+                    if state:
+                        current_info.append(f"当前提交数: {state.commits}")
+                        current_info.append(f"当前大小: {state.size_kb // 1024}MB")
 
                     if current_info:
                         f.write(f"**当前状态**: {' | '.join(current_info)}\n\n")
 
+                    # 最近一次的引用变化
+                    ref_changes = load_ref_changes(backup_root / repo_name)
+                    destructive = destructive_changes(
+                        ref_changes['changes'] if ref_changes else []
+                    )
+                    if destructive:
+                        f.write(
+                            f"**被改写/删除的引用** "
+                            f"(对比快照 {ref_changes['base']}):\n"
+                        )
+                        for change in destructive[:20]:
+                            f.write(f"  - {change.describe()}\n")
+                        if len(destructive) > 20:
+                            f.write(f"  - ... 还有 {len(destructive) - 20} 个\n")
+                        f.write("\n")
+
                     # 受保护的快照
                     snapshot_dir = backup_root / repo_name / "snapshots"
                     if snapshot_dir.exists():
                         snapshots = sorted(
                             snapshot_dir.iterdir(),
-                            key=lambda x: x.stat().st_mtime,
+                            key=snapshot_time,
                             reverse=True,
                         )
                         latest = snapshots[0].name if snapshots else "无"
@@ -1108,6 +2417,85 @@ def generate_report():
             f.write("## ✅ 全部正常\n\n")
             f.write("本周期内所有仓库均未检测到异常。\n\n")
 
+        # 完整性校验
+        verify_result = load_verify_result(backup_root)
+        if verify_result:
+            mismatches = verify_result['mismatches']
+            f.write("## 🧪 完整性校验\n\n")
+            f.write(
+                f"- **校验时间**: {verify_result['time'][:19].replace('T', ' ')}"
+                f"（{'全部' if verify_result.get('full') else '轮转抽检'}）\n"
+            )
+            f.write(
+                f"- **检查文件**: {verify_result['checked']} 个，"
+                f"{verify_result['checked_bytes'] // 1024 // 1024} MB\n"
+            )
+            f.write(f"- **不一致**: {len(mismatches)} 个\n\n")
+            if mismatches:
+                f.write("| 文件 | 期望 | 实际 |\n")
+                f.write("|------|------|------|\n")
+                for mismatch in mismatches[:20]:
+                    actual = (mismatch['actual'] or '缺失/不可读')[:12]
+                    f.write(
+                        f"| {mismatch['path']} | {mismatch['expected'][:12]} "
+                        f"| {actual} |\n"
+                    )
+                if len(mismatches) > 20:
+                    f.write(f"\n... 还有 {len(mismatches) - 20} 个文件\n")
+                f.write("\n")
+
+        # 恢复演练
+        drill_results = load_latest_drill(backup_root)
+        if drill_results:
+            ok_results = [r for r in drill_results if r['ok']]
+            f.write("## 🚑 恢复演练\n\n")
+            f.write(
+                f"- **演练时间**: {drill_results[0]['time'][:19].replace('T', ' ')}\n"
+            )
+            f.write(
+                f"- **演练快照**: {len(drill_results)} 个，"
+                f"失败 {len(drill_results) - len(ok_results)} 个\n"
+            )
+            if ok_results:
+                durations = sorted(r['total_seconds'] for r in ok_results)
+                total_mb = sum(r['size_bytes'] for r in ok_results) / 1024 / 1024
+                f.write(
+                    f"- **恢复耗时**: 中位数 {durations[len(durations) // 2]:.1f}s，"
+                    f"最长 {durations[-1]:.1f}s\n"
+                )
+                f.write(
+                    f"- **吞吐量**: {total_mb / max(sum(durations), 0.001):.1f} MB/s\n"
+                )
+            f.write("\n| 仓库 | 快照 | 方式 | 大小 | 耗时 | MB/s | 结果 |\n")
+            f.write("|------|------|------|------|------|------|------|\n")
+            for r in drill_results:
+                status = "✅" if r['ok'] else f"❌ {r['error'][:40]}"
+                f.write(
+                    f"| {r['repository']} | {r['snapshot']} | {r['mode']} | "
+                    f"{r['size_bytes'] // 1024 // 1024}MB | "
+                    f"{r['total_seconds']:.1f}s | {r['mb_per_second']} | {status} |\n"
+                )
+            f.write("\n")
+
+        # 全局异常评分
+        fleet_anomalies = load_anomalies(backup_root)
+        if fleet_anomalies:
+            f.write("## 📉 统计异常\n\n")
+            f.write(
+                "以下指标与仓库自身历史或其他仓库相比明显偏离（修正 z 分数）：\n\n"
+            )
+            f.write("| 仓库 | 指标 | z 分数 | 详情 |\n")
+            f.write("|------|------|--------|------|\n")
+            for anomaly in fleet_anomalies[:20]:
+                f.write(
+                    f"| {anomaly.repository} | "
+                    f"{METRIC_LABELS.get(anomaly.metric, anomaly.metric)} | "
+                    f"{anomaly.score:.1f} | {anomaly.detail} |\n"
+                )
+            if len(fleet_anomalies) > 20:
+                f.write(f"\n... 还有 {len(fleet_anomalies) - 20} 个异常指标\n")
+            f.write("\n")
+
         # 提交数变化统计
         repos_with_changes = [r for r in repo_details if r['commit_change']]
         if repos_with_changes:
@@ -1214,6 +2602,7 @@ def generate_report():
 # ============ 主函数 ============
 def main():
     """主函数"""
+    global inventory
     logger.info("=" * 50)
     logger.info("Gitea Docker 镜像备份任务开始")
     logger.info("=" * 50)
@@ -1226,6 +2615,10 @@ def main():
     backup_root = Path(config.BACKUP_ROOT)
     backup_root.mkdir(parents=True, exist_ok=True)
 
+    # 启动回收站后台删除（包括上次运行遗留的条目）
+    if trash:
+        trash.start()
+
     # 获取仓库路径
     repos_path = Path(config.GITEA_DATA_VOLUME) / config.GITEA_REPOS_PATH
 
@@ -1235,6 +2628,9 @@ def main():
 
     logger.info(f"仓库目录: {repos_path}")
 
+    # 一次读取所有仓库的镜像标记和同步时间
+    inventory = load_inventory()
+
     # 列出目录内容以便调试
     logger.info("扫描组织目录...")
     org_dirs = [d for d in repos_path.iterdir() if d.is_dir()]
@@ -1243,6 +2639,9 @@ def main():
     # 处理所有仓库
     processed_count = 0
     skipped_count = 0
+    small_repo_max_kb = 0
+    if config.get_loader().get('small_repos.enabled', False):
+        small_repo_max_kb = int(config.get_loader().get('small_repos.max_size_kb', 1024))
 
     for org_dir in repos_path.iterdir():
         if not org_dir.is_dir():
@@ -1267,6 +2666,12 @@ def main():
                     skipped_count += 1
                     continue
 
+                # 小仓库的快照打包到 owner 的共享文件中
+                if small_repo_max_kb and (
+                    get_directory_size(repo_path) < small_repo_max_kb
+                ):
+                    backup = PackedRepositoryBackup(repo_path)
+
                 backup.process()
                 processed_count += 1
 
@@ -1274,10 +2679,86 @@ def main():
                 logger.error(f"处理仓库失败 {repo_path}: {e}", exc_info=True)
 
     logger.info(f"跳过了 {skipped_count} 个仓库")
+    if archive_scheduler:
+        logger.info(
+            f"归档: 创建 {archive_scheduler.archived_count} 个 "
+            f"({archive_scheduler.used_bytes // 1024 // 1024} MB)，"
+            f"推迟 {archive_scheduler.deferred_count} 个"
+        )
 
     logger.info("=" * 50)
     logger.info(f"处理了 {processed_count} 个仓库")
 
+    # 全局异常评分（基于所有仓库的跟踪历史）
+    if config.get_loader().get('alerts.fleet_scoring.enabled', True):
+        try:
+            score_fleet()
+        except Exception as e:
+            logger.warning(f"全局异常评分失败: {e}")
+
+    # GFS 保留策略（所有仓库一次性计算）
+    if config.get_loader().get('backup.retention.gfs.enabled', False):
+        apply_retention()
+
+    # 快照冷层（在保留策略之后，不转换即将删除的快照）
+    if config.get_loader().get('tiering.enabled', False):
+        try:
+            run_tiering()
+        except Exception as e:
+            logger.warning(f"快照冷层转换失败: {e}")
+
+    # 引用索引去掉已删除的快照（并补上未索引的快照）
+    if config.get_loader().get('ref_index.enabled', True):
+        try:
+            stats = RefIndex(config.BACKUP_ROOT).sync()
+            logger.info(
+                f"引用索引: 新增 {stats['added']} 个快照，移除 {stats['removed']} 个"
+            )
+        except Exception as e:
+            logger.warning(f"更新引用索引失败: {e}")
+
+    # LFS 对象（在保留策略之后，清理只被已删除快照引用的对象）
+    if config.get_loader().get('lfs.enabled', False):
+        try:
+            run_lfs()
+        except Exception as e:
+            logger.warning(f"LFS 对象备份失败: {e}")
+
+    # 跨仓库去重（在保留策略之后，避免哈希即将删除的快照）
+    if config.get_loader().get('dedup.enabled', False):
+        try:
+            run_dedup()
+        except Exception as e:
+            logger.warning(f"跨仓库去重失败: {e}")
+
+    # 完整性校验（轮转抽检）
+    if config.get_loader().get('verify.enabled', False):
+        try:
+            run_verify()
+        except Exception as e:
+            logger.warning(f"完整性校验失败: {e}")
+
+    # 恢复演练
+    if config.get_loader().get('restore_drill.enabled', False):
+        try:
+            run_restore_drill()
+        except Exception as e:
+            logger.warning(f"恢复演练失败: {e}")
+
+    # 异地复制（在校验之后，只复制本次保留下来的快照和归档）
+    if config.get_loader().get('replication.enabled', False):
+        try:
+            run_replication()
+        except Exception as e:
+            logger.warning(f"异地复制失败: {e}")
+
+    # 等待回收站后台删除，超时的留到下次运行
+    if trash:
+        if not trash.wait(config.TRASH_DRAIN_TIMEOUT or None):
+            logger.info("回收站删除未在限定时间内完成，剩余条目将在下次运行时继续删除")
+        trash.shutdown()
+        logger.info(f"回收站: 已删除 {trash.purged_count} 个条目")
+
     # 每次都生成报告
     generate_report()
 
@@ -1308,6 +2789,31 @@ if __name__ == "__main__":
   %(prog)s -c config.yaml           # 使用指定配置文件
   %(prog)s --report                 # 只生成报告
   %(prog)s --cleanup                # 只清理旧报告
+  %(prog)s --retention-plan         # 输出 GFS 保留计划（不删除）
+  %(prog)s --dedup                  # 只执行跨仓库去重
+  %(prog)s --verify                 # 只执行完整性校验（轮转抽检）
+  %(prog)s --verify-all             # 校验全部快照和归档
+  %(prog)s --restore-drill          # 只执行恢复演练
+  %(prog)s --replicate              # 只执行异地复制
+  %(prog)s --tier                   # 只把旧快照转入冷层
+  %(prog)s --lfs                    # 只复制快照引用的 LFS 对象
+  %(prog)s --ref-diff org/repo       # 对比最近快照与在线仓库的引用
+  %(prog)s --ref-diff org/repo --from 20260101-000000 --to 20260102-000000
+                                    # 对比两个快照的引用
+  %(prog)s --find-oid 1a2b3c4d       # 查询引用指向该提交的快照
+  %(prog)s --find-oid v1.2.0 --repo 'org/*'
+                                    # 查询包含该标签/分支的快照
+  %(prog)s --find-oid <完整提交ID> --deep
+                                    # 查询能到达该提交的快照
+  %(prog)s --export org/repo         # 把最近快照导出为 org-repo-快照名.tar
+  %(prog)s --export org/repo --snapshot 20260101-000000 --export-format bundle
+                                    # 直接从快照生成 git bundle
+  %(prog)s --export org/repo -o - | ssh host 'cat > repo.tar'
+                                    # 流式导出到其他机器
+  %(prog)s --restore org --at 2026-01-01 --dry-run
+                                    # 输出 org 下所有仓库恢复到该时间点的计划
+  %(prog)s --restore 'org/*' --at 20260101-120000 --yes
+                                    # 批量恢复（只停止一次容器）
   %(prog)s --show-config            # 显示当前配置
   %(prog)s --validate-config        # 验证配置文件
 
@@ -1324,6 +2830,99 @@ if __name__ == "__main__":
             '--report', action='store_true', help='只生成报告，不执行备份'
         )
         parser.add_argument('--cleanup', action='store_true', help='只清理旧报告')
+        parser.add_argument(
+            '--retention-plan',
+            action='store_true',
+            help='输出 GFS 保留计划（dry-run，不删除快照）',
+        )
+        parser.add_argument(
+            '--dedup', action='store_true', help='只执行跨仓库硬链接去重'
+        )
+        parser.add_argument(
+            '--verify', action='store_true', help='只执行完整性校验（轮转抽检）'
+        )
+        parser.add_argument(
+            '--verify-all', action='store_true', help='校验全部快照和归档'
+        )
+        parser.add_argument(
+            '--restore-drill',
+            nargs='?',
+            type=int,
+            const=-1,
+            metavar='N',
+            help='只执行恢复演练（N 为抽取的仓库数，默认使用配置）',
+        )
+        parser.add_argument(
+            '--replicate', action='store_true', help='只执行异地复制（增量）'
+        )
+        parser.add_argument(
+            '--tier', action='store_true', help='只把旧快照转入冷层（bundle）'
+        )
+        parser.add_argument(
+            '--lfs', action='store_true', help='只复制快照引用的 LFS 对象'
+        )
+        parser.add_argument(
+            '--ref-diff',
+            metavar='REPO',
+            help='对比仓库两个快照（或快照与在线仓库）的引用变化',
+        )
+        parser.add_argument(
+            '--from',
+            dest='from_snapshot',
+            metavar='SNAPSHOT',
+            help='引用对比的基准快照（默认: 目标之前的最近快照）',
+        )
+        parser.add_argument(
+            '--to',
+            dest='to_snapshot',
+            default='live',
+            metavar='SNAPSHOT',
+            help='引用对比的目标快照（默认: live，即在线仓库）',
+        )
+        parser.add_argument(
+            '--find-oid',
+            metavar='OID',
+            help='查询包含该提交/标签（对象 ID 或引用名）的快照',
+        )
+        parser.add_argument(
+            '--deep', action='store_true', help='查询时检查可达性（较慢）'
+        )
+        parser.add_argument(
+            '--repo', metavar='PATTERN', help='查询的仓库范围（支持通配符）'
+        )
+        parser.add_argument(
+            '--export', metavar='REPO', help='把仓库快照流式导出为 tar 包或 bundle'
+        )
+        parser.add_argument(
+            '--snapshot', metavar='SNAPSHOT', help='导出的快照（默认: 最近的快照）'
+        )
+        parser.add_argument(
+            '--export-format',
+            choices=['tar', 'bundle'],
+            default='tar',
+            help='导出格式（默认: tar）',
+        )
+        parser.add_argument(
+            '-o', '--output', metavar='PATH', help='导出文件（- 表示标准输出）'
+        )
+        parser.add_argument(
+            '--resume', action='store_true', help='tar 导出时从已有文件末尾继续'
+        )
+        parser.add_argument(
+            '--restore',
+            metavar='PATTERN',
+            help='批量恢复匹配的仓库（owner 或 owner/repo，支持通配符）',
+        )
+        parser.add_argument(
+            '--at',
+            default='now',
+            metavar='TIME',
+            help='恢复的时间点（默认: now，如 2026-01-01、20260101-120000）',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true', help='只输出恢复计划，不执行'
+        )
+        parser.add_argument('--yes', action='store_true', help='恢复时不询问确认')
         parser.add_argument('--show-config', action='store_true', help='显示当前配置')
         parser.add_argument(
             '--validate-config', action='store_true', help='验证配置文件'
@@ -1331,6 +2930,10 @@ if __name__ == "__main__":
 
         args = parser.parse_args()
 
+        if args.export and args.output == '-':
+            # 导出数据独占标准输出，日志和提示改到标准错误
+            sys.stdout = sys.stderr
+
         # 初始化配置
         Config.init(args.config)
         config = Config()
@@ -1350,6 +2953,20 @@ if __name__ == "__main__":
             notifier = None
             logger.info("通知系统不可用（未安装 requests 库）")
 
+        # 初始化回收站
+        if config.TRASH_ENABLED:
+            trash = TrashQueue(
+                config.BACKUP_ROOT,
+                config.TRASH_WORKERS,
+                config.TRASH_MAX_UNLINKS_PER_SECOND,
+            )
+
+        # 初始化归档调度器（预算按单次运行计算）
+        archive_scheduler = ArchiveScheduler(
+            config.ARCHIVE_SCHEDULE,
+            config.ARCHIVE_MAX_MB_PER_RUN * 1024 * 1024,
+        )
+
         # 显示配置
         if args.show_config:
             config.get_loader().print_config()
@@ -1373,6 +2990,69 @@ if __name__ == "__main__":
             generate_report()
             sys.exit(0)
 
+        # 只输出保留计划
+        if args.retention_plan:
+            apply_retention(dry_run=True)
+            print((Path(config.BACKUP_ROOT) / ".retention_plan").read_text())
+            sys.exit(0)
+
+        # 只执行跨仓库去重
+        if args.dedup:
+            run_dedup()
+            sys.exit(0)
+
+        # 只执行完整性校验
+        if args.verify or args.verify_all:
+            result = run_verify(full=args.verify_all)
+            sys.exit(1 if result['mismatches'] else 0)
+
+        # 只执行恢复演练
+        if args.restore_drill is not None:
+            sample_size = args.restore_drill if args.restore_drill >= 0 else None
+            results = run_restore_drill(sample_size)
+            sys.exit(1 if any(not r['ok'] for r in results) else 0)
+
+        # 只执行异地复制
+        if args.replicate:
+            stats = run_replication()
+            sys.exit(0 if stats and not stats['failed'] else 1)
+
+        # 只执行快照冷层转换
+        if args.tier:
+            stats = run_tiering()
+            sys.exit(1 if stats['failed'] else 0)
+
+        # 只复制 LFS 对象
+        if args.lfs:
+            stats = run_lfs()
+            sys.exit(1 if stats['failed'] else 0)
+
+        # 引用对比
+        if args.ref_diff:
+            result = run_ref_diff(args.ref_diff, args.from_snapshot, args.to_snapshot)
+            sys.exit(1 if result is None or result['lost_commits'] else 0)
+
+        # 引用索引查询
+        if args.find_oid:
+            results = run_find_oid(args.find_oid, args.deep, args.repo)
+            sys.exit(0 if results else 1)
+
+        # 快照导出
+        if args.export:
+            ok = run_export(
+                args.export,
+                args.snapshot,
+                args.export_format,
+                args.output,
+                args.resume,
+            )
+            sys.exit(0 if ok else 1)
+
+        # 批量恢复
+        if args.restore:
+            results = run_restore(args.restore, args.at, args.dry_run, args.yes)
+            sys.exit(1 if any(not r['ok'] and r['source'] for r in results) else 0)
+
         # 只清理旧报告
         if args.cleanup:
             logger.info("清理旧报告...")
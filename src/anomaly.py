@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全局异常评分模块
+备份结束后一次性读取所有仓库最近的跟踪历史，使用稳健统计量
+（中位数 + MAD）计算修正 z 分数，找出偏离自身基线或整体分布的仓库：
+
+- 提交数变化：本次变化相对该仓库历史变化的 z 分数（只关注减少）
+- 大小变化：本次大小对数比相对该仓库历史的 z 分数（增减都关注）
+- 缓慢流失：窗口内提交数/大小相对峰值的回撤，在所有仓库间比较；
+  git gc 等日常维护也会让仓库变小，大小回撤只在提交数同时减少时参与比较
+"""
+
+import json
+import logging
+import math
+from datetime import datetime
+from pathlib import Path
+from statistics import median
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from src.tracking import TrackingHistory, TrackingRecord
+
+logger = logging.getLogger(__name__)
+
+ANOMALIES_FILE_NAME = ".fleet_anomalies.json"
+
+# MAD 到标准差的换算系数（正态分布下）
+MAD_SCALE = 1.4826
+
+# 尺度下限，避免长期不变的仓库 MAD 为 0 时任何变化都被放大
+COMMIT_SCALE_FLOOR = 1.0
+SIZE_SCALE_FLOOR = 0.02
+DRAWDOWN_SCALE_FLOOR = 0.01
+
+# 参与整体比较的最少仓库数
+MIN_FLEET_SIZE = 5
+
+METRIC_LABELS = {
+    'commit_delta': '提交数变化',
+    'size_delta': '大小变化',
+    'commit_drawdown': '提交数回撤',
+    'size_drawdown': '大小回撤',
+}
+
+
+class Anomaly(NamedTuple):
+    """一个异常指标"""
+
+    repository: str
+    metric: str
+    value: float
+    score: float
+    detail: str
+
+    def describe(self) -> str:
+        label = METRIC_LABELS.get(self.metric, self.metric)
+        return f"{label}异常 (z={self.score:.1f}): {self.detail}"
+
+
+def robust_z(value: float, baseline: Sequence[float], floor: float) -> float:
+    """
+    计算修正 z 分数
+
+    Args:
+        value: 待评估的值
+        baseline: 基线样本
+        floor: 尺度下限
+
+    Returns:
+        (value - 中位数) / max(1.4826 * MAD, floor)
+    """
+    center = median(baseline)
+    mad = median([abs(x - center) for x in baseline])
+    return (value - center) / max(MAD_SCALE * mad, floor)
+
+
+class FleetScorer:
+    """全局异常评分"""
+
+    def __init__(
+        self, window_days: int = 30, min_history: int = 5, threshold: float = 3.5
+    ):
+        """
+        Args:
+            window_days: 读取最近 N 天的跟踪历史
+            min_history: 计算单仓库基线至少需要的历史变化次数
+            threshold: |z| 超过该值视为异常
+        """
+        self.window_days = max(1, int(window_days or 1))
+        self.min_history = max(2, int(min_history or 2))
+        self.threshold = float(threshold)
+
+    def load(
+        self, backup_root: Path, now: Optional[datetime] = None
+    ) -> Dict[str, List[TrackingRecord]]:
+        """一次遍历读取所有仓库窗口内的跟踪历史"""
+        now = now or datetime.now()
+        since = int(now.timestamp()) - self.window_days * 86400
+        histories = {}
+        backup_root = Path(backup_root)
+        if not backup_root.exists():
+            return histories
+
+        for owner_dir in sorted(backup_root.iterdir()):
+            if not owner_dir.is_dir() or owner_dir.name.startswith('.'):
+                continue
+            for repo_dir in sorted(owner_dir.iterdir()):
+                if not repo_dir.is_dir():
+                    continue
+                records = TrackingHistory(repo_dir).window(since=since)
+                if records:
+                    histories[f"{owner_dir.name}/{repo_dir.name}"] = records
+        return histories
+
+    def score(self, histories: Dict[str, List[TrackingRecord]]) -> List[Anomaly]:
+        """
+        计算所有仓库的异常指标
+
+        Args:
+            histories: {仓库名: 按时间排序的跟踪记录}
+
+        Returns:
+            超过阈值的异常列表，按 |z| 从大到小排序
+        """
+        anomalies = []
+        drawdowns = {'commit_drawdown': {}, 'size_drawdown': {}}
+
+        for repo, records in histories.items():
+            if len(records) < 2:
+                continue
+            commits = [r.commits for r in records]
+            sizes = [r.size_kb for r in records]
+
+            # 单仓库基线：本次变化 vs 历史变化
+            commit_deltas = [b - a for a, b in zip(commits, commits[1:])]
+            size_deltas = [
+                math.log((b + 1) / (a + 1)) for a, b in zip(sizes, sizes[1:])
+            ]
+            if len(commit_deltas) > self.min_history:
+                z = robust_z(commit_deltas[-1], commit_deltas[:-1], COMMIT_SCALE_FLOOR)
+                if z <= -self.threshold:
+                    anomalies.append(
+                        Anomaly(
+                            repo,
+                            'commit_delta',
+                            commit_deltas[-1],
+                            z,
+                            f"{commits[-2]} → {commits[-1]} commits",
+                        )
+                    )
+                z = robust_z(size_deltas[-1], size_deltas[:-1], SIZE_SCALE_FLOOR)
+                if abs(z) >= self.threshold:
+                    anomalies.append(
+                        Anomaly(
+                            repo,
+                            'size_delta',
+                            size_deltas[-1],
+                            z,
+                            f"{sizes[-2]}KB → {sizes[-1]}KB",
+                        )
+                    )
+
+            # 窗口内相对峰值的回撤（用于整体比较）
+            peak_commits = max(commits)
+            peak_size = max(sizes)
+            drawdowns['commit_drawdown'][repo] = (
+                (peak_commits - commits[-1]) / peak_commits if peak_commits else 0.0,
+                f"峰值 {peak_commits} → 当前 {commits[-1]} commits",
+            )
+            # 提交数没有减少时变小通常是 gc 重新打包，不算流失
+            size_drawdown = (
+                (peak_size - sizes[-1]) / peak_size
+                if peak_size and commits[-1] < peak_commits
+                else 0.0
+            )
+            drawdowns['size_drawdown'][repo] = (
+                size_drawdown,
+                f"峰值 {peak_size}KB → 当前 {sizes[-1]}KB",
+            )
+
+        # 整体比较：回撤明显大于其他仓库的视为缓慢流失
+        for metric, values in drawdowns.items():
+            if len(values) < MIN_FLEET_SIZE:
+                continue
+            baseline = [v for v, _ in values.values()]
+            center = median(baseline)
+            scale = max(
+                MAD_SCALE * median([abs(x - center) for x in baseline]),
+                DRAWDOWN_SCALE_FLOOR,
+            )
+            for repo, (value, detail) in values.items():
+                z = (value - center) / scale
+                if z >= self.threshold:
+                    anomalies.append(
+                        Anomaly(repo, metric, value, z, f"{detail} ({value:.1%})")
+                    )
+
+        anomalies.sort(key=lambda a: abs(a.score), reverse=True)
+        return anomalies
+
+
+def save_anomalies(backup_root: Path, anomalies: List[Anomaly], elapsed: float):
+    """保存评分结果，供报告读取"""
+    data = {
+        'time': datetime.now().isoformat(),
+        'elapsed_seconds': round(elapsed, 3),
+        'anomalies': [a._asdict() for a in anomalies],
+    }
+    path = Path(backup_root) / ANOMALIES_FILE_NAME
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding='utf-8')
+
+
+def load_anomalies(backup_root: Path) -> List[Anomaly]:
+    """读取最近一次的评分结果"""
+    path = Path(backup_root) / ANOMALIES_FILE_NAME
+    if not path.exists():
+        return []
+    try:
+        data = json.loads(path.read_text(encoding='utf-8'))
+        return [Anomaly(**a) for a in data.get('anomalies', [])]
+    except (OSError, ValueError, TypeError) as e:
+        logger.warning(f"读取异常评分结果失败 {path}: {e}")
+        return []
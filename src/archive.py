@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+归档工具模块
+将 git bundle 的标准输出直接流式写入宿主机文件（可选并行压缩/加密），不在容器内落盘；
+按仓库错开月度归档日期；支持在宿主机上以低优先级从快照生成归档
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from src.archive_codec import ArchiveEncoder
+
+logger = logging.getLogger(__name__)
+
+# 每次从管道读取的块大小
+CHUNK_SIZE = 1024 * 1024
+
+# 归档文件名：archive-YYYYMM.bundle，压缩/加密后追加 .gz/.enc
+ARCHIVE_NAME_PATTERN = re.compile(r'^archive-\d{6}\.bundle(\.gz)?(\.enc)?$')
+
+# 进程的 umask（导入时读取一次；os.umask 只能通过设置来读取，不能在线程中调用）
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def stream_command_to_file(
+    cmd: List[str],
+    dest: Path,
+    checksum: Optional[str] = 'sha256',
+    encoder: Optional['ArchiveEncoder'] = None,
+    tap: Optional[Callable[[bytes], None]] = None,
+) -> Tuple[int, Optional[str]]:
+    """
+    运行命令并将其标准输出流式写入目标文件
+
+    数据先写入目标目录下的临时文件，命令成功后 fsync 并原子重命名，
+    失败时删除临时文件，目标文件不会出现半成品。
+
+    Args:
+        cmd: 要执行的命令（输出写到 stdout）
+        dest: 目标文件路径
+        checksum: 校验算法（hashlib 名称），为空则不计算
+        encoder: 压缩/加密编码器，输出先经过编码再写入（校验值针对写入的数据）
+        tap: 对每个原始数据块调用（如解析 bundle 头部）
+
+    Returns:
+        (写入字节数, 十六进制校验值或 None)
+    """
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    hasher = hashlib.new(checksum) if checksum else None
+
+    fd, tmp_name = tempfile.mkstemp(
+        prefix=f".{dest.name}.", suffix=".tmp", dir=str(dest.parent)
+    )
+    tmp_path = Path(tmp_name)
+    total = 0
+
+    try:
+        # stderr 写入临时文件，避免管道写满导致死锁
+        with os.fdopen(fd, 'wb') as out, tempfile.TemporaryFile() as err:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err)
+            try:
+                while True:
+                    chunk = proc.stdout.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if tap:
+                        tap(chunk)
+                    pieces = encoder.feed(chunk) if encoder else (chunk,)
+                    total += _write_pieces(out, hasher, pieces)
+            finally:
+                proc.stdout.close()
+                returncode = proc.wait()
+
+            if returncode != 0:
+                err.seek(0)
+                stderr = err.read().decode('utf-8', errors='replace')
+                raise subprocess.CalledProcessError(
+                    returncode, cmd, output=None, stderr=stderr
+                )
+
+            if encoder:
+                total += _write_pieces(out, hasher, encoder.finish())
+            out.flush()
+            os.fsync(out.fileno())
+
+        # mkstemp 创建的文件权限为 0600，改为与普通创建的文件一致（0666 & ~umask）
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, dest)
+    except BaseException:
+        if encoder:
+            encoder.close()
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+    return total, hasher.hexdigest() if hasher else None
+
+
+def _write_pieces(out, hasher, pieces) -> int:
+    written = 0
+    for piece in pieces:
+        out.write(piece)
+        if hasher:
+            hasher.update(piece)
+        written += len(piece)
+    return written
+
+
+def checksum_file_path(archive_file: Path, algorithm: str) -> Path:
+    """获取归档校验文件路径（如 archive-202601.bundle.sha256）"""
+    return archive_file.with_name(f"{archive_file.name}.{algorithm}")
+
+
+def write_checksum_file(archive_file: Path, digest: str, algorithm: str) -> Path:
+    """
+    写入校验文件（与 sha256sum 等工具的输出格式兼容）
+
+    Args:
+        archive_file: 归档文件路径
+        digest: 十六进制校验值
+        algorithm: 校验算法
+
+    Returns:
+        校验文件路径
+    """
+    checksum_file = checksum_file_path(archive_file, algorithm)
+    checksum_file.write_text(f"{digest}  {archive_file.name}\n")
+    return checksum_file
+
+
+def archive_month_stamp(when: date) -> str:
+    """获取归档月份标识（如 202601）"""
+    return when.strftime('%Y%m')
+
+
+def list_archives(archive_dir: Path) -> List[Path]:
+    """列出归档文件（不含校验文件等附属文件），按名称排序"""
+    if not archive_dir.exists():
+        return []
+    return sorted(
+        p for p in archive_dir.glob("archive-*") if ARCHIVE_NAME_PATTERN.match(p.name)
+    )
+
+
+def has_archive_for_month(archive_dir: Path, month_stamp: str) -> bool:
+    """检查指定月份的归档是否已存在"""
+    if not archive_dir.exists():
+        return False
+    return any(archive_dir.glob(f"archive-{month_stamp}.bundle*"))
+
+
+class ArchiveScheduler:
+    """
+    月度归档调度器
+
+    staggered 模式下，每个仓库按全名哈希得到月内固定的归档日（1-28 日），
+    从该日起本月归档缺失即视为到期；上月归档缺失（例如运行失败）时立即补做。
+    单次运行受字节预算限制，超出预算的仓库推迟到下次运行。
+    first_day 模式保持旧行为：只在每月 1 号归档。
+    """
+
+    MODES = ('staggered', 'first_day')
+
+    # 所有月份都有的天数，保证每月的归档日一致
+    SLOT_DAYS = 28
+
+    def __init__(self, mode: str = 'staggered', max_bytes_per_run: int = 0):
+        """
+        初始化调度器
+
+        Args:
+            mode: 调度模式 (staggered/first_day)
+            max_bytes_per_run: 单次运行的归档字节预算，0 表示不限制
+        """
+        if mode not in self.MODES:
+            logger.warning(f"未知的归档调度模式 {mode}，使用 staggered")
+            mode = 'staggered'
+        self.mode = mode
+        self.max_bytes_per_run = max(0, int(max_bytes_per_run or 0))
+        self.used_bytes = 0
+        self.archived_count = 0
+        self.deferred_count = 0
+
+    @classmethod
+    def slot_for(cls, full_name: str) -> int:
+        """获取仓库在月内的固定归档日（1-28）"""
+        digest = hashlib.sha1(full_name.lower().encode('utf-8')).digest()
+        return int.from_bytes(digest[:4], 'big') % cls.SLOT_DAYS + 1
+
+    def is_due(
+        self, full_name: str, archive_dir: Path, today: Optional[date] = None
+    ) -> bool:
+        """
+        检查仓库本次运行是否应创建归档
+
+        Args:
+            full_name: 仓库全名 owner/repo
+            archive_dir: 仓库归档目录
+            today: 当前日期（默认今天）
+
+        Returns:
+            是否到期
+        """
+        return self.due_month(full_name, archive_dir, today) is not None
+
+    def due_month(
+        self, full_name: str, archive_dir: Path, today: Optional[date] = None
+    ) -> Optional[str]:
+        """
+        获取本次运行应创建的归档月份
+
+        上月归档缺失时先补做上月（归档以上月命名），之后的运行再按归档日创建本月归档
+
+        Args:
+            full_name: 仓库全名 owner/repo
+            archive_dir: 仓库归档目录
+            today: 当前日期（默认今天）
+
+        Returns:
+            月份标识（如 202601），未到期时为 None
+        """
+        today = today or date.today()
+        current = archive_month_stamp(today)
+        if has_archive_for_month(archive_dir, current):
+            return None
+
+        if self.mode == 'first_day':
+            return current if today.day == 1 else None
+
+        # 上月归档缺失（仓库之前已有归档）则立即补做
+        last_month = archive_month_stamp(today.replace(day=1) - timedelta(days=1))
+        if archive_dir.exists() and any(archive_dir.glob("archive-*.bundle*")):
+            if not has_archive_for_month(archive_dir, last_month):
+                logger.info(f"  检测到 {last_month} 的归档缺失，立即补做")
+                return last_month
+
+        if today.day >= self.slot_for(full_name):
+            return current
+
+        return None
+
+    def has_budget(self, estimated_bytes: int) -> bool:
+        """
+        检查剩余预算是否足够（每次运行至少允许一个归档，避免大仓库永远被推迟）
+
+        Args:
+            estimated_bytes: 预计归档大小
+        """
+        if not self.max_bytes_per_run or self.archived_count == 0:
+            return True
+        if self.used_bytes + estimated_bytes <= self.max_bytes_per_run:
+            return True
+        self.deferred_count += 1
+        return False
+
+    def consume(self, actual_bytes: int):
+        """记录已完成归档的实际大小"""
+        self.used_bytes += max(0, int(actual_bytes or 0))
+        self.archived_count += 1
+
+
+def low_priority_command(cmd: List[str]) -> List[str]:
+    """
+    以最低 CPU/IO 优先级运行命令（nice/ionice 可用时）
+
+    Args:
+        cmd: 原始命令
+
+    Returns:
+        加上优先级前缀后的命令
+    """
+    prefix = []
+    if shutil.which('nice'):
+        prefix += ['nice', '-n', '19']
+    if shutil.which('ionice'):
+        prefix += ['ionice', '-c', '3']
+    return prefix + list(cmd)
+
+
+def host_bundle_command(git_dir: Path) -> List[str]:
+    """
+    在宿主机上对快照目录生成 bundle 的命令（输出到 stdout）
+
+    快照属主通常与当前用户不同，因此显式放行 safe.directory。
+    """
+    return low_priority_command(
+        [
+            'git',
+            '-c',
+            'safe.directory=*',
+            '-C',
+            str(git_dir),
+            'bundle',
+            'create',
+            '-',
+            '--all',
+        ]
+    )
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+归档目录模块
+每个仓库的 archives/.catalog.jsonl 中为每个归档追加一条记录（创建时写入）：
+引用及其最新提交、前置提交（增量 bundle）与基准归档、来源快照、大小、压缩比、
+吞吐量和校验值。报告、Web API、恢复来源选择和归档保留都只读取目录，
+不需要 stat 或打开归档文件。
+
+引用信息在归档流式写入时从 bundle 头部解析（不额外读取 bundle）；
+目录建立之前已有的归档由 sync_catalog 补录一次
+"""
+
+import json
+import logging
+import os
+import tempfile
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from src.archive import checksum_file_path, list_archives
+from src.archive_codec import iter_archive
+from src.integrity import read_checksum_file
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE_NAME = ".catalog.jsonl"
+
+# bundle 头部上限（引用很多的仓库也远小于此），超出视为格式错误
+MAX_HEADER_SIZE = 64 * 1024 * 1024
+
+
+def catalog_path(archive_dir: Path) -> Path:
+    """归档目录文件路径"""
+    return Path(archive_dir) / CATALOG_FILE_NAME
+
+
+class BundleHeaderReader:
+    """
+    从 bundle 数据流中解析头部（逐块喂入，解析完成后忽略后续数据）
+
+    v2/v3 bundle 头部：签名行、能力行（@，v3）、前置提交行（-oid 注释）、
+    引用行（oid 引用名），以空行结束，随后是 pack 数据
+    """
+
+    def __init__(self):
+        self.refs: Dict[str, str] = {}
+        self.prerequisites: List[str] = []
+        self.done = False
+        self._buffer = bytearray()
+
+    def feed(self, chunk: bytes):
+        if self.done:
+            return
+        self._buffer += chunk
+        end = self._buffer.find(b'\n\n')
+        if end < 0:
+            if len(self._buffer) > MAX_HEADER_SIZE:
+                raise ValueError("bundle 头部过大或格式错误")
+            return
+        lines = self._buffer[:end].decode('utf-8', errors='replace').split('\n')
+        self._buffer = bytearray()
+        self.done = True
+        if not lines[0].startswith('# v') or 'git bundle' not in lines[0]:
+            raise ValueError(f"不是 git bundle: {lines[0][:40]}")
+        for line in lines[1:]:
+            if line.startswith('@'):
+                continue
+            if line.startswith('-'):
+                self.prerequisites.append(line[1:].split(' ', 1)[0])
+            elif ' ' in line:
+                oid, name = line.split(' ', 1)
+                self.refs[name] = oid
+
+
+def find_base(records: Iterable[Dict], prerequisites: List[str]) -> Optional[str]:
+    """
+    增量 bundle 的基准归档：最新的、最新提交覆盖全部前置提交的归档
+
+    Returns:
+        基准归档文件名，完整 bundle 或找不到时为 None
+    """
+    if not prerequisites:
+        return None
+    needed = set(prerequisites)
+    for record in sorted(records, key=lambda r: r.get('time', ''), reverse=True):
+        if needed <= set(record.get('tips', [])):
+            return record['file']
+    return None
+
+
+def make_record(
+    archive_file: Path,
+    header: BundleHeaderReader,
+    records: Iterable[Dict],
+    **fields,
+) -> Dict:
+    """
+    组装一条归档记录
+
+    Args:
+        archive_file: 归档文件
+        header: 已解析的 bundle 头部
+        records: 同一目录中已有的记录（用于查找基准归档）
+        fields: 其余字段（month、time、source、snapshot、size、checksum 等）
+    """
+    record = {'file': Path(archive_file).name}
+    record.update(fields)
+    record.update(
+        {
+            'kind': 'incremental' if header.prerequisites else 'full',
+            'base': find_base(records, header.prerequisites),
+            'prerequisites': header.prerequisites,
+            'ref_count': len(header.refs),
+            'tips': sorted(set(header.refs.values())),
+            'refs': header.refs,
+        }
+    )
+    return record
+
+
+def append_record(archive_dir: Path, record: Dict):
+    """追加一条归档记录（同名归档以最后一条为准）"""
+    path = catalog_path(archive_dir)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def read_catalog(archive_dir: Path) -> List[Dict]:
+    """
+    读取归档记录（不访问归档文件）
+
+    Returns:
+        每个归档文件的最新记录，按文件名（月份）排序
+    """
+    path = catalog_path(archive_dir)
+    if not path.exists():
+        return []
+    records: Dict[str, Dict] = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning(f"跳过损坏的归档记录: {path}")
+                continue
+            if record.get('file'):
+                records[record['file']] = record
+    return [records[name] for name in sorted(records)]
+
+
+def write_catalog(archive_dir: Path, records: List[Dict]):
+    """重写归档目录（临时文件 + 原子重命名）"""
+    path = catalog_path(archive_dir)
+    fd, tmp_name = tempfile.mkstemp(
+        prefix=f"{path.name}.", suffix=".tmp", dir=str(path.parent)
+    )
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def remove_records(archive_dir: Path, names: Iterable[str]):
+    """删除归档后同步删除其记录"""
+    names = set(names)
+    if names:
+        records = read_catalog(archive_dir)
+        write_catalog(archive_dir, [r for r in records if r['file'] not in names])
+
+
+def _read_header(archive_file: Path, key: Optional[bytes]) -> BundleHeaderReader:
+    header = BundleHeaderReader()
+    chunks = iter_archive(archive_file, key, chunk_size=64 * 1024)
+    try:
+        for chunk in chunks:
+            header.feed(chunk)
+            if header.done:
+                break
+    finally:
+        chunks.close()
+    if not header.done:
+        raise ValueError("bundle 头部不完整")
+    return header
+
+
+def sync_catalog(archive_dir: Path, key: Optional[bytes] = None) -> Dict[str, int]:
+    """
+    与归档目录对齐：为没有记录的归档（目录建立之前创建的）补录记录，
+    删除已不存在的归档的记录
+
+    补录时只读取 bundle 头部；时间取文件修改时间，校验值取自校验文件
+
+    Args:
+        archive_dir: 仓库归档目录
+        key: 加密归档的解密密钥（没有密钥时加密归档只记录大小）
+
+    Returns:
+        {'added', 'removed'}
+    """
+    stats = {'added': 0, 'removed': 0}
+    archive_dir = Path(archive_dir)
+    archives = list_archives(archive_dir)
+    records = read_catalog(archive_dir)
+    if not archives and not records:
+        return stats
+
+    on_disk = {p.name for p in archives}
+    kept = [r for r in records if r['file'] in on_disk]
+    stats['removed'] = len(records) - len(kept)
+    if stats['removed']:
+        write_catalog(archive_dir, kept)
+
+    known = {r['file'] for r in kept}
+    for archive in archives:
+        if archive.name in known:
+            continue
+        try:
+            header = _read_header(archive, key)
+        except (OSError, ValueError, RuntimeError) as e:
+            logger.warning(f"  无法解析归档头部 {archive.name}: {e}")
+            header = BundleHeaderReader()
+        digest = read_checksum_file(checksum_file_path(archive, 'sha256'))
+        st = archive.stat()
+        created = datetime.fromtimestamp(st.st_mtime).isoformat()
+        record = make_record(
+            archive,
+            header,
+            kept,
+            month=archive.name[len('archive-'):len('archive-') + 6],
+            time=created,
+            created=created,
+            source='catalog-sync',
+            snapshot=None,
+            size=st.st_size,
+            checksum=f"sha256:{digest}" if digest else None,
+            compression='gzip' if '.gz' in archive.suffixes else 'none',
+            encrypted=archive.name.endswith('.enc'),
+        )
+        append_record(archive_dir, record)
+        kept.append(record)
+        stats['added'] += 1
+    return stats
+
+
+def month_age(month: str, today: Optional[date] = None) -> int:
+    """归档月份（YYYYMM）距今的月数"""
+    today = today or date.today()
+    return (today.year * 12 + today.month) - (int(month[:4]) * 12 + int(month[4:6]))
+
+
+def expired_records(
+    records: Iterable[Dict], keep_months: int, today: Optional[date] = None
+) -> List[Dict]:
+    """
+    按归档月份（而非文件修改时间）选出超过保留月数的归档
+
+    本月的归档总是保留
+    """
+    keep_months = max(1, int(keep_months or 0))
+    return [
+        r
+        for r in records
+        if r.get('month') and month_age(r['month'], today) >= keep_months
+    ]
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+归档压缩/加密模块
+git bundle 的输出在写入归档文件之前按块处理，原始 bundle 不落盘：
+
+- 压缩：数据切成固定大小的块，在线程池中并行压缩（zlib 压缩时释放 GIL），
+  每块是一个独立的 gzip 成员，按原顺序拼接后仍是标准 gzip 文件，
+  可以直接用 gunzip/zcat 解压
+- 加密：每块再用 AES-256-GCM 单独加密（与压缩在同一个任务中并行），
+  nonce 由文件随机前缀 + 块序号组成，文件末尾是一个带结束标记的空块，
+  块被调换、删除或文件被截断都会在解密时发现
+
+加密文件格式：MAGIC + 7 字节 nonce 前缀，随后每块为 4 字节大端长度 + 密文
+"""
+
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Deque, Iterable, Iterator, Optional
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
+    InvalidTag = ValueError
+
+# 压缩块大小
+BLOCK_SIZE = 4 * 1024 * 1024
+
+COMPRESSIONS = ('none', 'gzip')
+
+MAGIC = b'GMBAENC1'
+NONCE_PREFIX_SIZE = 7
+KEY_SIZE = 32
+TAG_SIZE = 16
+FRAME_HEADER = struct.Struct('>I')
+
+
+def archive_suffix(compression: str, encrypted: bool) -> str:
+    """归档文件在 .bundle 之后追加的后缀（如 .gz、.gz.enc）"""
+    suffix = '.gz' if compression == 'gzip' else ''
+    return suffix + ('.enc' if encrypted else '')
+
+
+def load_key(key_file: str) -> bytes:
+    """
+    读取加密密钥文件（64 位十六进制，或 32 字节原始数据）
+
+    可以用 openssl rand -hex 32 > archive.key 生成
+
+    Raises:
+        ValueError: 密钥格式不正确
+    """
+    data = Path(key_file).read_bytes()
+    text = data.strip()
+    if len(text) == KEY_SIZE * 2:
+        try:
+            return bytes.fromhex(text.decode('ascii'))
+        except (UnicodeDecodeError, ValueError):
+            pass
+    if len(data) == KEY_SIZE:
+        return data
+    raise ValueError(f"密钥文件应为 64 位十六进制或 32 字节: {key_file}")
+
+
+def _require_aesgcm():
+    if AESGCM is None:
+        raise RuntimeError("归档加密需要 cryptography 库: pip install cryptography")
+
+
+def _nonce(prefix: bytes, index: int, final: bool) -> bytes:
+    return prefix + struct.pack('>I?', index, final)
+
+
+class ArchiveEncoder:
+    """
+    流式归档编码器：喂入原始数据，按顺序产出压缩/加密后的数据
+
+    同时在途的块数不超过 workers 的两倍，内存占用与归档大小无关
+    """
+
+    def __init__(
+        self,
+        compression: str = 'gzip',
+        level: int = 6,
+        workers: int = 0,
+        key: Optional[bytes] = None,
+        block_size: int = BLOCK_SIZE,
+    ):
+        """
+        Args:
+            compression: 压缩方式 none/gzip
+            level: gzip 压缩级别 1-9
+            workers: 并行线程数，0 表示 CPU 核数
+            key: 32 字节 AES 密钥，None 表示不加密
+            block_size: 块大小
+        """
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"未知的归档压缩方式: {compression}")
+        if key is not None:
+            _require_aesgcm()
+            if len(key) != KEY_SIZE:
+                raise ValueError("归档加密密钥必须为 32 字节")
+        self.compression = compression
+        self.level = min(9, max(1, int(level)))
+        self.workers = int(workers) or os.cpu_count() or 1
+        self.block_size = block_size
+        self.aead = AESGCM(key) if key is not None else None
+        self.prefix = os.urandom(NONCE_PREFIX_SIZE)
+        self.header = MAGIC + self.prefix
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self._buffer = bytearray()
+        self._index = 0
+        self._started = False
+        self._pending: Deque[Future] = deque()
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix='archive-codec'
+        )
+
+    @property
+    def suffix(self) -> str:
+        return archive_suffix(self.compression, self.aead is not None)
+
+    def _encode(self, index: int, data: bytes, final: bool = False) -> bytes:
+        if self.compression == 'gzip' and data:
+            # wbits=31: 带 gzip 头和尾的完整成员
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+            data = compressor.compress(data) + compressor.flush()
+        if self.aead is None:
+            return data
+        sealed = self.aead.encrypt(
+            _nonce(self.prefix, index, final), data, self.header
+        )
+        return FRAME_HEADER.pack(len(sealed)) + sealed
+
+    def _submit(self, data: bytes):
+        self._pending.append(self._pool.submit(self._encode, self._index, data))
+        self._index += 1
+
+    def _emit(self, data: bytes) -> bytes:
+        if not self._started:
+            self._started = True
+            if self.aead is not None:
+                data = self.header + data
+        self.stored_bytes += len(data)
+        return data
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        """喂入原始数据，产出已按顺序完成的编码数据"""
+        self.raw_bytes += len(data)
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            self._submit(bytes(self._buffer[: self.block_size]))
+            del self._buffer[: self.block_size]
+        while self._pending and (
+            len(self._pending) >= self.workers * 2 or self._pending[0].done()
+        ):
+            yield self._emit(self._pending.popleft().result())
+
+    def finish(self) -> Iterator[bytes]:
+        """刷出剩余数据（加密时追加结束块）"""
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            yield self._emit(self._pending.popleft().result())
+        if self.aead is not None:
+            yield self._emit(self._encode(self._index, b'', final=True))
+        self.close()
+
+    def close(self):
+        """释放线程池（中途失败时取消未开始的块）"""
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._pool.shutdown(wait=True)
+
+
+def _read_exact(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("归档文件不完整（被截断）")
+    return data
+
+
+def _decrypt_frames(f: BinaryIO, key: Optional[bytes]) -> Iterator[bytes]:
+    if key is None:
+        raise ValueError("归档已加密，需要配置密钥（archive.encryption_key_file）")
+    _require_aesgcm()
+    header = _read_exact(f, len(MAGIC) + NONCE_PREFIX_SIZE)
+    if not header.startswith(MAGIC):
+        raise ValueError("不是加密归档文件")
+    aead = AESGCM(key)
+    prefix = header[len(MAGIC):]
+    index = 0
+    while True:
+        length = f.read(FRAME_HEADER.size)
+        if not length:
+            raise ValueError("归档文件不完整（缺少结束块）")
+        if len(length) != FRAME_HEADER.size:
+            raise ValueError("归档文件不完整（被截断）")
+        sealed = _read_exact(f, FRAME_HEADER.unpack(length)[0])
+        # 数据块不为空，只有结束块的密文只包含 16 字节认证标签
+        final = len(sealed) == TAG_SIZE
+        try:
+            data = aead.decrypt(_nonce(prefix, index, final), sealed, header)
+        except InvalidTag:
+            raise ValueError(
+                f"归档第 {index} 块解密失败（密钥错误或数据被篡改）"
+            ) from None
+        if final:
+            if f.read(1):
+                raise ValueError("归档文件结束块之后还有数据")
+            return
+        index += 1
+        yield data
+
+
+def _gunzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """解压（可能由多个成员拼接的）gzip 数据流"""
+    decompressor = zlib.decompressobj(31)
+    partial = False
+    for chunk in chunks:
+        while chunk:
+            partial = True
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            if not decompressor.eof:
+                break
+            # 一个成员结束，剩余数据属于下一个成员
+            chunk = decompressor.unused_data
+            decompressor = zlib.decompressobj(31)
+            partial = False
+    if partial:
+        raise ValueError("gzip 数据不完整（被截断）")
+
+
+def _read_chunks(f: BinaryIO, chunk_size: int) -> Iterator[bytes]:
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_archive(
+    path: Path, key: Optional[bytes] = None, chunk_size: int = BLOCK_SIZE
+) -> Iterator[bytes]:
+    """
+    按文件后缀解密/解压归档，产出原始 bundle 数据
+
+    Args:
+        path: 归档文件（.bundle / .bundle.gz / .bundle.enc / .bundle.gz.enc）
+        key: 解密密钥
+        chunk_size: 读取块大小
+
+    Raises:
+        ValueError: 缺少密钥、文件被截断或校验失败
+    """
+    path = Path(path)
+    name = path.name
+    with open(path, 'rb') as f:
+        if name.endswith('.enc'):
+            chunks = _decrypt_frames(f, key)
+            name = name[: -len('.enc')]
+        else:
+            chunks = _read_chunks(f, chunk_size)
+        if name.endswith('.gz'):
+            chunks = _gunzip(chunks)
+        yield from chunks
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量提交计数模块
+保存上一次的引用表和提交总数，本次只遍历新增的提交范围：
+
+    新提交数 = 上次提交数 + rev-list --count (新 tips ^旧 tips)
+
+前提是旧 tips 仍然全部可达（没有提交丢失）；检测到回退、计数出错
+或到达定期校验时间时才执行完整的 rev-list --all --count
+"""
+
+import json
+import logging
+import os
+import subprocess
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE_NAME = ".commit_state"
+
+# git 执行函数: (参数列表, 标准输入) -> CompletedProcess
+GitRunner = Callable[[List[str], Optional[str]], subprocess.CompletedProcess]
+
+
+def command_git_runner(
+    prefix: List[str], env: Optional[Dict[str, str]] = None
+) -> GitRunner:
+    """
+    根据命令前缀构造 git 执行函数
+
+    Args:
+        prefix: 执行 git 的命令前缀，如
+            ['git', '-C', '/path/to/repo'] 或
+            ['docker', 'exec', '-i', '-u', 'git', 'gitea', 'git', '-C', '/data/...']
+        env: 额外的环境变量
+
+    Returns:
+        GitRunner
+    """
+    full_env = {**os.environ, **env} if env else None
+
+    def run(args: List[str], stdin: Optional[str] = None):
+        return subprocess.run(
+            list(prefix) + list(args),
+            input=stdin,
+            capture_output=True,
+            text=True,
+            check=False,
+            env=full_env,
+        )
+
+    return run
+
+
+def host_git_runner(
+    git_dir: Path, alternates: Optional[List[Path]] = None
+) -> GitRunner:
+    """
+    在宿主机上对快照目录执行 git（commit-graph 存在时自动使用）
+
+    Args:
+        git_dir: 仓库目录
+        alternates: 额外的对象目录（如另一个快照的 objects），
+            用于比较两个快照时同时访问两边的对象
+    """
+    env = None
+    if alternates:
+        env = {
+            'GIT_ALTERNATE_OBJECT_DIRECTORIES': os.pathsep.join(
+                str(Path(d).resolve()) for d in alternates
+            )
+        }
+    return command_git_runner(
+        [
+            'git',
+            '-c',
+            'safe.directory=*',
+            '-c',
+            'core.commitGraph=true',
+            '-C',
+            str(git_dir),
+        ],
+        env,
+    )
+
+
+class CommitCounter:
+    """增量提交计数器"""
+
+    def __init__(
+        self, repo_backup_dir: Path, run_git: GitRunner, full_recount_days: int = 30
+    ):
+        """
+        Args:
+            repo_backup_dir: 仓库备份目录 BACKUP_ROOT/{owner}/{repo}
+            run_git: git 执行函数
+            full_recount_days: 定期完整重新计数的间隔天数，0 表示不定期重算
+        """
+        self.path = Path(repo_backup_dir) / STATE_FILE_NAME
+        self.run_git = run_git
+        self.full_recount_days = max(0, int(full_recount_days or 0))
+        # 最近一次计数方式: unchanged / incremental / full
+        self.last_mode: Optional[str] = None
+
+    def load_state(self) -> Optional[Dict]:
+        """读取上一次的计数状态"""
+        if not self.path.exists():
+            return None
+        try:
+            state = json.loads(self.path.read_text(encoding='utf-8'))
+            if isinstance(state.get('refs'), dict) and 'count' in state:
+                return state
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取提交计数状态失败 {self.path}: {e}")
+        return None
+
+    def save_state(self, ref_map: Dict[str, str], count: int, full_count_at: float):
+        """保存计数状态（写临时文件后原子替换）"""
+        state = {
+            'refs': ref_map,
+            'count': count,
+            'full_count_at': full_count_at,
+            'updated_at': time.time(),
+        }
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        tmp.write_text(json.dumps(state, sort_keys=True), encoding='utf-8')
+        os.replace(tmp, self.path)
+
+    def count(self, ref_map: Dict[str, str]) -> Optional[int]:
+        """
+        计算仓库当前的提交总数
+
+        Args:
+            ref_map: 当前引用表 {引用名: 对象 ID}
+
+        Returns:
+            提交总数，git 执行失败时返回 None
+        """
+        state = self.load_state()
+        now = time.time()
+
+        if state is None:
+            return self._full_count(ref_map, now, reason="首次计数")
+
+        if self.full_recount_days and (
+            now - float(state.get('full_count_at', 0))
+            >= self.full_recount_days * 86400
+        ):
+            count = self._full_count(ref_map, now, reason="定期校验")
+            if count is not None and state['refs'] == ref_map:
+                if count != state['count']:
+                    logger.warning(
+                        f"    增量提交计数偏差: 记录 {state['count']}，实际 {count}"
+                    )
+            return count
+
+        old_tips = set(state['refs'].values())
+        new_tips = set(ref_map.values())
+
+        if old_tips == new_tips:
+            self.last_mode = 'unchanged'
+            if state['refs'] != ref_map:
+                self.save_state(ref_map, state['count'], state['full_count_at'])
+            return state['count']
+
+        # 旧 tips 中有提交不再可达（强制推送、删除分支），或旧对象已被清理
+        lost = self._rev_list_count(old_tips, new_tips)
+        if lost is None or lost > 0:
+            return self._full_count(ref_map, now, reason="检测到引用回退")
+
+        added = self._rev_list_count(new_tips, old_tips)
+        if added is None:
+            return self._full_count(ref_map, now, reason="增量计数失败")
+
+        count = int(state['count']) + added
+        self.last_mode = 'incremental'
+        self.save_state(ref_map, count, state['full_count_at'])
+        return count
+
+    def _rev_list_count(self, include, exclude) -> Optional[int]:
+        """统计从 include 可达但从 exclude 不可达的提交数"""
+        if not include:
+            return 0
+        revs = sorted(include) + ['^' + oid for oid in sorted(exclude)]
+        result = self.run_git(
+            ['rev-list', '--count', '--stdin'], "\n".join(revs) + "\n"
+        )
+        if result.returncode != 0:
+            logger.debug(f"rev-list --stdin 失败: {result.stderr.strip()}")
+            return None
+        try:
+            return int(result.stdout.strip())
+        except ValueError:
+            return None
+
+    def _full_count(
+        self, ref_map: Dict[str, str], now: float, reason: str
+    ) -> Optional[int]:
+        """完整遍历所有引用计数"""
+        logger.info(f"    完整计算提交数（{reason}）")
+        result = self.run_git(['rev-list', '--all', '--count'], None)
+        if result.returncode != 0:
+            logger.warning(f"    无法获取提交数: {result.stderr.strip()}")
+            return None
+        try:
+            count = int(result.stdout.strip())
+        except ValueError:
+            return None
+        self.last_mode = 'full'
+        self.save_state(ref_map, count, now)
+        return count
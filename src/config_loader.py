@@ -36,12 +36,110 @@ class ConfigLoader:
                 'snapshots_days': 30,
                 'archives_months': 12,
                 'reports_days': 30,
+                'gfs': {
+                    'enabled': False,
+                    'keep_daily': 7,
+                    'keep_weekly': 4,
+                    'keep_monthly': 12,
+                    'keep_yearly': 0,
+                    'keep_within_days': 0,
+                    'dry_run': False,
+                },
             },
         },
+        'archive': {
+            'checksum': 'sha256',
+            'schedule': 'staggered',
+            'max_mb_per_run': 0,
+            'source': 'snapshot',
+            'compression': 'none',
+            'compression_level': 6,
+            'workers': 0,
+            'encryption_key_file': '',
+        },
+        'trash': {
+            'enabled': True,
+            'workers': 2,
+            'max_unlinks_per_second': 0,
+            'drain_timeout': 600,
+        },
+        'dedup': {
+            'enabled': False,
+            'min_size': 0,
+        },
+        'verify': {
+            'manifests': True,
+            'enabled': False,
+            'sample_percent': 10,
+            'workers': 2,
+            'max_mb_per_second': 0,
+        },
+        'restore_drill': {
+            'enabled': False,
+            'sample_size': 5,
+            'workers': 2,
+            'mode': 'hardlink',
+            'scratch_dir': '',
+        },
+        'restore': {
+            'workers': 4,
+            'mode': 'hardlink',
+            'owner': '',
+        },
+        'ref_index': {
+            'enabled': True,
+        },
+        'replication': {
+            'enabled': False,
+            'target': '',
+            'endpoint_url': '',
+            'access_key': '',
+            'secret_key': '',
+            'region': '',
+            'workers': 4,
+            'part_size_mb': 64,
+            'max_mb_per_second': 0,
+        },
+        'small_repos': {
+            'enabled': False,
+            'max_size_kb': 1024,
+        },
+        'tiering': {
+            'enabled': False,
+            'cold_after_days': 30,
+            'cold_root': '',
+            'max_per_run': 0,
+        },
+        'lfs': {
+            'enabled': False,
+            'path': 'git/lfs',
+            'workers': 4,
+        },
+        'inventory': {
+            'provider': 'exec',
+            'sqlite_path': 'gitea/gitea.db',
+            'skip_unchanged': False,
+            'api_url': '',
+            'api_token': '',
+            'api_page_size': 50,
+            'api_workers': 4,
+        },
+        'tracking': {
+            'incremental_commit_count': True,
+            'full_recount_days': 30,
+        },
         'alerts': {
             'commit_decrease_threshold': 10,
             'size_decrease_threshold': 30,
             'protect_abnormal_snapshots': True,
+            'detect_ref_rewrites': True,
+            'ref_rewrite_ignore': ['refs/pull/*'],
+            'fleet_scoring': {
+                'enabled': True,
+                'window_days': 30,
+                'min_history': 5,
+                'threshold': 3.5,
+            },
         },
         'logging': {
             'file': '/var/log/gitea-mirror-backup.log',
@@ -73,9 +171,64 @@ class ConfigLoader:
         'SNAPSHOT_RETENTION_DAYS': 'backup.retention.snapshots_days',
         'ARCHIVE_RETENTION_MONTHS': 'backup.retention.archives_months',
         'REPORT_RETENTION_DAYS': 'backup.retention.reports_days',
+        'RETENTION_GFS_ENABLED': 'backup.retention.gfs.enabled',
+        'RETENTION_GFS_DRY_RUN': 'backup.retention.gfs.dry_run',
+        'ARCHIVE_CHECKSUM': 'archive.checksum',
+        'ARCHIVE_SCHEDULE': 'archive.schedule',
+        'ARCHIVE_MAX_MB_PER_RUN': 'archive.max_mb_per_run',
+        'ARCHIVE_SOURCE': 'archive.source',
+        'ARCHIVE_COMPRESSION': 'archive.compression',
+        'ARCHIVE_COMPRESSION_LEVEL': 'archive.compression_level',
+        'ARCHIVE_WORKERS': 'archive.workers',
+        'ARCHIVE_ENCRYPTION_KEY_FILE': 'archive.encryption_key_file',
+        'TRASH_ENABLED': 'trash.enabled',
+        'TRASH_WORKERS': 'trash.workers',
+        'TRASH_MAX_UNLINKS_PER_SECOND': 'trash.max_unlinks_per_second',
+        'TRASH_DRAIN_TIMEOUT': 'trash.drain_timeout',
+        'DEDUP_ENABLED': 'dedup.enabled',
+        'VERIFY_MANIFESTS': 'verify.manifests',
+        'VERIFY_ENABLED': 'verify.enabled',
+        'VERIFY_SAMPLE_PERCENT': 'verify.sample_percent',
+        'VERIFY_MAX_MB_PER_SECOND': 'verify.max_mb_per_second',
+        'RESTORE_DRILL_ENABLED': 'restore_drill.enabled',
+        'RESTORE_DRILL_SAMPLE_SIZE': 'restore_drill.sample_size',
+        'RESTORE_WORKERS': 'restore.workers',
+        'RESTORE_MODE': 'restore.mode',
+        'RESTORE_OWNER': 'restore.owner',
+        'REF_INDEX_ENABLED': 'ref_index.enabled',
+        'REPLICATION_ENABLED': 'replication.enabled',
+        'REPLICATION_TARGET': 'replication.target',
+        'REPLICATION_ENDPOINT_URL': 'replication.endpoint_url',
+        'REPLICATION_ACCESS_KEY': 'replication.access_key',
+        'REPLICATION_SECRET_KEY': 'replication.secret_key',
+        'REPLICATION_REGION': 'replication.region',
+        'REPLICATION_WORKERS': 'replication.workers',
+        'REPLICATION_MAX_MB_PER_SECOND': 'replication.max_mb_per_second',
+        'SMALL_REPOS_ENABLED': 'small_repos.enabled',
+        'SMALL_REPOS_MAX_SIZE_KB': 'small_repos.max_size_kb',
+        'TIERING_ENABLED': 'tiering.enabled',
+        'TIERING_COLD_AFTER_DAYS': 'tiering.cold_after_days',
+        'TIERING_COLD_ROOT': 'tiering.cold_root',
+        'TIERING_MAX_PER_RUN': 'tiering.max_per_run',
+        'LFS_ENABLED': 'lfs.enabled',
+        'LFS_PATH': 'lfs.path',
+        'LFS_WORKERS': 'lfs.workers',
+        'INVENTORY_PROVIDER': 'inventory.provider',
+        'INVENTORY_SQLITE_PATH': 'inventory.sqlite_path',
+        'INVENTORY_SKIP_UNCHANGED': 'inventory.skip_unchanged',
+        'INVENTORY_API_URL': 'inventory.api_url',
+        'INVENTORY_API_TOKEN': 'inventory.api_token',
+        'INVENTORY_API_PAGE_SIZE': 'inventory.api_page_size',
+        'INVENTORY_API_WORKERS': 'inventory.api_workers',
+        'TRACKING_INCREMENTAL_COMMIT_COUNT': 'tracking.incremental_commit_count',
+        'TRACKING_FULL_RECOUNT_DAYS': 'tracking.full_recount_days',
         'COMMIT_DECREASE_THRESHOLD': 'alerts.commit_decrease_threshold',
         'SIZE_DECREASE_THRESHOLD': 'alerts.size_decrease_threshold',
         'PROTECT_ABNORMAL_SNAPSHOTS': 'alerts.protect_abnormal_snapshots',
+        'ALERTS_DETECT_REF_REWRITES': 'alerts.detect_ref_rewrites',
+        'ALERTS_REF_REWRITE_IGNORE': 'alerts.ref_rewrite_ignore',  # 逗号分隔
+        'ALERTS_FLEET_SCORING_ENABLED': 'alerts.fleet_scoring.enabled',
+        'ALERTS_FLEET_SCORING_THRESHOLD': 'alerts.fleet_scoring.threshold',
         'LOG_FILE': 'logging.file',
         'LOG_LEVEL': 'logging.level',
         # 通知配置 - 企业微信
@@ -369,6 +522,46 @@ class Config:
     def REPORT_RETENTION_DAYS(self) -> int:
         return self.get_loader().get('backup.retention.reports_days')
 
+    @property
+    def ARCHIVE_CHECKSUM(self) -> str:
+        return self.get_loader().get('archive.checksum', '')
+
+    @property
+    def ARCHIVE_SCHEDULE(self) -> str:
+        return self.get_loader().get('archive.schedule', 'staggered')
+
+    @property
+    def ARCHIVE_MAX_MB_PER_RUN(self) -> int:
+        return self.get_loader().get('archive.max_mb_per_run', 0)
+
+    @property
+    def ARCHIVE_SOURCE(self) -> str:
+        return self.get_loader().get('archive.source', 'snapshot')
+
+    @property
+    def TRASH_ENABLED(self) -> bool:
+        return self.get_loader().get('trash.enabled', True)
+
+    @property
+    def TRASH_WORKERS(self) -> int:
+        return self.get_loader().get('trash.workers', 2)
+
+    @property
+    def TRASH_MAX_UNLINKS_PER_SECOND(self) -> int:
+        return self.get_loader().get('trash.max_unlinks_per_second', 0)
+
+    @property
+    def TRASH_DRAIN_TIMEOUT(self) -> int:
+        return self.get_loader().get('trash.drain_timeout', 600)
+
+    @property
+    def TRACKING_INCREMENTAL_COMMIT_COUNT(self) -> bool:
+        return self.get_loader().get('tracking.incremental_commit_count', True)
+
+    @property
+    def TRACKING_FULL_RECOUNT_DAYS(self) -> int:
+        return self.get_loader().get('tracking.full_recount_days', 30)
+
     @property
     def COMMIT_DECREASE_THRESHOLD(self) -> int:
         return self.get_loader().get('alerts.commit_decrease_threshold')
@@ -381,6 +574,14 @@ class Config:
     def PROTECT_ABNORMAL_SNAPSHOTS(self) -> bool:
         return self.get_loader().get('alerts.protect_abnormal_snapshots')
 
+    @property
+    def ALERTS_DETECT_REF_REWRITES(self) -> bool:
+        return self.get_loader().get('alerts.detect_ref_rewrites', True)
+
+    @property
+    def ALERTS_REF_REWRITE_IGNORE(self) -> List[str]:
+        return self.get_loader().get('alerts.ref_rewrite_ignore', ['refs/pull/*'])
+
     @property
     def LOG_FILE(self) -> str:
         return self.get_loader().get('logging.file')
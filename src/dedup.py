@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跨仓库去重模块
+fork 和重复镜像在不同仓库下存在相同的 pack 文件和松散对象。
+去重遍历整个备份根目录中快照里的不可变文件（objects/pack/*.pack、*.idx、
+松散对象），按内容哈希把重复文件替换为指向同一份数据的硬链接。
+
+哈希结果按 (设备, inode) 持久化在 sqlite 索引中，文件大小和 mtime 不变时
+直接复用，每次运行只需要哈希新出现的文件
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE_NAME = ".dedup_index.db"
+
+# 松散对象: objects/ab/cdef...
+LOOSE_OBJECT_DIR = re.compile(r'^[0-9a-f]{2}$')
+PACK_SUFFIXES = ('.pack', '.idx')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (dev, ino)
+);
+CREATE TABLE IF NOT EXISTS canonical (
+    sha256 TEXT PRIMARY KEY,
+    path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    time REAL NOT NULL,
+    files INTEGER NOT NULL,
+    hashed INTEGER NOT NULL,
+    relinked INTEGER NOT NULL,
+    reclaimed_bytes INTEGER NOT NULL,
+    elapsed REAL NOT NULL
+);
+"""
+
+
+def hash_file(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """计算文件 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_immutable_files(backup_root: Path) -> Iterator[Path]:
+    """遍历备份根目录下所有快照中的 pack 文件和松散对象"""
+    backup_root = Path(backup_root)
+    for owner_dir in sorted(backup_root.iterdir()):
+        if not owner_dir.is_dir() or owner_dir.name.startswith('.'):
+            continue
+        for snapshot_dir in sorted(owner_dir.glob('*/snapshots/*')):
+            objects_dir = snapshot_dir / "objects"
+            if not objects_dir.is_dir():
+                continue
+            for entry in sorted(objects_dir.iterdir()):
+                if entry.name == 'pack':
+                    for path in sorted(entry.iterdir()):
+                        if path.suffix in PACK_SUFFIXES and path.is_file():
+                            yield path
+                elif LOOSE_OBJECT_DIR.match(entry.name) and entry.is_dir():
+                    for path in sorted(entry.iterdir()):
+                        if path.is_file():
+                            yield path
+
+
+class Deduplicator:
+    """跨仓库硬链接去重"""
+
+    def __init__(self, backup_root: Path, min_size: int = 1):
+        """
+        Args:
+            backup_root: 备份根目录
+            min_size: 小于该大小（字节）的文件不参与去重
+        """
+        self.backup_root = Path(backup_root)
+        self.index_path = self.backup_root / INDEX_FILE_NAME
+        self.min_size = max(0, int(min_size or 0))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.index_path))
+        conn.executescript(SCHEMA)
+        return conn
+
+    def run(self) -> Dict[str, int]:
+        """
+        执行一次去重
+
+        Returns:
+            {'files', 'hashed', 'relinked', 'reclaimed_bytes'}
+        """
+        stats = {'files': 0, 'hashed': 0, 'relinked': 0, 'reclaimed_bytes': 0}
+        if not self.backup_root.exists():
+            return stats
+
+        started = time.monotonic()
+        conn = self._connect()
+        try:
+            known = {
+                (dev, ino): (size, mtime_ns, sha)
+                for dev, ino, size, mtime_ns, sha in conn.execute(
+                    "SELECT dev, ino, size, mtime_ns, sha256 FROM files"
+                )
+            }
+            canonical = dict(conn.execute("SELECT sha256, path FROM canonical"))
+            seen = set()
+
+            for path in iter_immutable_files(self.backup_root):
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                if st.st_size < self.min_size:
+                    continue
+                stats['files'] += 1
+
+                key = (st.st_dev, st.st_ino)
+                seen.add(key)
+                cached = known.get(key)
+                if cached and cached[:2] == (st.st_size, st.st_mtime_ns):
+                    sha = cached[2]
+                else:
+                    try:
+                        sha = hash_file(path)
+                    except OSError as e:
+                        logger.warning(f"哈希文件失败 {path}: {e}")
+                        continue
+                    stats['hashed'] += 1
+                    known[key] = (st.st_size, st.st_mtime_ns, sha)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                        (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, sha),
+                    )
+
+                target = self._canonical_stat(canonical.get(sha), sha, known)
+                if target is None:
+                    canonical[sha] = str(path)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO canonical VALUES (?, ?)",
+                        (sha, str(path)),
+                    )
+                    continue
+                if (target.st_dev, target.st_ino) == key:
+                    continue
+                if target.st_dev != st.st_dev:
+                    continue
+
+                if self._relink(Path(canonical[sha]), path):
+                    stats['relinked'] += 1
+                    # 最后一个链接被替换时才真正释放空间
+                    if st.st_nlink == 1:
+                        stats['reclaimed_bytes'] += st.st_size
+
+            # 清理已不存在的 inode
+            stale = [key for key in known if key not in seen]
+            conn.executemany("DELETE FROM files WHERE dev = ? AND ino = ?", stale)
+
+            elapsed = time.monotonic() - started
+            conn.execute(
+                "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    time.time(),
+                    stats['files'],
+                    stats['hashed'],
+                    stats['relinked'],
+                    stats['reclaimed_bytes'],
+                    elapsed,
+                ),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        return stats
+
+    @staticmethod
+    def _canonical_stat(
+        path: Optional[str], sha: str, known: Dict
+    ) -> Optional[os.stat_result]:
+        """返回规范副本的 stat；规范副本已删除或内容已变化时返回 None"""
+        if not path:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        cached = known.get((st.st_dev, st.st_ino))
+        if not cached or cached != (st.st_size, st.st_mtime_ns, sha):
+            return None
+        return st
+
+    @staticmethod
+    def _relink(source: Path, dest: Path) -> bool:
+        """用指向 source 的硬链接原子替换 dest"""
+        tmp = dest.with_name(f".{dest.name}.dedup-tmp")
+        try:
+            if tmp.exists():
+                tmp.unlink()
+            os.link(source, tmp)
+            os.replace(tmp, dest)
+            return True
+        except OSError as e:
+            logger.warning(f"替换硬链接失败 {dest}: {e}")
+            if tmp.exists():
+                tmp.unlink()
+            return False
+
+    def last_run(self) -> Optional[Dict]:
+        """读取最近一次去重的统计"""
+        if not self.index_path.exists():
+            return None
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT time, files, hashed, relinked, reclaimed_bytes, elapsed "
+                "FROM runs ORDER BY time DESC LIMIT 1"
+            ).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        keys = ('time', 'files', 'hashed', 'relinked', 'reclaimed_bytes', 'elapsed')
+        return dict(zip(keys, row))
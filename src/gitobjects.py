@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Git 对象读取模块
+直接读取裸仓库（快照）的 pack 文件和松散对象，不需要启动 git 进程：
+
+- pack 索引（.idx v2）和 pack 文件通过 mmap 访问，按 fanout 表二分查找对象
+- 打开的 pack 放在 LRU 缓存中，浏览多个路径时不重复打开和解析索引
+- 支持 OFS_DELTA / REF_DELTA，解析出的 delta 基对象按字节数做 LRU 缓存
+"""
+
+import logging
+import mmap
+import re
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from src.refs import read_ref_map
+
+logger = logging.getLogger(__name__)
+
+OBJ_COMMIT = 1
+OBJ_TREE = 2
+OBJ_BLOB = 3
+OBJ_TAG = 4
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+
+TYPE_NAMES = {OBJ_COMMIT: 'commit', OBJ_TREE: 'tree', OBJ_BLOB: 'blob', OBJ_TAG: 'tag'}
+
+IDX_MAGIC = b'\377tOc'
+SHA_RE = re.compile(r'^[0-9a-f]{40}$')
+
+
+class TreeEntry(NamedTuple):
+    """树对象中的一项"""
+
+    mode: str
+    name: str
+    sha: str
+
+    @property
+    def type(self) -> str:
+        if self.mode == '40000':
+            return 'tree'
+        if self.mode == '160000':
+            return 'commit'  # 子模块
+        return 'blob'
+
+
+def _inflate(buf, pos: int, size: int) -> bytes:
+    """从 pos 开始解压一个 zlib 流（解压后长度应为 size）"""
+    decompressor = zlib.decompressobj()
+    parts = []
+    chunk_size = size + 1024
+    while not decompressor.eof:
+        chunk = buf[pos : pos + chunk_size]
+        if not chunk:
+            raise ValueError("zlib 数据不完整")
+        pos += len(chunk)
+        parts.append(decompressor.decompress(chunk))
+        chunk_size = 64 * 1024
+    data = b''.join(parts)
+    if len(data) != size:
+        raise ValueError(f"对象大小不一致: {len(data)} != {size}")
+    return data
+
+
+def _delta_varint(delta: bytes, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        c = delta[pos]
+        pos += 1
+        result |= (c & 0x7F) << shift
+        shift += 7
+        if not c & 0x80:
+            return result, pos
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    """应用 git delta（复制/插入指令）"""
+    src_size, pos = _delta_varint(delta, 0)
+    dst_size, pos = _delta_varint(delta, pos)
+    if src_size != len(base):
+        raise ValueError("delta 基对象大小不一致")
+
+    out = bytearray()
+    while pos < len(delta):
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            offset = size = 0
+            for i in range(4):
+                if op & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if op & (0x10 << i):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+            out += base[offset : offset + (size or 0x10000)]
+        elif op:
+            out += delta[pos : pos + op]
+            pos += op
+        else:
+            raise ValueError("无效的 delta 指令")
+
+    if len(out) != dst_size:
+        raise ValueError("delta 结果大小不一致")
+    return bytes(out)
+
+
+class PackIndex:
+    """pack 索引（.idx v2），通过 mmap 访问"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:4] != IDX_MAGIC or struct.unpack_from('>I', self._map, 4)[0] != 2:
+            self._map.close()
+            raise ValueError(f"不支持的 pack 索引格式: {self.path}")
+
+        self.count = self._fanout(255)
+        self._names = 8 + 256 * 4
+        self._offsets = self._names + self.count * 24  # SHA-1 表 + CRC 表
+        self._large_offsets = self._offsets + self.count * 4
+
+    def _fanout(self, i: int) -> int:
+        return struct.unpack_from('>I', self._map, 8 + i * 4)[0]
+
+    def find(self, binsha: bytes) -> Optional[int]:
+        """查找对象在 pack 中的偏移，不存在时返回 None"""
+        first = binsha[0]
+        lo = self._fanout(first - 1) if first else 0
+        hi = self._fanout(first)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self._names + mid * 20
+            current = self._map[start : start + 20]
+            if current < binsha:
+                lo = mid + 1
+            elif current > binsha:
+                hi = mid
+            else:
+                return self._offset_at(mid)
+        return None
+
+    def _offset_at(self, i: int) -> int:
+        offset = struct.unpack_from('>I', self._map, self._offsets + i * 4)[0]
+        if offset & 0x80000000:
+            index = offset & 0x7FFFFFFF
+            position = self._large_offsets + index * 8
+            offset = struct.unpack_from('>Q', self._map, position)[0]
+        return offset
+
+    def close(self):
+        self._map.close()
+
+
+class Pack:
+    """一个 pack 文件及其索引"""
+
+    def __init__(self, pack_path: Path):
+        self.path = Path(pack_path)
+        self.index = PackIndex(self.path.with_suffix('.idx'))
+        try:
+            with open(self.path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.index.close()
+            raise
+
+    def header(self, offset: int) -> Tuple[int, int, int]:
+        """解析对象头，返回 (类型, 大小, 数据起始位置)"""
+        c = self._map[offset]
+        obj_type = (c >> 4) & 7
+        size = c & 0x0F
+        shift = 4
+        pos = offset + 1
+        while c & 0x80:
+            c = self._map[pos]
+            pos += 1
+            size |= (c & 0x7F) << shift
+            shift += 7
+        return obj_type, size, pos
+
+    def ofs_delta_base(self, offset: int, pos: int) -> Tuple[int, int]:
+        """解析 OFS_DELTA 的基对象偏移，返回 (基对象偏移, 数据起始位置)"""
+        c = self._map[pos]
+        pos += 1
+        distance = c & 0x7F
+        while c & 0x80:
+            c = self._map[pos]
+            pos += 1
+            distance = ((distance + 1) << 7) | (c & 0x7F)
+        return offset - distance, pos
+
+    def inflate(self, pos: int, size: int) -> bytes:
+        return _inflate(self._map, pos, size)
+
+    def sha_at(self, pos: int) -> bytes:
+        return self._map[pos : pos + 20]
+
+    def close(self):
+        self._map.close()
+        self.index.close()
+
+
+class PackCache:
+    """
+    打开的 pack 的 LRU 缓存（多个仓库、多个请求共享）
+
+    Args:
+        max_open: 同时保持打开的 pack 数
+        max_base_bytes: delta 基对象缓存的字节数上限
+    """
+
+    def __init__(self, max_open: int = 64, max_base_bytes: int = 32 * 1024 * 1024):
+        self.max_open = max(1, int(max_open))
+        self.max_base_bytes = max_base_bytes
+        self.lock = threading.RLock()
+        self._packs: 'OrderedDict[Path, Pack]' = OrderedDict()
+        self._bases: 'OrderedDict[Tuple[Path, int], Tuple[int, bytes]]' = OrderedDict()
+        self._base_bytes = 0
+        self.opened = 0
+
+    def get(self, pack_path: Path) -> Pack:
+        """取出已打开的 pack（不存在时打开并淘汰最久未使用的）"""
+        with self.lock:
+            pack = self._packs.get(pack_path)
+            if pack is not None:
+                self._packs.move_to_end(pack_path)
+                return pack
+            pack = Pack(pack_path)
+            self.opened += 1
+            self._packs[pack_path] = pack
+            while len(self._packs) > self.max_open:
+                old_path, old = self._packs.popitem(last=False)
+                self._drop_bases(old_path)
+                old.close()
+            return pack
+
+    def get_base(self, key: Tuple[Path, int]) -> Optional[Tuple[int, bytes]]:
+        with self.lock:
+            value = self._bases.get(key)
+            if value is not None:
+                self._bases.move_to_end(key)
+            return value
+
+    def put_base(self, key: Tuple[Path, int], value: Tuple[int, bytes]):
+        size = len(value[1])
+        if size > self.max_base_bytes // 4:
+            return
+        with self.lock:
+            if key in self._bases:
+                return
+            self._bases[key] = value
+            self._base_bytes += size
+            while self._base_bytes > self.max_base_bytes:
+                _, (_, data) = self._bases.popitem(last=False)
+                self._base_bytes -= len(data)
+
+    def _drop_bases(self, pack_path: Path):
+        for key in [k for k in self._bases if k[0] == pack_path]:
+            self._base_bytes -= len(self._bases.pop(key)[1])
+
+    def close(self):
+        with self.lock:
+            for pack in self._packs.values():
+                pack.close()
+            self._packs.clear()
+            self._bases.clear()
+            self._base_bytes = 0
+
+
+class ObjectStore:
+    """裸仓库（快照）的对象读取"""
+
+    def __init__(self, git_dir: Path, cache: Optional[PackCache] = None):
+        """
+        Args:
+            git_dir: 裸仓库目录
+            cache: 共享的 pack 缓存（None 时使用私有缓存）
+        """
+        self.git_dir = Path(git_dir)
+        self.cache = cache or PackCache()
+        self.object_dirs = [self.git_dir / "objects"]
+        alternates = self.git_dir / "objects" / "info" / "alternates"
+        if alternates.exists():
+            for line in alternates.read_text().splitlines():
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    self.object_dirs.append((self.git_dir / "objects" / line).resolve())
+        self.pack_paths = [
+            idx.with_suffix('.pack')
+            for objects in self.object_dirs
+            for idx in sorted((objects / "pack").glob("*.idx"))
+            if idx.with_suffix('.pack').exists()
+        ]
+
+    def read(self, sha: str) -> Tuple[str, bytes]:
+        """
+        读取对象
+
+        Returns:
+            (类型名, 内容)
+
+        Raises:
+            KeyError: 对象不存在
+        """
+        obj_type, data = self._read_binsha(bytes.fromhex(sha))
+        return TYPE_NAMES[obj_type], data
+
+    def contains(self, sha: str) -> bool:
+        """对象是否存在（只查 pack 索引和松散对象路径，不解压）"""
+        binsha = bytes.fromhex(sha)
+        with self.cache.lock:
+            for pack_path in self.pack_paths:
+                if self.cache.get(pack_path).index.find(binsha) is not None:
+                    return True
+        return any(
+            (objects / sha[:2] / sha[2:]).exists() for objects in self.object_dirs
+        )
+
+    def _read_binsha(self, binsha: bytes) -> Tuple[int, bytes]:
+        with self.cache.lock:
+            for pack_path in self.pack_paths:
+                pack = self.cache.get(pack_path)
+                offset = pack.index.find(binsha)
+                if offset is not None:
+                    return self._read_packed(pack, offset)
+
+        sha = binsha.hex()
+        for objects in self.object_dirs:
+            path = objects / sha[:2] / sha[2:]
+            if path.exists():
+                raw = zlib.decompress(path.read_bytes())
+                header, _, data = raw.partition(b'\0')
+                type_name, _, size = header.decode('ascii').partition(' ')
+                if int(size) != len(data):
+                    raise ValueError(f"松散对象大小不一致: {sha}")
+                obj_type = {v: k for k, v in TYPE_NAMES.items()}[type_name]
+                return obj_type, data
+        raise KeyError(sha)
+
+    def _read_packed(self, pack: Pack, offset: int) -> Tuple[int, bytes]:
+        """读取 pack 中的对象，逐层展开 delta 链"""
+        chain = []
+        while True:
+            cached = self.cache.get_base((pack.path, offset))
+            if cached is not None:
+                obj_type, data = cached
+                break
+            obj_type, size, pos = pack.header(offset)
+            if obj_type == OBJ_OFS_DELTA:
+                base_offset, pos = pack.ofs_delta_base(offset, pos)
+                chain.append((pack, offset, pos, size))
+                offset = base_offset
+            elif obj_type == OBJ_REF_DELTA:
+                chain.append((pack, offset, pos + 20, size))
+                obj_type, data = self._read_binsha(pack.sha_at(pos))
+                break
+            else:
+                data = pack.inflate(pos, size)
+                self.cache.put_base((pack.path, offset), (obj_type, data))
+                break
+
+        for delta_pack, delta_offset, pos, size in reversed(chain):
+            data = apply_delta(data, delta_pack.inflate(pos, size))
+            self.cache.put_base((delta_pack.path, delta_offset), (obj_type, data))
+        return obj_type, data
+
+    # ---------- 引用与路径 ----------
+
+    def refs(self) -> Dict[str, str]:
+        """{引用名: 对象 ID}"""
+        return read_ref_map(self.git_dir)
+
+    def head(self) -> Optional[str]:
+        """HEAD 指向的引用名（分离 HEAD 时返回对象 ID）"""
+        try:
+            value = (self.git_dir / "HEAD").read_text().strip()
+        except OSError:
+            return None
+        return value[4:].strip() if value.startswith('ref:') else value
+
+    def resolve(self, rev: str = 'HEAD') -> str:
+        """
+        把 HEAD / 引用名 / 分支名 / 标签名 / 对象 ID 解析为提交 ID（剥离标签）
+
+        Raises:
+            KeyError: 无法解析
+        """
+        if rev == 'HEAD':
+            rev = self.head() or ''
+        if SHA_RE.match(rev):
+            sha = rev
+        else:
+            refs = self.refs()
+            for name in (rev, f"refs/heads/{rev}", f"refs/tags/{rev}"):
+                if name in refs:
+                    sha = refs[name]
+                    break
+            else:
+                raise KeyError(rev)
+
+        obj_type, data = self.read(sha)
+        while obj_type == 'tag':
+            sha = data.split(b'\n', 1)[0].split(b' ', 1)[1].decode('ascii')
+            obj_type, data = self.read(sha)
+        if obj_type != 'commit':
+            raise KeyError(rev)
+        return sha
+
+    def commit(self, sha: str) -> Dict:
+        """解析提交对象"""
+        obj_type, data = self.read(sha)
+        if obj_type != 'commit':
+            raise ValueError(f"不是提交对象: {sha}")
+        return parse_commit(data)
+
+    def tree(self, sha: str) -> List[TreeEntry]:
+        """解析树对象"""
+        obj_type, data = self.read(sha)
+        if obj_type != 'tree':
+            raise ValueError(f"不是树对象: {sha}")
+        return parse_tree(data)
+
+    def lookup(self, commit_sha: str, path: str = '') -> TreeEntry:
+        """
+        在提交中按路径查找对象（空路径返回根目录）
+
+        Raises:
+            KeyError: 路径不存在
+        """
+        entry = TreeEntry('40000', '', self.commit(commit_sha)['tree'])
+        for part in [p for p in path.strip('/').split('/') if p]:
+            if entry.type != 'tree':
+                raise KeyError(path)
+            entry = next((e for e in self.tree(entry.sha) if e.name == part), None)
+            if entry is None:
+                raise KeyError(path)
+        return entry
+
+
+def parse_tree(data: bytes) -> List[TreeEntry]:
+    """解析树对象内容"""
+    entries = []
+    pos = 0
+    while pos < len(data):
+        space = data.index(b' ', pos)
+        nul = data.index(b'\0', space)
+        mode = data[pos:space].decode('ascii')
+        name = data[space + 1 : nul].decode('utf-8', errors='replace')
+        sha = data[nul + 1 : nul + 21].hex()
+        entries.append(TreeEntry(mode, name, sha))
+        pos = nul + 21
+    return entries
+
+
+def parse_commit(data: bytes) -> Dict:
+    """解析提交对象内容"""
+    header, _, message = data.partition(b'\n\n')
+    commit = {'tree': '', 'parents': [], 'author': '', 'committer': ''}
+    for line in header.decode('utf-8', errors='replace').split('\n'):
+        key, _, value = line.partition(' ')
+        if key == 'tree':
+            commit['tree'] = value
+        elif key == 'parent':
+            commit['parents'].append(value)
+        elif key in ('author', 'committer'):
+            commit[key] = value
+    commit['message'] = message.decode('utf-8', errors='replace')
+    return commit
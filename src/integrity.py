@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+完整性校验模块
+
+- 清单：创建快照时为每个文件记录 SHA-256（.manifest），与上一次快照共享
+  inode 的文件（cp -al 硬链接）直接复用上次的哈希，只需哈希新数据。
+  快照与在线仓库共享 inode，只记录创建后不会被原地改写的文件
+- 校验：定期在进程池中重新哈希快照文件、冷层 bundle（.snapshot_meta 中的
+  cold_sha256）和归档（.bundle + .sha256），
+  每次按轮转游标抽检一部分（或全部），并限制读取速率
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from src.tiering import cold_bundle_path, read_snapshot_meta
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE_NAME = ".manifest"
+MANIFEST_HEADER = "# gitea-mirror-backup manifest v1 sha256\n"
+VERIFY_STATE_FILE_NAME = ".verify_state.json"
+VERIFY_RESULT_FILE_NAME = ".verify_result.json"
+
+# 清单只覆盖不会被原地改写的文件：对象只新增不修改，引用和 HEAD 通过锁文件
+# 重命名更新（在线仓库换成新 inode，快照中的硬链接不变）。FETCH_HEAD、logs/、
+# config、hooks/ 等会在在线仓库中原地改写，记录它们会在下次同步后误报损坏
+MANIFEST_DIRS = ('objects', 'refs')
+MANIFEST_FILES = ('HEAD', 'packed-refs')
+
+
+class ManifestEntry(NamedTuple):
+    """清单中的一个文件"""
+
+    sha256: str
+    size: int
+    mtime_ns: int
+    dev: int
+    ino: int
+    path: str
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """计算文件 SHA-256（进程池中执行，参数使用字符串便于序列化）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(snapshot_path: Path) -> List[ManifestEntry]:
+    """读取快照清单，不存在时返回空列表"""
+    manifest = Path(snapshot_path) / MANIFEST_FILE_NAME
+    if not manifest.exists():
+        return []
+    entries = []
+    with open(manifest, encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            parts = line.rstrip('\n').split(' ', 5)
+            if len(parts) != 6:
+                continue
+            sha, size, mtime_ns, dev, ino, path = parts
+            entries.append(
+                ManifestEntry(sha, int(size), int(mtime_ns), int(dev), int(ino), path)
+            )
+    return entries
+
+
+def is_manifest_path(rel: str) -> bool:
+    """快照内的相对路径是否应记录在清单中（见 MANIFEST_DIRS/MANIFEST_FILES）"""
+    top, sep, _ = rel.partition('/')
+    return top in MANIFEST_DIRS if sep else rel in MANIFEST_FILES
+
+
+def iter_snapshot_files(snapshot_path: Path):
+    """遍历快照中应记录在清单中的文件（objects/、refs/、HEAD、packed-refs）"""
+    snapshot_path = Path(snapshot_path)
+    for root, dirs, files in os.walk(snapshot_path):
+        top = Path(root) == snapshot_path
+        if top:
+            dirs[:] = [d for d in dirs if d in MANIFEST_DIRS]
+        dirs.sort()
+        for name in sorted(files):
+            if top and name not in MANIFEST_FILES:
+                continue
+            yield Path(root) / name
+
+
+def build_manifest(
+    snapshot_path: Path, previous_snapshot: Optional[Path] = None
+) -> Dict[str, int]:
+    """
+    为快照生成清单
+
+    Args:
+        snapshot_path: 快照目录
+        previous_snapshot: 上一次快照，其清单中 inode/大小/mtime 相同的文件直接复用哈希
+
+    Returns:
+        {'files', 'hashed', 'hashed_bytes', 'reused_bytes'}
+    """
+    snapshot_path = Path(snapshot_path)
+    cache: Dict[Tuple[int, int], ManifestEntry] = {}
+    if previous_snapshot:
+        for entry in read_manifest(previous_snapshot):
+            cache[(entry.dev, entry.ino)] = entry
+
+    stats = {'files': 0, 'hashed': 0, 'hashed_bytes': 0, 'reused_bytes': 0}
+    lines = [MANIFEST_HEADER]
+    for path in iter_snapshot_files(snapshot_path):
+        st = path.stat()
+        cached = cache.get((st.st_dev, st.st_ino))
+        if cached and (cached.size, cached.mtime_ns) == (st.st_size, st.st_mtime_ns):
+            sha = cached.sha256
+            stats['reused_bytes'] += st.st_size
+        else:
+            sha = hash_file(str(path))
+            stats['hashed'] += 1
+            stats['hashed_bytes'] += st.st_size
+        stats['files'] += 1
+        rel = path.relative_to(snapshot_path).as_posix()
+        lines.append(
+            f"{sha} {st.st_size} {st.st_mtime_ns} {st.st_dev} {st.st_ino} {rel}\n"
+        )
+
+    tmp = snapshot_path / f"{MANIFEST_FILE_NAME}.tmp"
+    tmp.write_text(''.join(lines), encoding='utf-8')
+    os.replace(tmp, snapshot_path / MANIFEST_FILE_NAME)
+    return stats
+
+
+def read_checksum_file(checksum_file: Path) -> Optional[str]:
+    """读取 sha256sum 格式的校验文件"""
+    try:
+        content = checksum_file.read_text().split()
+    except OSError:
+        return None
+    return content[0] if content else None
+
+
+class VerifyItem(NamedTuple):
+    """一个待校验的 inode 及引用它的所有路径"""
+
+    key: str
+    size: int
+    # [(路径, 期望的哈希, 所属仓库 owner/repo)]
+    expected: List[Tuple[str, str, str]]
+
+
+class Verifier:
+    """快照与归档的完整性校验"""
+
+    def __init__(
+        self,
+        backup_root: Path,
+        workers: int = 2,
+        sample_percent: float = 10,
+        max_mb_per_second: float = 0,
+    ):
+        """
+        Args:
+            backup_root: 备份根目录
+            workers: 进程池大小
+            sample_percent: 每次抽检的比例（按数据量），100 表示全部
+            max_mb_per_second: 读取速率上限（MB/s），0 表示不限制
+        """
+        self.backup_root = Path(backup_root)
+        self.workers = max(1, int(workers or 1))
+        self.sample_percent = min(100.0, max(0.0, float(sample_percent or 0)))
+        self.max_bytes_per_second = float(max_mb_per_second or 0) * 1024 * 1024
+        self.state_path = self.backup_root / VERIFY_STATE_FILE_NAME
+        self.result_path = self.backup_root / VERIFY_RESULT_FILE_NAME
+
+    def collect(self) -> List[VerifyItem]:
+        """
+        收集所有快照清单、冷层 bundle 和归档校验文件，按 inode 合并
+
+        同一 inode 被多个快照引用时只哈希一次
+        """
+        items: Dict[str, VerifyItem] = {}
+
+        def add(path: Path, sha: str, size: int, identity: Optional[Tuple]):
+            key = f"{identity[0]}:{identity[1]}" if identity else f"missing:{path}"
+            item = items.get(key)
+            if item is None:
+                item = items[key] = VerifyItem(key, size, [])
+            # 冷层 bundle 可能在备份根目录之外，所属仓库随条目记录
+            item.expected.append((str(path), sha, repository))
+
+        if not self.backup_root.exists():
+            return []
+
+        for owner_dir in sorted(self.backup_root.iterdir()):
+            if not owner_dir.is_dir() or owner_dir.name.startswith('.'):
+                continue
+            for repo_dir in sorted(owner_dir.iterdir()):
+                if not repo_dir.is_dir():
+                    continue
+                repository = f"{owner_dir.name}/{repo_dir.name}"
+                for snapshot in sorted(repo_dir.glob('snapshots/*')):
+                    # 冷快照的存根没有清单，校验生成时记录的 bundle 哈希
+                    meta = read_snapshot_meta(snapshot)
+                    if meta.get('tier') == 'cold' and meta.get('cold_sha256'):
+                        bundle = cold_bundle_path(snapshot)
+                        identity = _identity(bundle)
+                        size = bundle.stat().st_size if identity else 0
+                        add(bundle, meta['cold_sha256'], size, identity)
+                        continue
+                    for entry in read_manifest(snapshot):
+                        # 旧版本生成的清单可能包含会被原地改写的文件
+                        if not is_manifest_path(entry.path):
+                            continue
+                        path = snapshot / entry.path
+                        add(path, entry.sha256, entry.size, _identity(path))
+                for checksum_file in sorted(repo_dir.glob('archives/*.sha256')):
+                    archive = checksum_file.with_suffix('')
+                    sha = read_checksum_file(checksum_file)
+                    if sha:
+                        identity = _identity(archive)
+                        size = archive.stat().st_size if identity else 0
+                        add(archive, sha, size, identity)
+
+        # 按第一个路径排序，游标在快照增删时仍然稳定
+        return sorted(items.values(), key=lambda i: i.expected[0][0])
+
+    def select(self, items: List[VerifyItem], full: bool = False) -> List[VerifyItem]:
+        """从上次的游标位置开始选出本次要校验的条目（按数据量轮转抽检）"""
+        if full or self.sample_percent >= 100 or not items:
+            return list(items)
+
+        cursor = ''
+        if self.state_path.exists():
+            try:
+                cursor = json.loads(self.state_path.read_text()).get('cursor', '')
+            except (OSError, ValueError):
+                cursor = ''
+
+        start = 0
+        for i, item in enumerate(items):
+            if item.expected[0][0] > cursor:
+                start = i
+                break
+
+        budget = sum(i.size for i in items) * self.sample_percent / 100
+        selected, used = [], 0
+        for offset in range(len(items)):
+            item = items[(start + offset) % len(items)]
+            selected.append(item)
+            used += item.size
+            if used >= budget:
+                break
+        return selected
+
+    def run(self, full: bool = False) -> Dict:
+        """
+        执行一次校验
+
+        Args:
+            full: 校验全部（忽略抽检比例）
+
+        Returns:
+            校验结果 {'time', 'checked', 'checked_bytes', 'elapsed', 'mismatches'}
+        """
+        started = time.monotonic()
+        selected = self.select(self.collect(), full)
+        mismatches = []
+        checked_bytes = 0
+        submitted_bytes = 0
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = {}
+            for item in selected:
+                path = item.expected[0][0]
+                if item.key.startswith('missing:'):
+                    mismatches.extend(
+                        {'path': p, 'repository': r, 'expected': sha, 'actual': None}
+                        for p, sha, r in item.expected
+                    )
+                    continue
+
+                # 限制在途任务数量和读取速率
+                while len(pending) >= self.workers * 2:
+                    checked_bytes += self._collect_done(pending, mismatches)
+                submitted_bytes += item.size
+                self._throttle(started, submitted_bytes)
+                pending[pool.submit(hash_file, path)] = item
+
+            while pending:
+                checked_bytes += self._collect_done(pending, mismatches)
+
+        if selected and not full:
+            self.state_path.write_text(
+                json.dumps({'cursor': selected[-1].expected[0][0]})
+            )
+
+        result = {
+            'time': datetime.now().isoformat(),
+            'full': full,
+            'checked': len(selected),
+            'checked_bytes': checked_bytes,
+            'elapsed': round(time.monotonic() - started, 3),
+            'mismatches': mismatches,
+        }
+        self.result_path.write_text(
+            json.dumps(result, ensure_ascii=False, indent=2), encoding='utf-8'
+        )
+        return result
+
+    @staticmethod
+    def _collect_done(pending: Dict, mismatches: List[Dict]) -> int:
+        """等待至少一个任务完成并检查结果，返回已完成的字节数"""
+        done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+        finished = 0
+        for future in done:
+            item = pending.pop(future)
+            finished += item.size
+            try:
+                actual = future.result()
+            except OSError as e:
+                logger.warning(f"读取文件失败 {item.expected[0][0]}: {e}")
+                actual = None
+            for path, expected, repository in item.expected:
+                if actual != expected:
+                    mismatches.append(
+                        {
+                            'path': path,
+                            'repository': repository,
+                            'expected': expected,
+                            'actual': actual,
+                        }
+                    )
+        return finished
+
+    def _throttle(self, started: float, total_bytes: int):
+        """按速率上限等待"""
+        if not self.max_bytes_per_second:
+            return
+        earliest = started + total_bytes / self.max_bytes_per_second
+        delay = earliest - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _identity(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+
+def load_verify_result(backup_root: Path) -> Optional[Dict]:
+    """读取最近一次的校验结果"""
+    path = Path(backup_root) / VERIFY_RESULT_FILE_NAME
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取校验结果失败 {path}: {e}")
+        return None
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+镜像清单模块
+默认每个仓库都要通过 docker exec 读取 remote.origin.url 来判断是否是镜像，
+几千个仓库就是几千次 exec。Gitea 自己的数据库中已经记录了每个仓库是否是
+镜像（repository.is_mirror）和最近一次镜像同步时间（mirror.updated_unix）。
+
+清单提供者一次读取全部仓库的这些信息，按磁盘上的目录名（owner/repo，小写）
+索引，供过滤和变化检测使用：
+
+- sqlite：以只读方式打开 Gitea 的 SQLite 数据库文件（默认配置下在数据卷中）
+- api：通过 Gitea API（/api/v1/repos/search?mode=mirror）分页读取镜像列表。
+  第一页返回总数后并发请求其余页，共用一个保持连接的会话；每页的 ETag /
+  Last-Modified 和内容缓存在备份根目录，下次运行时条件请求，未变化的页
+  （304）直接使用缓存
+"""
+
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+logger = logging.getLogger(__name__)
+
+API_CACHE_FILE_NAME = ".inventory_cache.json"
+SEARCH_PATH = "/api/v1/repos/search"
+# 缓存中每个仓库只保留用到的字段
+API_FIELDS = ('full_name', 'mirror', 'updated_at', 'mirror_updated')
+
+# 一次查询得到所有仓库的镜像标记和同步时间
+SQLITE_QUERY = """
+SELECT r.owner_name, r.lower_name, r.is_mirror, r.updated_unix, m.updated_unix
+FROM repository AS r
+LEFT JOIN mirror AS m ON m.repo_id = r.id
+"""
+
+
+class MirrorInfo(NamedTuple):
+    """清单中的一个仓库"""
+
+    # owner/repo（小写，与 git/repositories 下的目录名一致）
+    full_name: str
+    is_mirror: bool
+    # 最近一次镜像同步时间（非镜像或从未同步时为 None）
+    last_sync: Optional[datetime]
+    # 仓库最近更新时间
+    updated: Optional[datetime]
+
+
+def inventory_key(full_name: str) -> str:
+    """清单的键：小写的 owner/repo（不带 .git）"""
+    name = full_name.strip('/').lower()
+    return name[:-4] if name.endswith('.git') else name
+
+
+def _from_unix(value) -> Optional[datetime]:
+    return datetime.fromtimestamp(int(value)) if value else None
+
+
+class SqliteInventory:
+    """从 Gitea 的 SQLite 数据库读取镜像清单（只读）"""
+
+    name = 'sqlite'
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+
+    def load(self) -> Dict[str, MirrorInfo]:
+        """
+        读取清单
+
+        Returns:
+            {小写 owner/repo: MirrorInfo}
+
+        Raises:
+            FileNotFoundError: 数据库文件不存在
+            sqlite3.Error: 数据库无法读取（如不是 Gitea 的数据库）
+        """
+        if not self.db_path.is_file():
+            raise FileNotFoundError(f"Gitea 数据库不存在: {self.db_path}")
+        # mode=ro：只读打开，不会创建文件，也不会修改数据库
+        conn = sqlite3.connect(
+            f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True, timeout=10
+        )
+        try:
+            rows = conn.execute(SQLITE_QUERY).fetchall()
+        finally:
+            conn.close()
+
+        inventory = {}
+        for owner, name, is_mirror, updated, synced in rows:
+            key = inventory_key(f"{owner}/{name}")
+            inventory[key] = MirrorInfo(
+                full_name=key,
+                is_mirror=bool(is_mirror),
+                last_sync=_from_unix(synced) if is_mirror else None,
+                updated=_from_unix(updated),
+            )
+        return inventory
+
+
+def _from_iso(value: Optional[str]) -> Optional[datetime]:
+    """API 返回的时间（带时区）转换为本地时间；Gitea 用 0001 年表示从未"""
+    if not value:
+        return None
+    taken = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if taken.year <= 1970:
+        return None
+    if taken.tzinfo is not None:
+        taken = taken.astimezone().replace(tzinfo=None)
+    return taken
+
+
+class ApiInventory:
+    """通过 Gitea API 分页读取镜像清单（只包含镜像仓库）"""
+
+    name = 'api'
+
+    def __init__(
+        self,
+        base_url: str,
+        token: str = '',
+        cache_path: Optional[Path] = None,
+        page_size: int = 50,
+        workers: int = 4,
+        timeout: float = 30,
+    ):
+        """
+        Args:
+            base_url: Gitea 地址，如 http://localhost:3000
+            token: 访问令牌（需要能看到所有镜像仓库，如管理员令牌）
+            cache_path: 条件请求缓存文件，None 时不缓存
+            page_size: 每页数量（不超过 Gitea 的 MAX_RESPONSE_ITEMS）
+            workers: 并发请求数（也是连接池大小）
+            timeout: 单次请求超时秒数
+        """
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.page_size = max(1, int(page_size))
+        self.workers = max(1, int(workers))
+        self.timeout = timeout
+        # 上一次 load 的请求数和其中未变化（304）的页数
+        self.requests = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, MirrorInfo]:
+        """
+        读取清单
+
+        Returns:
+            {小写 owner/repo: MirrorInfo}
+
+        Raises:
+            RuntimeError: 未安装 requests，或 API 返回错误
+            requests.RequestException: 请求失败
+        """
+        if requests is None:
+            raise RuntimeError("使用 Gitea API 读取镜像清单需要安装 requests")
+        self.requests = self.not_modified = 0
+        cache = self._read_cache()
+        fresh: Dict[str, Dict] = {}
+
+        session = self._session()
+        try:
+            pages = {1: self._fetch(session, 1, cache, fresh)}
+            total = fresh['1']['total']
+            # 第一页未变化（304）时总数来自缓存，可能已经过时
+            cached_total = fresh['1'] is cache.get('1')
+            count = math.ceil(total / self.page_size) if total is not None else 1
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                numbers = range(2, count + 1)
+                for page, repos in zip(
+                    numbers,
+                    pool.map(lambda n: self._fetch(session, n, cache, fresh), numbers),
+                ):
+                    pages[page] = repos
+            # 总数未知或来自缓存：继续读到不满一页为止（新增的仓库可能在新的一页）
+            page = max(count, 1)
+            while len(pages[page]) >= self.page_size and (
+                total is None or cached_total
+            ):
+                page += 1
+                pages[page] = self._fetch(session, page, cache, fresh)
+        finally:
+            session.close()
+        self._write_cache(fresh)
+
+        inventory = {}
+        for page in sorted(pages):
+            for repo in pages[page]:
+                key = inventory_key(repo['full_name'])
+                updated = _from_iso(repo.get('updated_at'))
+                inventory[key] = MirrorInfo(
+                    full_name=key,
+                    is_mirror=bool(repo.get('mirror', True)),
+                    # 旧版本 Gitea 没有 mirror_updated，用仓库更新时间代替
+                    last_sync=_from_iso(repo.get('mirror_updated')) or updated,
+                    updated=updated,
+                )
+        return inventory
+
+    def _session(self):
+        """保持连接的会话，连接池大小与并发数一致"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['Accept'] = 'application/json'
+        if self.token:
+            session.headers['Authorization'] = f"token {self.token}"
+        return session
+
+    def _fetch(
+        self, session, page: int, cache: Dict[str, Dict], fresh: Dict[str, Dict]
+    ) -> List[Dict]:
+        """请求一页（有缓存时带条件），返回该页的仓库列表"""
+        cached = cache.get(str(page))
+        headers = {}
+        if cached and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+        response = session.get(
+            self.base_url + SEARCH_PATH,
+            params={'mode': 'mirror', 'page': page, 'limit': self.page_size},
+            headers=headers,
+            timeout=self.timeout,
+        )
+        with self._lock:
+            self.requests += 1
+            if response.status_code == 304 and cached:
+                self.not_modified += 1
+                fresh[str(page)] = cached
+                return cached['repos']
+
+        response.raise_for_status()
+        body = response.json()
+        if not body.get('ok', True):
+            raise RuntimeError(f"Gitea API 返回错误: {body}")
+        repos = [
+            {k: repo.get(k) for k in API_FIELDS} for repo in body.get('data') or []
+        ]
+        total = response.headers.get('X-Total-Count')
+        with self._lock:
+            fresh[str(page)] = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'total': int(total) if total and total.isdigit() else None,
+                'repos': repos,
+            }
+        return repos
+
+    def _read_cache(self) -> Dict[str, Dict]:
+        """上次的分页缓存（Gitea 地址或每页数量不同时作废）"""
+        if not self.cache_path or not self.cache_path.exists():
+            return {}
+        try:
+            data = json.loads(self.cache_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+        if (data.get('url'), data.get('page_size')) != (self.base_url, self.page_size):
+            return {}
+        return data.get('pages') or {}
+
+    def _write_cache(self, pages: Dict[str, Dict]):
+        if not self.cache_path:
+            return
+        data = {'url': self.base_url, 'page_size': self.page_size, 'pages': pages}
+        tmp = self.cache_path.with_name(self.cache_path.name + '.tmp')
+        try:
+            tmp.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            logger.warning(f"保存镜像清单缓存失败: {e}")
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LFS 对象备份模块
+快照只包含 git/repositories 下的裸仓库，LFS 对象在 Gitea 的 LFS 目录中
+（默认 数据卷/git/lfs/ab/cd/ef...，按 SHA-256 存放）。
+
+- 创建快照时扫描仓库中的 LFS 指针（小于 1KB 且以 LFS 版本行开头的 blob），
+  把引用的对象 ID 和大小写入快照的 .lfs_oids；引用表与上一个快照相同时直接复用
+- LFS 对象本身按内容寻址，备份根目录/.lfs/objects/ab/cd/<oid> 中每个对象
+  只保存一份，所有快照共用。每次运行只复制存储中还没有的对象，并发复制，
+  边复制边校验 SHA-256；中断留下的 .part 文件下次从末尾继续
+- 不再被任何快照引用的对象在复制之后清理
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.small_repos import owner_packs
+from src.tiering import is_snapshot
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR_NAME = ".lfs"
+LFS_OIDS_FILE_NAME = ".lfs_oids"
+CHUNK_SIZE = 1024 * 1024
+
+# LFS 规范：指针文件小于 1024 字节
+MAX_POINTER_SIZE = 1024
+POINTER_PREFIX = b"version https://git-lfs.github.com/spec/v1\n"
+POINTER_OID = re.compile(rb'^oid sha256:([0-9a-f]{64})$', re.M)
+POINTER_SIZE = re.compile(rb'^size (\d+)$', re.M)
+OID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def scan_pointers(git_command: List[str]) -> Dict[str, int]:
+    """
+    扫描仓库中的 LFS 指针
+
+    先用 cat-file --batch-check 列出所有对象，只读取小于 1KB 的 blob
+
+    Args:
+        git_command: 执行 git 的命令前缀（如 ['git', '-C', 快照目录]）
+
+    Returns:
+        {LFS 对象 ID: 大小}
+
+    Raises:
+        subprocess.CalledProcessError: git 执行失败
+    """
+    listing = subprocess.run(
+        list(git_command)
+        + [
+            'cat-file',
+            '--batch-all-objects',
+            '--unordered',
+            '--batch-check=%(objectname) %(objecttype) %(objectsize)',
+        ],
+        capture_output=True,
+        check=True,
+    ).stdout
+    candidates = []
+    for line in listing.splitlines():
+        name, kind, size = line.split()
+        if kind == b'blob' and len(POINTER_PREFIX) < int(size) < MAX_POINTER_SIZE:
+            candidates.append(name)
+    if not candidates:
+        return {}
+
+    data = subprocess.run(
+        list(git_command) + ['cat-file', '--batch'],
+        input=b"\n".join(candidates) + b"\n",
+        capture_output=True,
+        check=True,
+    ).stdout
+    oids = {}
+    pos = 0
+    while pos < len(data):
+        header_end = data.index(b"\n", pos)
+        size = int(data[pos:header_end].split()[2])
+        content = data[header_end + 1 : header_end + 1 + size]
+        pos = header_end + 1 + size + 1
+        if not content.startswith(POINTER_PREFIX):
+            continue
+        oid = POINTER_OID.search(content)
+        oid_size = POINTER_SIZE.search(content)
+        if oid and oid_size:
+            oids[oid.group(1).decode()] = int(oid_size.group(1))
+    return oids
+
+
+def read_lfs_oids(snapshot: Path) -> Dict[str, int]:
+    """读取快照引用的 LFS 对象（没有记录时为空）"""
+    oids = {}
+    try:
+        text = (Path(snapshot) / LFS_OIDS_FILE_NAME).read_text()
+    except OSError:
+        return oids
+    for line in text.splitlines():
+        oid, _, size = line.partition(' ')
+        if OID_PATTERN.match(oid) and size.isdigit():
+            oids[oid] = int(size)
+    return oids
+
+
+def write_lfs_oids(snapshot: Path, oids: Dict[str, int]):
+    """把快照引用的 LFS 对象写入 .lfs_oids（每行: 对象 ID 大小）"""
+    tmp = Path(snapshot) / f"{LFS_OIDS_FILE_NAME}.tmp"
+    with open(tmp, 'w') as f:
+        for oid in sorted(oids):
+            f.write(f"{oid} {oids[oid]}\n")
+    os.replace(tmp, Path(snapshot) / LFS_OIDS_FILE_NAME)
+
+
+def iter_snapshot_oids(backup_root: Path) -> Iterator[Tuple[str, Dict[str, int]]]:
+    """遍历所有快照（目录快照和打包的快照）引用的 LFS 对象: (仓库, {oid: 大小})"""
+    backup_root = Path(backup_root)
+    if not backup_root.exists():
+        return
+    for owner_dir in sorted(backup_root.iterdir()):
+        if not owner_dir.is_dir() or owner_dir.name.startswith('.'):
+            continue
+        for repo_dir in sorted(owner_dir.iterdir()):
+            snapshots_dir = repo_dir / "snapshots"
+            if repo_dir.name.startswith('.') or not snapshots_dir.is_dir():
+                continue
+            for snapshot in sorted(snapshots_dir.iterdir()):
+                if snapshot.name.startswith('.') or not is_snapshot(snapshot):
+                    continue
+                oids = read_lfs_oids(snapshot)
+                if oids:
+                    yield f"{owner_dir.name}/{repo_dir.name}", oids
+    for pack in owner_packs(backup_root):
+        for snapshot in pack.snapshots():
+            if snapshot.lfs_oids:
+                yield snapshot.repository, snapshot.lfs_oids
+
+
+class LfsStore:
+    """按内容寻址的 LFS 对象存储（备份根目录/.lfs/objects）"""
+
+    def __init__(self, backup_root: Path, source_dir: Path, workers: int = 4):
+        """
+        Args:
+            backup_root: 备份根目录
+            source_dir: Gitea 的 LFS 目录（数据卷/git/lfs）
+            workers: 并发复制数
+        """
+        self.backup_root = Path(backup_root)
+        self.source_dir = Path(source_dir)
+        self.path = self.backup_root / STORE_DIR_NAME / "objects"
+        self.workers = max(1, int(workers))
+
+    def object_path(self, oid: str) -> Path:
+        return self.path / oid[0:2] / oid[2:4] / oid
+
+    def source_path(self, oid: str) -> Path:
+        """Gitea 存放对象的位置（ab/cd/ef...，去掉了前 4 位）"""
+        return self.source_dir / oid[0:2] / oid[2:4] / oid[4:]
+
+    def run(self, gc: bool = True) -> Dict[str, int]:
+        """
+        复制所有快照引用、存储中还没有的对象，然后清理不再引用的对象
+
+        Returns:
+            统计 {'referenced', 'copied', 'copied_bytes', 'existing',
+            'missing', 'failed', 'removed', 'removed_bytes', 'elapsed'}
+        """
+        started = time.monotonic()
+        referenced: Dict[str, int] = {}
+        for _, oids in iter_snapshot_oids(self.backup_root):
+            referenced.update(oids)
+
+        stats = dict.fromkeys(
+            ('copied', 'copied_bytes', 'existing', 'missing', 'failed'), 0
+        )
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for result, size in pool.map(
+                lambda item: self._copy(*item), sorted(referenced.items())
+            ):
+                stats[result] += 1
+                if result == 'copied':
+                    stats['copied_bytes'] += size
+
+        stats['removed'], stats['removed_bytes'] = (
+            self.gc(set(referenced)) if gc else (0, 0)
+        )
+        stats['referenced'] = len(referenced)
+        stats['elapsed'] = time.monotonic() - started
+        return stats
+
+    def _copy(self, oid: str, size: int) -> Tuple[str, int]:
+        """复制一个对象，返回 (结果, 字节数)，结果为 copied/existing/missing/failed"""
+        dest = self.object_path(oid)
+        if dest.exists():
+            return 'existing', 0
+        source = self.source_path(oid)
+        if not source.exists():
+            # 镜像未同步 LFS 或对象已被 Gitea 删除
+            logger.debug(f"LFS 对象不存在: {source}")
+            return 'missing', 0
+        try:
+            copied = copy_verified(source, dest, oid, size)
+            return 'copied', copied
+        except Exception as e:
+            logger.warning(f"复制 LFS 对象失败 {oid}: {e}")
+            return 'failed', 0
+
+    def gc(self, referenced: set) -> Tuple[int, int]:
+        """删除不再被引用的对象和 .part 文件，返回 (删除数, 释放字节数)"""
+        removed = removed_bytes = 0
+        if not self.path.exists():
+            return removed, removed_bytes
+        for path in self.path.glob('*/*/*'):
+            oid = path.name[:-5] if path.name.endswith('.part') else path.name
+            if oid in referenced:
+                continue
+            try:
+                removed_bytes += path.stat().st_size
+                path.unlink()
+                removed += 1
+            except OSError as e:
+                logger.warning(f"删除 LFS 对象失败 {path}: {e}")
+        return removed, removed_bytes
+
+    def restore(
+        self, oids: Dict[str, int], owner: Optional[Tuple[int, int]] = None
+    ) -> Dict[str, int]:
+        """
+        把对象复制回 Gitea 的 LFS 目录（已存在的跳过）
+
+        Args:
+            oids: {对象 ID: 大小}
+            owner: 复制出的文件和目录的 (uid, gid)
+
+        Returns:
+            统计 {'restored', 'existing', 'missing', 'failed'}
+        """
+        stats = dict.fromkeys(('restored', 'existing', 'missing', 'failed'), 0)
+        for oid, size in sorted(oids.items()):
+            dest = self.source_path(oid)
+            source = self.object_path(oid)
+            if dest.exists():
+                stats['existing'] += 1
+            elif not source.exists():
+                stats['missing'] += 1
+            else:
+                try:
+                    copy_verified(source, dest, oid, size)
+                    if owner:
+                        for path in (dest, dest.parent, dest.parent.parent):
+                            os.chown(path, *owner)
+                    stats['restored'] += 1
+                except Exception as e:
+                    logger.warning(f"恢复 LFS 对象失败 {oid}: {e}")
+                    stats['failed'] += 1
+        return stats
+
+
+def copy_verified(source: Path, dest: Path, oid: str, size: int) -> int:
+    """
+    复制文件并校验 SHA-256 和大小，先写 dest.part，校验通过后重命名
+
+    .part 已存在时（上次中断）先哈希已有部分，再从其末尾继续复制
+
+    Returns:
+        本次复制的字节数
+
+    Raises:
+        ValueError: 内容与对象 ID 或大小不一致（.part 被删除）
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = dest.with_name(dest.name + '.part')
+    digest = hashlib.sha256()
+    copied = 0
+    with open(source, 'rb') as src, open(part, 'ab+') as out:
+        out.seek(0)
+        for chunk in iter(lambda: out.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+        offset = out.tell()
+        src.seek(offset)
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            out.write(chunk)
+            copied += len(chunk)
+        out.flush()
+        os.fsync(out.fileno())
+        total = out.tell()
+    if digest.hexdigest() != oid or total != size:
+        part.unlink()
+        raise ValueError(f"LFS 对象校验失败: {source}")
+    os.replace(part, dest)
+    shutil.copystat(source, dest)
+    return copied
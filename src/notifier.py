@@ -102,7 +102,9 @@ class NotificationManager:
         Args:
             report_data: 报告数据
         """
-        has_alerts = report_data.get('has_alerts', False)
+        has_alerts = report_data.get('has_alerts', False) or bool(
+            report_data.get('verify_mismatches')
+        )
 
         if has_alerts:
             level = "warning"
@@ -126,6 +128,10 @@ class NotificationManager:
         lines.append(f"总提交数: {report_data.get('total_commits', 0):,}")
         lines.append(f"快照总数: {report_data.get('total_snapshots', 0)}")
         lines.append(f"占用空间: {report_data.get('total_size_mb', 0)} MB")
+        if report_data.get('trash_size_mb'):
+            lines.append(f"回收站（待删除）: {report_data['trash_size_mb']} MB")
+        if report_data.get('verify_mismatches'):
+            lines.append(f"❌ 完整性校验不一致: {report_data['verify_mismatches']} 个文件")
 
         # 异常信息
         if report_data.get('has_alerts'):
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+引用变化检测模块
+比较上一次快照与当前仓库的引用表，找出被强制推送（回退）或删除的引用。
+引用表直接读取文件，只对发生变化的引用执行一次 merge-base --is-ancestor；
+比较两个快照时通过 alternates 同时访问两边的对象，统计每个引用丢失的提交数
+"""
+
+import json
+import logging
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from src.commit_counter import GitRunner, host_git_runner
+from src.refs import cached_ref_map, read_ref_map
+
+logger = logging.getLogger(__name__)
+
+REF_CHANGES_FILE_NAME = ".ref_changes.json"
+
+CREATED = 'created'
+DELETED = 'deleted'
+FAST_FORWARD = 'fast_forward'
+REWOUND = 'rewound'
+
+# 会丢失历史的变化类型
+DESTRUCTIVE_KINDS = (DELETED, REWOUND)
+
+KIND_LABELS = {
+    CREATED: '新建',
+    DELETED: '删除',
+    FAST_FORWARD: '快进',
+    REWOUND: '改写',
+}
+
+
+class RefChange(NamedTuple):
+    """单个引用的变化"""
+
+    ref: str
+    kind: str
+    old: Optional[str]
+    new: Optional[str]
+
+    def describe(self) -> str:
+        old = (self.old or '')[:10]
+        new = (self.new or '')[:10]
+        label = KIND_LABELS.get(self.kind, self.kind)
+        if self.kind == CREATED:
+            return f"引用{label}: {self.ref} ({new})"
+        if self.kind == DELETED:
+            return f"引用{label}: {self.ref} ({old})"
+        return f"引用{label}: {self.ref} ({old} → {new})"
+
+
+def diff_ref_maps(
+    old_refs: Dict[str, str], new_refs: Dict[str, str], run_git: GitRunner
+) -> List[RefChange]:
+    """
+    比较两个引用表并对每个变化的引用分类
+
+    Args:
+        old_refs: 上一次快照的引用表
+        new_refs: 当前引用表
+        run_git: 在当前仓库上执行 git 的函数
+
+    Returns:
+        按引用名排序的变化列表（未变化的引用不包含在内）
+    """
+    changes = []
+    for ref in sorted(set(old_refs) | set(new_refs)):
+        old = old_refs.get(ref)
+        new = new_refs.get(ref)
+        if old == new:
+            continue
+        if old is None:
+            changes.append(RefChange(ref, CREATED, None, new))
+        elif new is None:
+            changes.append(RefChange(ref, DELETED, old, None))
+        else:
+            # 旧提交是新提交的祖先即为快进；旧对象已不存在或不是祖先都视为改写
+            result = run_git(['merge-base', '--is-ancestor', old, new], None)
+            kind = FAST_FORWARD if result.returncode == 0 else REWOUND
+            changes.append(RefChange(ref, kind, old, new))
+    return changes
+
+
+def count_lost_commits(
+    changes: Iterable[RefChange], new_refs: Dict[str, str], run_git: GitRunner
+) -> Dict[str, Optional[int]]:
+    """
+    统计被删除/改写的引用丢失的提交数
+
+    丢失的提交 = 旧 tip 可达、但任何新引用都不可达的提交；
+    run_git 需要能同时访问新旧两边的对象（见 compare_snapshots）
+
+    Returns:
+        {引用名: 丢失的提交数}，无法计算时为 None；键 '*' 为所有引用合计（去重）
+    """
+    exclude = ''.join(f"^{oid}\n" for oid in sorted(set(new_refs.values())))
+
+    def count(tips: List[str]) -> Optional[int]:
+        result = run_git(
+            ['rev-list', '--count', '--stdin'],
+            ''.join(f"{tip}\n" for tip in tips) + exclude,
+        )
+        if result.returncode != 0:
+            return None
+        return int(result.stdout.strip() or 0)
+
+    lost: Dict[str, Optional[int]] = {}
+    for change in destructive_changes(changes):
+        lost[change.ref] = count([change.old])
+    if lost:
+        lost['*'] = count(sorted({c.old for c in destructive_changes(changes)}))
+    return lost
+
+
+def compare_snapshots(
+    base_snapshot: Path, target: Path, target_is_live: bool = False
+) -> Dict:
+    """
+    比较两个快照（或快照与在线仓库）的引用表
+
+    Args:
+        base_snapshot: 作为基准的旧快照
+        target: 新快照或在线仓库目录
+        target_is_live: target 是在线仓库（引用会变化，不使用 .refmap 缓存）
+
+    Returns:
+        {'base', 'target', 'summary', 'lost_commits',
+         'changes': [{'ref', 'kind', 'old', 'new', 'lost_commits'}]}
+    """
+    base_snapshot = Path(base_snapshot)
+    target = Path(target)
+    old_refs = cached_ref_map(base_snapshot)
+    new_refs = read_ref_map(target) if target_is_live else cached_ref_map(target)
+
+    # 在目标仓库上执行 git，并把旧快照的对象目录作为 alternates
+    run_git = host_git_runner(target, [base_snapshot / "objects"])
+    changes = diff_ref_maps(old_refs, new_refs, run_git)
+    lost = count_lost_commits(changes, new_refs, run_git)
+
+    return {
+        'base': base_snapshot.name,
+        'target': 'live' if target_is_live else target.name,
+        'summary': summarize(changes),
+        'lost_commits': lost.get('*', 0),
+        'changes': [
+            dict(c._asdict(), lost_commits=lost.get(c.ref, 0)) for c in changes
+        ],
+    }
+
+
+def filter_ignored(
+    changes: Iterable[RefChange], patterns: Iterable[str]
+) -> List[RefChange]:
+    """过滤掉匹配忽略规则的引用（如 refs/pull/*）"""
+    patterns = list(patterns or [])
+    return [c for c in changes if not any(fnmatch(c.ref, p) for p in patterns)]
+
+
+def destructive_changes(changes: Iterable[RefChange]) -> List[RefChange]:
+    """返回会丢失历史的变化（删除和改写）"""
+    return [c for c in changes if c.kind in DESTRUCTIVE_KINDS]
+
+
+def summarize(changes: Iterable[RefChange]) -> Dict[str, int]:
+    """按类型统计变化数量"""
+    summary = {kind: 0 for kind in KIND_LABELS}
+    for change in changes:
+        summary[change.kind] = summary.get(change.kind, 0) + 1
+    return summary
+
+
+def save_ref_changes(
+    repo_backup_dir: Path, snapshot: str, base: str, changes: List[RefChange]
+):
+    """保存本次的引用变化，供报告读取"""
+    data = {
+        'snapshot': snapshot,
+        'base': base,
+        'summary': summarize(changes),
+        'changes': [c._asdict() for c in changes],
+    }
+    path = Path(repo_backup_dir) / REF_CHANGES_FILE_NAME
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding='utf-8')
+
+
+def load_ref_changes(repo_backup_dir: Path) -> Optional[Dict]:
+    """读取最近一次的引用变化"""
+    path = Path(repo_backup_dir) / REF_CHANGES_FILE_NAME
+    if not path.exists():
+        return None
+    try:
+        data = json.loads(path.read_text(encoding='utf-8'))
+        data['changes'] = [RefChange(**c) for c in data.get('changes', [])]
+        return data
+    except (OSError, ValueError, TypeError) as e:
+        logger.warning(f"读取引用变化失败 {path}: {e}")
+        return None
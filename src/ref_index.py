@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+引用索引模块
+把每个快照的引用表（引用名 → 提交/标签 ID）记录在备份根目录的 sqlite 索引中，
+用于回答"哪些快照还包含某个提交或标签"。
+
+引用未变化的快照共享同一份引用集合（按引用表指纹去重），索引大小与引用变化
+次数成正比。快速查询只匹配引用的最新提交（tip）和引用名；深度查询再对索引
+之外的提交检查可达性：先用 pack 索引判断对象是否存在，只对包含该对象的
+候选快照运行 git for-each-ref --contains，同一引用集合只检查一次
+"""
+
+import fnmatch
+import logging
+import re
+import sqlite3
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from src.gitobjects import ObjectStore, PackCache
+from src.refs import cached_ref_map, ref_fingerprint
+from src.retention import snapshot_time
+from src.small_repos import PackedSnapshot, open_pack
+from src.tiering import is_snapshot
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE_NAME = ".ref_index.db"
+
+# 完整或缩写的对象 ID
+OID_PATTERN = re.compile(r'^[0-9a-f]{4,40}$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS refsets (
+    id INTEGER PRIMARY KEY,
+    fingerprint BLOB NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS refs (
+    refset_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    oid TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS refs_oid ON refs (oid);
+CREATE INDEX IF NOT EXISTS refs_name ON refs (name);
+CREATE INDEX IF NOT EXISTS refs_refset ON refs (refset_id);
+CREATE TABLE IF NOT EXISTS snapshots (
+    repository TEXT NOT NULL,
+    snapshot TEXT NOT NULL,
+    time TEXT NOT NULL,
+    refset_id INTEGER NOT NULL,
+    PRIMARY KEY (repository, snapshot)
+);
+CREATE INDEX IF NOT EXISTS snapshots_refset ON snapshots (refset_id);
+"""
+
+
+class RefIndex:
+    """快照引用索引"""
+
+    def __init__(self, backup_root: Path, read_only: bool = False):
+        """
+        Args:
+            backup_root: 备份根目录
+            read_only: 只读打开索引（备份目录只读挂载时，如 Web 服务）
+        """
+        self.backup_root = Path(backup_root)
+        self.index_path = self.backup_root / INDEX_FILE_NAME
+        self.read_only = read_only
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.read_only:
+            return sqlite3.connect(
+                f"{self.index_path.resolve().as_uri()}?mode=ro", uri=True
+            )
+        conn = sqlite3.connect(str(self.index_path), timeout=30)
+        conn.executescript(SCHEMA)
+        return conn
+
+    @staticmethod
+    def _add(
+        conn: sqlite3.Connection,
+        repository: str,
+        snapshot: str,
+        taken: datetime,
+        ref_map: Dict[str, str],
+    ):
+        fingerprint = ref_fingerprint(ref_map)
+        row = conn.execute(
+            "SELECT id FROM refsets WHERE fingerprint = ?", (fingerprint,)
+        ).fetchone()
+        if row:
+            refset_id = row[0]
+        else:
+            refset_id = conn.execute(
+                "INSERT INTO refsets (fingerprint) VALUES (?)", (fingerprint,)
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO refs (refset_id, name, oid) VALUES (?, ?, ?)",
+                [(refset_id, name, oid) for name, oid in ref_map.items()],
+            )
+        conn.execute(
+            "INSERT OR REPLACE INTO snapshots (repository, snapshot, time, refset_id) "
+            "VALUES (?, ?, ?, ?)",
+            (repository, snapshot, taken.isoformat(), refset_id),
+        )
+
+    def add(
+        self,
+        repository: str,
+        snapshot_path: Path,
+        ref_map: Optional[Dict[str, str]] = None,
+    ):
+        """
+        把一个快照加入索引（创建快照后调用）
+
+        Args:
+            repository: 仓库全名 owner/repo
+            snapshot_path: 快照目录
+            ref_map: 快照的引用表，None 时从快照读取
+        """
+        snapshot_path = Path(snapshot_path)
+        if ref_map is None:
+            ref_map = cached_ref_map(snapshot_path)
+        self.add_refs(
+            repository, snapshot_path.name, snapshot_time(snapshot_path), ref_map
+        )
+
+    def add_refs(
+        self, repository: str, snapshot: str, taken: datetime, ref_map: Dict[str, str]
+    ):
+        """把一个快照的引用表加入索引（小仓库打包的快照没有目录）"""
+        conn = self._connect()
+        try:
+            with conn:
+                self._add(conn, repository, snapshot, taken, ref_map)
+        finally:
+            conn.close()
+
+    def sync(self) -> Dict[str, int]:
+        """
+        与备份目录对齐：补充未索引的快照，删除已不存在的快照
+
+        Returns:
+            {'added', 'removed'}
+        """
+        stats = {'added': 0, 'removed': 0}
+        if not self.backup_root.exists():
+            return stats
+
+        on_disk = {}
+        for owner_dir in sorted(self.backup_root.iterdir()):
+            if not owner_dir.is_dir() or owner_dir.name.startswith('.'):
+                continue
+            for snapshot in owner_dir.glob('*/snapshots/*'):
+                if is_snapshot(snapshot):
+                    repository = f"{owner_dir.name}/{snapshot.parent.parent.name}"
+                    on_disk[(repository, snapshot.name)] = snapshot
+            for packed in open_pack(owner_dir).snapshots():
+                on_disk[(packed.repository, packed.name)] = packed
+
+        conn = self._connect()
+        try:
+            with conn:
+                indexed = set(
+                    conn.execute("SELECT repository, snapshot FROM snapshots")
+                )
+                for key in sorted(set(on_disk) - indexed):
+                    snapshot = on_disk[key]
+                    try:
+                        if isinstance(snapshot, PackedSnapshot):
+                            self._add(
+                                conn, key[0], key[1], snapshot.time, snapshot.refs
+                            )
+                        else:
+                            self._add(
+                                conn,
+                                key[0],
+                                key[1],
+                                snapshot_time(snapshot),
+                                cached_ref_map(snapshot),
+                            )
+                        stats['added'] += 1
+                    except OSError as e:
+                        logger.warning(f"索引快照失败 {snapshot}: {e}")
+                gone = sorted(indexed - set(on_disk))
+                conn.executemany(
+                    "DELETE FROM snapshots WHERE repository = ? AND snapshot = ?", gone
+                )
+                stats['removed'] = len(gone)
+                if gone:
+                    conn.execute(
+                        "DELETE FROM refs WHERE refset_id NOT IN "
+                        "(SELECT refset_id FROM snapshots)"
+                    )
+                    conn.execute(
+                        "DELETE FROM refsets WHERE id NOT IN "
+                        "(SELECT refset_id FROM snapshots)"
+                    )
+        finally:
+            conn.close()
+        return stats
+
+    def find(self, query: str, repository: Optional[str] = None) -> List[Dict]:
+        """
+        快速查询：引用最新提交为该 ID（或 ID 前缀），或名称匹配的快照
+
+        Args:
+            query: 对象 ID（至少 4 位）或引用名（完整名，或分支/标签短名）
+            repository: 仓库过滤（owner/repo，支持通配符）
+
+        Returns:
+            [{'repository', 'snapshot', 'time', 'ref', 'oid'}]，按时间从新到旧
+        """
+        query = query.strip()
+        conditions = ["r.name = ?", "r.name = ?", "r.name = ?"]
+        params: List[str] = [query, f"refs/heads/{query}", f"refs/tags/{query}"]
+        if OID_PATTERN.match(query.lower()):
+            if len(query) == 40:
+                conditions.append("r.oid = ?")
+                params.append(query.lower())
+            else:
+                # 前缀范围查询可以走 oid 索引
+                conditions.append("(r.oid >= ? AND r.oid < ?)")
+                params += [query.lower(), query.lower() + 'g']
+
+        sql = (
+            "SELECT s.repository, s.snapshot, s.time, r.name, r.oid "
+            "FROM refs r JOIN snapshots s ON s.refset_id = r.refset_id "
+            f"WHERE {' OR '.join(conditions)} "
+            "ORDER BY s.time DESC, s.repository, r.name"
+        )
+        if not self.index_path.exists():
+            return []
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        return [
+            {'repository': repo, 'snapshot': snap, 'time': t, 'ref': name, 'oid': oid}
+            for repo, snap, t, name, oid in rows
+            if _matches(repo, repository)
+        ]
+
+    def find_reachable(
+        self, oid: str, repository: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        深度查询：哪些快照的引用能到达该提交（不只是引用的最新提交）
+
+        Args:
+            oid: 完整的 40 位提交 ID
+            repository: 仓库过滤（owner/repo，支持通配符）
+
+        Returns:
+            [{'repository', 'snapshot', 'time', 'refs'}]，按时间从新到旧
+        """
+        oid = oid.strip().lower()
+        if len(oid) != 40 or not OID_PATTERN.match(oid):
+            raise ValueError(f"深度查询需要完整的 40 位对象 ID: {oid}")
+        if not self.index_path.exists():
+            return []
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT repository, snapshot, time, refset_id FROM snapshots "
+                "ORDER BY time DESC, repository"
+            ).fetchall()
+        finally:
+            conn.close()
+
+        # 同一仓库中引用集合相同的快照结果相同，每组只检查一个（最新的）快照
+        groups: Dict[tuple, List[tuple]] = {}
+        for repo, snap, t, refset_id in rows:
+            if _matches(repo, repository):
+                groups.setdefault((repo, refset_id), []).append((snap, t))
+
+        cache = PackCache()
+        results = []
+        try:
+            for (repo, _), snapshots in groups.items():
+                refs = self._containing_refs(repo, snapshots, oid, cache)
+                results += [
+                    {'repository': repo, 'snapshot': snap, 'time': t, 'refs': refs}
+                    for snap, t in snapshots
+                    if refs
+                ]
+        finally:
+            cache.close()
+        results.sort(key=lambda r: (r['time'], r['repository']), reverse=True)
+        return results
+
+    def _containing_refs(
+        self, repo: str, snapshots: List[tuple], oid: str, cache: PackCache
+    ) -> List[str]:
+        """组内第一个仍存在的快照中，包含该提交的引用"""
+        for snap, _ in snapshots:
+            path = self.backup_root / repo / "snapshots" / snap
+            # 冷层快照没有对象目录，由同组的其他快照回答
+            if not (path / "objects").is_dir():
+                continue
+            # 对象不存在时不可能可达，不必启动 git
+            if not ObjectStore(path, cache).contains(oid):
+                return []
+            result = subprocess.run(
+                ['git', '-c', 'safe.directory=*', '-C', str(path), 'for-each-ref']
+                + ['--contains', oid, '--format=%(refname)'],
+                capture_output=True,
+                text=True,
+            )
+            if result.returncode != 0:
+                # 对象不是提交（如 blob）
+                return []
+            return result.stdout.split()
+        return []
+
+
+def _matches(repo: str, pattern: Optional[str]) -> bool:
+    if not pattern:
+        return True
+    pattern = pattern.strip().strip('/').lower()
+    if '/' not in pattern:
+        pattern = f"{pattern}/*"
+    return fnmatch.fnmatchcase(repo.lower(), pattern)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+引用读取模块
+直接解析裸仓库的 packed-refs 与 refs/ 目录，不需要启动 git 进程
+"""
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# 快照引用表缓存（快照不可变，引用表只需读取一次）
+REF_MAP_CACHE_FILE_NAME = ".refmap"
+
+
+def read_ref_map(git_dir: Path) -> Dict[str, str]:
+    """
+    读取仓库的引用表
+
+    Args:
+        git_dir: 裸仓库目录（或快照目录）
+
+    Returns:
+        {引用名: 对象 ID}，不包含符号引用（如 HEAD）
+    """
+    git_dir = Path(git_dir)
+    refs: Dict[str, str] = {}
+
+    # packed-refs
+    packed = git_dir / "packed-refs"
+    if packed.exists():
+        try:
+            content = packed.read_text(encoding='utf-8', errors='replace')
+            for line in content.splitlines():
+                if not line or line[0] in '#^':
+                    continue
+                oid, _, name = line.partition(' ')
+                if name:
+                    refs[name.strip()] = oid.strip()
+        except OSError as e:
+            logger.warning(f"读取 packed-refs 失败 {packed}: {e}")
+
+    # 松散引用优先于 packed-refs
+    refs_dir = git_dir / "refs"
+    if refs_dir.is_dir():
+        for root, _, files in os.walk(refs_dir):
+            for name in files:
+                path = Path(root) / name
+                if name.endswith('.lock'):
+                    continue
+                try:
+                    value = path.read_text(encoding='utf-8', errors='replace').strip()
+                except OSError:
+                    continue
+                if not value or value.startswith('ref:'):
+                    continue
+                refs[path.relative_to(git_dir).as_posix()] = value
+
+    return refs
+
+
+def cached_ref_map(snapshot_path: Path) -> Dict[str, str]:
+    """
+    读取快照的引用表，优先使用快照中的 .refmap 缓存
+
+    缓存不存在时解析引用并写入缓存（快照目录只读时只返回结果）。
+    只用于快照，在线仓库的引用会变化，应直接调用 read_ref_map
+    """
+    cache = Path(snapshot_path) / REF_MAP_CACHE_FILE_NAME
+    if cache.exists():
+        try:
+            refs = {}
+            for line in cache.read_text(encoding='utf-8').splitlines():
+                oid, _, name = line.partition(' ')
+                if name:
+                    refs[name] = oid
+            return refs
+        except OSError as e:
+            logger.warning(f"读取引用表缓存失败 {cache}: {e}")
+
+    refs = read_ref_map(snapshot_path)
+    try:
+        tmp = cache.with_name(f"{REF_MAP_CACHE_FILE_NAME}.tmp")
+        tmp.write_text(
+            ''.join(f"{refs[name]} {name}\n" for name in sorted(refs)),
+            encoding='utf-8',
+        )
+        os.replace(tmp, cache)
+    except OSError:
+        pass
+    return refs
+
+
+def ref_fingerprint(ref_map: Dict[str, str]) -> bytes:
+    """计算引用表指纹（20 字节 SHA-1），引用未变化时指纹不变"""
+    digest = hashlib.sha1()
+    for name in sorted(ref_map):
+        digest.update(f"{name} {ref_map[name]}\n".encode('utf-8'))
+    return digest.digest()
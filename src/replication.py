@@ -0,0 +1,874 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异地复制模块
+把备份根目录中的快照和归档增量复制到第二个目标：另一个挂载路径，或 S3 兼容
+存储（如 MinIO）。
+
+- 快照和归档生成后不再变化，整体复制完成的快照/归档记录在状态库中，之后直接跳过
+- 文件按内容（SHA-256）去重：快照清单和归档校验文件中已有哈希，其余文件按
+  (设备, inode, 大小, mtime) 缓存哈希；目标上已有相同内容时在目标端硬链接/
+  服务端复制，不再传输数据。每晚的复制量约等于当天新增的数据
+- 大文件在 S3 上并发分片上传，已完成的分片记录在状态库中，中断后继续上传；
+  本地目标先写 .part 文件，中断后从其末尾继续
+- 小仓库打包目录（<owner>/.small_repos）的打包文件只追加，按上次复制时的
+  大小只传输新增的末尾（S3 上用服务端复制拼接已有部分）；索引在打包数据之后
+  整体复制，整理后不再存在的打包文件从目标上删除
+- 所有传输共用一个速率上限
+"""
+
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from src.archive import checksum_file_path, list_archives
+from src.integrity import read_checksum_file, read_manifest
+from src.small_repos import INDEX_FILE_NAME, PACK_DIR_NAME
+from src.tiering import is_snapshot
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE_NAME = ".replication.db"
+CHUNK_SIZE = 1024 * 1024
+
+# S3 分片（最后一片除外）最小 5 MB，服务端复制的单个分片最大 5 GB
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_COPY_PART_SIZE = 5 * 1024 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    target TEXT NOT NULL,
+    path TEXT NOT NULL,
+    time REAL NOT NULL,
+    PRIMARY KEY (target, path)
+);
+CREATE TABLE IF NOT EXISTS files (
+    target TEXT NOT NULL,
+    path TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (target, path)
+);
+CREATE INDEX IF NOT EXISTS files_sha ON files (target, sha256);
+CREATE TABLE IF NOT EXISTS hashes (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (dev, ino)
+);
+CREATE TABLE IF NOT EXISTS uploads (
+    target TEXT NOT NULL,
+    path TEXT NOT NULL,
+    upload_id TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    part_size INTEGER NOT NULL,
+    PRIMARY KEY (target, path)
+);
+CREATE TABLE IF NOT EXISTS parts (
+    target TEXT NOT NULL,
+    path TEXT NOT NULL,
+    part_number INTEGER NOT NULL,
+    etag TEXT NOT NULL,
+    PRIMARY KEY (target, path, part_number)
+);
+CREATE TABLE IF NOT EXISTS tails (
+    target TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (target, path)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    target TEXT NOT NULL,
+    time REAL NOT NULL,
+    files INTEGER NOT NULL,
+    uploaded INTEGER NOT NULL,
+    linked INTEGER NOT NULL,
+    uploaded_bytes INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    elapsed REAL NOT NULL
+);
+"""
+
+
+class RateLimiter:
+    """多个线程共用的字节速率上限"""
+
+    def __init__(self, max_bytes_per_second: float = 0):
+        self.max_bytes_per_second = float(max_bytes_per_second or 0)
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def consume(self, size: int):
+        """预约传输 size 字节的时间段，超出速率时等待"""
+        if not self.max_bytes_per_second or size <= 0:
+            return
+        # 每次预约下一个时间段，空闲后不会突发追赶
+        with self._lock:
+            now = time.monotonic()
+            due = max(self._next_slot, now)
+            self._next_slot = due + size / self.max_bytes_per_second
+        delay = due - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ReplicationState:
+    """复制状态库（备份根目录/.replication.db），可在多个线程中使用"""
+
+    def __init__(self, path: Path):
+        self.conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def query(self, sql: str, params: tuple = ()) -> list:
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def execute(self, sql: str, params: tuple = ()):
+        with self.lock, self.conn:
+            self.conn.execute(sql, params)
+
+    def close(self):
+        self.conn.close()
+
+    # ---------- 分片上传检查点 ----------
+
+    def get_upload(self, target: str, key: str) -> Optional[Tuple[str, str, int]]:
+        """未完成的分片上传 (upload_id, sha256, part_size)"""
+        rows = self.query(
+            "SELECT upload_id, sha256, part_size FROM uploads "
+            "WHERE target = ? AND path = ?",
+            (target, key),
+        )
+        return rows[0] if rows else None
+
+    def get_parts(self, target: str, key: str) -> Dict[int, str]:
+        return dict(
+            self.query(
+                "SELECT part_number, etag FROM parts WHERE target = ? AND path = ?",
+                (target, key),
+            )
+        )
+
+    def save_upload(
+        self, target: str, key: str, upload_id: str, sha: str, part_size: int
+    ):
+        self.clear_upload(target, key)
+        self.execute(
+            "INSERT INTO uploads (target, path, upload_id, sha256, part_size) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (target, key, upload_id, sha, part_size),
+        )
+
+    def save_part(self, target: str, key: str, part_number: int, etag: str):
+        self.execute(
+            "INSERT OR REPLACE INTO parts (target, path, part_number, etag) "
+            "VALUES (?, ?, ?, ?)",
+            (target, key, part_number, etag),
+        )
+
+    def clear_upload(self, target: str, key: str):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM uploads WHERE target = ? AND path = ?", (target, key)
+            )
+            self.conn.execute(
+                "DELETE FROM parts WHERE target = ? AND path = ?", (target, key)
+            )
+
+
+class LocalTarget:
+    """复制到另一个挂载路径（保持与备份根目录相同的目录结构）"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.name = f"file://{self.root.resolve()}"
+
+    def make_dirs(self, key: str):
+        (self.root / key).mkdir(parents=True, exist_ok=True)
+
+    def link(self, src_key: str, key: str):
+        """在目标上复用已有内容（硬链接，不支持时本地复制）"""
+        src, dest = self.root / src_key, self.root / key
+        if not src.is_file():
+            raise FileNotFoundError(str(src))
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.link")
+        if tmp.exists():
+            tmp.unlink()
+        try:
+            os.link(src, tmp)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+            shutil.copy2(src, tmp)
+        os.replace(tmp, dest)
+
+    def put(
+        self,
+        path: Path,
+        key: str,
+        sha: str,
+        limiter: RateLimiter,
+        state: ReplicationState,
+    ) -> int:
+        """
+        复制文件（先写 .part，中断后从其末尾继续）
+
+        Returns:
+            实际传输的字节数
+        """
+        dest = self.root / key
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        part = dest.with_name(f".{dest.name}.part")
+        size = path.stat().st_size
+        offset = part.stat().st_size if part.exists() else 0
+        if offset > size:
+            part.unlink()
+            offset = 0
+
+        sent = 0
+        with open(path, 'rb') as src, open(part, 'ab') as out:
+            src.seek(offset)
+            while True:
+                data = src.read(CHUNK_SIZE)
+                if not data:
+                    break
+                limiter.consume(len(data))
+                out.write(data)
+                sent += len(data)
+            out.flush()
+            os.fsync(out.fileno())
+        shutil.copystat(path, part)
+        os.replace(part, dest)
+        return sent
+
+    def append(
+        self, path: Path, key: str, offset: int, limiter: RateLimiter
+    ) -> Optional[int]:
+        """
+        把只追加文件从 offset 开始的新增部分追加到目标上的副本
+
+        Returns:
+            实际传输的字节数；目标上的副本不存在或短于 offset 时为 None
+        """
+        dest = self.root / key
+        if not dest.is_file() or dest.stat().st_size < offset:
+            return None
+        sent = 0
+        with open(path, 'rb') as src, open(dest, 'r+b') as out:
+            # 去掉上次中断时多写的部分
+            out.truncate(offset)
+            out.seek(offset)
+            src.seek(offset)
+            while True:
+                data = src.read(CHUNK_SIZE)
+                if not data:
+                    break
+                limiter.consume(len(data))
+                out.write(data)
+                sent += len(data)
+            out.flush()
+            os.fsync(out.fileno())
+        shutil.copystat(path, dest)
+        return sent
+
+    def delete(self, key: str):
+        try:
+            (self.root / key).unlink()
+        except FileNotFoundError:
+            pass
+
+
+class S3Target:
+    """复制到 S3 兼容存储（对象键为 前缀 + 备份根目录下的相对路径）"""
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = '',
+        endpoint_url: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        region: Optional[str] = None,
+        part_size: int = 64 * 1024 * 1024,
+        part_workers: int = 4,
+    ):
+        if boto3 is None:
+            raise RuntimeError("复制到 S3 需要安装 boto3: pip install boto3")
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.name = f"s3://{bucket}/{self.prefix}"
+        self.part_size = max(MIN_PART_SIZE, int(part_size))
+        self.part_workers = max(1, int(part_workers or 1))
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+            region_name=region or None,
+        )
+
+    def make_dirs(self, key: str):
+        """对象存储没有目录"""
+
+    def link(self, src_key: str, key: str):
+        """服务端复制已有对象，不经过本机传输"""
+        self.client.copy(
+            {'Bucket': self.bucket, 'Key': self.prefix + src_key},
+            self.bucket,
+            self.prefix + key,
+        )
+
+    def put(
+        self,
+        path: Path,
+        key: str,
+        sha: str,
+        limiter: RateLimiter,
+        state: ReplicationState,
+    ) -> int:
+        """
+        上传文件；大文件并发分片上传，已完成的分片记录为检查点
+
+        Returns:
+            实际传输的字节数
+        """
+        size = path.stat().st_size
+        if size <= self.part_size:
+            data = path.read_bytes()
+            limiter.consume(len(data))
+            self.client.put_object(
+                Bucket=self.bucket,
+                Key=self.prefix + key,
+                Body=data,
+                Metadata={'sha256': sha},
+            )
+            return len(data)
+        return self._put_multipart(path, key, sha, size, limiter, state)
+
+    def _put_multipart(
+        self,
+        path: Path,
+        key: str,
+        sha: str,
+        size: int,
+        limiter: RateLimiter,
+        state: ReplicationState,
+    ) -> int:
+        object_key = self.prefix + key
+        upload_id, done = self._resume_upload(key, sha, state)
+        if upload_id is None:
+            upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=object_key, Metadata={'sha256': sha}
+            )['UploadId']
+            state.save_upload(self.name, key, upload_id, sha, self.part_size)
+            done = {}
+        elif done:
+            logger.info(f"  续传 {key}: 已完成 {len(done)} 个分片")
+
+        count = (size + self.part_size - 1) // self.part_size
+        todo = [n for n in range(1, count + 1) if n not in done]
+        sent = [0]
+        sent_lock = threading.Lock()
+
+        def upload_part(number: int):
+            offset = (number - 1) * self.part_size
+            with open(path, 'rb') as f:
+                data = os.pread(f.fileno(), self.part_size, offset)
+            limiter.consume(len(data))
+            etag = self.client.upload_part(
+                Bucket=self.bucket,
+                Key=object_key,
+                UploadId=upload_id,
+                PartNumber=number,
+                Body=data,
+            )['ETag']
+            state.save_part(self.name, key, number, etag)
+            with sent_lock:
+                sent[0] += len(data)
+            return number, etag
+
+        with ThreadPoolExecutor(max_workers=self.part_workers) as pool:
+            for number, etag in pool.map(upload_part, todo):
+                done[number] = etag
+
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=object_key,
+            UploadId=upload_id,
+            MultipartUpload={
+                'Parts': [
+                    {'PartNumber': n, 'ETag': done[n]} for n in sorted(done)
+                ]
+            },
+        )
+        state.clear_upload(self.name, key)
+        return sent[0]
+
+    def append(
+        self, path: Path, key: str, offset: int, limiter: RateLimiter
+    ) -> Optional[int]:
+        """
+        把只追加文件从 offset 开始的新增部分追加到已有对象：分片上传中第一片
+        服务端复制已有对象的前 offset 字节，其余分片上传新增部分
+
+        Returns:
+            实际传输的字节数；已有部分不满足分片大小限制或对象不存在时为 None
+        """
+        if not MIN_PART_SIZE <= offset <= MAX_COPY_PART_SIZE:
+            return None
+        object_key = self.prefix + key
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=object_key)
+        except Exception:
+            return None
+        if head['ContentLength'] < offset:
+            return None
+
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=object_key
+        )['UploadId']
+        try:
+            copied = self.client.upload_part_copy(
+                Bucket=self.bucket,
+                Key=object_key,
+                UploadId=upload_id,
+                PartNumber=1,
+                CopySource={'Bucket': self.bucket, 'Key': object_key},
+                CopySourceRange=f"bytes=0-{offset - 1}",
+            )
+            parts = [{'PartNumber': 1, 'ETag': copied['CopyPartResult']['ETag']}]
+            sent = 0
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                while True:
+                    data = f.read(self.part_size)
+                    if not data:
+                        break
+                    limiter.consume(len(data))
+                    etag = self.client.upload_part(
+                        Bucket=self.bucket,
+                        Key=object_key,
+                        UploadId=upload_id,
+                        PartNumber=len(parts) + 1,
+                        Body=data,
+                    )['ETag']
+                    parts.append({'PartNumber': len(parts) + 1, 'ETag': etag})
+                    sent += len(data)
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=object_key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts},
+            )
+        except BaseException:
+            self._abort(key, upload_id)
+            raise
+        return sent
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def _resume_upload(
+        self, key: str, sha: str, state: ReplicationState
+    ) -> Tuple[Optional[str], Dict[int, str]]:
+        """找回上次中断的分片上传，内容或分片大小变化时放弃"""
+        saved = state.get_upload(self.name, key)
+        if not saved:
+            return None, {}
+        upload_id, saved_sha, part_size = saved
+        if saved_sha != sha or part_size != self.part_size:
+            self._abort(key, upload_id)
+            return None, {}
+        try:
+            listed = self.client.list_parts(
+                Bucket=self.bucket, Key=self.prefix + key, UploadId=upload_id
+            )
+        except Exception:
+            # 上传已过期或被清理
+            state.clear_upload(self.name, key)
+            return None, {}
+        remote = {p['PartNumber']: p['ETag'] for p in listed.get('Parts', [])}
+        local = state.get_parts(self.name, key)
+        return upload_id, {n: e for n, e in local.items() if remote.get(n) == e}
+
+    def _abort(self, key: str, upload_id: str):
+        try:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.prefix + key, UploadId=upload_id
+            )
+        except Exception:
+            pass
+
+
+def open_target(url: str, options: Optional[Dict] = None):
+    """
+    按目标地址创建复制目标
+
+    Args:
+        url: s3://bucket/prefix，或本地路径（可带 file:// 前缀）
+        options: S3 选项 endpoint_url/access_key/secret_key/region/
+            part_size/part_workers
+    """
+    options = options or {}
+    if url.startswith('s3://'):
+        bucket, _, prefix = url[5:].partition('/')
+        return S3Target(bucket, prefix, **options)
+    if url.startswith('file://'):
+        url = url[7:]
+    return LocalTarget(Path(url))
+
+
+class FileItem(NamedTuple):
+    """待复制的文件"""
+
+    path: Path
+    key: str
+    sha256: str
+    size: int
+    item: str
+
+
+class Replicator:
+    """备份根目录增量复制"""
+
+    def __init__(
+        self, backup_root: Path, target, workers: int = 4, max_mb_per_second: float = 0
+    ):
+        """
+        Args:
+            backup_root: 备份根目录
+            target: LocalTarget 或 S3Target
+            workers: 并发传输的文件数
+            max_mb_per_second: 传输速率上限（MB/s），0 表示不限制
+        """
+        self.backup_root = Path(backup_root)
+        self.target = target
+        self.workers = max(1, int(workers or 1))
+        self.limiter = RateLimiter(float(max_mb_per_second or 0) * 1024 * 1024)
+        self.state_path = self.backup_root / STATE_FILE_NAME
+
+    def collect_items(self) -> List[Tuple[str, Path]]:
+        """
+        列出可复制的快照和归档（按修改时间从旧到新）
+
+        Returns:
+            [(相对路径, 路径)]，快照为目录，归档为 bundle 文件（连同校验文件）
+        """
+        items = []
+        for owner_dir in sorted(self.backup_root.iterdir()):
+            if not owner_dir.is_dir() or owner_dir.name.startswith('.'):
+                continue
+            for snapshot in owner_dir.glob('*/snapshots/*'):
+                # 跳过冷层转换中断留下的 .<快照名>.hot/.cold
+                if not snapshot.name.startswith('.') and is_snapshot(snapshot):
+                    items.append(snapshot)
+            for archive_dir in owner_dir.glob('*/archives'):
+                items.extend(list_archives(archive_dir))
+        items.sort(key=lambda p: (p.stat().st_mtime, str(p)))
+        return [(p.relative_to(self.backup_root).as_posix(), p) for p in items]
+
+    def run(self) -> Dict[str, int]:
+        """
+        执行一次增量复制
+
+        Returns:
+            {'items', 'files', 'uploaded', 'linked', 'skipped',
+             'uploaded_bytes', 'pack_files', 'failed'}
+        """
+        stats = {
+            'items': 0,
+            'files': 0,
+            'pack_files': 0,
+            'uploaded': 0,
+            'linked': 0,
+            'skipped': 0,
+            'uploaded_bytes': 0,
+            'failed': 0,
+        }
+        if not self.backup_root.exists():
+            return stats
+
+        started = time.monotonic()
+        state = ReplicationState(self.state_path)
+        target = self.target.name
+        try:
+            done = {
+                row[0]
+                for row in state.query(
+                    "SELECT path FROM items WHERE target = ?", (target,)
+                )
+            }
+            pending = [(rel, p) for rel, p in self.collect_items() if rel not in done]
+
+            files: List[FileItem] = []
+            for rel, path in pending:
+                try:
+                    files.extend(self._item_files(rel, path, state))
+                except OSError as e:
+                    logger.warning(f"读取待复制文件失败 {path}: {e}")
+
+            failed_items = self._replicate(files, state, stats)
+            for rel, _ in pending:
+                if rel not in failed_items:
+                    state.execute(
+                        "INSERT OR REPLACE INTO items (target, path, time) "
+                        "VALUES (?, ?, ?)",
+                        (target, rel, time.time()),
+                    )
+                    stats['items'] += 1
+
+            self._replicate_packs(state, stats)
+
+            state.execute(
+                "INSERT INTO runs (target, time, files, uploaded, linked, "
+                "uploaded_bytes, failed, elapsed) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    target,
+                    time.time(),
+                    stats['files'],
+                    stats['uploaded'],
+                    stats['linked'],
+                    stats['uploaded_bytes'],
+                    stats['failed'],
+                    time.monotonic() - started,
+                ),
+            )
+        finally:
+            state.close()
+        return stats
+
+    def _replicate_packs(self, state: ReplicationState, stats: Dict[str, int]):
+        """
+        复制小仓库打包目录：打包文件只传输上次复制之后追加的部分，索引在
+        打包数据之后整体复制（目标上的索引不会引用尚未复制的数据），
+        整理后不再存在的打包文件从目标上删除
+        """
+        target = self.target.name
+        for pack_dir in sorted(self.backup_root.glob(f"*/{PACK_DIR_NAME}")):
+            rel_dir = pack_dir.relative_to(self.backup_root).as_posix()
+            recorded = {
+                path: (size, mtime_ns)
+                for path, size, mtime_ns in state.query(
+                    "SELECT path, size, mtime_ns FROM tails "
+                    "WHERE target = ? AND path LIKE ?",
+                    (target, f"{rel_dir}/%"),
+                )
+            }
+            files = sorted(pack_dir.glob('pack-*.dat')) + [pack_dir / INDEX_FILE_NAME]
+            ok = True
+            for path in files:
+                if not path.is_file() or (path.name == INDEX_FILE_NAME and not ok):
+                    continue
+                key = f"{rel_dir}/{path.name}"
+                st = path.stat()
+                previous = recorded.get(key)
+                if previous == (st.st_size, st.st_mtime_ns):
+                    continue
+                try:
+                    sent = None
+                    if (
+                        previous
+                        and path.name != INDEX_FILE_NAME
+                        and st.st_size > previous[0]
+                    ):
+                        sent = self.target.append(path, key, previous[0], self.limiter)
+                    if sent is None:
+                        sha = self._cached_hash(path, st, state)
+                        sent = self.target.put(path, key, sha, self.limiter, state)
+                except Exception as e:
+                    logger.error(f"  ✗ 复制失败 {key}: {e}")
+                    stats['failed'] += 1
+                    ok = False
+                    continue
+                state.execute(
+                    "INSERT OR REPLACE INTO tails (target, path, size, mtime_ns) "
+                    "VALUES (?, ?, ?, ?)",
+                    (target, key, st.st_size, st.st_mtime_ns),
+                )
+                stats['pack_files'] += 1
+                stats['uploaded_bytes'] += sent
+
+            if not ok:
+                continue
+            current = {f"{rel_dir}/{p.name}" for p in files}
+            for key in set(recorded) - current:
+                try:
+                    self.target.delete(key)
+                except Exception as e:
+                    logger.warning(f"删除目标上的旧打包文件失败 {key}: {e}")
+                    continue
+                state.execute(
+                    "DELETE FROM tails WHERE target = ? AND path = ?", (target, key)
+                )
+
+    def _item_files(
+        self, rel: str, path: Path, state: ReplicationState
+    ) -> List[FileItem]:
+        """快照或归档中的文件及其内容哈希"""
+        # 已知哈希：归档校验文件按路径，快照清单按 (设备, inode, 大小, mtime)
+        by_path: Dict[Path, str] = {}
+        by_inode: Dict[Tuple[int, int, int, int], str] = {}
+        if path.is_file():
+            checksum = checksum_file_path(path, 'sha256')
+            paths = [path]
+            if checksum.exists():
+                paths.append(checksum)
+                sha = read_checksum_file(checksum)
+                if sha:
+                    by_path[path] = sha
+        else:
+            paths = []
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                if not names and not dirs:
+                    # 保留空目录（如 refs/tags），本地目标恢复后可直接使用
+                    self.target.make_dirs(
+                        Path(root).relative_to(self.backup_root).as_posix()
+                    )
+                paths.extend(
+                    Path(root) / n for n in sorted(names) if not n.endswith('.tmp')
+                )
+            for entry in read_manifest(path):
+                identity = (entry.dev, entry.ino, entry.size, entry.mtime_ns)
+                by_inode[identity] = entry.sha256
+
+        items = []
+        for file_path in paths:
+            st = file_path.stat()
+            sha = by_path.get(file_path) or by_inode.get(
+                (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+            )
+            if not sha:
+                sha = self._cached_hash(file_path, st, state)
+            key = file_path.relative_to(self.backup_root).as_posix()
+            items.append(FileItem(file_path, key, sha, st.st_size, rel))
+        return items
+
+    @staticmethod
+    def _cached_hash(path: Path, st: os.stat_result, state: ReplicationState) -> str:
+        """按 (设备, inode, 大小, mtime) 缓存的文件哈希"""
+        rows = state.query(
+            "SELECT size, mtime_ns, sha256 FROM hashes WHERE dev = ? AND ino = ?",
+            (st.st_dev, st.st_ino),
+        )
+        if rows and rows[0][:2] == (st.st_size, st.st_mtime_ns):
+            return rows[0][2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        sha = digest.hexdigest()
+        state.execute(
+            "INSERT OR REPLACE INTO hashes (dev, ino, size, mtime_ns, sha256) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, sha),
+        )
+        return sha
+
+    def _replicate(
+        self, files: List[FileItem], state: ReplicationState, stats: Dict[str, int]
+    ) -> set:
+        """
+        传输文件：已复制的跳过，目标上已有相同内容的链接，其余并发上传
+
+        Returns:
+            有文件失败的快照/归档（相对路径）
+        """
+        target = self.target.name
+        failed_items = set()
+        in_flight = {}
+        deferred: List[FileItem] = []
+
+        def record(item: FileItem):
+            state.execute(
+                "INSERT OR REPLACE INTO files (target, path, sha256) VALUES (?, ?, ?)",
+                (target, item.key, item.sha256),
+            )
+
+        def upload(item: FileItem) -> int:
+            sent = self.target.put(
+                item.path, item.key, item.sha256, self.limiter, state
+            )
+            record(item)
+            return sent
+
+        def try_link(item: FileItem) -> bool:
+            rows = state.query(
+                "SELECT path FROM files WHERE target = ? AND sha256 = ? LIMIT 1",
+                (target, item.sha256),
+            )
+            if not rows:
+                return False
+            try:
+                self.target.link(rows[0][0], item.key)
+            except Exception as e:
+                # 目标上的副本已不存在，重新上传
+                logger.debug(f"链接失败 {item.key}: {e}")
+                state.execute(
+                    "DELETE FROM files WHERE target = ? AND path = ?",
+                    (target, rows[0][0]),
+                )
+                return False
+            record(item)
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {}
+            for item in files:
+                stats['files'] += 1
+                replicated = state.query(
+                    "SELECT sha256 FROM files WHERE target = ? AND path = ?",
+                    (target, item.key),
+                )
+                if replicated and replicated[0][0] == item.sha256:
+                    stats['skipped'] += 1
+                elif item.sha256 in in_flight:
+                    # 相同内容正在上传，完成后再链接
+                    deferred.append(item)
+                elif try_link(item):
+                    stats['linked'] += 1
+                else:
+                    future = pool.submit(upload, item)
+                    in_flight[item.sha256] = future
+                    futures[future] = item
+
+            finished, _ = wait(futures)
+            for future in finished:
+                item = futures[future]
+                try:
+                    stats['uploaded_bytes'] += future.result()
+                    stats['uploaded'] += 1
+                except Exception as e:
+                    logger.error(f"  ✗ 复制失败 {item.key}: {e}")
+                    stats['failed'] += 1
+                    failed_items.add(item.item)
+
+        for item in deferred:
+            try:
+                if try_link(item):
+                    stats['linked'] += 1
+                else:
+                    stats['uploaded_bytes'] += upload(item)
+                    stats['uploaded'] += 1
+            except Exception as e:
+                logger.error(f"  ✗ 复制失败 {item.key}: {e}")
+                stats['failed'] += 1
+                failed_items.add(item.item)
+        return failed_items
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量时间点恢复模块
+按 owner/仓库 模式和时间点为每个仓库选择恢复来源（该时间点之前最近的快照，
+没有快照时使用归档 bundle），在容器运行期间并发准备好恢复副本（硬链接/
+reflink/复制），最后只停止一次容器，统一替换所有仓库
+"""
+
+import fnmatch
+import json
+import logging
+import os
+import shutil
+import subprocess
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from src.archive import list_archives
+from src.archive_catalog import catalog_path, read_catalog
+from src.archive_codec import iter_archive
+from src.restore_drill import clone_tree, strip_snapshot_metadata
+from src.retention import SNAPSHOT_NAME_FORMAT, snapshot_time
+from src.small_repos import open_pack
+from src.tiering import cold_bundle_path, is_snapshot, snapshot_tier
+
+logger = logging.getLogger(__name__)
+
+RESTORE_LOG_FILE_NAME = ".restores.jsonl"
+
+# 从在线仓库保留到 bundle 恢复结果中的文件（镜像配置、默认分支、Gitea 钩子）
+LIVE_REPO_FILES = ('config', 'HEAD', 'hooks')
+
+
+class RestoreItem(NamedTuple):
+    """一个仓库的恢复计划"""
+
+    repository: str
+    # snapshot / archive，没有可用来源时为空
+    kind: str
+    source: Optional[Path]
+    source_time: Optional[datetime]
+    dest: Path
+
+    def describe(self) -> str:
+        if not self.source:
+            return f"{self.repository}: 没有该时间点之前的快照或归档"
+        label = "快照" if self.kind == 'snapshot' else "归档"
+        return (
+            f"{self.repository}: {label} {self.source.name} "
+            f"({self.source_time:%Y-%m-%d %H:%M:%S}) -> {self.dest}"
+        )
+
+
+def parse_point_in_time(value: str) -> datetime:
+    """
+    解析时间点：now、快照目录名格式（20260101-120000）或 ISO 格式
+    （2026-01-01、2026-01-01T12:00）；只有日期时表示当天结束
+    """
+    value = value.strip()
+    if value.lower() == 'now':
+        return datetime.now()
+    try:
+        return datetime.strptime(value, SNAPSHOT_NAME_FORMAT)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"无法解析时间点: {value}")
+    if len(value) == 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59)
+    return parsed
+
+
+def match_repositories(backup_root: Path, pattern: str) -> List[str]:
+    """
+    按模式匹配备份中的仓库（owner/repo，支持通配符，不含 / 时匹配整个 owner）
+    """
+    pattern = pattern.strip().strip('/').lower()
+    if '/' not in pattern:
+        pattern = f"{pattern}/*"
+    backup_root = Path(backup_root)
+    if not backup_root.exists():
+        return []
+
+    matched = []
+    for owner_dir in sorted(backup_root.iterdir()):
+        if not owner_dir.is_dir() or owner_dir.name.startswith('.'):
+            continue
+        for repo_dir in sorted(owner_dir.iterdir()):
+            if not repo_dir.is_dir() or repo_dir.name.startswith('.'):
+                continue
+            name = f"{owner_dir.name}/{repo_dir.name}"
+            if fnmatch.fnmatchcase(name.lower(), pattern):
+                matched.append(name)
+    return matched
+
+
+def find_source(
+    repo_backup_dir: Path, at: datetime
+) -> Tuple[str, Optional[Path], Optional[datetime]]:
+    """
+    选出时间点之前最近的恢复来源
+
+    快照和归档都参与比较，时间相同时优先快照（不需要重新解包）。
+    月度归档是完整 bundle，归档链只需要最近的一个；归档从归档目录中选择，
+    不访问归档文件。小仓库打包的快照（packed）的路径为 owner 的打包目录。
+
+    Returns:
+        (类型, 路径, 时间)，没有可用来源时为 ('', None, None)
+    """
+    candidates = []
+    for snapshot in repo_backup_dir.glob('snapshots/*'):
+        if not is_snapshot(snapshot):
+            continue
+        taken = snapshot_time(snapshot)
+        if taken <= at:
+            candidates.append((taken, 1, 'snapshot', snapshot))
+    pack = open_pack(repo_backup_dir.parent)
+    repository = f"{repo_backup_dir.parent.name}/{repo_backup_dir.name}"
+    for packed in pack.snapshots(repository):
+        if packed.time <= at and packed.size:
+            candidates.append((packed.time, 1, 'packed', pack.path))
+    archive_dir = repo_backup_dir / 'archives'
+    if catalog_path(archive_dir).exists():
+        # 归档时间取自归档目录（从快照生成的归档为快照时间）
+        archives = [
+            (datetime.fromisoformat(r['time']), archive_dir / r['file'])
+            for r in read_catalog(archive_dir)
+            if r.get('time')
+        ]
+    else:
+        # 尚未建立归档目录的旧备份
+        archives = [
+            (datetime.fromtimestamp(bundle.stat().st_mtime), bundle)
+            for bundle in list_archives(archive_dir)
+        ]
+    for created, bundle in archives:
+        if created <= at:
+            candidates.append((created, 0, 'archive', bundle))
+
+    if not candidates:
+        return '', None, None
+    taken, _, kind, path = max(candidates)
+    return kind, path, taken
+
+
+def plan_restore(
+    backup_root: Path, repos_root: Path, pattern: str, at: datetime
+) -> List[RestoreItem]:
+    """为匹配的每个仓库生成恢复计划"""
+    plan = []
+    for name in match_repositories(backup_root, pattern):
+        owner, repo = name.split('/', 1)
+        kind, source, taken = find_source(Path(backup_root) / name, at)
+        dest = Path(repos_root) / owner / f"{repo}.git"
+        plan.append(RestoreItem(name, kind, source, taken, dest))
+    return plan
+
+
+def chown_tree(path: Path, uid: int, gid: int):
+    """递归修改所有者（不跟随符号链接）"""
+    os.lchown(path, uid, gid)
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            os.lchown(os.path.join(root, name), uid, gid)
+
+
+def _git(repo: Path, *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        ['git', '-c', 'safe.directory=*', '-C', str(repo), *args],
+        capture_output=True,
+        text=True,
+    )
+
+
+class RestoreEngine:
+    """批量恢复：并发准备 + 停一次容器统一替换"""
+
+    def __init__(
+        self,
+        backup_root: Path,
+        workers: int = 4,
+        mode: str = 'hardlink',
+        owner: Optional[Tuple[int, int]] = None,
+        stop_container: Optional[Callable[[], None]] = None,
+        start_container: Optional[Callable[[], None]] = None,
+        archive_key: Optional[bytes] = None,
+    ):
+        """
+        Args:
+            backup_root: 备份根目录（恢复记录写入 .restores.jsonl）
+            workers: 并发准备的仓库数
+            mode: 快照恢复方式 hardlink/reflink/copy
+            owner: 恢复后的 (uid, gid)，None 时沿用原仓库（或 owner 目录）的所有者
+            stop_container: 替换前调用一次，停止 Gitea 容器
+            start_container: 替换后调用一次（失败时也会调用），启动 Gitea 容器
+            archive_key: 加密归档的解密密钥
+        """
+        self.backup_root = Path(backup_root)
+        self.workers = max(1, int(workers or 1))
+        self.mode = mode
+        self.owner = owner
+        self.stop_container = stop_container
+        self.start_container = start_container
+        self.archive_key = archive_key
+        self.log_path = self.backup_root / RESTORE_LOG_FILE_NAME
+
+    def run(self, plan: List[RestoreItem]) -> List[Dict]:
+        """
+        执行恢复计划
+
+        1. 容器运行期间并发把来源恢复到目标旁边的临时目录
+        2. 停止容器，把现有仓库改名为 .backup-时间戳，临时目录改名为仓库
+        3. 启动容器
+
+        Returns:
+            每个仓库的恢复结果
+        """
+        run_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        results = {item.repository: self._new_result(run_id, item) for item in plan}
+
+        todo = [item for item in plan if item.source]
+        for item in plan:
+            if not item.source:
+                results[item.repository]['error'] = "没有可用的恢复来源"
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            staged = list(
+                pool.map(lambda i: self._stage(run_id, i, results[i.repository]), todo)
+            )
+        ready = [(item, path) for item, path in zip(todo, staged) if path]
+
+        if ready:
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            try:
+                if self.stop_container:
+                    self.stop_container()
+                for item, staging in ready:
+                    self._swap(item, staging, stamp, results[item.repository])
+            except Exception as e:
+                logger.error(f"  ✗ 恢复中断: {e}")
+                for item, _ in ready:
+                    result = results[item.repository]
+                    if not result['ok'] and not result['error']:
+                        result['error'] = str(e)
+            finally:
+                if self.start_container:
+                    self.start_container()
+                # 未替换的恢复副本（中断时）不保留
+                for _, staging in ready:
+                    shutil.rmtree(staging, ignore_errors=True)
+
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            for item in plan:
+                f.write(json.dumps(results[item.repository], ensure_ascii=False) + "\n")
+        return [results[item.repository] for item in plan]
+
+    @staticmethod
+    def _new_result(run_id: str, item: RestoreItem) -> Dict:
+        return {
+            'run_id': run_id,
+            'time': datetime.now().isoformat(),
+            'repository': item.repository,
+            'kind': item.kind,
+            'source': str(item.source) if item.source else None,
+            'source_time': item.source_time.isoformat() if item.source_time else None,
+            'dest': str(item.dest),
+            'mode': '',
+            'previous': None,
+            'stage_seconds': 0.0,
+            'ok': False,
+            'error': '',
+        }
+
+    def _stage(self, run_id: str, item: RestoreItem, result: Dict) -> Optional[Path]:
+        """在目标旁边准备恢复副本，失败时返回 None"""
+        staging = item.dest.parent / f".{item.dest.name}.restore-{run_id}"
+        started = time.monotonic()
+        try:
+            if item.kind == 'snapshot' and snapshot_tier(item.source) == 'cold':
+                # 冷层快照从其 bundle 恢复
+                result['mode'] = 'cold-bundle'
+                bundle = cold_bundle_path(item.source)
+                if bundle is None or not bundle.exists():
+                    raise RuntimeError(f"冷层 bundle 不存在: {bundle}")
+                self._unbundle(bundle, staging, item.dest)
+            elif item.kind == 'snapshot':
+                result['mode'] = clone_tree(item.source, staging, self.mode)
+                strip_snapshot_metadata(staging)
+            elif item.kind == 'packed':
+                # 小仓库打包的快照：取出 bundle 后恢复
+                result['mode'] = 'packed'
+                pack = open_pack(item.source.parent)
+                name = item.source_time.strftime(SNAPSHOT_NAME_FORMAT)
+                packed = pack.find(item.repository, name)
+                if packed is None:
+                    raise RuntimeError(f"打包快照不存在: {item.repository} {name}")
+                bundle = staging.with_name(f"{staging.name}.bundle")
+                pack.write_bundle(packed, bundle)
+                try:
+                    self._unbundle(bundle, staging, item.dest)
+                finally:
+                    try:
+                        bundle.unlink()
+                    except FileNotFoundError:
+                        pass
+            else:
+                result['mode'] = 'bundle'
+                self._unbundle(item.source, staging, item.dest, self.archive_key)
+
+            refresh = _git(staging, 'update-server-info')
+            if refresh.returncode != 0:
+                raise RuntimeError(refresh.stderr.strip())
+
+            owner = self.owner or self._current_owner(item.dest)
+            if owner and os.geteuid() == 0:
+                chown_tree(staging, *owner)
+        except Exception as e:
+            logger.error(f"  ✗ 准备恢复失败 {item.repository}: {e}")
+            result['error'] = str(e)
+            shutil.rmtree(staging, ignore_errors=True)
+            return None
+
+        result['stage_seconds'] = round(time.monotonic() - started, 3)
+        return staging
+
+    @staticmethod
+    def _unbundle(
+        bundle: Path, staging: Path, live: Path, key: Optional[bytes] = None
+    ):
+        """从 bundle 恢复裸仓库，并沿用在线仓库的配置、HEAD 和钩子"""
+        staging.parent.mkdir(parents=True, exist_ok=True)
+        init = subprocess.run(
+            ['git', 'init', '-q', '--bare', str(staging)],
+            capture_output=True,
+            text=True,
+        )
+        if init.returncode != 0:
+            raise RuntimeError(init.stderr.strip())
+
+        # 压缩/加密的归档先还原到恢复副本内（git fetch 需要 bundle 文件）
+        source = bundle
+        if not bundle.name.endswith('.bundle'):
+            source = staging / "restore.bundle"
+            with open(source, 'wb') as f:
+                for chunk in iter_archive(bundle, key):
+                    f.write(chunk)
+        try:
+            fetch = _git(staging, 'fetch', '-q', str(source), '+refs/*:refs/*')
+        finally:
+            if source != bundle:
+                source.unlink()
+        if fetch.returncode != 0:
+            raise RuntimeError(fetch.stderr.strip())
+
+        for name in LIVE_REPO_FILES:
+            src = live / name
+            dest = staging / name
+            if src.is_dir():
+                shutil.rmtree(dest, ignore_errors=True)
+                shutil.copytree(src, dest, symlinks=True)
+            elif src.is_file():
+                shutil.copy2(src, dest)
+
+    @staticmethod
+    def _current_owner(dest: Path) -> Optional[Tuple[int, int]]:
+        """原仓库（不存在时为 owner 目录）的所有者"""
+        for path in (dest, dest.parent):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            return st.st_uid, st.st_gid
+        return None
+
+    @staticmethod
+    def _swap(item: RestoreItem, staging: Path, stamp: str, result: Dict):
+        """把现有仓库移到 .backup-时间戳，恢复副本改名为仓库"""
+        previous = item.dest.with_name(f"{item.dest.name}.backup-{stamp}")
+        moved = False
+        try:
+            if item.dest.exists():
+                os.rename(item.dest, previous)
+                moved = True
+                result['previous'] = str(previous)
+            os.rename(staging, item.dest)
+            result['ok'] = True
+        except OSError as e:
+            logger.error(f"  ✗ 替换仓库失败 {item.repository}: {e}")
+            result['error'] = str(e)
+            if moved and not item.dest.exists():
+                os.rename(previous, item.dest)
+                result['previous'] = None
+            shutil.rmtree(staging, ignore_errors=True)
+
+
+def load_latest_restore(backup_root: Path) -> List[Dict]:
+    """读取最近一次批量恢复（同一 run_id）的全部结果"""
+    path = Path(backup_root) / RESTORE_LOG_FILE_NAME
+    if not path.exists():
+        return []
+    results = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                results.append(json.loads(line))
+            except ValueError:
+                continue
+    if not results:
+        return []
+    run_id = results[-1].get('run_id')
+    return [r for r in results if r.get('run_id') == run_id]
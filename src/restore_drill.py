@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+恢复演练模块
+抽取部分仓库的快照，恢复到临时目录（硬链接/reflink/复制），用宿主机 git
+执行 git fsck --connectivity-only，记录恢复耗时和吞吐量，
+为恢复时间目标（RTO）提供实测数据
+"""
+
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DRILL_LOG_FILE_NAME = ".restore_drills.jsonl"
+SCRATCH_DIR_NAME = ".restore_drill"
+
+# 快照顶层的备份元数据，恢复时不复制到仓库中
+SNAPSHOT_METADATA_FILES = (
+    '.snapshot_meta',
+    '.protected',
+    '.manifest',
+    '.refmap',
+    '.lfs_oids',
+)
+
+
+def clone_tree(src: Path, dest: Path, mode: str = 'hardlink') -> str:
+    """
+    复制目录树
+
+    Args:
+        src: 源目录
+        dest: 目标目录（不能已存在）
+        mode: hardlink（cp -al）、reflink（cp --reflink=always）或 copy（cp -a）；
+            硬链接/reflink 不可用时（跨文件系统、文件系统不支持）回退到普通复制
+
+    Returns:
+        实际使用的方式
+    """
+    attempts = {
+        'hardlink': [('hardlink', ['cp', '-al'])],
+        'reflink': [('reflink', ['cp', '-a', '--reflink=always'])],
+    }.get(mode, [])
+    attempts.append(('copy', ['cp', '-a']))
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    error = ''
+    for used, cmd in attempts:
+        result = subprocess.run(
+            cmd + [str(src), str(dest)], capture_output=True, text=True
+        )
+        if result.returncode == 0:
+            return used
+        error = result.stderr.strip()
+        if dest.exists():
+            shutil.rmtree(dest, ignore_errors=True)
+    raise OSError(f"复制失败 {src} -> {dest}: {error}")
+
+
+def strip_snapshot_metadata(repo_dir: Path):
+    """删除从快照带过来的备份元数据文件"""
+    for name in SNAPSHOT_METADATA_FILES:
+        path = repo_dir / name
+        if path.exists():
+            path.unlink()
+
+
+def tree_size(path: Path) -> int:
+    """目录内文件总字节数"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def pick_samples(
+    backup_root: Path, count: int, rng: Optional[random.Random] = None
+) -> List[Tuple[str, Path]]:
+    """
+    随机抽取仓库，每个仓库随机取一个快照（新旧快照都会被演练到）
+
+    Returns:
+        [(仓库名, 快照目录)]
+    """
+    rng = rng or random.Random()
+    candidates = []
+    backup_root = Path(backup_root)
+    for owner_dir in sorted(backup_root.iterdir()):
+        if not owner_dir.is_dir() or owner_dir.name.startswith('.'):
+            continue
+        for repo_dir in sorted(owner_dir.iterdir()):
+            snapshots = sorted(
+                s for s in repo_dir.glob('snapshots/*') if (s / "objects").is_dir()
+            )
+            if snapshots:
+                candidates.append((f"{owner_dir.name}/{repo_dir.name}", snapshots))
+
+    picked = rng.sample(candidates, min(max(0, count), len(candidates)))
+    return [(name, rng.choice(snapshots)) for name, snapshots in picked]
+
+
+class RestoreDrill:
+    """恢复演练"""
+
+    def __init__(
+        self,
+        backup_root: Path,
+        scratch_dir: Optional[Path] = None,
+        workers: int = 2,
+        mode: str = 'hardlink',
+    ):
+        """
+        Args:
+            backup_root: 备份根目录
+            scratch_dir: 临时恢复目录（默认 BACKUP_ROOT/.restore_drill，
+                与快照在同一文件系统上以便使用硬链接）
+            workers: 并发演练数
+            mode: 恢复方式 hardlink/reflink/copy
+        """
+        self.backup_root = Path(backup_root)
+        self.scratch_dir = Path(scratch_dir or self.backup_root / SCRATCH_DIR_NAME)
+        self.workers = max(1, int(workers or 1))
+        self.mode = mode
+        self.log_path = self.backup_root / DRILL_LOG_FILE_NAME
+
+    def run(self, samples: List[Tuple[str, Path]]) -> List[Dict]:
+        """
+        并发演练并把结果追加到 .restore_drills.jsonl
+
+        Args:
+            samples: [(仓库名, 快照目录)]
+
+        Returns:
+            每个样本的演练结果
+        """
+        run_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(
+                pool.map(lambda s: self.drill_one(run_id, s[0], s[1]), samples)
+            )
+
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+        if self.scratch_dir.exists() and not any(self.scratch_dir.iterdir()):
+            self.scratch_dir.rmdir()
+        return results
+
+    def drill_one(self, run_id: str, repository: str, snapshot: Path) -> Dict:
+        """演练单个快照：恢复 + fsck，结束后删除临时目录"""
+        dest = self.scratch_dir / f"{uuid.uuid4().hex[:8]}-{snapshot.name}.git"
+        result = {
+            'run_id': run_id,
+            'time': datetime.now().isoformat(),
+            'repository': repository,
+            'snapshot': snapshot.name,
+            'mode': self.mode,
+            'size_bytes': 0,
+            'copy_seconds': 0.0,
+            'fsck_seconds': 0.0,
+            'total_seconds': 0.0,
+            'mb_per_second': 0.0,
+            'ok': False,
+            'error': '',
+        }
+
+        started = time.monotonic()
+        try:
+            result['mode'] = clone_tree(snapshot, dest, self.mode)
+            strip_snapshot_metadata(dest)
+            copied = time.monotonic()
+
+            fsck = subprocess.run(
+                [
+                    'git',
+                    '-c',
+                    'safe.directory=*',
+                    '-C',
+                    str(dest),
+                    'fsck',
+                    '--connectivity-only',
+                    '--no-progress',
+                ],
+                capture_output=True,
+                text=True,
+            )
+            finished = time.monotonic()
+            total = finished - started
+
+            result['size_bytes'] = tree_size(dest)
+            result['copy_seconds'] = round(copied - started, 3)
+            result['fsck_seconds'] = round(finished - copied, 3)
+            result['ok'] = fsck.returncode == 0
+            if not result['ok']:
+                result['error'] = (fsck.stderr or fsck.stdout).strip()[-500:]
+        except Exception as e:
+            result['error'] = str(e)
+            total = time.monotonic() - started
+        finally:
+            shutil.rmtree(dest, ignore_errors=True)
+
+        result['total_seconds'] = round(total, 3)
+        if total > 0:
+            size_mb = result['size_bytes'] / 1024 / 1024
+            result['mb_per_second'] = round(size_mb / total, 2)
+        return result
+
+
+def load_latest_drill(backup_root: Path) -> List[Dict]:
+    """读取最近一次演练（同一 run_id）的全部结果"""
+    path = Path(backup_root) / DRILL_LOG_FILE_NAME
+    if not path.exists():
+        return []
+    results = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                results.append(json.loads(line))
+            except ValueError:
+                continue
+    if not results:
+        return []
+    run_id = results[-1].get('run_id')
+    return [r for r in results if r.get('run_id') == run_id]
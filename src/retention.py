@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+快照保留策略模块
+GFS（祖父-父-子）保留：按日/周/月/年分桶，每个桶保留最新的一个快照
+"""
+
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 快照目录名格式（与 create_snapshot 一致）
+SNAPSHOT_NAME_FORMAT = '%Y%m%d-%H%M%S'
+
+
+def snapshot_time(snapshot: Path) -> datetime:
+    """获取快照时间（优先解析目录名，失败时使用 mtime）"""
+    try:
+        return datetime.strptime(snapshot.name, SNAPSHOT_NAME_FORMAT)
+    except ValueError:
+        return datetime.fromtimestamp(snapshot.stat().st_mtime)
+
+
+class RetentionPolicy:
+    """GFS 保留策略"""
+
+    # 桶类型 -> 分桶函数
+    BUCKETS = (
+        ('daily', lambda t: t.date()),
+        ('weekly', lambda t: tuple(t.isocalendar())[:2]),
+        ('monthly', lambda t: (t.year, t.month)),
+        ('yearly', lambda t: t.year),
+    )
+
+    def __init__(
+        self,
+        keep_daily: int = 7,
+        keep_weekly: int = 4,
+        keep_monthly: int = 12,
+        keep_yearly: int = 0,
+        keep_within_days: int = 0,
+    ):
+        """
+        初始化保留策略
+
+        Args:
+            keep_daily: 保留最近 N 天（每天最新的一个）
+            keep_weekly: 保留最近 N 周（每周最新的一个）
+            keep_monthly: 保留最近 N 个月（每月最新的一个）
+            keep_yearly: 保留最近 N 年（每年最新的一个）
+            keep_within_days: 最近 N 天内的快照全部保留
+        """
+        self.limits = {
+            'daily': max(0, int(keep_daily or 0)),
+            'weekly': max(0, int(keep_weekly or 0)),
+            'monthly': max(0, int(keep_monthly or 0)),
+            'yearly': max(0, int(keep_yearly or 0)),
+        }
+        self.keep_within_days = max(0, int(keep_within_days or 0))
+
+    def plan(
+        self,
+        snapshots: List[Tuple[str, datetime, bool]],
+        now: Optional[datetime] = None,
+    ) -> Dict:
+        """
+        计算单个仓库的保留计划
+
+        Args:
+            snapshots: [(快照名, 快照时间, 是否受保护)]
+            now: 当前时间（默认 datetime.now()）
+
+        Returns:
+            {'keep': {快照名: [保留原因]}, 'delete': [快照名]}
+        """
+        now = now or datetime.now()
+        ordered = sorted(snapshots, key=lambda s: s[1], reverse=True)
+        keep: Dict[str, List[str]] = {}
+
+        def mark(name: str, reason: str):
+            keep.setdefault(name, []).append(reason)
+
+        # 最新快照始终保留
+        if ordered:
+            mark(ordered[0][0], 'latest')
+
+        for name, when, protected in ordered:
+            if protected:
+                mark(name, 'protected')
+            if self.keep_within_days and when >= now - timedelta(
+                days=self.keep_within_days
+            ):
+                mark(name, 'within')
+
+        # 每种桶按时间倒序，保留前 N 个不同桶中最新的快照
+        for bucket, key_func in self.BUCKETS:
+            limit = self.limits[bucket]
+            if not limit:
+                continue
+            seen = set()
+            for name, when, _ in ordered:
+                key = key_func(when)
+                if key in seen:
+                    continue
+                seen.add(key)
+                mark(name, bucket)
+                if len(seen) >= limit:
+                    break
+
+        delete = [name for name, _, _ in ordered if name not in keep]
+        return {'keep': keep, 'delete': delete}
+
+
+def list_repo_snapshots(snapshot_dir: Path) -> List[Tuple[str, datetime, bool]]:
+    """
+    列出仓库快照 [(快照名, 快照时间, 是否受保护)]
+
+    以 . 开头的目录（冷层转换中断留下的 .<快照名>.hot/.cold）不是快照，
+    由分层任务恢复或清理，不参与保留策略
+    """
+    if not snapshot_dir.exists():
+        return []
+    snapshots = []
+    for snapshot in snapshot_dir.iterdir():
+        if not snapshot.is_dir() or snapshot.name.startswith('.'):
+            continue
+        protected = (snapshot / ".protected").exists()
+        snapshots.append((snapshot.name, snapshot_time(snapshot), protected))
+    return snapshots
+
+
+def plan_backup_root(
+    backup_root: Path, policy: RetentionPolicy, now: Optional[datetime] = None
+) -> List[Dict]:
+    """
+    一次遍历计算所有仓库的保留计划
+
+    Args:
+        backup_root: 备份根目录
+        policy: 保留策略
+        now: 当前时间
+
+    Returns:
+        [{'repository', 'snapshot_dir', 'keep', 'delete'}]，按仓库名排序
+    """
+    plans = []
+    backup_root = Path(backup_root)
+    if not backup_root.exists():
+        return plans
+
+    for owner_dir in sorted(backup_root.iterdir()):
+        if not owner_dir.is_dir() or owner_dir.name.startswith('.'):
+            continue
+        for repo_dir in sorted(owner_dir.iterdir()):
+            snapshot_dir = repo_dir / "snapshots"
+            if not repo_dir.is_dir() or not snapshot_dir.exists():
+                continue
+            plan = policy.plan(list_repo_snapshots(snapshot_dir), now)
+            plan['repository'] = f"{owner_dir.name}/{repo_dir.name}"
+            plan['snapshot_dir'] = snapshot_dir
+            plans.append(plan)
+
+    return plans
+
+
+def format_plan(plans: List[Dict]) -> str:
+    """将保留计划格式化为文本（dry-run 输出）"""
+    lines = []
+    total_keep = sum(len(p['keep']) for p in plans)
+    total_delete = sum(len(p['delete']) for p in plans)
+    lines.append(
+        f"# 保留计划: {len(plans)} 个仓库，保留 {total_keep} 个快照，"
+        f"删除 {total_delete} 个快照"
+    )
+    for plan in plans:
+        lines.append(f"\n[{plan['repository']}]")
+        for name in sorted(plan['keep'], reverse=True):
+            lines.append(f"  keep    {name}  ({', '.join(plan['keep'][name])})")
+        for name in plan['delete']:
+            lines.append(f"  delete  {name}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+小仓库打包模块
+很多镜像仓库不足 1MB，但每个快照都是一整套裸仓库目录（hooks、info、config 等
+几十个文件）。小于阈值的仓库不再创建快照目录，而是把快照作为 bundle 追加到
+所属 owner 的共享打包文件中：
+
+    备份根目录/owner/.small_repos/pack-000001.dat   只追加的 bundle 数据
+    备份根目录/owner/.small_repos/index.jsonl       只追加的索引记录
+
+索引记录有三种：add（新快照：位置、大小、校验值、引用表、提交数）、
+protect（标记永久保留）和 delete（过期删除），按顺序重放得到当前状态。
+引用与上一个快照完全相同时，新快照直接指向已有数据，不再追加。
+
+删除只追加记录；失效数据超过有效数据时把有效数据复制到新的打包文件，
+重写索引（原子重命名）后再删除旧文件，失效记录过多时只重写索引。
+每个小仓库每天只增加一条索引记录
+"""
+
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from src.archive import CHUNK_SIZE
+from src.archive_catalog import BundleHeaderReader
+from src.retention import SNAPSHOT_NAME_FORMAT
+
+logger = logging.getLogger(__name__)
+
+PACK_DIR_NAME = ".small_repos"
+INDEX_FILE_NAME = "index.jsonl"
+PACK_FILE_PATTERN = "pack-{:06d}.dat"
+
+
+class PackedSnapshot(NamedTuple):
+    """打包文件中的一个快照（与快照目录一样有 name 属性）"""
+
+    repository: str
+    name: str
+    time: datetime
+    pack: str
+    offset: int
+    size: int
+    sha256: Optional[str]
+    refs: Dict[str, str]
+    commit_count: Optional[int]
+    protected: List[str]
+    # 引用的 LFS 对象 {对象 ID: 大小}（见 src/lfs.py）
+    lfs_oids: Dict[str, int] = {}
+
+
+def _to_snapshot(record: Dict) -> PackedSnapshot:
+    return PackedSnapshot(
+        repository=record['repository'],
+        name=record['snapshot'],
+        time=datetime.strptime(record['snapshot'], SNAPSHOT_NAME_FORMAT),
+        pack=record.get('pack') or '',
+        offset=int(record.get('offset') or 0),
+        size=int(record.get('size') or 0),
+        sha256=record.get('sha256'),
+        refs=record.get('refs') or {},
+        commit_count=record.get('commit_count'),
+        protected=list(record.get('protected') or []),
+        lfs_oids=record.get('lfs_oids') or {},
+    )
+
+
+class SmallRepoPack:
+    """
+    一个 owner 的小仓库打包文件
+
+    重放后的索引缓存在实例中（按仓库分组），索引文件被其他进程修改时重新读取；
+    同一次运行中各仓库应共用 open_pack 返回的实例
+    """
+
+    def __init__(self, owner_dir: Path):
+        """
+        Args:
+            owner_dir: 备份根目录下的 owner 目录
+        """
+        self.owner_dir = Path(owner_dir)
+        self.path = self.owner_dir / PACK_DIR_NAME
+        self.index_path = self.path / INDEX_FILE_NAME
+        self._state: Dict[str, Dict[str, Dict]] = {}
+        self._lines = 0
+        self._stamp: Optional[Tuple[int, int]] = None
+        # 恢复时多个线程共用同一个实例
+        self._lock = threading.RLock()
+
+    def exists(self) -> bool:
+        return self.index_path.exists()
+
+    def _index_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = self.index_path.stat()
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def _load(self) -> Dict[str, Dict[str, Dict]]:
+        """重放索引：{仓库: {快照名: add 记录（protect 合并到 protected 字段）}}"""
+        with self._lock:
+            stamp = self._index_stamp()
+            if stamp == self._stamp:
+                return self._state
+            self._state, self._lines = {}, 0
+            if stamp is not None:
+                with open(self.index_path, encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            self._apply(json.loads(line))
+                        except (ValueError, KeyError, TypeError, AttributeError):
+                            # 追加中断留下的半行
+                            logger.warning(
+                                f"跳过损坏的打包索引记录: {self.index_path}"
+                            )
+            self._stamp = stamp
+            return self._state
+
+    def _apply(self, record: Dict):
+        record = dict(record)
+        op = record.pop('op', 'add')
+        snapshots = self._state.setdefault(record['repository'], {})
+        name = record['snapshot']
+        if op == 'add':
+            snapshots[name] = record
+        elif op == 'delete':
+            snapshots.pop(name, None)
+        elif op == 'protect' and name in snapshots:
+            snapshots[name]['protected'] = record.get('reasons') or ['manual']
+        if not snapshots:
+            del self._state[record['repository']]
+        self._lines += 1
+
+    def _trim_torn_line(self):
+        """索引不以换行结尾时（上次追加中断）截掉最后的半行，新记录另起一行"""
+        try:
+            f = open(self.index_path, 'r+b')
+        except FileNotFoundError:
+            return
+        with f:
+            size = f.seek(0, 2)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            keep = pos = size
+            while pos > 0:
+                start = max(0, pos - 4096)
+                f.seek(start)
+                newline = f.read(pos - start).rfind(b"\n")
+                if newline >= 0:
+                    keep = start + newline + 1
+                    break
+                pos = start
+            else:
+                keep = 0
+            logger.warning(
+                f"打包索引末尾有不完整的记录（{size - keep} 字节），已截掉: "
+                f"{self.index_path}"
+            )
+            f.truncate(keep)
+
+    def _append(self, *records: Dict):
+        with self._lock:
+            self._trim_torn_line()
+            self._load()
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            for record in records:
+                self._apply(record)
+            self._stamp = self._index_stamp()
+
+    def _records(self) -> List[Dict]:
+        return [r for snaps in self._load().values() for r in snaps.values()]
+
+    def snapshots(self, repository: Optional[str] = None) -> List[PackedSnapshot]:
+        """
+        列出打包的快照
+
+        Args:
+            repository: 只列出该仓库（owner/repo）
+
+        Returns:
+            按仓库和快照时间从旧到新排序
+        """
+        state = self._load()
+        if repository is None:
+            records = self._records()
+        else:
+            records = list(state.get(repository, {}).values())
+        result = [_to_snapshot(r) for r in records]
+        result.sort(key=lambda s: (s.repository, s.time))
+        return result
+
+    def repositories(self) -> List[str]:
+        """有打包快照的仓库"""
+        return sorted(self._load())
+
+    def find(self, repository: str, name: str) -> Optional[PackedSnapshot]:
+        """按快照名查找"""
+        record = self._load().get(repository, {}).get(name)
+        return _to_snapshot(record) if record else None
+
+    def _current_pack(self) -> str:
+        """追加写入的打包文件（编号最大的，没有时为第一个）"""
+        names = [p.name for p in self.path.glob('pack-*.dat')]
+        return max(names) if names else PACK_FILE_PATTERN.format(1)
+
+    def add(
+        self,
+        repository: str,
+        name: str,
+        cmd: List[str],
+        ref_map: Dict[str, str],
+        **fields,
+    ) -> PackedSnapshot:
+        """
+        追加一个快照
+
+        引用与该仓库上一个快照相同时复用已有数据；空仓库（没有引用）不写数据
+
+        Args:
+            repository: 仓库全名 owner/repo
+            name: 快照名（时间戳）
+            cmd: 生成 bundle 的命令（输出到 stdout）
+            ref_map: 仓库当前的引用表
+            fields: 其余字段（commit_count、source 等）
+
+        Raises:
+            subprocess.CalledProcessError: 生成 bundle 失败（打包文件保持不变）
+        """
+        record = {'op': 'add', 'repository': repository, 'snapshot': name}
+        record.update(fields)
+        previous = self.snapshots(repository)
+        if previous and previous[-1].refs == ref_map and previous[-1].size:
+            last = previous[-1]
+            record.update(
+                pack=last.pack,
+                offset=last.offset,
+                size=last.size,
+                sha256=last.sha256,
+                refs=last.refs,
+                reused=last.name,
+            )
+        elif not ref_map:
+            record.update(pack='', offset=0, size=0, sha256=None, refs={})
+        else:
+            pack = self._current_pack()
+            offset, size, digest, header = self._append_output(pack, cmd)
+            refs = {n: o for n, o in header.refs.items() if n != 'HEAD'}
+            record.update(pack=pack, offset=offset, size=size, sha256=digest, refs=refs)
+        record['created'] = datetime.now().isoformat()
+        self._append(record)
+        record.pop('op')
+        return _to_snapshot(record)
+
+    def _append_output(
+        self, pack: str, cmd: List[str]
+    ) -> Tuple[int, int, str, BundleHeaderReader]:
+        """把命令输出追加到打包文件末尾，失败时截断回原长度"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        hasher = hashlib.sha256()
+        header = BundleHeaderReader()
+        with open(self.path / pack, 'ab') as out, tempfile.TemporaryFile() as err:
+            offset = out.seek(0, os.SEEK_END)
+            try:
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err)
+                try:
+                    while True:
+                        chunk = proc.stdout.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        header.feed(chunk)
+                        hasher.update(chunk)
+                        out.write(chunk)
+                finally:
+                    proc.stdout.close()
+                    returncode = proc.wait()
+                if returncode != 0:
+                    err.seek(0)
+                    raise subprocess.CalledProcessError(
+                        returncode,
+                        cmd,
+                        output=None,
+                        stderr=err.read().decode('utf-8', errors='replace'),
+                    )
+                out.flush()
+                os.fsync(out.fileno())
+            except BaseException:
+                out.truncate(offset)
+                raise
+            size = out.tell() - offset
+        return offset, size, hasher.hexdigest(), header
+
+    def protect(self, repository: str, name: str, reasons: List[str]):
+        """标记快照为永久保留"""
+        self._append(
+            {
+                'op': 'protect',
+                'repository': repository,
+                'snapshot': name,
+                'reasons': list(reasons),
+                'time': datetime.now().isoformat(),
+            }
+        )
+
+    def remove(self, repository: str, names: Iterable[str]) -> int:
+        """
+        删除快照（追加删除记录）
+
+        失效数据超过有效数据时整理打包文件，失效索引记录超过有效快照数时重写索引
+
+        Returns:
+            删除的快照数
+        """
+        with self._lock:
+            existing = self._load().get(repository, {})
+            names = sorted(set(names) & set(existing))
+            if not names:
+                return 0
+            self._append(
+                *(
+                    {'op': 'delete', 'repository': repository, 'snapshot': n}
+                    for n in names
+                )
+            )
+            live, total = self.usage()
+            entries = len(self._records())
+            if total - live > live:
+                self.compact()
+            elif self._lines - entries > entries:
+                self._write_index(self._records())
+            return len(names)
+
+    def usage(self) -> Tuple[int, int]:
+        """(有效数据字节数, 打包文件总字节数)"""
+        live = {
+            (r['pack'], r['offset']): r['size']
+            for r in self._records()
+            if r.get('size')
+        }
+        total = sum(p.stat().st_size for p in self.path.glob('pack-*.dat'))
+        return sum(live.values()), total
+
+    def _write_index(self, records: List[Dict]):
+        """重写索引，每个快照一条 add 记录（临时文件 + 原子重命名）"""
+        fd, tmp_name = tempfile.mkstemp(
+            prefix=f"{INDEX_FILE_NAME}.", suffix=".tmp", dir=str(self.path)
+        )
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for record in records:
+                    line = json.dumps(dict(record, op='add'), ensure_ascii=False)
+                    f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_name, self.index_path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+        self._stamp = None
+
+    def compact(self) -> int:
+        """
+        把有效数据复制到新的打包文件并重写索引，然后删除旧打包文件
+
+        中断时索引仍指向旧打包文件，新文件中多余的数据在下次整理时回收
+
+        Returns:
+            回收的字节数
+        """
+        with self._lock:
+            records = [dict(r) for r in self._records()]
+            _, before = self.usage()
+            old_packs = list(self.path.glob('pack-*.dat'))
+            number = int(self._current_pack()[5:11]) + 1
+            new_pack = PACK_FILE_PATTERN.format(number)
+
+            moved: Dict[Tuple[str, int], int] = {}
+            with open(self.path / new_pack, 'wb') as out:
+                records.sort(key=lambda r: (r['pack'], r['offset']))
+                for record in records:
+                    if not record.get('size'):
+                        continue
+                    key = (record['pack'], record['offset'])
+                    if key not in moved:
+                        moved[key] = out.tell()
+                        for chunk in self._read_range(
+                            record['pack'], record['offset'], record['size']
+                        ):
+                            out.write(chunk)
+                    record['pack'] = new_pack
+                    record['offset'] = moved[key]
+                out.flush()
+                os.fsync(out.fileno())
+
+            try:
+                self._write_index(records)
+            except BaseException:
+                (self.path / new_pack).unlink()
+                raise
+            for pack in old_packs:
+                pack.unlink()
+            if not moved:
+                (self.path / new_pack).unlink()
+            _, after = self.usage()
+            logger.info(
+                f"  整理小仓库打包文件 {self.path}: 回收 {(before - after) // 1024}KB"
+            )
+            return before - after
+
+    def _read_range(
+        self, pack: str, offset: int, size: int, chunk_size: int = CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        with open(self.path / pack, 'rb') as f:
+            f.seek(offset)
+            remaining = size
+            while remaining:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    raise ValueError(f"打包文件被截断: {pack}")
+                remaining -= len(data)
+                yield data
+
+    def iter_bundle(
+        self, snapshot: PackedSnapshot, chunk_size: int = CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        """
+        按块读出快照的 bundle，读完后校验
+
+        Raises:
+            ValueError: 空仓库快照，或数据与校验值不一致
+        """
+        if not snapshot.size:
+            raise ValueError(f"快照为空仓库，没有数据: {snapshot.name}")
+        hasher = hashlib.sha256()
+        for data in self._read_range(
+            snapshot.pack, snapshot.offset, snapshot.size, chunk_size
+        ):
+            hasher.update(data)
+            yield data
+        if snapshot.sha256 and hasher.hexdigest() != snapshot.sha256:
+            raise ValueError(f"打包数据校验失败: {snapshot.repository} {snapshot.name}")
+
+    def write_bundle(self, snapshot: PackedSnapshot, dest: Path):
+        """把快照的 bundle 写出为文件（恢复时 git fetch 需要文件）"""
+        try:
+            with open(dest, 'wb') as f:
+                for data in self.iter_bundle(snapshot):
+                    f.write(data)
+        except BaseException:
+            try:
+                Path(dest).unlink()
+            except FileNotFoundError:
+                pass
+            raise
+
+
+_packs: Dict[Path, SmallRepoPack] = {}
+
+
+def open_pack(owner_dir: Path) -> SmallRepoPack:
+    """owner 的打包文件（同一进程内共用一个实例，索引只重放一次）"""
+    owner_dir = Path(owner_dir).absolute()
+    if owner_dir not in _packs:
+        _packs[owner_dir] = SmallRepoPack(owner_dir)
+    return _packs[owner_dir]
+
+
+def owner_packs(backup_root: Path) -> List[SmallRepoPack]:
+    """备份根目录下所有存在的小仓库打包文件"""
+    backup_root = Path(backup_root)
+    if not backup_root.exists():
+        return []
+    return [
+        open_pack(owner_dir)
+        for owner_dir in sorted(backup_root.iterdir())
+        if owner_dir.is_dir()
+        and not owner_dir.name.startswith('.')
+        and (owner_dir / PACK_DIR_NAME / INDEX_FILE_NAME).exists()
+    ]
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+快照导出模块
+直接从快照目录流式生成 tar 包或 git bundle，不产生临时副本，内存占用固定
+
+tar 包的布局（每个成员的头部和文件数据在输出中的偏移）预先计算好，
+总大小已知，可以从任意偏移开始输出，支持 HTTP Range 和断点续传；
+写入文件描述符时用 sendfile 零拷贝输出文件数据
+"""
+
+import errno
+import os
+import stat
+import subprocess
+import tarfile
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from src.restore_drill import SNAPSHOT_METADATA_FILES
+from src.tiering import cold_bundle_path, snapshot_tier
+
+CHUNK_SIZE = 1024 * 1024
+BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+class Segment(NamedTuple):
+    """tar 输出中的一段：头部/填充（bytes）或文件数据（路径）"""
+
+    start: int
+    length: int
+    data: Union[bytes, Path]
+
+
+class TarLayout:
+    """快照 tar 包的布局"""
+
+    def __init__(self, snapshot: Path, arcname: Optional[str] = None):
+        """
+        Args:
+            snapshot: 快照目录
+            arcname: tar 包中的顶层目录名（默认 快照名.git）
+        """
+        self.snapshot = Path(snapshot)
+        self.arcname = arcname or f"{self.snapshot.name}.git"
+        self.segments: List[Segment] = []
+        self.size = 0
+        self._build()
+
+    def _add(self, data: Union[bytes, Path], length: int):
+        if length:
+            self.segments.append(Segment(self.size, length, data))
+            self.size += length
+
+    def _add_member(self, path: Path, name: str, st: os.stat_result):
+        info = tarfile.TarInfo(name)
+        info.mode = stat.S_IMODE(st.st_mode)
+        info.mtime = int(st.st_mtime)
+        info.uid, info.gid = st.st_uid, st.st_gid
+        if stat.S_ISDIR(st.st_mode):
+            info.type = tarfile.DIRTYPE
+        elif stat.S_ISLNK(st.st_mode):
+            info.type = tarfile.SYMTYPE
+            info.linkname = os.readlink(path)
+        elif stat.S_ISREG(st.st_mode):
+            info.size = st.st_size
+        else:
+            return
+
+        header = info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+        self._add(header, len(header))
+        if info.size:
+            self._add(path, info.size)
+            self._add(b'\0' * (-info.size % BLOCK_SIZE), -info.size % BLOCK_SIZE)
+
+    def _build(self):
+        self._add_member(self.snapshot, self.arcname, self.snapshot.lstat())
+        for root, dirs, files in os.walk(self.snapshot):
+            dirs.sort()
+            rel = Path(root).relative_to(self.snapshot)
+            for name in sorted(dirs + files):
+                if rel == Path('.') and name in SNAPSHOT_METADATA_FILES:
+                    continue
+                path = Path(root) / name
+                self._add_member(path, f"{self.arcname}/{rel / name}", path.lstat())
+
+        # 结尾两个空块，并按 tarfile 的记录大小补齐
+        end = self.size + 2 * BLOCK_SIZE
+        end += -end % tarfile.RECORDSIZE
+        self._add(b'\0' * (end - self.size), end - self.size)
+
+    def _pieces(self, start: int, end: int) -> Iterator[Tuple[Segment, int, int]]:
+        """与 [start, end) 相交的各段：(段, 段内起点, 长度)"""
+        for seg in self.segments:
+            if seg.start + seg.length <= start:
+                continue
+            if seg.start >= end:
+                break
+            offset = max(start, seg.start) - seg.start
+            yield seg, offset, min(end, seg.start + seg.length) - seg.start - offset
+
+    def iter_bytes(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """按块输出 [start, end) 的内容（end 默认到结尾）"""
+        end = self.size if end is None else min(end, self.size)
+        for seg, offset, length in self._pieces(start, end):
+            if isinstance(seg.data, bytes):
+                yield seg.data[offset:offset + length]
+                continue
+            yield from _read_range(seg.data, offset, length)
+
+    def write_to(self, out: BinaryIO, start: int = 0, end: Optional[int] = None) -> int:
+        """
+        把 [start, end) 写入文件对象，文件数据优先用 sendfile 输出
+
+        Returns:
+            写入的字节数
+        """
+        end = self.size if end is None else min(end, self.size)
+        try:
+            out_fd = out.fileno()
+        except (AttributeError, OSError, ValueError):
+            out_fd = None
+
+        written = 0
+        for seg, offset, length in self._pieces(start, end):
+            if isinstance(seg.data, bytes):
+                out.write(seg.data[offset:offset + length])
+            elif out_fd is None:
+                for data in _read_range(seg.data, offset, length):
+                    out.write(data)
+            else:
+                out.flush()
+                _sendfile(out_fd, seg.data, offset, length)
+            written += length
+        out.flush()
+        return written
+
+
+def _read_range(path: Path, offset: int, length: int) -> Iterator[bytes]:
+    """按块读取文件的一段"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while length > 0:
+            data = f.read(min(CHUNK_SIZE, length))
+            if not data:
+                raise OSError(f"文件在导出过程中被截断: {path}")
+            length -= len(data)
+            yield data
+
+
+def _sendfile(out_fd: int, path: Path, offset: int, length: int):
+    """用 sendfile 复制文件的一段，输出不支持时回退到普通读写"""
+    with open(path, 'rb') as f:
+        while length > 0:
+            try:
+                sent = os.sendfile(out_fd, f.fileno(), offset, min(length, 1 << 30))
+            except OSError as e:
+                if e.errno not in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+                    raise
+                break
+            if sent == 0:
+                raise OSError(f"文件在导出过程中被截断: {path}")
+            offset += sent
+            length -= sent
+    if length > 0:
+        for data in _read_range(path, offset, length):
+            while data:
+                data = data[os.write(out_fd, data):]
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析 HTTP Range 头（只支持单个 bytes 区间）
+
+    Returns:
+        (start, end)，end 不包含；没有 Range 头时为 None
+
+    Raises:
+        ValueError: 区间无法满足
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        raise ValueError(f"不支持的 Range: {header}")
+    first, _, last = spec.strip().partition('-')
+    try:
+        if first:
+            start = int(first)
+            end = int(last) + 1 if last else size
+        else:
+            start, end = max(0, size - int(last)), size
+    except ValueError:
+        raise ValueError(f"无效的 Range: {header}")
+    end = min(end, size)
+    if start >= end:
+        raise ValueError(f"Range 超出范围: {header}")
+    return start, end
+
+
+def iter_bundle(snapshot: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    直接从快照生成 git bundle（包含所有引用）并按块输出
+
+    冷层快照直接输出其 bundle 文件
+
+    Raises:
+        RuntimeError: git bundle 失败（如空仓库）或冷层 bundle 不可读
+    """
+    if snapshot_tier(snapshot) == 'cold':
+        bundle = cold_bundle_path(snapshot)
+        try:
+            with open(bundle, 'rb') as f:
+                while True:
+                    data = f.read(chunk_size)
+                    if not data:
+                        break
+                    yield data
+        except (OSError, TypeError) as e:
+            raise RuntimeError(f"读取冷层 bundle 失败: {e}")
+        return
+    process = subprocess.Popen(
+        ['git', '-c', 'safe.directory=*', '-C', str(snapshot)]
+        + ['bundle', 'create', '-q', '-', '--all'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    finished = False
+    try:
+        while True:
+            data = process.stdout.read(chunk_size)
+            if not data:
+                break
+            yield data
+        finished = True
+    finally:
+        if not finished:
+            # 调用方提前结束（如客户端断开）
+            process.kill()
+        process.stdout.close()
+        stderr = process.stderr.read().decode(errors='replace').strip()
+        process.stderr.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise RuntimeError(f"生成 bundle 失败: {stderr}")
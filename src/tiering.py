@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+快照冷层模块
+硬链接快照在过期之前一直是完整的目录树，每个快照都占用一整套 inode。
+超过 N 天的快照被压缩为单个 bundle，原快照目录替换为只包含元数据的存根：
+
+- .snapshot_meta：原有元数据，追加 tier=cold 和 bundle 的位置、大小、校验值
+- .refmap / .protected / .lfs_oids / HEAD：引用索引、保留策略、LFS 备份和浏览
+  仍然可用
+
+bundle 默认放在存根目录内（snapshot.bundle），也可以放到单独的（较慢的）
+冷存储目录 COLD_ROOT/owner/repo/快照名.bundle。每个冷快照只占用几个 inode。
+
+列表、引用索引、复制和恢复通过 is_snapshot / snapshot_tier 同时识别两种形态：
+恢复冷快照时从 bundle 取回对象，导出 bundle 时直接输出冷层文件
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.archive import host_bundle_command, stream_command_to_file
+from src.refs import cached_ref_map
+from src.retention import snapshot_time
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_META_FILE_NAME = ".snapshot_meta"
+COLD_BUNDLE_NAME = "snapshot.bundle"
+
+# 冷快照存根中保留的文件
+STUB_FILES = ('.refmap', '.protected', '.lfs_oids', 'HEAD')
+
+
+def read_snapshot_meta(snapshot: Path) -> Dict[str, str]:
+    """读取快照元数据（key=value 行）"""
+    meta = {}
+    try:
+        text = (Path(snapshot) / SNAPSHOT_META_FILE_NAME).read_text()
+    except OSError:
+        return meta
+    for line in text.splitlines():
+        key, sep, value = line.partition('=')
+        if sep:
+            meta[key.strip()] = value.strip()
+    return meta
+
+
+def snapshot_tier(snapshot: Path) -> str:
+    """快照所在的层：hot（目录树）或 cold（bundle）"""
+    if (Path(snapshot) / "objects").is_dir():
+        return 'hot'
+    return 'cold' if read_snapshot_meta(snapshot).get('tier') == 'cold' else ''
+
+
+def is_snapshot(path: Path) -> bool:
+    """是否是可用的快照（任一层）"""
+    return snapshot_tier(path) != ''
+
+
+def cold_bundle_path(snapshot: Path) -> Optional[Path]:
+    """冷快照的 bundle 文件（相对路径相对于存根目录）"""
+    location = read_snapshot_meta(snapshot).get('cold_bundle')
+    if not location:
+        return None
+    return Path(snapshot) / location
+
+
+class ColdTier:
+    """把旧快照压缩为冷层 bundle"""
+
+    def __init__(
+        self,
+        backup_root: Path,
+        cold_after_days: int = 30,
+        cold_root: Optional[Path] = None,
+        max_per_run: int = 0,
+        trash=None,
+    ):
+        """
+        Args:
+            backup_root: 备份根目录
+            cold_after_days: 快照超过该天数后转入冷层
+            cold_root: 冷层 bundle 存放目录，None 时放在存根目录内
+            max_per_run: 单次运行最多转换的快照数，0 表示不限制
+            trash: 回收站（TrashQueue），None 时直接删除原目录树
+        """
+        self.backup_root = Path(backup_root)
+        self.cold_after_days = max(1, int(cold_after_days or 1))
+        self.cold_root = Path(cold_root).absolute() if cold_root else None
+        self.max_per_run = max(0, int(max_per_run or 0))
+        self.trash = trash
+
+    def _repositories(self) -> List[Tuple[str, Path]]:
+        repos = []
+        if not self.backup_root.exists():
+            return repos
+        for owner_dir in sorted(self.backup_root.iterdir()):
+            if not owner_dir.is_dir() or owner_dir.name.startswith('.'):
+                continue
+            for snapshot_dir in sorted(owner_dir.glob('*/snapshots')):
+                repository = f"{owner_dir.name}/{snapshot_dir.parent.name}"
+                repos.append((repository, snapshot_dir))
+        return repos
+
+    def candidates(self, now: Optional[datetime] = None) -> List[Tuple[str, Path]]:
+        """
+        列出应转入冷层的快照（从旧到新）
+
+        每个仓库最新的快照总是保留为目录树（下次备份的引用对比和清单复用需要）
+        """
+        cutoff = (now or datetime.now()) - timedelta(days=self.cold_after_days)
+        result = []
+        for repository, snapshot_dir in self._repositories():
+            snapshots = sorted(
+                (
+                    s
+                    for s in snapshot_dir.iterdir()
+                    if not s.name.startswith('.') and s.is_dir()
+                ),
+                key=snapshot_time,
+            )
+            for snapshot in snapshots[:-1]:
+                if snapshot_time(snapshot) >= cutoff:
+                    break
+                if snapshot_tier(snapshot) == 'hot':
+                    result.append((repository, snapshot))
+        result.sort(key=lambda item: snapshot_time(item[1]))
+        return result
+
+    def run(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        执行一次分层
+
+        Returns:
+            {'compacted', 'failed', 'bundle_bytes', 'orphans'}
+        """
+        stats = {'compacted': 0, 'failed': 0, 'bundle_bytes': 0, 'orphans': 0}
+        self._remove_leftovers()
+        todo = self.candidates(now)
+        if self.max_per_run:
+            todo = todo[: self.max_per_run]
+        for repository, snapshot in todo:
+            try:
+                stats['bundle_bytes'] += self.compact(repository, snapshot)
+                stats['compacted'] += 1
+            except Exception as e:
+                logger.warning(f"  快照转入冷层失败 {repository}/{snapshot.name}: {e}")
+                stats['failed'] += 1
+        stats['orphans'] = self.remove_orphans()
+        return stats
+
+    def compact(self, repository: str, snapshot: Path) -> int:
+        """
+        把一个快照转为冷层：生成并校验 bundle，写入存根，替换原目录树
+
+        Returns:
+            bundle 大小（字节）
+
+        Raises:
+            RuntimeError: 生成或校验 bundle 失败（快照保持不变）
+        """
+        snapshot = Path(snapshot)
+        ref_map = cached_ref_map(snapshot)
+        meta = read_snapshot_meta(snapshot)
+        stub = snapshot.with_name(f".{snapshot.name}.cold")
+        old = snapshot.with_name(f".{snapshot.name}.hot")
+        shutil.rmtree(stub, ignore_errors=True)
+        stub.mkdir()
+
+        try:
+            if self.cold_root:
+                bundle = self.cold_root / repository / f"{snapshot.name}.bundle"
+                location = str(bundle)
+            else:
+                bundle = stub / COLD_BUNDLE_NAME
+                location = COLD_BUNDLE_NAME
+            try:
+                size, digest = stream_command_to_file(
+                    host_bundle_command(snapshot), bundle
+                )
+            except subprocess.CalledProcessError as e:
+                raise RuntimeError(f"生成 bundle 失败: {(e.stderr or '').strip()}")
+            self._check_bundle(bundle, ref_map)
+
+            for name in STUB_FILES:
+                if (snapshot / name).is_file():
+                    shutil.copy2(snapshot / name, stub / name)
+            meta.update(
+                {
+                    'tier': 'cold',
+                    'cold_bundle': location,
+                    'cold_size': str(size),
+                    'cold_sha256': digest,
+                    'cold_at': datetime.now().isoformat(),
+                }
+            )
+            (stub / SNAPSHOT_META_FILE_NAME).write_text(
+                ''.join(f"{key}={value}\n" for key, value in meta.items())
+            )
+            # 保持原修改时间（按 mtime 清理旧快照时不受影响）
+            st = snapshot.stat()
+            os.utime(stub, (st.st_atime, st.st_mtime))
+        except BaseException:
+            shutil.rmtree(stub, ignore_errors=True)
+            if self.cold_root:
+                try:
+                    bundle.unlink()
+                except FileNotFoundError:
+                    pass
+            raise
+
+        os.rename(snapshot, old)
+        os.rename(stub, snapshot)
+        if self.trash:
+            self.trash.move(old, repository.replace('/', '-'))
+        else:
+            shutil.rmtree(old)
+        logger.info(
+            f"  冷层: {repository}/{snapshot.name} → {size // 1024}KB bundle"
+        )
+        return size
+
+    @staticmethod
+    def _check_bundle(bundle: Path, ref_map: Dict[str, str]):
+        """bundle 中的引用必须与快照一致"""
+        result = subprocess.run(
+            ['git', 'bundle', 'list-heads', str(bundle)],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"校验 bundle 失败: {result.stderr.strip()}")
+        heads = {}
+        for line in result.stdout.splitlines():
+            oid, _, name = line.partition(' ')
+            if name.startswith('refs/'):
+                heads[name] = oid
+        expected = {n: o for n, o in ref_map.items() if n.startswith('refs/')}
+        if heads != expected:
+            raise RuntimeError("bundle 中的引用与快照不一致")
+
+    def _remove_leftovers(self):
+        """
+        处理中断后的残留：原目录树还没换下时恢复原样（下次重新转换），
+        已换下的原目录树和未完成的存根直接删除
+        """
+        for _, snapshot_dir in self._repositories():
+            for old in snapshot_dir.glob('.*.hot'):
+                snapshot = snapshot_dir / old.name[1 : -len('.hot')]
+                if snapshot.exists():
+                    shutil.rmtree(old, ignore_errors=True)
+                else:
+                    os.rename(old, snapshot)
+            for stub in snapshot_dir.glob('.*.cold'):
+                shutil.rmtree(stub, ignore_errors=True)
+
+    def remove_orphans(self) -> int:
+        """删除冷存储目录中快照已被删除（过期）的 bundle"""
+        if not self.cold_root or not self.cold_root.exists():
+            return 0
+        removed = 0
+        for bundle in self.cold_root.glob('*/*/*.bundle'):
+            repository = bundle.parent.relative_to(self.cold_root)
+            if not (self.backup_root / repository / "snapshots" / bundle.stem).exists():
+                bundle.unlink()
+                removed += 1
+        return removed
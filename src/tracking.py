@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+仓库跟踪历史模块
+每个仓库一个只追加的定长二进制记录文件（.tracking_history），
+一次顺序读取或内存映射即可获得完整历史，支持按时间窗口查询
+"""
+
+import logging
+import mmap
+import struct
+from datetime import datetime
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FILE_NAME = ".tracking_history"
+
+# 文件头: 魔数(8) + 记录长度(4) + 保留(4)
+MAGIC = b"GMBTRK01"
+HEADER = struct.Struct('<8sII')
+
+# 记录: 时间戳(秒) + 提交数 + 大小(KB) + 引用数 + 引用指纹(SHA-1)
+RECORD = struct.Struct('<qqqI20s')
+TIMESTAMP = struct.Struct('<q')
+
+
+class TrackingRecord(NamedTuple):
+    """一次备份的跟踪记录"""
+
+    timestamp: int
+    commits: int
+    size_kb: int
+    ref_count: int
+    ref_fingerprint: bytes
+
+    @property
+    def time(self) -> datetime:
+        return datetime.fromtimestamp(self.timestamp)
+
+
+class TrackingHistory:
+    """仓库跟踪历史（只追加）"""
+
+    def __init__(self, repo_backup_dir: Path):
+        """
+        Args:
+            repo_backup_dir: 仓库备份目录 BACKUP_ROOT/{owner}/{repo}
+        """
+        self.path = Path(repo_backup_dir) / HISTORY_FILE_NAME
+
+    def exists(self) -> bool:
+        return self.path.exists() and self.path.stat().st_size >= HEADER.size
+
+    def append(self, record: TrackingRecord):
+        """
+        追加一条记录（单次写入）
+
+        上次写入中断留下的不完整记录先截掉，保证新记录与记录边界对齐
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = RECORD.pack(
+            int(record.timestamp),
+            int(record.commits),
+            int(record.size_kb),
+            int(record.ref_count),
+            bytes(record.ref_fingerprint or b'')[:20],
+        )
+        with open(self.path, 'ab') as f:
+            size = f.seek(0, 2)
+            whole = self._whole_size(size)
+            if whole != size:
+                logger.warning(
+                    f"跟踪历史末尾有不完整的记录（{size - whole} 字节），已截掉: "
+                    f"{self.path}"
+                )
+                f.truncate(whole)
+            if whole == 0:
+                data = HEADER.pack(MAGIC, RECORD.size, 0) + data
+            f.write(data)
+
+    @staticmethod
+    def _whole_size(size: int) -> int:
+        """文件中完整部分（文件头 + 完整记录）的长度，文件头不完整时为 0"""
+        if size < HEADER.size:
+            return 0
+        return HEADER.size + (size - HEADER.size) // RECORD.size * RECORD.size
+
+    def __len__(self) -> int:
+        """完整记录数（忽略末尾不完整的记录）"""
+        if not self.exists():
+            return 0
+        return (self.path.stat().st_size - HEADER.size) // RECORD.size
+
+    def latest(self) -> Optional[TrackingRecord]:
+        """读取最后一条记录（只读文件头和文件末尾）"""
+        count = len(self)
+        if count == 0:
+            return None
+        with open(self.path, 'rb') as f:
+            magic, record_size, _ = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or record_size != RECORD.size:
+                logger.warning(f"跟踪历史文件格式不正确: {self.path}")
+                return None
+            f.seek(HEADER.size + (count - 1) * RECORD.size)
+            return TrackingRecord(*RECORD.unpack(f.read(RECORD.size)))
+
+    def read_all(self) -> List[TrackingRecord]:
+        """顺序读取全部记录"""
+        return self.window()
+
+    def window(
+        self, since: Optional[int] = None, until: Optional[int] = None
+    ) -> List[TrackingRecord]:
+        """
+        按时间窗口查询记录（内存映射 + 二分查找，不解析文本）
+
+        Args:
+            since: 起始时间戳（含），None 表示不限制
+            until: 结束时间戳（含），None 表示不限制
+
+        Returns:
+            时间窗口内的记录列表
+        """
+        count = len(self)
+        if count == 0:
+            return []
+
+        with open(self.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, record_size, _ = HEADER.unpack_from(mm, 0)
+                if magic != MAGIC or record_size != RECORD.size:
+                    logger.warning(f"跟踪历史文件格式不正确: {self.path}")
+                    return []
+
+                def ts_at(i: int) -> int:
+                    offset = HEADER.size + i * RECORD.size
+                    return TIMESTAMP.unpack_from(mm, offset)[0]
+
+                start = 0 if since is None else self._bisect(ts_at, count, since)
+                end = count if until is None else self._bisect(ts_at, count, until + 1)
+                return [
+                    TrackingRecord(
+                        *RECORD.unpack_from(mm, HEADER.size + i * RECORD.size)
+                    )
+                    for i in range(start, end)
+                ]
+
+    @staticmethod
+    def _bisect(ts_at, count: int, value: int) -> int:
+        """返回第一个时间戳 >= value 的记录下标"""
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ts_at(mid) < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+def load_latest_state(repo_backup_dir: Path) -> Optional[TrackingRecord]:
+    """
+    获取仓库最近一次的跟踪状态
+
+    优先读取 .tracking_history，没有时兼容旧版的 .commit_tracking/.size_tracking
+
+    Args:
+        repo_backup_dir: 仓库备份目录
+
+    Returns:
+        最近一次记录，没有任何跟踪数据时返回 None
+    """
+    repo_backup_dir = Path(repo_backup_dir)
+    history = TrackingHistory(repo_backup_dir)
+    if history.exists():
+        return history.latest()
+
+    commit_file = repo_backup_dir / ".commit_tracking"
+    size_file = repo_backup_dir / ".size_tracking"
+    if not commit_file.exists():
+        return None
+    try:
+        commits = int(commit_file.read_text().strip())
+        size_kb = int(size_file.read_text().strip()) if size_file.exists() else 0
+        timestamp = int(commit_file.stat().st_mtime)
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取旧版跟踪文件失败 {commit_file}: {e}")
+        return None
+    return TrackingRecord(timestamp, commits, size_kb, 0, b'')
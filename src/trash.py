@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+回收站模块
+过期快照先原子重命名到 BACKUP_ROOT/.trash，再由后台线程限速删除
+"""
+
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRASH_DIR_NAME = ".trash"
+
+
+class PurgeAborted(Exception):
+    """后台删除被中止（剩余内容留在回收站，下次运行继续）"""
+
+
+class TrashQueue:
+    """
+    回收站队列
+
+    move() 只做一次 rename（O(1)），不会阻塞备份流程；后台线程池以有限并发
+    和每秒 unlink 次数上限删除回收站中的内容。回收站目录本身就是持久化队列，
+    进程中断后残留的条目会在下次 start() 时继续删除。
+    """
+
+    def __init__(
+        self,
+        backup_root: str,
+        max_workers: int = 2,
+        max_unlinks_per_second: int = 0,
+    ):
+        """
+        初始化回收站
+
+        Args:
+            backup_root: 备份根目录
+            max_workers: 后台删除并发数
+            max_unlinks_per_second: 每秒最多删除的文件/目录数，0 表示不限制
+        """
+        self.trash_dir = Path(backup_root) / TRASH_DIR_NAME
+        self.max_workers = max(1, int(max_workers or 1))
+        self.max_unlinks_per_second = max(0, int(max_unlinks_per_second or 0))
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._futures = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self.purged_count = 0
+
+    # ---------- 入队 ----------
+
+    def move(self, path: Path, label: str = "") -> Optional[Path]:
+        """
+        将目录移入回收站
+
+        Args:
+            path: 要删除的目录
+            label: 附加在回收站条目名中的说明（如 owner-repo）
+
+        Returns:
+            回收站中的新路径；无法重命名（如跨文件系统）时直接删除并返回 None
+        """
+        self.trash_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        parts = [stamp, label, path.name, uuid.uuid4().hex[:8]]
+        entry = self.trash_dir / "-".join(p for p in parts if p)
+
+        try:
+            os.rename(path, entry)
+        except OSError as e:
+            logger.warning(f"无法移入回收站 {path}: {e}，直接删除")
+            shutil.rmtree(path)
+            return None
+
+        if self._executor is not None:
+            self._submit(entry)
+        return entry
+
+    # ---------- 后台删除 ----------
+
+    def start(self):
+        """启动后台删除，并接管回收站中上次运行遗留的条目"""
+        if self._executor is not None:
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="trash-purge"
+        )
+
+        leftovers = self.entries()
+        if leftovers:
+            logger.info(f"回收站中有 {len(leftovers)} 个待删除条目，后台继续删除")
+        for entry in leftovers:
+            self._submit(entry)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待后台删除完成
+
+        Args:
+            timeout: 最长等待秒数，None 表示一直等待
+
+        Returns:
+            是否已全部删除
+        """
+        with self._lock:
+            futures = list(self._futures)
+        if not futures:
+            return True
+        _, not_done = wait(futures, timeout=timeout)
+        return not not_done
+
+    def shutdown(self):
+        """停止后台删除，未完成的条目留待下次运行"""
+        if self._executor is None:
+            return
+        self._stop.set()
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        with self._lock:
+            self._futures = []
+
+    def _submit(self, entry: Path):
+        future = self._executor.submit(self._purge_entry, entry)
+        with self._lock:
+            self._futures = [f for f in self._futures if not f.done()]
+            self._futures.append(future)
+
+    def _purge_entry(self, entry: Path):
+        """自底向上删除一个回收站条目"""
+        try:
+            if entry.is_symlink() or not entry.is_dir():
+                self._unlink(os.unlink, entry)
+            else:
+                for root, dirs, files in os.walk(entry, topdown=False):
+                    for name in files:
+                        self._unlink(os.unlink, os.path.join(root, name))
+                    for name in dirs:
+                        path = os.path.join(root, name)
+                        op = os.unlink if os.path.islink(path) else os.rmdir
+                        self._unlink(op, path)
+                self._unlink(os.rmdir, entry)
+            with self._lock:
+                self.purged_count += 1
+        except PurgeAborted:
+            pass
+        except Exception as e:
+            logger.warning(f"删除回收站条目失败 {entry}: {e}")
+
+    def _unlink(self, op, path):
+        """执行一次删除操作，并按 unlink 预算限速"""
+        if self._stop.is_set():
+            raise PurgeAborted()
+        try:
+            op(path)
+        except FileNotFoundError:
+            pass
+
+        if not self.max_unlinks_per_second:
+            return
+        # 每次操作预约下一个时间槽，空闲后不会突发追赶
+        with self._lock:
+            now = time.monotonic()
+            due = max(self._next_slot, now)
+            self._next_slot = due + 1.0 / self.max_unlinks_per_second
+        delay = due - now
+        if delay > 0:
+            time.sleep(delay)
+
+    # ---------- 统计 ----------
+
+    def entries(self) -> List[Path]:
+        """列出回收站中的条目"""
+        if not self.trash_dir.exists():
+            return []
+        return sorted(self.trash_dir.iterdir())
+
+    def usage(self) -> Tuple[int, int]:
+        """
+        获取回收站占用
+
+        Returns:
+            (条目数, 占用大小 KB)
+        """
+        entries = self.entries()
+        if not entries:
+            return 0, 0
+
+        size_kb = 0
+        seen = set()
+        for root, _, files in os.walk(self.trash_dir):
+            for name in files:
+                try:
+                    st = os.lstat(os.path.join(root, name))
+                except OSError:
+                    continue
+                # 硬链接只统计一次
+                if (st.st_dev, st.st_ino) in seen:
+                    continue
+                seen.add((st.st_dev, st.st_ino))
+                size_kb += st.st_blocks // 2
+        return len(entries), size_kb
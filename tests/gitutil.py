@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试共用的 git 辅助函数
+"""
+
+import subprocess
+from pathlib import Path
+from typing import Optional
+
+# 固定提交者身份，避免依赖运行环境的 git 全局配置
+GIT = ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+
+
+def init(path: Path) -> Path:
+    """在 path 初始化一个默认分支为 main 的工作仓库"""
+    subprocess.run(GIT + ['init', '-q', '-b', 'main', str(path)], check=True)
+    return path
+
+
+def rev(repo: Path, revision: str) -> str:
+    """解析 revision 对应的完整 SHA"""
+    return subprocess.run(
+        ['git', '-C', str(repo), 'rev-parse', revision],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+
+
+def commit(
+    work: Path, message: str, name: str = "file.txt", data: Optional[bytes] = None
+) -> str:
+    """写入 name（默认内容为提交说明）并提交，返回新提交的 SHA"""
+    target = work / name
+    if data is None:
+        target.write_text(f"{message}\n")
+    else:
+        target.write_bytes(data)
+    subprocess.run(GIT + ['-C', str(work), 'add', '.'], check=True)
+    subprocess.run(GIT + ['-C', str(work), 'commit', '-q', '-m', message], check=True)
+    return rev(work, 'HEAD')
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全局异常评分测试脚本
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from src.anomaly import FleetScorer, load_anomalies, robust_z, save_anomalies
+from src.tracking import TrackingHistory, TrackingRecord
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DAY = 86400
+
+
+def _history(commits, sizes, start=0):
+    return [
+        TrackingRecord(start + i * DAY, c, s, 1, b"")
+        for i, (c, s) in enumerate(zip(commits, sizes))
+    ]
+
+
+def _fleet(count: int, days: int = 20, seed: int = 1):
+    """生成稳定增长的仓库集合"""
+    rng = random.Random(seed)
+    histories = {}
+    for n in range(count):
+        commits, sizes = [1000], [50000]
+        for _ in range(days - 1):
+            commits.append(commits[-1] + rng.randint(0, 20))
+            sizes.append(int(sizes[-1] * (1 + rng.uniform(0, 0.01))))
+        histories[f"org/repo{n}"] = _history(commits, sizes)
+    return histories
+
+
+def test_robust_z():
+    """测试修正 z 分数"""
+    print("\n" + "=" * 50)
+    print("测试 1: 修正 z 分数")
+    print("=" * 50)
+
+    assert robust_z(5, [5, 5, 5], floor=1.0) == 0
+    assert robust_z(-10, [0, 0, 0], floor=1.0) == -10
+    assert abs(robust_z(10, [1, 2, 3, 4, 5], floor=0.1) - 7 / 1.4826) < 1e-9
+
+    print("[OK] z 分数计算正确")
+    return True
+
+
+def test_score_fleet():
+    """测试突然减少与缓慢流失的检测"""
+    print("\n" + "=" * 50)
+    print("测试 2: 异常检测")
+    print("=" * 50)
+
+    histories = _fleet(50)
+    scorer = FleetScorer(window_days=30, min_history=5, threshold=3.5)
+    assert scorer.score(histories) == []
+
+    # 大仓库本次少了 3% 的提交（低于 10% 的固定阈值）
+    records = histories['org/repo1']
+    last = records[-1]
+    records.append(
+        last._replace(timestamp=last.timestamp + DAY, commits=last.commits - 40)
+    )
+
+    # 另一个仓库每次少一点，整体缓慢流失
+    commits = [2000 - i * 15 for i in range(20)]
+    histories['org/bleeding'] = _history(commits, [80000] * 20)
+
+    anomalies = scorer.score(histories)
+    found = {(a.repository, a.metric) for a in anomalies}
+    assert ('org/repo1', 'commit_delta') in found
+    assert ('org/bleeding', 'commit_drawdown') in found
+    assert all(a.repository in ('org/repo1', 'org/bleeding') for a in anomalies)
+
+    # 大多数仓库没有变化时，gc 让一个仓库变小 5% 不算异常
+    flat = {f"org/flat{n}": _history([500] * 10, [40000] * 10) for n in range(20)}
+    flat['org/gc'] = _history([500] * 10, [40000] * 9 + [38000])
+    assert scorer.score(flat) == []
+    # 提交数同时减少时大小回撤仍然参与比较
+    flat['org/gc'] = _history([500] * 9 + [480], [40000] * 9 + [38000])
+    found = {(a.repository, a.metric) for a in scorer.score(flat)}
+    assert ('org/gc', 'size_drawdown') in found
+
+    print("[OK] 异常检测正确")
+    return True
+
+
+def test_load_and_speed():
+    """测试从备份目录读取历史，以及数千个仓库的评分耗时"""
+    print("\n" + "=" * 50)
+    print("测试 3: 读取历史与评分耗时")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        now = datetime.now()
+        start = int(now.timestamp()) - 40 * DAY
+        for name in ("org/a", "org/b"):
+            history = TrackingHistory(Path(tmp) / name)
+            for record in _history(range(100, 140), [1000] * 40, start=start):
+                history.append(record)
+        (Path(tmp) / ".trash").mkdir()
+
+        scorer = FleetScorer(window_days=30)
+        histories = scorer.load(Path(tmp), now)
+        assert sorted(histories) == ["org/a", "org/b"]
+        assert 29 <= len(histories["org/a"]) <= 31
+
+        anomalies = scorer.score(_fleet(5))
+        save_anomalies(Path(tmp), anomalies, 0.1)
+        assert load_anomalies(Path(tmp)) == anomalies
+
+    histories = _fleet(3000, days=30)
+    started = time.monotonic()
+    FleetScorer().score(histories)
+    elapsed = time.monotonic() - started
+    print(f"3000 个仓库评分耗时: {elapsed:.3f}s")
+    assert elapsed < 1.0
+
+    print("[OK] 评分耗时符合要求")
+    return True
+
+
+if __name__ == '__main__':
+    success = all([test_robust_z(), test_score_fleet(), test_load_and_speed()])
+    sys.exit(0 if success else 1)
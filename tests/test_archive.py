@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+归档工具测试脚本
+"""
+
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import date
+from pathlib import Path
+
+from src.archive import (
+    ArchiveScheduler,
+    host_bundle_command,
+    stream_command_to_file,
+    write_checksum_file,
+)
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_stream_to_file():
+    """测试流式写入与校验"""
+    print("\n" + "=" * 50)
+    print("测试 1: 流式写入与校验")
+    print("=" * 50)
+
+    payload = b"x" * (3 * 1024 * 1024 + 7)
+    cmd = [
+        sys.executable,
+        '-c',
+        f"import sys; sys.stdout.buffer.write(b'x' * {len(payload)})",
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dest = Path(tmp) / "archive-202601.bundle"
+        size, digest = stream_command_to_file(cmd, dest)
+
+        assert size == len(payload)
+        assert dest.read_bytes() == payload
+        assert digest == hashlib.sha256(payload).hexdigest()
+
+        # 不应残留临时文件
+        assert [p.name for p in Path(tmp).iterdir()] == [dest.name]
+
+        # 权限与普通创建的文件一致（不是 mkstemp 的 0600）
+        umask = os.umask(0)
+        os.umask(umask)
+        assert dest.stat().st_mode & 0o777 == 0o666 & ~umask
+
+        checksum_file = write_checksum_file(dest, digest, 'sha256')
+        assert checksum_file.name == "archive-202601.bundle.sha256"
+        assert checksum_file.read_text() == f"{digest}  {dest.name}\n"
+
+    print("[OK] 流式写入成功")
+    return True
+
+
+def test_stream_failure_cleanup():
+    """测试命令失败时不留下半成品"""
+    print("\n" + "=" * 50)
+    print("测试 2: 失败清理")
+    print("=" * 50)
+
+    cmd = [
+        sys.executable,
+        '-c',
+        "import sys; sys.stdout.write('partial'); sys.stderr.write('boom'); sys.exit(3)",
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dest = Path(tmp) / "archive.bundle"
+        try:
+            stream_command_to_file(cmd, dest, checksum=None)
+            raise AssertionError("应当抛出 CalledProcessError")
+        except subprocess.CalledProcessError as e:
+            assert e.returncode == 3
+            assert 'boom' in e.stderr
+
+        assert not dest.exists()
+        assert list(Path(tmp).iterdir()) == []
+
+    print("[OK] 失败时已清理临时文件")
+    return True
+
+
+def test_archive_scheduler():
+    """测试错峰归档调度"""
+    print("\n" + "=" * 50)
+    print("测试 3: 错峰归档调度")
+    print("=" * 50)
+
+    # 归档日稳定且在 1-28 之间
+    slot = ArchiveScheduler.slot_for("Org/Repo")
+    assert slot == ArchiveScheduler.slot_for("org/repo")
+    assert 1 <= slot <= 28
+    slots = {ArchiveScheduler.slot_for(f"org/repo-{i}") for i in range(500)}
+    assert len(slots) == 28
+
+    scheduler = ArchiveScheduler('staggered')
+    with tempfile.TemporaryDirectory() as tmp:
+        archive_dir = Path(tmp)
+
+        # 归档日之前不到期，之后到期（包括错过归档日的补做）
+        if slot > 1:
+            day_before = date(2026, 3, slot - 1)
+            assert not scheduler.is_due("org/repo", archive_dir, day_before)
+        assert scheduler.is_due("org/repo", archive_dir, date(2026, 3, slot))
+        assert scheduler.is_due("org/repo", archive_dir, date(2026, 3, 28))
+
+        # 本月已归档则不再到期
+        (archive_dir / "archive-202603.bundle").write_bytes(b"")
+        assert not scheduler.is_due("org/repo", archive_dir, date(2026, 3, 28))
+
+        # 上月归档缺失时，本月归档日之前也立即补做，归档以缺失的月份命名
+        (archive_dir / "archive-202603.bundle").unlink()
+        (archive_dir / "archive-202601.bundle").write_bytes(b"")
+        assert scheduler.is_due("org/repo", archive_dir, date(2026, 3, 1))
+        assert scheduler.due_month("org/repo", archive_dir, date(2026, 3, 28)) == (
+            "202602"
+        )
+        (archive_dir / "archive-202602.bundle").write_bytes(b"")
+        assert scheduler.due_month("org/repo", archive_dir, date(2026, 3, 28)) == (
+            "202603"
+        )
+
+    legacy = ArchiveScheduler('first_day')
+    with tempfile.TemporaryDirectory() as tmp:
+        assert legacy.is_due("org/repo", Path(tmp), date(2026, 3, 1))
+        assert not legacy.is_due("org/repo", Path(tmp), date(2026, 3, 2))
+
+    print("[OK] 调度测试通过")
+    return True
+
+
+def test_archive_budget():
+    """测试单次运行字节预算"""
+    print("\n" + "=" * 50)
+    print("测试 4: 归档预算")
+    print("=" * 50)
+
+    scheduler = ArchiveScheduler('staggered', max_bytes_per_run=100)
+
+    # 第一个归档总是允许，即使超出预算
+    assert scheduler.has_budget(500)
+    scheduler.consume(500)
+    assert not scheduler.has_budget(1)
+    assert scheduler.deferred_count == 1
+
+    unlimited = ArchiveScheduler('staggered')
+    unlimited.consume(10 ** 12)
+    assert unlimited.has_budget(10 ** 12)
+
+    print("[OK] 预算测试通过")
+    return True
+
+
+def test_bundle_from_snapshot():
+    """测试在宿主机上从快照目录生成 bundle"""
+    print("\n" + "=" * 50)
+    print("测试 5: 从快照生成 bundle")
+    print("=" * 50)
+
+    git = ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(tmp) / "work"
+        snapshot = Path(tmp) / "snapshot"
+        subprocess.run(git + ['init', '-q', str(work)], check=True)
+        subprocess.run(
+            git + ['-C', str(work), 'commit', '-q', '--allow-empty', '-m', 'init'],
+            check=True,
+        )
+        subprocess.run(
+            git + ['clone', '-q', '--bare', str(work), str(snapshot)], check=True
+        )
+        (snapshot / ".snapshot_meta").write_text("timestamp=2026-01-01T00:00:00\n")
+
+        bundle = Path(tmp) / "archive-202601.bundle"
+        cmd = host_bundle_command(snapshot)
+        assert cmd[-6:] == ['-C', str(snapshot), 'bundle', 'create', '-', '--all']
+        size, _ = stream_command_to_file(cmd, bundle)
+        assert size > 0
+
+        result = subprocess.run(
+            ['git', '-C', str(snapshot), 'bundle', 'verify', str(bundle)],
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode == 0, result.stderr
+
+    print("[OK] bundle 生成成功")
+    return True
+
+
+if __name__ == '__main__':
+    success = all(
+        [
+            test_stream_to_file(),
+            test_stream_failure_cleanup(),
+            test_archive_scheduler(),
+            test_archive_budget(),
+            test_bundle_from_snapshot(),
+        ]
+    )
+    sys.exit(0 if success else 1)
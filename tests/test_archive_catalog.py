@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+归档目录测试脚本
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import date, datetime
+from pathlib import Path
+
+from src.archive import stream_command_to_file
+from src.archive_catalog import (
+    CATALOG_FILE_NAME,
+    BundleHeaderReader,
+    append_record,
+    expired_records,
+    make_record,
+    read_catalog,
+    remove_records,
+    sync_catalog,
+)
+from src.archive_codec import ArchiveEncoder
+from src.restore import find_source
+from tests.gitutil import GIT, commit, init
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _bundle_cmd(work: Path, *revs: str):
+    return ['git', '-C', str(work), 'bundle', 'create', '-q', '-', *revs]
+
+
+def test_record_from_stream():
+    """测试写入时解析 bundle 头部：引用、最新提交、增量 bundle 的基准归档"""
+    print("\n" + "=" * 50)
+    print("测试 1: 写入时生成记录")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        work = tmp / "work"
+        init(work)
+        c0 = commit(work, "c0")
+        subprocess.run(GIT + ['-C', str(work), 'tag', 'v1'], check=True)
+        archives = tmp / "archives"
+
+        full = archives / "archive-202601.bundle.gz"
+        header = BundleHeaderReader()
+        size, _ = stream_command_to_file(
+            _bundle_cmd(work, '--all'),
+            full,
+            encoder=ArchiveEncoder('gzip', workers=2),
+            tap=header.feed,
+        )
+        record = make_record(
+            full, header, [], month="202601", time="2026-01-05T00:00:00", size=size
+        )
+        assert record['kind'] == 'full' and record['base'] is None
+        assert record['refs'] == {
+            'refs/heads/main': c0,
+            'refs/tags/v1': c0,
+            'HEAD': c0,
+        }
+        assert record['tips'] == [c0] and record['ref_count'] == 3
+        append_record(archives, record)
+
+        # 只包含新提交的增量 bundle，基准是最新提交覆盖其前置提交的归档
+        c1 = commit(work, "c1")
+        incremental = archives / "archive-202602.bundle"
+        header = BundleHeaderReader()
+        stream_command_to_file(
+            _bundle_cmd(work, f'{c0}..main'), incremental, tap=header.feed
+        )
+        record = make_record(
+            incremental,
+            header,
+            read_catalog(archives),
+            month="202602",
+            time="2026-02-05T00:00:00",
+            size=incremental.stat().st_size,
+        )
+        assert record['kind'] == 'incremental'
+        assert record['prerequisites'] == [c0]
+        assert record['base'] == "archive-202601.bundle.gz"
+        assert record['tips'] == [c1]
+        append_record(archives, record)
+
+        # 同名归档以最后一条记录为准
+        append_record(archives, dict(record, size=1))
+        records = read_catalog(archives)
+        assert [r['file'] for r in records] == [full.name, incremental.name]
+        assert records[1]['size'] == 1
+
+        try:
+            BundleHeaderReader().feed(b"not a bundle\n\nxxxx")
+            assert False, "应该抛出 ValueError"
+        except ValueError:
+            pass
+
+    print("[OK] 写入时生成记录正确")
+    return True
+
+
+def test_sync_catalog():
+    """测试补录旧归档（只读头部）并删除已不存在归档的记录"""
+    print("\n" + "=" * 50)
+    print("测试 2: 补录旧归档")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        work = tmp / "work"
+        init(work)
+        c0 = commit(work, "c0")
+        archives = tmp / "archives"
+        old = archives / "archive-202512.bundle"
+        stream_command_to_file(_bundle_cmd(work, '--all'), old)
+        gz = archives / "archive-202601.bundle.gz"
+        stream_command_to_file(
+            _bundle_cmd(work, '--all'), gz, encoder=ArchiveEncoder('gzip')
+        )
+        (archives / "archive-202601.bundle.gz.sha256").write_text(
+            f"{'a' * 64}  {gz.name}\n"
+        )
+
+        assert sync_catalog(archives) == {'added': 2, 'removed': 0}
+        assert sync_catalog(archives) == {'added': 0, 'removed': 0}
+        records = read_catalog(archives)
+        assert [r['month'] for r in records] == ["202512", "202601"]
+        assert all(r['tips'] == [c0] for r in records)
+        assert records[1]['compression'] == 'gzip'
+        assert records[1]['checksum'] == f"sha256:{'a' * 64}"
+
+        old.unlink()
+        assert sync_catalog(archives) == {'added': 0, 'removed': 1}
+        assert [r['file'] for r in read_catalog(archives)] == [gz.name]
+
+        remove_records(archives, [gz.name])
+        assert read_catalog(archives) == []
+        assert (archives / CATALOG_FILE_NAME).exists()
+
+    print("[OK] 补录旧归档正确")
+    return True
+
+
+def test_retention_and_restore_selection():
+    """测试按归档月份保留，以及恢复来源按目录中的时间选择"""
+    print("\n" + "=" * 50)
+    print("测试 3: 保留和恢复选择")
+    print("=" * 50)
+
+    records = [
+        {'file': f"archive-{m}.bundle", 'month': m}
+        for m in ("202510", "202511", "202512", "202601")
+    ]
+    today = date(2026, 1, 15)
+    assert [r['month'] for r in expired_records(records, 2, today)] == [
+        "202510",
+        "202511",
+    ]
+    assert expired_records(records, 12, today) == []
+    # 本月的归档总是保留
+    assert len(expired_records(records, 0, today)) == 3
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo_dir = Path(tmp) / "org" / "demo"
+        archives = repo_dir / "archives"
+        archives.mkdir(parents=True)
+        for month, taken in (("202512", "2025-12-03"), ("202601", "2026-01-07")):
+            name = f"archive-{month}.bundle"
+            (archives / name).write_bytes(b"")
+            append_record(archives, {'file': name, 'month': month, 'time': taken})
+
+        # 文件修改时间是现在，选择依据是目录中的时间点
+        kind, source, taken = find_source(repo_dir, datetime(2026, 1, 1))
+        assert (kind, source.name) == ('archive', "archive-202512.bundle")
+        assert taken == datetime(2025, 12, 3)
+        kind, source, _ = find_source(repo_dir, datetime(2026, 2, 1))
+        assert source.name == "archive-202601.bundle"
+        assert find_source(repo_dir, datetime(2025, 1, 1)) == ('', None, None)
+
+    print("[OK] 保留和恢复选择正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all(
+        [
+            test_record_from_stream(),
+            test_sync_catalog(),
+            test_retention_and_restore_selection(),
+        ]
+    )
+    sys.exit(0 if success else 1)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+归档压缩/加密测试脚本
+"""
+
+import gzip
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from src.archive import list_archives, stream_command_to_file
+from src.archive_codec import AESGCM, ArchiveEncoder, iter_archive, load_key
+from src.restore import RestoreEngine, find_source
+from tests.gitutil import GIT, init
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _sample(size: int) -> bytes:
+    """可压缩的测试数据（文本 + 少量随机数据）"""
+    text = b"".join(f"line {i} of the archive\n".encode() for i in range(size // 24))
+    return text[: size - 4096] + os.urandom(4096)
+
+
+def test_parallel_gzip():
+    """测试分块并行压缩：结果是标准 gzip，校验值针对写入的数据"""
+    print("\n" + "=" * 50)
+    print("测试 1: 并行压缩")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        raw = tmp / "raw.bin"
+        data = _sample(3 * 1024 * 1024 + 123)
+        raw.write_bytes(data)
+
+        encoder = ArchiveEncoder('gzip', level=6, workers=3, block_size=256 * 1024)
+        dest = tmp / f"archive-202601.bundle{encoder.suffix}"
+        size, digest = stream_command_to_file(
+            ['cat', str(raw)], dest, checksum='sha256', encoder=encoder
+        )
+        assert dest.name == "archive-202601.bundle.gz"
+        assert size == dest.stat().st_size == encoder.stored_bytes
+        assert encoder.raw_bytes == len(data) and size < len(data)
+        assert digest == hashlib.sha256(dest.read_bytes()).hexdigest()
+
+        # 多个成员拼接，标准 gzip 工具可以直接解压
+        assert gzip.decompress(dest.read_bytes()) == data
+        assert b"".join(iter_archive(dest, chunk_size=1000)) == data
+        assert list_archives(tmp) == [dest]
+
+        # 命令失败时不留下半成品
+        failed = ArchiveEncoder('gzip', workers=2)
+        try:
+            stream_command_to_file(
+                ['sh', '-c', f'cat {raw}; exit 3'], tmp / "bad.gz", encoder=failed
+            )
+            assert False, "应该抛出 CalledProcessError"
+        except subprocess.CalledProcessError:
+            pass
+        assert not (tmp / "bad.gz").exists()
+        assert not list(tmp.glob(".bad.gz.*"))
+
+        # 截断的文件无法解压
+        truncated = tmp / "archive-202602.bundle.gz"
+        truncated.write_bytes(dest.read_bytes()[:-100])
+        try:
+            b"".join(iter_archive(truncated))
+            assert False, "应该抛出 ValueError"
+        except ValueError:
+            pass
+
+    print("[OK] 并行压缩正确")
+    return True
+
+
+def test_encryption():
+    """测试分块加密：往返一致，截断、篡改和错误密钥都会被发现"""
+    print("\n" + "=" * 50)
+    print("测试 2: 加密")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        key_file = tmp / "archive.key"
+        key_file.write_text(os.urandom(32).hex() + "\n")
+        key = load_key(str(key_file))
+        assert len(key) == 32
+
+        if AESGCM is None:
+            try:
+                ArchiveEncoder('gzip', key=key)
+                assert False, "应该抛出 RuntimeError"
+            except RuntimeError:
+                pass
+            print("[OK] 未安装 cryptography，加密被拒绝")
+            return True
+
+        raw = tmp / "raw.bin"
+        data = _sample(2 * 1024 * 1024)
+        raw.write_bytes(data)
+        encoder = ArchiveEncoder('gzip', workers=2, key=key, block_size=200 * 1024)
+        dest = tmp / f"archive-202601.bundle{encoder.suffix}"
+        stream_command_to_file(['cat', str(raw)], dest, encoder=encoder)
+        assert dest.name == "archive-202601.bundle.gz.enc"
+        assert b"".join(iter_archive(dest, key)) == data
+
+        stored = dest.read_bytes()
+        for name, content, with_key in (
+            ("truncated", stored[:-20], key),
+            ("tampered", stored[:100] + bytes([stored[100] ^ 1]) + stored[101:], key),
+            ("wrong-key", stored, os.urandom(32)),
+            ("no-key", stored, None),
+        ):
+            broken = tmp / f"{name}.bundle.gz.enc"
+            broken.write_bytes(content)
+            try:
+                b"".join(iter_archive(broken, with_key))
+                assert False, f"{name}: 应该抛出 ValueError"
+            except ValueError:
+                pass
+
+    print("[OK] 加密正确")
+    return True
+
+
+def test_restore_from_compressed_archive():
+    """测试恢复选择并还原压缩归档"""
+    print("\n" + "=" * 50)
+    print("测试 3: 从压缩归档恢复")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        work = tmp / "work"
+        init(work)
+        (work / "file.txt").write_text("hello\n")
+        subprocess.run(GIT + ['-C', str(work), 'add', '.'], check=True)
+        subprocess.run(GIT + ['-C', str(work), 'commit', '-q', '-m', 'c0'], check=True)
+
+        repo_dir = tmp / "backup" / "org" / "demo"
+        archive = repo_dir / "archives" / "archive-202601.bundle.gz"
+        stream_command_to_file(
+            ['git', '-C', str(work), 'bundle', 'create', '-q', '-', '--all'],
+            archive,
+            encoder=ArchiveEncoder('gzip', workers=2),
+        )
+        (archive.parent / "archive-202601.bundle.gz.sha256").write_text("x\n")
+
+        kind, source, _ = find_source(repo_dir, datetime.now())
+        assert (kind, source) == ('archive', archive)
+
+        live = tmp / "repos" / "org" / "demo.git"
+        subprocess.run(['git', 'init', '-q', '--bare', str(live)], check=True)
+        staging = tmp / "repos" / "org" / ".demo.git.restore"
+        RestoreEngine._unbundle(archive, staging, live)
+        head = subprocess.run(
+            ['git', '-C', str(staging), 'rev-parse', 'refs/heads/main'],
+            capture_output=True,
+            text=True,
+        )
+        expected = subprocess.run(
+            ['git', '-C', str(work), 'rev-parse', 'HEAD'],
+            capture_output=True,
+            text=True,
+        )
+        assert head.stdout == expected.stdout
+        assert not (staging / "restore.bundle").exists()
+
+    print("[OK] 从压缩归档恢复正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all(
+        [
+            test_parallel_gzip(),
+            test_encryption(),
+            test_restore_from_compressed_archive(),
+        ]
+    )
+    sys.exit(0 if success else 1)
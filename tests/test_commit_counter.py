@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量提交计数测试脚本
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from src.commit_counter import STATE_FILE_NAME, CommitCounter, host_git_runner
+from src.refs import read_ref_map
+from tests.gitutil import GIT, init
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _git(repo: Path, *args) -> str:
+    result = subprocess.run(
+        GIT + ['-C', str(repo)] + list(args),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.strip()
+
+
+def _commit(repo: Path, count: int, message: str = 'c'):
+    for i in range(count):
+        _git(repo, 'commit', '-q', '--allow-empty', '-m', f"{message}{i}")
+
+
+def _full_count(repo: Path) -> int:
+    return int(_git(repo, 'rev-list', '--all', '--count'))
+
+
+class _RecordingRunner:
+    """记录执行过的 git 命令"""
+
+    def __init__(self, repo: Path):
+        self.run_git = host_git_runner(repo)
+        self.calls = []
+
+    def __call__(self, args, stdin=None):
+        self.calls.append(args)
+        return self.run_git(args, stdin)
+
+
+def test_incremental_count():
+    """测试首次完整计数、未变化和增量计数"""
+    print("\n" + "=" * 50)
+    print("测试 1: 增量计数")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Path(tmp) / "repo"
+        state_dir = Path(tmp) / "backup"
+        state_dir.mkdir()
+        init(repo)
+        _commit(repo, 5)
+
+        runner = _RecordingRunner(repo)
+        counter = CommitCounter(state_dir, runner)
+
+        assert counter.count(read_ref_map(repo / ".git")) == 5
+        assert counter.last_mode == 'full'
+        assert (state_dir / STATE_FILE_NAME).exists()
+
+        # 引用未变化时不执行 git
+        runner.calls.clear()
+        assert counter.count(read_ref_map(repo / ".git")) == 5
+        assert counter.last_mode == 'unchanged' and runner.calls == []
+
+        # 新增提交和分支
+        _commit(repo, 3)
+        _git(repo, 'checkout', '-q', '-b', 'feature')
+        _commit(repo, 2, 'f')
+        runner.calls.clear()
+        assert counter.count(read_ref_map(repo / ".git")) == _full_count(repo) == 10
+        assert counter.last_mode == 'incremental'
+        assert ['rev-list', '--all', '--count'] not in runner.calls
+
+    print("[OK] 增量计数正确")
+    return True
+
+
+def test_rewind_triggers_full_count():
+    """测试引用回退和定期校验时完整重新计数"""
+    print("\n" + "=" * 50)
+    print("测试 2: 回退与定期校验")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Path(tmp) / "repo"
+        state_dir = Path(tmp) / "backup"
+        state_dir.mkdir()
+        init(repo)
+        _commit(repo, 6)
+
+        counter = CommitCounter(state_dir, host_git_runner(repo))
+        assert counter.count(read_ref_map(repo / ".git")) == 6
+
+        # 模拟强制推送：回退 3 个提交后再提交 1 个
+        _git(repo, 'reset', '-q', '--hard', 'HEAD~3')
+        _commit(repo, 1, 'r')
+        _git(repo, 'reflog', 'expire', '--expire=now', '--all')
+        assert counter.count(read_ref_map(repo / ".git")) == _full_count(repo) == 4
+        assert counter.last_mode == 'full'
+
+        # 旧对象被清理后（rev-list 报错）同样回退到完整计数
+        _commit(repo, 1, 'x')
+        state_file = state_dir / STATE_FILE_NAME
+        state = json.loads(state_file.read_text())
+        state['refs']['refs/heads/gone'] = 'deadbeef' * 5
+        state_file.write_text(json.dumps(state))
+        assert counter.count(read_ref_map(repo / ".git")) == 5
+        assert counter.last_mode == 'full'
+
+        # 到达定期校验时间
+        state = json.loads(state_file.read_text())
+        state['full_count_at'] = 0
+        state_file.write_text(json.dumps(state))
+        assert counter.count(read_ref_map(repo / ".git")) == 5
+        assert counter.last_mode == 'full'
+
+        # 关闭定期校验
+        state['full_count_at'] = 0
+        state_file.write_text(json.dumps(state))
+        counter = CommitCounter(state_dir, host_git_runner(repo), full_recount_days=0)
+        assert counter.count(read_ref_map(repo / ".git")) == 5
+        assert counter.last_mode == 'unchanged'
+
+    print("[OK] 回退检测正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all([test_incremental_count(), test_rewind_triggers_full_count()])
+    sys.exit(0 if success else 1)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跨仓库去重测试脚本
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from src.dedup import INDEX_FILE_NAME, Deduplicator, iter_immutable_files
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _make_snapshot(root: Path, repo: str, name: str, packs: dict, loose: dict = None):
+    """创建一个模拟快照目录"""
+    objects = root / repo / "snapshots" / name / "objects"
+    (objects / "pack").mkdir(parents=True)
+    (objects / "info").mkdir()
+    (objects / "info" / "packs").write_text("P pack-x.pack\n")
+    for file_name, data in packs.items():
+        (objects / "pack" / file_name).write_bytes(data)
+    for rel, data in (loose or {}).items():
+        path = objects / rel
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(data)
+    return objects
+
+
+def test_dedup_across_repos():
+    """测试不同仓库之间的重复文件替换为硬链接"""
+    print("\n" + "=" * 50)
+    print("测试 1: 跨仓库去重")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        pack = os.urandom(64 * 1024)
+        a = _make_snapshot(
+            root,
+            "upstream/repo",
+            "20260101-000000",
+            {"pack-1.pack": pack, "pack-1.idx": b"idx"},
+            {"ab/cdef": b"loose"},
+        )
+        b = _make_snapshot(
+            root,
+            "fork/repo",
+            "20260101-000000",
+            {"pack-1.pack": pack, "pack-1.idx": b"idx", "pack-2.pack": b"other"},
+            {"ab/cdef": b"loose"},
+        )
+        (root / ".trash" / "x").mkdir(parents=True)
+
+        files = list(iter_immutable_files(root))
+        assert len(files) == 7
+        assert not any("info" in str(f) for f in files)
+
+        stats = Deduplicator(root).run()
+        assert stats['files'] == 7 and stats['hashed'] == 7
+        assert stats['relinked'] == 3
+        assert stats['reclaimed_bytes'] == len(pack) + len(b"idx") + len(b"loose")
+
+        assert os.path.samefile(
+            a / "pack" / "pack-1.pack", b / "pack" / "pack-1.pack"
+        )
+        assert os.path.samefile(a / "ab" / "cdef", b / "ab" / "cdef")
+        assert (b / "pack" / "pack-1.pack").read_bytes() == pack
+        assert (root / INDEX_FILE_NAME).exists()
+
+    print("[OK] 跨仓库去重成功")
+    return True
+
+
+def test_incremental_index():
+    """测试持久化索引：第二次运行只哈希新文件"""
+    print("\n" + "=" * 50)
+    print("测试 2: 增量哈希")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        pack = os.urandom(4096)
+        _make_snapshot(root, "org/a", "20260101-000000", {"pack-1.pack": pack})
+        _make_snapshot(root, "org/b", "20260101-000000", {"pack-1.pack": pack})
+        dedup = Deduplicator(root)
+        assert dedup.run()['hashed'] == 2
+
+        # 已去重的文件不再哈希，也不重复替换
+        stats = dedup.run()
+        assert stats['hashed'] == 0 and stats['relinked'] == 0
+
+        # 同一仓库的新快照（cp -al）共享 inode，也不需要哈希
+        src = root / "org/b/snapshots/20260101-000000/objects/pack/pack-1.pack"
+        new = _make_snapshot(root, "org/b", "20260102-000000", {})
+        os.link(src, new / "pack" / "pack-1.pack")
+        _make_snapshot(root, "org/c", "20260101-000000", {"pack-1.pack": pack})
+
+        stats = dedup.run()
+        assert stats['hashed'] == 1 and stats['relinked'] == 1
+        assert stats['reclaimed_bytes'] == len(pack)
+        assert dedup.last_run()['reclaimed_bytes'] == len(pack)
+
+    print("[OK] 增量哈希正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all([test_dedup_across_repos(), test_incremental_index()])
+    sys.exit(0 if success else 1)
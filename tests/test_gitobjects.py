@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Git 对象读取测试脚本
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from src.gitobjects import ObjectStore, PackCache, apply_delta
+from tests.gitutil import GIT, init
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _make_repo(tmp: Path) -> Path:
+    """创建一个有多次修改（便于产生 delta）的裸仓库"""
+    work = tmp / "work"
+    init(work)
+    (work / "src").mkdir()
+    lines = [f"line {i}\n" for i in range(400)]
+    for i in range(5):
+        lines[i * 50] = f"changed {i}\n"
+        (work / "src" / "big.txt").write_text(''.join(lines))
+        (work / "README.md").write_text(f"readme {i}\n")
+        subprocess.run(GIT + ['-C', str(work), 'add', '.'], check=True)
+        subprocess.run(
+            GIT + ['-C', str(work), 'commit', '-q', '-m', f"c{i}"], check=True
+        )
+    subprocess.run(GIT + ['-C', str(work), 'tag', '-a', 'v1', '-m', 'v1'], check=True)
+    bare = tmp / "repo.git"
+    subprocess.run(GIT + ['clone', '-q', '--bare', str(work), str(bare)], check=True)
+    return bare
+
+
+def _git(repo: Path, *args) -> bytes:
+    return subprocess.run(
+        ['git', '-C', str(repo), *args], capture_output=True, check=True
+    ).stdout
+
+
+def _all_objects(repo: Path):
+    out = _git(repo, 'cat-file', '--batch-all-objects', '--batch-check').decode()
+    return [line.split()[:2] for line in out.splitlines()]
+
+
+def test_apply_delta():
+    """测试 delta 复制/插入指令"""
+    print("\n" + "=" * 50)
+    print("测试 1: 应用 delta")
+    print("=" * 50)
+
+    base = b"hello world"
+    # 源大小 11，目标大小 11；复制 base[0:6]，插入 "there"
+    delta = bytes([11, 11, 0x90, 6, 5]) + b"there"
+    assert apply_delta(base, delta) == b"hello there"
+
+    print("[OK] delta 应用正确")
+    return True
+
+
+def test_read_packed_and_loose():
+    """测试读取 pack（含 delta）和松散对象，与 git cat-file 一致"""
+    print("\n" + "=" * 50)
+    print("测试 2: 读取对象")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = _make_repo(Path(tmp))
+
+        # 克隆后对象为松散或单个 pack，先全部读一遍
+        store = ObjectStore(repo)
+        for sha, obj_type in _all_objects(repo):
+            assert store.read(sha) == (obj_type, _git(repo, 'cat-file', obj_type, sha))
+
+        # 重新打包，生成 delta
+        _git(repo, 'repack', '-adf', '--depth=10', '-q')
+        _git(repo, 'prune-packed')
+        indexes = [str(p) for p in repo.glob('objects/pack/*.idx')]
+        verify = _git(repo, 'verify-pack', '-v', *indexes)
+        assert b'chain length' in verify
+
+        store = ObjectStore(repo, PackCache())
+        for sha, obj_type in _all_objects(repo):
+            assert store.read(sha) == (obj_type, _git(repo, 'cat-file', obj_type, sha))
+
+        try:
+            store.read("0" * 40)
+            assert False, "应该抛出 KeyError"
+        except KeyError:
+            pass
+
+    print("[OK] 读取对象与 git 一致")
+    return True
+
+
+def test_browse():
+    """测试解析引用、遍历目录和按路径读取文件"""
+    print("\n" + "=" * 50)
+    print("测试 3: 浏览快照")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = _make_repo(Path(tmp))
+        store = ObjectStore(repo)
+
+        head = _git(repo, 'rev-parse', 'HEAD').decode().strip()
+        assert store.head() == "refs/heads/main"
+        assert store.resolve() == head
+        assert store.resolve('main') == head
+        # 附注标签剥离到提交
+        assert store.resolve('v1') == head
+        assert set(store.refs()) == {"refs/heads/main", "refs/tags/v1"}
+
+        commit = store.commit(head)
+        assert commit['message'].strip() == "c4" and len(commit['parents']) == 1
+
+        root = store.lookup(head)
+        names = {e.name: e.type for e in store.tree(root.sha)}
+        assert names == {"README.md": 'blob', "src": 'tree'}
+
+        entry = store.lookup(head, "src/big.txt")
+        assert store.read(entry.sha)[1] == _git(repo, 'show', 'HEAD:src/big.txt')
+        for missing in ("nope", "README.md/x"):
+            try:
+                store.lookup(head, missing)
+                assert False, "应该抛出 KeyError"
+            except KeyError:
+                pass
+
+    print("[OK] 浏览快照正确")
+    return True
+
+
+def test_pack_cache_lru():
+    """测试 pack 缓存复用已打开的 pack，并淘汰最久未使用的"""
+    print("\n" + "=" * 50)
+    print("测试 4: pack 缓存")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        repo_a = _make_repo(tmp / "a")
+        repo_b = _make_repo(tmp / "b")
+        for repo in (repo_a, repo_b):
+            _git(repo, 'repack', '-adq')
+
+        cache = PackCache(max_open=1)
+        store_a = ObjectStore(repo_a, cache)
+        head_a = store_a.resolve()
+        for _ in range(3):
+            store_a.lookup(head_a, "src/big.txt")
+        assert cache.opened == 1
+
+        store_b = ObjectStore(repo_b, cache)
+        store_b.lookup(store_b.resolve(), "README.md")
+        assert cache.opened == 2
+        # 仓库 a 的 pack 已被淘汰，需要重新打开
+        store_a.lookup(head_a, "README.md")
+        assert cache.opened == 3
+        cache.close()
+
+    print("[OK] pack 缓存正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all(
+        [
+            test_apply_delta(),
+            test_read_packed_and_loose(),
+            test_browse(),
+            test_pack_cache_lru(),
+        ]
+    )
+    sys.exit(0 if success else 1)
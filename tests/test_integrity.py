@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+校验清单与完整性校验测试脚本
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from src.archive import write_checksum_file
+from src.integrity import (
+    MANIFEST_FILE_NAME,
+    Verifier,
+    build_manifest,
+    hash_file,
+    load_verify_result,
+    read_manifest,
+)
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _make_repo(path: Path):
+    """创建一个模拟裸仓库"""
+    (path / "objects" / "pack").mkdir(parents=True)
+    (path / "refs" / "heads").mkdir(parents=True)
+    (path / "objects" / "pack" / "pack-1.pack").write_bytes(os.urandom(32 * 1024))
+    (path / "HEAD").write_text("ref: refs/heads/main\n")
+    # 在线仓库中会被原地改写的文件
+    (path / "FETCH_HEAD").write_text("abc\t\tbranch 'main'\n")
+    (path / "logs").mkdir()
+    (path / "logs" / "HEAD").write_text("0 1 sync\n")
+
+
+def _snapshot(repo: Path, snapshot: Path):
+    snapshot.parent.mkdir(parents=True, exist_ok=True)
+    subprocess.run(['cp', '-al', str(repo), str(snapshot)], check=True)
+    (snapshot / ".snapshot_meta").write_text("commit_count=1\n")
+
+
+def test_manifest_reuses_inodes():
+    """测试清单生成以及按 inode 复用哈希"""
+    print("\n" + "=" * 50)
+    print("测试 1: 校验清单")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Path(tmp) / "live" / "repo.git"
+        _make_repo(repo)
+        snapshots = Path(tmp) / "backup" / "org" / "repo" / "snapshots"
+
+        first = snapshots / "20260101-000000"
+        _snapshot(repo, first)
+        stats = build_manifest(first)
+        assert stats['files'] == 2 and stats['hashed'] == 2
+
+        entries = {e.path: e for e in read_manifest(first)}
+        assert set(entries) == {"HEAD", "objects/pack/pack-1.pack"}
+        pack = first / "objects" / "pack" / "pack-1.pack"
+        assert entries["objects/pack/pack-1.pack"].sha256 == hash_file(str(pack))
+
+        # 新增一个 pack：只哈希新文件
+        (repo / "objects" / "pack" / "pack-2.pack").write_bytes(b"new data")
+        second = snapshots / "20260102-000000"
+        _snapshot(repo, second)
+        stats = build_manifest(second, first)
+        assert stats['files'] == 3 and stats['hashed'] == 1
+        assert stats['hashed_bytes'] == len(b"new data")
+        assert (second / MANIFEST_FILE_NAME).exists()
+
+    print("[OK] 清单复用哈希正确")
+    return True
+
+
+def test_verify_detects_corruption():
+    """测试校验发现损坏的快照文件和归档"""
+    print("\n" + "=" * 50)
+    print("测试 2: 发现损坏")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "backup"
+        repo = Path(tmp) / "live" / "repo.git"
+        _make_repo(repo)
+        snapshots = root / "org" / "repo" / "snapshots"
+        first = snapshots / "20260101-000000"
+        _snapshot(repo, first)
+        build_manifest(first)
+        second = snapshots / "20260102-000000"
+        _snapshot(repo, second)
+        build_manifest(second, first)
+
+        archive_dir = root / "org" / "repo" / "archives"
+        archive_dir.mkdir()
+        bundle = archive_dir / "archive-202601.bundle"
+        bundle.write_bytes(b"bundle data")
+        write_checksum_file(bundle, hash_file(str(bundle)), 'sha256')
+
+        verifier = Verifier(root, workers=2)
+        items = verifier.collect()
+        # 两个快照共享 inode，只需校验一次
+        assert len(items) == 3
+        result = verifier.run(full=True)
+        assert result['checked'] == 3 and result['mismatches'] == []
+
+        # 在线仓库再次同步：原地改写的文件与快照共享 inode，但不在清单中
+        with open(repo / "FETCH_HEAD", 'w') as f:
+            f.write("def\t\tbranch 'main'\n")
+        with open(repo / "logs" / "HEAD", 'a') as f:
+            f.write("1 2 sync\n")
+        assert (first / "FETCH_HEAD").read_text().startswith("def")
+        assert verifier.run(full=True)['mismatches'] == []
+
+        # 损坏 pack（影响共享同一 inode 的两个快照），删除 HEAD，篡改归档
+        with open(first / "objects" / "pack" / "pack-1.pack", 'r+b') as f:
+            f.write(b"\0\0\0\0")
+        (second / "HEAD").unlink()
+        bundle.write_bytes(b"bundle DATA")
+
+        result = verifier.run(full=True)
+        paths = sorted(
+            Path(m['path']).relative_to(root).as_posix()
+            for m in result['mismatches']
+        )
+        assert paths == [
+            "org/repo/archives/archive-202601.bundle",
+            "org/repo/snapshots/20260101-000000/objects/pack/pack-1.pack",
+            "org/repo/snapshots/20260102-000000/HEAD",
+            "org/repo/snapshots/20260102-000000/objects/pack/pack-1.pack",
+        ]
+        assert len(load_verify_result(root)['mismatches']) == 4
+
+    print("[OK] 损坏检测正确")
+    return True
+
+
+def test_rotating_sample():
+    """测试轮转抽检覆盖全部数据"""
+    print("\n" + "=" * 50)
+    print("测试 3: 轮转抽检")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        for n in range(10):
+            snapshot = root / "org" / f"repo{n}" / "snapshots" / "20260101-000000"
+            (snapshot / "objects").mkdir(parents=True)
+            (snapshot / "objects" / "data").write_bytes(b"x" * 1000)
+            build_manifest(snapshot)
+
+        verifier = Verifier(root, workers=1, sample_percent=30)
+        items = verifier.collect()
+        assert len(items) == 10
+
+        # 每次抽检 30%，游标依次推进，4 次运行后覆盖全部并回绕
+        covered = []
+        for _ in range(4):
+            covered.extend(i.key for i in verifier.select(items))
+            result = verifier.run()
+            assert result['checked'] == 3
+        assert set(covered) == {i.key for i in items}
+        assert covered[:3] == [i.key for i in items[:3]]
+        assert covered[9:] == [items[9].key] + [i.key for i in items[:2]]
+
+    print("[OK] 轮转抽检正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all(
+        [
+            test_manifest_reuses_inodes(),
+            test_verify_detects_corruption(),
+            test_rotating_sample(),
+        ]
+    )
+    sys.exit(0 if success else 1)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+镜像清单测试脚本
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from src.inventory import SqliteInventory, inventory_key
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SYNCED = int(datetime(2026, 3, 1, 8, 0).timestamp())
+UPDATED = int(datetime(2026, 2, 20).timestamp())
+
+
+def _gitea_db(path: Path) -> Path:
+    """与 Gitea 表结构一致的最小数据库（只含用到的列）"""
+    conn = sqlite3.connect(str(path))
+    conn.executescript(
+        """
+        CREATE TABLE repository (
+            id INTEGER PRIMARY KEY,
+            owner_name TEXT,
+            lower_name TEXT,
+            name TEXT,
+            is_mirror INTEGER,
+            updated_unix INTEGER
+        );
+        CREATE TABLE mirror (
+            id INTEGER PRIMARY KEY,
+            repo_id INTEGER,
+            "interval" INTEGER,
+            updated_unix INTEGER,
+            next_update_unix INTEGER
+        );
+        """
+    )
+    conn.executemany(
+        "INSERT INTO repository VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (1, 'Org', 'demo', 'Demo', 1, UPDATED),
+            (2, 'org', 'local', 'local', 0, UPDATED),
+            (3, 'team', 'pending', 'pending', 1, 0),
+        ],
+    )
+    conn.execute("INSERT INTO mirror VALUES (1, 1, 28800, ?, 0)", (SYNCED,))
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_sqlite_inventory():
+    """测试一次查询读取镜像标记和同步时间"""
+    print("\n" + "=" * 50)
+    print("测试 1: 读取 SQLite 镜像清单")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        inventory = SqliteInventory(_gitea_db(Path(tmp) / "gitea.db")).load()
+        assert sorted(inventory) == ["org/demo", "org/local", "team/pending"]
+
+        demo = inventory["org/demo"]
+        assert demo.is_mirror and demo.last_sync == datetime(2026, 3, 1, 8, 0)
+        assert demo.updated == datetime(2026, 2, 20)
+        assert not inventory["org/local"].is_mirror
+        assert inventory["org/local"].last_sync is None
+
+        # 从未同步过的镜像没有同步时间
+        pending = inventory["team/pending"]
+        assert pending.is_mirror and pending.last_sync is None
+        assert pending.updated is None
+
+    print("[OK] SQLite 镜像清单读取正确")
+    return True
+
+
+def test_read_only():
+    """测试只读打开：不修改数据库，也不会创建不存在的文件"""
+    print("\n" + "=" * 50)
+    print("测试 2: 只读访问")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = _gitea_db(Path(tmp) / "gitea.db")
+        before = (db.read_bytes(), sorted(os.listdir(tmp)))
+        SqliteInventory(db).load()
+        assert (db.read_bytes(), sorted(os.listdir(tmp))) == before
+
+        missing = Path(tmp) / "missing.db"
+        try:
+            SqliteInventory(missing).load()
+            assert False, "应该抛出 FileNotFoundError"
+        except FileNotFoundError:
+            assert not missing.exists()
+
+        # 不是 Gitea 的数据库
+        other = Path(tmp) / "other.db"
+        sqlite3.connect(str(other)).close()
+        try:
+            SqliteInventory(other).load()
+            assert False, "应该抛出 sqlite3.Error"
+        except sqlite3.Error:
+            pass
+
+    print("[OK] 只读访问正确")
+    return True
+
+
+def test_inventory_key():
+    """测试清单键与备份目录中的仓库名对应"""
+    print("\n" + "=" * 50)
+    print("测试 3: 清单键")
+    print("=" * 50)
+
+    assert inventory_key("Org/Demo") == "org/demo"
+    assert inventory_key("org/demo.git") == "org/demo"
+    assert inventory_key("/org/demo/") == "org/demo"
+
+    print("[OK] 清单键正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all(
+        [
+            test_sqlite_inventory(),
+            test_read_only(),
+            test_inventory_key(),
+        ]
+    )
+    sys.exit(0 if success else 1)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gitea API 镜像清单测试脚本（本地 HTTP 服务模拟 /api/v1/repos/search）
+"""
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from src.inventory import API_CACHE_FILE_NAME, ApiInventory
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TOKEN = "secret"
+
+
+def _repo(owner: str, name: str, day: int) -> dict:
+    return {
+        'id': day,
+        'full_name': f"{owner}/{name}",
+        'mirror': True,
+        'updated_at': f"2026-02-{day:02d}T00:00:00Z",
+        'mirror_updated': f"2026-03-{day:02d}T08:00:00+00:00",
+        'description': "x" * 100,
+    }
+
+
+class FakeGitea:
+    """按 Gitea 的方式分页、返回 X-Total-Count 和 ETag 的本地服务"""
+
+    def __init__(self, repos):
+        self.repos = list(repos)
+        self.status = 200
+        self.requests = []
+        self.connections = set()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake.connections.add(self.client_address)
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                fake.requests.append((url.path, query, dict(self.headers)))
+                if self.headers.get('Authorization') != f"token {TOKEN}":
+                    return self._send(401, b'{"message": "token is required"}')
+                if fake.status != 200:
+                    return self._send(fake.status, b'{}')
+
+                limit, page = int(query['limit']), int(query['page'])
+                mirrors = [r for r in fake.repos if r['mirror']]
+                data = mirrors[(page - 1) * limit : page * limit]
+                body = json.dumps({'ok': True, 'data': data}).encode()
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    return self._send(304, b'', {'ETag': etag})
+                self._send(
+                    200, body, {'ETag': etag, 'X-Total-Count': str(len(mirrors))}
+                )
+
+            def _send(self, status, body, headers=None):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_paginated_fetch():
+    """测试分页并发读取、连接复用和时间字段"""
+    print("\n" + "=" * 50)
+    print("测试 1: 分页并发读取")
+    print("=" * 50)
+
+    repos = [_repo("Org", f"repo-{i}", i) for i in range(1, 8)]
+    repos.append(dict(_repo("org", "source", 9), mirror=False))
+    gitea = FakeGitea(repos)
+    try:
+        source = ApiInventory(gitea.url, TOKEN, page_size=3, workers=2)
+        inventory = source.load()
+        assert sorted(inventory) == [f"org/repo-{i}" for i in range(1, 8)]
+        assert source.requests == 3 and source.not_modified == 0
+        assert all(q['mode'] == 'mirror' for _, q, _ in gitea.requests)
+        assert sorted(int(q['page']) for _, q, _ in gitea.requests) == [1, 2, 3]
+        # 所有请求共用连接池（不超过并发数个连接）
+        assert len(gitea.connections) <= 2
+
+        info = inventory["org/repo-2"]
+        assert info.is_mirror
+        # 带时区的时间转换为本地时间
+        synced = datetime(2026, 3, 2, 8, 0, tzinfo=timezone.utc)
+        updated = datetime(2026, 2, 2, tzinfo=timezone.utc)
+        assert info.last_sync == synced.astimezone().replace(tzinfo=None)
+        assert info.updated == updated.astimezone().replace(tzinfo=None)
+    finally:
+        gitea.close()
+
+    print("[OK] 分页并发读取正确")
+    return True
+
+
+def test_conditional_cache():
+    """测试 ETag 缓存：未变化的页返回 304 并使用缓存，新增仓库时多读一页"""
+    print("\n" + "=" * 50)
+    print("测试 2: 条件请求缓存")
+    print("=" * 50)
+
+    gitea = FakeGitea([_repo("org", f"repo-{i}", i) for i in range(1, 7)])
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = Path(tmp) / API_CACHE_FILE_NAME
+            source = ApiInventory(gitea.url, TOKEN, cache_path=cache, page_size=3)
+            first = source.load()
+            assert cache.exists() and len(first) == 6
+
+            assert source.requests == 2
+
+            # 总数来自缓存时多读一页，确认没有新增的仓库
+            second = source.load()
+            assert second == first
+            assert (source.requests, source.not_modified) == (3, 2)
+            headers = gitea.requests[-2][2]
+            assert headers.get('If-None-Match', '').startswith('"')
+            # 缓存只保存用到的字段
+            assert 'description' not in cache.read_text()
+
+            # 新增的仓库落在新的一页，前两页仍然未变化
+            gitea.repos.append(_repo("org", "repo-7", 7))
+            third = source.load()
+            assert len(third) == 7 and "org/repo-7" in third
+            assert (source.requests, source.not_modified) == (3, 2)
+
+            # 每页数量不同时缓存作废
+            other = ApiInventory(gitea.url, TOKEN, cache_path=cache, page_size=5)
+            assert len(other.load()) == 7 and other.not_modified == 0
+    finally:
+        gitea.close()
+
+    print("[OK] 条件请求缓存正确")
+    return True
+
+
+def test_errors():
+    """测试认证失败和服务端错误时抛出异常（调用方回退到逐个仓库检查）"""
+    print("\n" + "=" * 50)
+    print("测试 3: 错误处理")
+    print("=" * 50)
+
+    import requests
+
+    gitea = FakeGitea([_repo("org", "demo", 1)])
+    try:
+        try:
+            ApiInventory(gitea.url, "wrong").load()
+            assert False, "应该抛出 HTTPError"
+        except requests.HTTPError as e:
+            assert e.response.status_code == 401
+
+        gitea.status = 500
+        try:
+            ApiInventory(gitea.url, TOKEN).load()
+            assert False, "应该抛出 HTTPError"
+        except requests.HTTPError:
+            pass
+    finally:
+        gitea.close()
+
+    print("[OK] 错误处理正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all(
+        [
+            test_paginated_fetch(),
+            test_conditional_cache(),
+            test_errors(),
+        ]
+    )
+    sys.exit(0 if success else 1)
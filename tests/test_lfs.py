@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LFS 对象备份测试脚本
+"""
+
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from src.lfs import (
+    LFS_OIDS_FILE_NAME,
+    LfsStore,
+    copy_verified,
+    iter_snapshot_oids,
+    read_lfs_oids,
+    scan_pointers,
+    write_lfs_oids,
+)
+from src.small_repos import open_pack
+from tests.gitutil import GIT, init
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _pointer(content: bytes) -> str:
+    oid = hashlib.sha256(content).hexdigest()
+    return (
+        "version https://git-lfs.github.com/spec/v1\n"
+        f"oid sha256:{oid}\n"
+        f"size {len(content)}\n"
+    )
+
+
+def _gitea_object(lfs_dir: Path, content: bytes) -> str:
+    """按 Gitea 的布局（ab/cd/ef...）写入 LFS 对象"""
+    oid = hashlib.sha256(content).hexdigest()
+    path = lfs_dir / oid[0:2] / oid[2:4] / oid[4:]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return oid
+
+
+def _snapshot(root: Path, repo: str, name: str, oids) -> Path:
+    snapshot = root / repo / "snapshots" / name
+    (snapshot / "objects").mkdir(parents=True)
+    write_lfs_oids(snapshot, oids)
+    return snapshot
+
+
+def test_scan_pointers():
+    """测试扫描仓库中的 LFS 指针（跳过普通小文件和二进制文件）"""
+    print("\n" + "=" * 50)
+    print("测试 1: 扫描 LFS 指针")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(tmp) / "work"
+        init(work)
+        (work / "model.bin").write_text(_pointer(b"model-v1"))
+        (work / "README.md").write_text("version https://example.com\n")
+        (work / "icon.png").write_bytes(bytes(range(256)) * 2)
+        subprocess.run(GIT + ['-C', str(work), 'add', '.'], check=True)
+        subprocess.run(GIT + ['-C', str(work), 'commit', '-q', '-m', 'v1'], check=True)
+        (work / "model.bin").write_text(_pointer(b"model-v2!"))
+        subprocess.run(
+            GIT + ['-C', str(work), 'commit', '-q', '-am', 'v2'], check=True
+        )
+
+        oids = scan_pointers(['git', '-C', str(work)])
+        assert oids == {
+            hashlib.sha256(b"model-v1").hexdigest(): 8,
+            hashlib.sha256(b"model-v2!").hexdigest(): 9,
+        }
+
+        # 没有 LFS 指针的仓库
+        empty = Path(tmp) / "empty"
+        subprocess.run(GIT + ['init', '-q', str(empty)], check=True)
+        assert scan_pointers(['git', '-C', str(empty)]) == {}
+
+    print("[OK] 扫描 LFS 指针正确")
+    return True
+
+
+def test_store_copy_and_gc():
+    """测试对象只复制一次、校验失败、中断后继续以及清理不再引用的对象"""
+    print("\n" + "=" * 50)
+    print("测试 2: 复制和清理")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root = tmp / "backup"
+        lfs_dir = tmp / "lfs"
+        a = _gitea_object(lfs_dir, b"a" * 3000)
+        b = _gitea_object(lfs_dir, b"b" * 10)
+        gone = hashlib.sha256(b"gone").hexdigest()
+
+        old = _snapshot(root, "org/demo", "20260101-000000", {a: 3000})
+        _snapshot(root, "org/demo", "20260102-000000", {a: 3000, gone: 4})
+        open_pack(root / "other").add(
+            "other/tiny", "20260101-000000", ['true'], {}, lfs_oids={b: 10}
+        )
+        assert read_lfs_oids(old) == {a: 3000}
+        assert sorted(r for r, _ in iter_snapshot_oids(root)) == [
+            "org/demo",
+            "org/demo",
+            "other/tiny",
+        ]
+
+        store = LfsStore(root, lfs_dir, workers=2)
+        stats = store.run()
+        assert (stats['referenced'], stats['copied'], stats['missing']) == (3, 2, 1)
+        assert stats['copied_bytes'] == 3010
+        assert store.object_path(a).read_bytes() == b"a" * 3000
+
+        # 第二次运行不再复制
+        stats = store.run()
+        assert (stats['copied'], stats['existing']) == (0, 2)
+
+        # 中断留下的 .part 从末尾继续；内容不符时丢弃
+        dest = store.object_path(a)
+        dest.unlink()
+        part = dest.with_name(dest.name + '.part')
+        part.write_bytes(b"a" * 1000)
+        assert copy_verified(store.source_path(a), dest, a, 3000) == 2000
+        try:
+            copy_verified(store.source_path(b), store.object_path(a), b, 99)
+            assert False, "应该抛出 ValueError"
+        except ValueError:
+            assert not list(dest.parent.glob('*.part'))
+
+        # 快照删除后，只被它引用的对象被清理
+        subprocess.run(['rm', '-rf', str(root / "other")], check=True)
+        stats = store.run()
+        assert (stats['removed'], stats['removed_bytes']) == (1, 10)
+        assert not store.object_path(b).exists() and dest.exists()
+
+    print("[OK] 复制和清理正确")
+    return True
+
+
+def test_restore_objects():
+    """测试把对象复制回 Gitea 的 LFS 目录"""
+    print("\n" + "=" * 50)
+    print("测试 3: 恢复 LFS 对象")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root = tmp / "backup"
+        lfs_dir = tmp / "lfs"
+        a = _gitea_object(lfs_dir, b"payload")
+        b = _gitea_object(lfs_dir, b"kept")
+        snapshot = _snapshot(root, "org/demo", "20260101-000000", {a: 7, b: 4})
+        assert (snapshot / LFS_OIDS_FILE_NAME).exists()
+
+        store = LfsStore(root, lfs_dir)
+        assert store.run()['copied'] == 2
+
+        # Gitea 中的对象丢失后从存储中恢复
+        store.source_path(a).unlink()
+        missing = hashlib.sha256(b"never-stored").hexdigest()
+        stats = store.restore({**read_lfs_oids(snapshot), missing: 12})
+        assert stats == {'restored': 1, 'existing': 1, 'missing': 1, 'failed': 0}
+        assert store.source_path(a).read_bytes() == b"payload"
+
+    print("[OK] 恢复 LFS 对象正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all(
+        [
+            test_scan_pointers(),
+            test_store_copy_and_gc(),
+            test_restore_objects(),
+        ]
+    )
+    sys.exit(0 if success else 1)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+引用变化检测测试脚本
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from src.commit_counter import host_git_runner
+from src.ref_diff import (
+    CREATED,
+    DELETED,
+    FAST_FORWARD,
+    REWOUND,
+    compare_snapshots,
+    destructive_changes,
+    diff_ref_maps,
+    filter_ignored,
+    load_ref_changes,
+    save_ref_changes,
+    summarize,
+)
+from src.refs import REF_MAP_CACHE_FILE_NAME, cached_ref_map, read_ref_map
+from tests.gitutil import GIT, init
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _git(repo: Path, *args) -> str:
+    result = subprocess.run(
+        GIT + ['-C', str(repo)] + list(args),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.strip()
+
+
+def _commit(repo: Path, message: str):
+    _git(repo, 'commit', '-q', '--allow-empty', '-m', message)
+
+
+def test_classify_ref_changes():
+    """测试新建、删除、快进和改写的分类"""
+    print("\n" + "=" * 50)
+    print("测试 1: 引用变化分类")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Path(tmp) / "repo"
+        init(repo)
+        for i in range(3):
+            _commit(repo, f"c{i}")
+        _git(repo, 'branch', 'feature')
+        _git(repo, 'branch', 'old')
+        _git(repo, 'update-ref', 'refs/pull/1/head', 'HEAD')
+        before = read_ref_map(repo / ".git")
+
+        # main 快进，feature 被改写，old 被删除，新建标签，PR 引用被改写
+        _commit(repo, "c3")
+        _git(repo, 'branch', '-f', 'feature', 'HEAD~3')
+        _git(repo, 'branch', '-D', 'old')
+        _git(repo, 'tag', 'v1')
+        _git(repo, 'update-ref', 'refs/pull/1/head', 'HEAD~2')
+        after = read_ref_map(repo / ".git")
+
+        changes = diff_ref_maps(before, after, host_git_runner(repo))
+        kinds = {c.ref: c.kind for c in changes}
+        assert kinds == {
+            'refs/heads/main': FAST_FORWARD,
+            'refs/heads/feature': REWOUND,
+            'refs/heads/old': DELETED,
+            'refs/tags/v1': CREATED,
+            'refs/pull/1/head': REWOUND,
+        }
+
+        changes = filter_ignored(changes, ['refs/pull/*'])
+        destructive = destructive_changes(changes)
+        assert [c.ref for c in destructive] == ['refs/heads/feature', 'refs/heads/old']
+        assert summarize(changes)[REWOUND] == 1
+        assert 'refs/heads/feature' in destructive[0].describe()
+
+        # 旧对象已不存在时视为改写
+        missing = {'refs/heads/main': 'deadbeef' * 5}
+        changes = diff_ref_maps(missing, after, host_git_runner(repo))
+        kinds = {c.ref: c.kind for c in changes}
+        assert kinds['refs/heads/main'] == REWOUND
+
+    print("[OK] 引用变化分类正确")
+    return True
+
+
+def test_save_and_load():
+    """测试保存和读取引用变化"""
+    print("\n" + "=" * 50)
+    print("测试 2: 保存引用变化")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        assert load_ref_changes(Path(tmp)) is None
+
+        old = {'refs/heads/main': 'a' * 40, 'refs/heads/x': 'b' * 40}
+        new = {'refs/heads/main': 'a' * 40}
+        changes = diff_ref_maps(old, new, run_git=None)
+        save_ref_changes(Path(tmp), '20260102-000000', '20260101-000000', changes)
+
+        data = load_ref_changes(Path(tmp))
+        assert data['base'] == '20260101-000000'
+        assert data['summary'][DELETED] == 1
+        assert data['changes'] == changes
+
+    print("[OK] 引用变化保存正确")
+    return True
+
+
+def test_compare_snapshots():
+    """测试比较两个快照：丢失的提交数和引用表缓存"""
+    print("\n" + "=" * 50)
+    print("测试 3: 快照对比")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        work = tmp / "work"
+        init(work)
+        for i in range(3):
+            _commit(work, f"c{i}")
+        _git(work, 'checkout', '-q', '-b', 'feature')
+        for i in range(2):
+            _commit(work, f"f{i}")
+        _git(work, 'checkout', '-q', '-b', 'old')
+        _commit(work, "o0")
+        _git(work, 'checkout', '-q', 'main')
+
+        live = tmp / "live.git"
+        subprocess.run(
+            GIT + ['clone', '-q', '--mirror', str(work), str(live)], check=True
+        )
+        base = tmp / "snapshots" / "20260101-000000"
+        base.parent.mkdir()
+        subprocess.run(['cp', '-a', str(live), str(base)], check=True)
+
+        # feature 被改写（丢失 2 个提交），old 被删除（丢失 f0、f1 之外的 o0），
+        # 在线仓库 gc 后旧对象只存在于旧快照中
+        _git(work, 'branch', '-f', 'feature', 'main~1')
+        _git(work, 'branch', '-D', 'old')
+        _commit(work, "c3")
+        _git(live, 'fetch', '-q', '--prune')
+        _git(live, 'reflog', 'expire', '--expire=now', '--all')
+        _git(live, 'gc', '-q', '--prune=now')
+        target = tmp / "snapshots" / "20260102-000000"
+        subprocess.run(['cp', '-a', str(live), str(target)], check=True)
+
+        old_tip = read_ref_map(base)['refs/heads/old']
+        missing = subprocess.run(['git', '-C', str(target), 'cat-file', '-e', old_tip])
+        assert missing.returncode != 0
+
+        result = compare_snapshots(base, target)
+        changes = {c['ref']: c for c in result['changes']}
+        assert changes['refs/heads/main']['kind'] == FAST_FORWARD
+        assert changes['refs/heads/feature']['kind'] == REWOUND
+        assert changes['refs/heads/feature']['lost_commits'] == 2
+        assert changes['refs/heads/old']['kind'] == DELETED
+        assert changes['refs/heads/old']['lost_commits'] == 3
+        assert changes['refs/heads/main']['lost_commits'] == 0
+        assert result['lost_commits'] == 3
+        assert result['base'] == base.name and result['target'] == target.name
+
+        # 快照的引用表已缓存；在线仓库不使用缓存
+        assert (base / REF_MAP_CACHE_FILE_NAME).exists()
+        assert cached_ref_map(target) == read_ref_map(target)
+        _git(live, 'update-ref', 'refs/heads/new', 'main')
+        result = compare_snapshots(target, live, target_is_live=True)
+        assert result['target'] == 'live'
+        assert [c['ref'] for c in result['changes']] == ['refs/heads/new']
+        assert not (live / REF_MAP_CACHE_FILE_NAME).exists()
+
+    print("[OK] 快照对比正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all(
+        [test_classify_ref_changes(), test_save_and_load(), test_compare_snapshots()]
+    )
+    sys.exit(0 if success else 1)
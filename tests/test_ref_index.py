@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+引用索引测试脚本
+"""
+
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from src.ref_index import INDEX_FILE_NAME, RefIndex
+from tests.gitutil import GIT, commit, init
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _snapshot(work: Path, root: Path, repo: str, name: str) -> Path:
+    """把工作仓库克隆为快照"""
+    snapshot = root / repo / "snapshots" / name
+    snapshot.parent.mkdir(parents=True, exist_ok=True)
+    subprocess.run(
+        GIT + ['clone', '-q', '--mirror', str(work), str(snapshot)], check=True
+    )
+    return snapshot
+
+
+def test_find():
+    """测试按对象 ID、前缀和引用名查询，以及引用集合去重"""
+    print("\n" + "=" * 50)
+    print("测试 1: 快速查询")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root = tmp / "backup"
+        work = tmp / "work"
+        init(work)
+        c0 = commit(work, "c0")
+        subprocess.run(GIT + ['-C', str(work), 'tag', 'v1'], check=True)
+
+        index = RefIndex(root)
+        for name in ("20260101-000000", "20260102-000000"):
+            index.add("org/a", _snapshot(work, root, "org/a", name))
+        index.add("org/b", _snapshot(work, root, "org/b", "20260101-120000"))
+        c1 = commit(work, "c1")
+        index.add("org/a", _snapshot(work, root, "org/a", "20260103-000000"))
+
+        hits = index.find(c0)
+        branch_hits = [h for h in hits if h['ref'] == 'refs/heads/main']
+        assert [(h['repository'], h['snapshot']) for h in branch_hits] == [
+            ("org/a", "20260102-000000"),
+            ("org/b", "20260101-120000"),
+            ("org/a", "20260101-000000"),
+        ]
+        # 标签 v1 在所有快照中都指向 c0
+        assert len(hits) == 7
+        assert [h['snapshot'] for h in index.find(c1[:7])] == ["20260103-000000"]
+        assert len(index.find("v1")) == 4
+        assert len(index.find("refs/tags/v1", repository="org/b")) == 1
+        assert len(index.find("main", repository="org")) == 4
+        assert index.find("0000000") == []
+
+        # 引用相同的快照共享引用集合
+        conn = sqlite3.connect(str(root / INDEX_FILE_NAME))
+        assert conn.execute("SELECT COUNT(*) FROM refsets").fetchone()[0] == 2
+        conn.close()
+
+        # 只读打开（Web 服务）
+        assert len(RefIndex(root, read_only=True).find("v1")) == 4
+
+    print("[OK] 快速查询正确")
+    return True
+
+
+def test_sync():
+    """测试同步补充未索引的快照并移除已删除的快照"""
+    print("\n" + "=" * 50)
+    print("测试 2: 同步")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root = tmp / "backup"
+        work = tmp / "work"
+        init(work)
+        c0 = commit(work, "c0")
+        old = _snapshot(work, root, "org/a", "20260101-000000")
+        commit(work, "c1")
+        _snapshot(work, root, "org/a", "20260102-000000")
+
+        index = RefIndex(root)
+        assert index.sync() == {'added': 2, 'removed': 0}
+        assert index.sync() == {'added': 0, 'removed': 0}
+        assert len(index.find(c0)) == 1
+
+        shutil.rmtree(old)
+        assert index.sync() == {'added': 0, 'removed': 1}
+        assert index.find(c0) == []
+        conn = sqlite3.connect(str(root / INDEX_FILE_NAME))
+        assert conn.execute("SELECT COUNT(*) FROM refsets").fetchone()[0] == 1
+        conn.close()
+
+    print("[OK] 同步正确")
+    return True
+
+
+def test_find_reachable():
+    """测试深度查询：不是引用最新提交的历史提交"""
+    print("\n" + "=" * 50)
+    print("测试 3: 深度查询")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root = tmp / "backup"
+        work = tmp / "work"
+        init(work)
+        c0 = commit(work, "c0")
+        c1 = commit(work, "c1")
+        commit(work, "c2")
+        _snapshot(work, root, "org/a", "20260101-000000")
+        _snapshot(work, root, "org/a", "20260102-000000")
+
+        # 强制回退后 c1 不再可达（对象仍可能存在）
+        subprocess.run(GIT + ['-C', str(work), 'reset', '-q', '--hard', c0], check=True)
+        _snapshot(work, root, "org/a", "20260103-000000")
+        _snapshot(work, root, "org/other", "20260103-000000")
+
+        index = RefIndex(root)
+        index.sync()
+        assert index.find(c1) == []
+
+        hits = index.find_reachable(c1)
+        assert [(h['repository'], h['snapshot']) for h in hits] == [
+            ("org/a", "20260102-000000"),
+            ("org/a", "20260101-000000"),
+        ]
+        assert hits[0]['refs'] == ["refs/heads/main"]
+        assert len(index.find_reachable(c0)) == 4
+        assert len(index.find_reachable(c0, repository="org/other")) == 1
+        assert index.find_reachable("f" * 40) == []
+        try:
+            index.find_reachable(c1[:8])
+            assert False, "应该抛出 ValueError"
+        except ValueError:
+            pass
+
+    print("[OK] 深度查询正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all([test_find(), test_sync(), test_find_reachable()])
+    sys.exit(0 if success else 1)
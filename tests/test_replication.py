@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异地复制测试脚本
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from src.archive import host_bundle_command, write_checksum_file
+from src.integrity import build_manifest, hash_file
+from src.refs import read_ref_map
+from src.replication import LocalTarget, RateLimiter, Replicator, open_target
+from src.small_repos import INDEX_FILE_NAME, SmallRepoPack
+from tests.gitutil import GIT, commit, init
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _snapshot(live: Path, root: Path, name: str, previous: Path = None) -> Path:
+    """模拟一次备份：cp -al 在线仓库为快照并生成清单"""
+    snapshot = root / "org" / "demo" / "snapshots" / name
+    snapshot.parent.mkdir(parents=True, exist_ok=True)
+    subprocess.run(['cp', '-al', str(live), str(snapshot)], check=True)
+    (snapshot / ".snapshot_meta").write_text(f"timestamp={name}\n")
+    build_manifest(snapshot, previous)
+    os.utime(snapshot, (time.time(), time.time()))
+    return snapshot
+
+
+def _setup(tmp: Path):
+    work = tmp / "work"
+    init(work)
+    commit(work, "c0", "c0.txt", os.urandom(20000))
+    live = tmp / "live.git"
+    subprocess.run(GIT + ['clone', '-q', '--mirror', str(work), str(live)], check=True)
+    return work, live
+
+
+def test_incremental_replication():
+    """测试增量复制：硬链接快照在目标端复用，已复制的快照直接跳过"""
+    print("\n" + "=" * 50)
+    print("测试 1: 增量复制")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root = tmp / "backup"
+        work, live = _setup(tmp)
+        first = _snapshot(live, root, "20260101-000000")
+        second = _snapshot(live, root, "20260102-000000", first)
+
+        archives = root / "org" / "demo" / "archives"
+        archives.mkdir()
+        bundle = archives / "archive-202601.bundle"
+        subprocess.run(
+            ['git', '-C', str(live), 'bundle', 'create', '-q', str(bundle), '--all'],
+            check=True,
+        )
+        write_checksum_file(bundle, hash_file(str(bundle)), 'sha256')
+
+        # 冷层转换中断留下的目录不复制
+        leftover = first.with_name(f".{first.name}.hot")
+        subprocess.run(['cp', '-al', str(first), str(leftover)], check=True)
+
+        remote = tmp / "offsite"
+        stats = Replicator(root, LocalTarget(remote), workers=3).run()
+        assert stats['items'] == 3 and stats['failed'] == 0
+        assert not (remote / leftover.relative_to(root)).exists()
+        # 第二个快照与第一个内容相同（只有元数据不同），在目标端链接
+        assert stats['linked'] > 0 and stats['uploaded'] < stats['files']
+
+        for snapshot in (first, second):
+            copy = remote / snapshot.relative_to(root)
+            fsck = subprocess.run(
+                ['git', '-C', str(copy), 'fsck', '--no-progress'], capture_output=True
+            )
+            assert fsck.returncode == 0
+            assert (copy / ".manifest").read_text() == (
+                snapshot / ".manifest"
+            ).read_text()
+        obj = next(p for p in sorted(first.rglob("objects/*/*")) if p.is_file())
+        rel = obj.relative_to(first)
+        copies = [remote / s.relative_to(root) / rel for s in (first, second)]
+        assert copies[0].stat().st_ino == copies[1].stat().st_ino
+        assert (remote / bundle.relative_to(root)).read_bytes() == bundle.read_bytes()
+
+        # 再次运行：没有新快照，不读取任何文件
+        stats = Replicator(root, LocalTarget(remote)).run()
+        assert stats['items'] == 0 and stats['files'] == 0
+
+        # 新快照只传输新增内容
+        commit(work, "c1", "c1.txt", os.urandom(20000))
+        subprocess.run(GIT + ['-C', str(live), 'fetch', '-q'], check=True)
+        _snapshot(live, root, "20260103-000000", second)
+        stats = Replicator(root, LocalTarget(remote)).run()
+        assert stats['items'] == 1 and stats['failed'] == 0
+        assert stats['uploaded_bytes'] < 100000
+        assert stats['linked'] > 0
+
+    print("[OK] 增量复制正确")
+    return True
+
+
+def test_resume_and_relink():
+    """测试 .part 续传，以及目标端副本丢失时重新上传"""
+    print("\n" + "=" * 50)
+    print("测试 2: 续传和重新上传")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root = tmp / "backup"
+        archives = root / "org" / "demo" / "archives"
+        archives.mkdir(parents=True)
+        bundle = archives / "archive-202601.bundle"
+        data = os.urandom(3 * 1024 * 1024 + 17)
+        bundle.write_bytes(data)
+
+        remote = tmp / "offsite"
+        part = remote / "org/demo/archives/.archive-202601.bundle.part"
+        part.parent.mkdir(parents=True)
+        part.write_bytes(data[:1024 * 1024])
+
+        stats = Replicator(root, LocalTarget(remote)).run()
+        assert stats['uploaded_bytes'] == len(data) - 1024 * 1024
+        assert (remote / "org/demo/archives/archive-202601.bundle").read_bytes() == data
+        assert not part.exists()
+
+        # 目标端副本被删除后，相同内容的新文件重新上传
+        (remote / "org/demo/archives/archive-202601.bundle").unlink()
+        (archives / "archive-202602.bundle").write_bytes(data)
+        stats = Replicator(root, LocalTarget(remote)).run()
+        assert stats['uploaded'] == 1 and stats['linked'] == 0
+        assert (remote / "org/demo/archives/archive-202602.bundle").read_bytes() == data
+
+        # 小仓库打包文件：只追加新增的末尾，索引整体复制
+        work, live = _setup(tmp)
+        pack = SmallRepoPack(root / "org")
+
+        def add(name: str):
+            pack.add(
+                "org/tiny", name, host_bundle_command(live), read_ref_map(live)
+            )
+
+        add("20260101-000000")
+        stats = Replicator(root, LocalTarget(remote)).run()
+        copy = remote / "org" / pack.path.name
+        data_file = next(pack.path.glob('pack-*.dat'))
+        assert stats['pack_files'] == 2 and stats['failed'] == 0
+        assert (copy / data_file.name).read_bytes() == data_file.read_bytes()
+
+        first_size = data_file.stat().st_size
+        commit(work, "c1", "c1.txt", os.urandom(20000))
+        subprocess.run(GIT + ['-C', str(live), 'fetch', '-q'], check=True)
+        add("20260102-000000")
+        # 上次中断时多写的部分被截掉
+        with open(copy / data_file.name, 'ab') as f:
+            f.write(b"torn")
+        stats = Replicator(root, LocalTarget(remote)).run()
+        assert stats['pack_files'] == 2
+        index_size = (pack.path / INDEX_FILE_NAME).stat().st_size
+        assert stats['uploaded_bytes'] == data_file.stat().st_size - first_size + (
+            index_size
+        )
+        assert (copy / data_file.name).read_bytes() == data_file.read_bytes()
+        reloaded = SmallRepoPack(tmp / "offsite" / "org")
+        assert [s.name for s in reloaded.snapshots("org/tiny")] == [
+            "20260101-000000",
+            "20260102-000000",
+        ]
+        assert Replicator(root, LocalTarget(remote)).run()['pack_files'] == 0
+
+        # 整理后旧打包文件从目标上删除
+        pack.remove("org/tiny", ["20260101-000000"])
+        pack.compact()
+        Replicator(root, LocalTarget(remote)).run()
+        assert sorted(p.name for p in copy.glob('pack-*.dat')) == sorted(
+            p.name for p in pack.path.glob('pack-*.dat')
+        )
+        assert not (copy / data_file.name).exists()
+
+    print("[OK] 续传和重新上传正确")
+    return True
+
+
+def test_rate_limiter():
+    """测试速率上限和目标地址解析"""
+    print("\n" + "=" * 50)
+    print("测试 3: 速率上限")
+    print("=" * 50)
+
+    limiter = RateLimiter(10 * 1024 * 1024)
+    started = time.monotonic()
+    for _ in range(3):
+        limiter.consume(1024 * 1024)
+    assert time.monotonic() - started >= 0.19
+
+    started = time.monotonic()
+    RateLimiter(0).consume(1 << 30)
+    assert time.monotonic() - started < 0.1
+
+    assert isinstance(open_target("/mnt/offsite"), LocalTarget)
+    assert open_target("file:///mnt/offsite").root == Path("/mnt/offsite")
+
+    print("[OK] 速率上限正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all(
+        [test_incremental_replication(), test_resume_and_relink(), test_rate_limiter()]
+    )
+    sys.exit(0 if success else 1)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量时间点恢复测试脚本
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from src.restore import (
+    RESTORE_LOG_FILE_NAME,
+    RestoreEngine,
+    load_latest_restore,
+    match_repositories,
+    parse_point_in_time,
+    plan_restore,
+)
+from tests.gitutil import GIT, commit, init
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _setup(tmp: Path, repo: str) -> Path:
+    """创建工作仓库和 Gitea 在线仓库（镜像）"""
+    work = tmp / "work" / repo
+    init(work)
+    commit(work, "c0")
+    live = tmp / "repos" / f"{repo}.git"
+    live.parent.mkdir(parents=True, exist_ok=True)
+    subprocess.run(GIT + ['clone', '-q', '--mirror', str(work), str(live)], check=True)
+    return work
+
+
+def _snapshot(tmp: Path, repo: str, name: str) -> Path:
+    """模拟一次备份：同步在线仓库后 cp -al 为快照"""
+    live = tmp / "repos" / f"{repo}.git"
+    subprocess.run(GIT + ['-C', str(live), 'fetch', '-q', '--prune'], check=True)
+    snapshot = tmp / "backup" / repo / "snapshots" / name
+    snapshot.parent.mkdir(parents=True, exist_ok=True)
+    subprocess.run(['cp', '-al', str(live), str(snapshot)], check=True)
+    (snapshot / ".snapshot_meta").write_text("commit_count=1\n")
+    return snapshot
+
+
+def _log(repo: Path) -> str:
+    return subprocess.run(
+        ['git', '-C', str(repo), 'log', '--format=%s', '-1', 'main'],
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+def test_plan():
+    """测试时间点解析、模式匹配和来源选择"""
+    print("\n" + "=" * 50)
+    print("测试 1: 恢复计划")
+    print("=" * 50)
+
+    assert parse_point_in_time("20260102-030405") == datetime(2026, 1, 2, 3, 4, 5)
+    assert parse_point_in_time("2026-01-02") == datetime(2026, 1, 2, 23, 59, 59)
+    assert parse_point_in_time("2026-01-02T08:00") == datetime(2026, 1, 2, 8, 0)
+    try:
+        parse_point_in_time("yesterday")
+        assert False, "应该抛出 ValueError"
+    except ValueError:
+        pass
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "backup"
+        for name in ("org/a", "org/b", "Org2/a", "other/x"):
+            (root / name / "snapshots").mkdir(parents=True)
+        (root / ".trash").mkdir()
+
+        assert match_repositories(root, "org") == ["org/a", "org/b"]
+        assert match_repositories(root, "org2/*") == ["Org2/a"]
+        assert match_repositories(root, "*/a") == ["Org2/a", "org/a"]
+
+        for name in ("20260101-000000", "20260105-000000"):
+            (root / "org/a/snapshots" / name / "objects").mkdir(parents=True)
+        archives = root / "org/b/archives"
+        archives.mkdir()
+        bundle = archives / "archive-202512.bundle"
+        bundle.write_bytes(b"bundle")
+        stamp = datetime(2025, 12, 15).timestamp()
+        os.utime(bundle, (stamp, stamp))
+
+        repos = Path(tmp) / "repos"
+        plan = {
+            i.repository: i
+            for i in plan_restore(root, repos, "org", datetime(2026, 1, 3))
+        }
+        assert plan["org/a"].kind == 'snapshot'
+        assert plan["org/a"].source.name == "20260101-000000"
+        assert plan["org/a"].dest == repos / "org" / "a.git"
+        # 没有快照时使用归档
+        assert plan["org/b"].kind == 'archive' and plan["org/b"].source == bundle
+
+        plan = plan_restore(root, repos, "org/*", datetime(2025, 1, 1))
+        assert all(i.source is None for i in plan)
+
+    print("[OK] 恢复计划正确")
+    return True
+
+
+def test_bulk_restore():
+    """测试批量恢复：快照和归档来源，只停止一次容器"""
+    print("\n" + "=" * 50)
+    print("测试 2: 批量恢复")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root = tmp / "backup"
+
+        work_a = _setup(tmp, "org/a")
+        _snapshot(tmp, "org/a", "20260101-000000")
+        commit(work_a, "c1")
+        _snapshot(tmp, "org/a", "20260102-000000")
+
+        # org/b 只有归档
+        work_b = _setup(tmp, "org/b")
+        archives = root / "org/b/archives"
+        archives.mkdir(parents=True)
+        subprocess.run(
+            ['git', '-C', str(tmp / "repos/org/b.git"), 'bundle', 'create', '-q']
+            + [str(archives / "archive-202601.bundle"), '--all'],
+            check=True,
+        )
+        stamp = datetime(2026, 1, 1, 6).timestamp()
+        os.utime(archives / "archive-202601.bundle", (stamp, stamp))
+        commit(work_b, "c1")
+        subprocess.run(
+            GIT + ['-C', str(tmp / "repos/org/b.git"), 'fetch', '-q'], check=True
+        )
+        (tmp / "repos/org/b.git/hooks/post-receive").write_text("#!/bin/sh\n")
+
+        events = []
+        engine = RestoreEngine(
+            root,
+            workers=2,
+            stop_container=lambda: events.append('stop'),
+            start_container=lambda: events.append('start'),
+        )
+        plan = plan_restore(root, tmp / "repos", "org", datetime(2026, 1, 1, 12))
+        results = {r['repository']: r for r in engine.run(plan)}
+        assert events == ['stop', 'start']
+
+        restored_a = tmp / "repos/org/a.git"
+        assert results["org/a"]['ok'] and results["org/a"]['mode'] == 'hardlink'
+        assert _log(restored_a) == "c0"
+        assert not (restored_a / ".snapshot_meta").exists()
+        assert _log(Path(results["org/a"]['previous'])) == "c1"
+
+        restored_b = tmp / "repos/org/b.git"
+        assert results["org/b"]['ok'] and results["org/b"]['mode'] == 'bundle'
+        assert _log(restored_b) == "c0"
+        # 沿用在线仓库的镜像配置和钩子
+        assert (restored_b / "hooks/post-receive").exists()
+        url = subprocess.run(
+            ['git', '-C', str(restored_b), 'config', 'remote.origin.url'],
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+        assert url == str(work_b)
+
+        assert not list((tmp / "repos/org").glob(".*restore-*"))
+        assert (root / RESTORE_LOG_FILE_NAME).exists()
+        assert [r['repository'] for r in load_latest_restore(root)] == ["org/a", "org/b"]
+
+    print("[OK] 批量恢复正确")
+    return True
+
+
+def test_failed_stage_keeps_live_repo():
+    """测试准备失败的仓库不被替换，也不停止容器"""
+    print("\n" + "=" * 50)
+    print("测试 3: 准备失败")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root = tmp / "backup"
+        _setup(tmp, "org/a")
+        archives = root / "org/a/archives"
+        archives.mkdir(parents=True)
+        (archives / "archive-202601.bundle").write_bytes(b"not a bundle")
+
+        events = []
+        engine = RestoreEngine(
+            root,
+            stop_container=lambda: events.append('stop'),
+            start_container=lambda: events.append('start'),
+        )
+        results = engine.run(plan_restore(root, tmp / "repos", "org/a", datetime.now()))
+        assert not results[0]['ok'] and results[0]['error']
+        assert events == []
+        assert _log(tmp / "repos/org/a.git") == "c0"
+        assert not list((tmp / "repos/org").glob(".*restore-*"))
+
+    print("[OK] 准备失败时保留原仓库")
+    return True
+
+
+if __name__ == '__main__':
+    success = all(
+        [test_plan(), test_bulk_restore(), test_failed_stage_keeps_live_repo()]
+    )
+    sys.exit(0 if success else 1)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+恢复演练测试脚本
+"""
+
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from src.restore_drill import (
+    DRILL_LOG_FILE_NAME,
+    RestoreDrill,
+    clone_tree,
+    load_latest_drill,
+    pick_samples,
+)
+from tests.gitutil import GIT, init
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _make_snapshot(tmp: Path, repo: str, name: str) -> Path:
+    """用 git clone --mirror 创建一个快照"""
+    work = tmp / "work" / repo
+    if not work.exists():
+        init(work)
+        for i in range(3):
+            (work / "file.txt").write_text(f"v{i}\n")
+            subprocess.run(GIT + ['-C', str(work), 'add', '.'], check=True)
+            subprocess.run(
+                GIT + ['-C', str(work), 'commit', '-q', '-m', f"c{i}"], check=True
+            )
+    snapshot = tmp / "backup" / repo / "snapshots" / name
+    snapshot.parent.mkdir(parents=True, exist_ok=True)
+    subprocess.run(GIT + ['clone', '-q', '--mirror', str(work), str(snapshot)])
+    (snapshot / ".snapshot_meta").write_text("commit_count=3\n")
+    return snapshot
+
+
+def test_clone_tree():
+    """测试复制方式与回退"""
+    print("\n" + "=" * 50)
+    print("测试 1: 复制目录树")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / "src"
+        (src / "objects").mkdir(parents=True)
+        (src / "objects" / "a").write_bytes(b"data")
+
+        assert clone_tree(src, Path(tmp) / "h", 'hardlink') == 'hardlink'
+        assert os.path.samefile(src / "objects" / "a", Path(tmp) / "h/objects/a")
+
+        assert clone_tree(src, Path(tmp) / "c", 'copy') == 'copy'
+        assert not os.path.samefile(src / "objects" / "a", Path(tmp) / "c/objects/a")
+
+        # reflink 不受支持时回退到普通复制
+        assert clone_tree(src, Path(tmp) / "r", 'reflink') in ('reflink', 'copy')
+        assert (Path(tmp) / "r/objects/a").read_bytes() == b"data"
+
+    print("[OK] 复制目录树正确")
+    return True
+
+
+def test_restore_drill():
+    """测试演练成功、损坏快照失败以及结果记录"""
+    print("\n" + "=" * 50)
+    print("测试 2: 恢复演练")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        good = _make_snapshot(tmp, "org/good", "20260101-000000")
+        _make_snapshot(tmp, "org/good", "20260102-000000")
+        bad = _make_snapshot(tmp, "org/bad", "20260101-000000")
+        shutil.rmtree(bad / "objects")
+        (bad / "objects").mkdir()
+        root = tmp / "backup"
+
+        samples = pick_samples(root, 10, random.Random(1))
+        assert sorted(name for name, _ in samples) == ["org/bad", "org/good"]
+        assert len(pick_samples(root, 1)) == 1
+
+        drill = RestoreDrill(root, workers=2)
+        results = drill.run([("org/good", good), ("org/bad", bad)])
+        by_repo = {r['repository']: r for r in results}
+
+        assert by_repo['org/good']['ok']
+        assert by_repo['org/good']['mode'] == 'hardlink'
+        assert by_repo['org/good']['size_bytes'] > 0
+        assert by_repo['org/good']['total_seconds'] > 0
+        assert not by_repo['org/bad']['ok'] and by_repo['org/bad']['error']
+
+        # 临时目录已清理，快照本身不受影响
+        assert not (root / ".restore_drill").exists()
+        assert (good / ".snapshot_meta").exists()
+
+        assert (root / DRILL_LOG_FILE_NAME).exists()
+        drill.run([("org/good", good)])
+        latest = load_latest_drill(root)
+        assert len(latest) == 1 and latest[0]['ok']
+
+    print("[OK] 恢复演练正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all([test_clone_tree(), test_restore_drill()])
+    sys.exit(0 if success else 1)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GFS 保留策略测试脚本
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from src.retention import RetentionPolicy, format_plan, plan_backup_root
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _daily_snapshots(now: datetime, days: int):
+    """每天 02:00 一个快照"""
+    snapshots = []
+    for i in range(days):
+        when = (now - timedelta(days=i)).replace(hour=2, minute=0, second=0)
+        snapshots.append((when.strftime('%Y%m%d-%H%M%S'), when, False))
+    return snapshots
+
+
+def test_gfs_buckets():
+    """测试日/周/月分桶"""
+    print("\n" + "=" * 50)
+    print("测试 1: GFS 分桶")
+    print("=" * 50)
+
+    now = datetime(2026, 6, 30, 12, 0, 0)
+    snapshots = _daily_snapshots(now, 400)
+    policy = RetentionPolicy(keep_daily=7, keep_weekly=4, keep_monthly=12)
+    plan = policy.plan(snapshots, now)
+
+    # 7 天 + 若干周 + 12 个月，远少于 400 个
+    assert 12 <= len(plan['keep']) <= 7 + 4 + 12
+    assert len(plan['keep']) + len(plan['delete']) == 400
+
+    # 最近 7 天全部保留
+    for name, _, _ in snapshots[:7]:
+        assert 'daily' in plan['keep'][name]
+    assert 'latest' in plan['keep'][snapshots[0][0]]
+
+    # 每个月保留的是该月最新的快照（月末）
+    monthly = [n for n, reasons in plan['keep'].items() if 'monthly' in reasons]
+    assert len(monthly) == 12
+    assert '20260531-020000' in monthly
+
+    print("[OK] 分桶测试通过")
+    return True
+
+
+def test_protected_and_within():
+    """测试受保护快照与 keep_within_days"""
+    print("\n" + "=" * 50)
+    print("测试 2: 受保护快照")
+    print("=" * 50)
+
+    now = datetime(2026, 6, 30, 12, 0, 0)
+    snapshots = _daily_snapshots(now, 60)
+    old_name, old_time, _ = snapshots[50]
+    snapshots[50] = (old_name, old_time, True)
+
+    policy = RetentionPolicy(
+        keep_daily=1, keep_weekly=0, keep_monthly=0, keep_within_days=10
+    )
+    plan = policy.plan(snapshots, now)
+
+    assert 'protected' in plan['keep'][old_name]
+    assert len([n for n, r in plan['keep'].items() if 'within' in r]) == 10
+    assert len(plan['keep']) == 11
+
+    print("[OK] 受保护快照保留")
+    return True
+
+
+def test_plan_backup_root():
+    """测试一次遍历所有仓库并输出计划"""
+    print("\n" + "=" * 50)
+    print("测试 3: 全量保留计划")
+    print("=" * 50)
+
+    now = datetime(2026, 6, 30, 12, 0, 0)
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        for repo in ("org/a", "org/b"):
+            for name, _, _ in _daily_snapshots(now, 20):
+                (root / repo / "snapshots" / name).mkdir(parents=True)
+        (root / ".trash" / "x").mkdir(parents=True)
+        # 冷层转换中断留下的目录不是快照，不占用保留名额也不会被删除
+        for leftover in (".20260611-020000.hot", ".20260611-020000.cold"):
+            (root / "org/a" / "snapshots" / leftover).mkdir()
+
+        policy = RetentionPolicy(keep_daily=3, keep_weekly=0, keep_monthly=0)
+        plans = plan_backup_root(root, policy, now)
+
+        assert [p['repository'] for p in plans] == ["org/a", "org/b"]
+        assert all(len(p['keep']) == 3 and len(p['delete']) == 17 for p in plans)
+        assert not any(n.startswith('.') for p in plans for n in p['delete'])
+
+        text = format_plan(plans)
+        assert "保留 6 个快照，删除 34 个快照" in text
+        assert "delete  20260611-020000" in text
+
+    print("[OK] 全量保留计划通过")
+    return True
+
+
+if __name__ == '__main__':
+    success = all(
+        [test_gfs_buckets(), test_protected_and_within(), test_plan_backup_root()]
+    )
+    sys.exit(0 if success else 1)
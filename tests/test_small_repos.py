@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+小仓库打包测试脚本
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from src.archive import host_bundle_command
+from src.ref_index import RefIndex
+from src.refs import read_ref_map
+from src.restore import RestoreEngine, find_source, plan_restore
+from src.small_repos import (
+    INDEX_FILE_NAME,
+    PACK_DIR_NAME,
+    SmallRepoPack,
+    open_pack,
+    owner_packs,
+)
+from tests.gitutil import commit, init, rev
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _add(pack: SmallRepoPack, repo: str, name: str, work: Path):
+    """与 PackedRepositoryBackup 一样把仓库当前状态追加到打包文件"""
+    (pack.owner_dir / repo.split('/')[1]).mkdir(parents=True, exist_ok=True)
+    git_dir = work / ".git"
+    return pack.add(
+        repo, name, host_bundle_command(git_dir), read_ref_map(git_dir), commit_count=1
+    )
+
+
+def test_add_and_restore():
+    """测试追加快照、相同引用复用数据、空仓库，以及从打包文件恢复"""
+    print("\n" + "=" * 50)
+    print("测试 1: 追加快照并恢复")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root = tmp / "backup"
+        work = init(tmp / "work")
+        empty = init(tmp / "empty")
+        c0 = commit(work, "c0")
+
+        pack = SmallRepoPack(root / "org")
+        first = _add(pack, "org/demo", "20260101-000000", work)
+        assert first.size > 0 and first.refs == {'refs/heads/main': c0}
+        same = _add(pack, "org/demo", "20260102-000000", work)
+        assert (same.pack, same.offset, same.size) == (
+            first.pack,
+            first.offset,
+            first.size,
+        )
+        assert pack.usage() == (first.size, first.size)
+        assert _add(pack, "org/empty", "20260101-000000", empty).size == 0
+
+        c1 = commit(work, "c1")
+        latest = _add(pack, "org/demo", "20260110-000000", work)
+        assert latest.offset == first.size and latest.refs['refs/heads/main'] == c1
+
+        # 新实例重放索引得到相同的状态
+        reloaded = SmallRepoPack(root / "org")
+        assert reloaded.snapshots("org/demo") == pack.snapshots("org/demo")
+        assert reloaded.repositories() == ["org/demo", "org/empty"]
+        bundle = b"".join(reloaded.iter_bundle(latest))
+        assert bundle.startswith(b"# v2 git bundle")
+
+        # 恢复到指定时间点：取打包文件中之前最近的快照
+        repos = tmp / "repos"
+        live = repos / "org" / "demo.git"
+        subprocess.run(['git', 'init', '-q', '--bare', str(live)], check=True)
+        plan = plan_restore(root, repos, "org/demo", datetime(2026, 1, 5))
+        assert plan[0].kind == 'packed' and plan[0].source == pack.path
+        result = RestoreEngine(root).run(plan)[0]
+        assert result['ok'] and result['mode'] == 'packed'
+        assert rev(live, 'refs/heads/main') == c0
+        assert not list((live.parent).glob('*.bundle'))
+
+    print("[OK] 追加快照并恢复正确")
+    return True
+
+
+def test_remove_and_compact():
+    """测试删除记录、失效数据过多时整理打包文件，以及索引重写"""
+    print("\n" + "=" * 50)
+    print("测试 2: 删除和整理")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root = tmp / "backup"
+        work = init(tmp / "work")
+        pack = SmallRepoPack(root / "org")
+
+        names = []
+        for day in range(1, 6):
+            commit(work, f"c{day}")
+            names.append(f"2026010{day}-000000")
+            _add(pack, "org/demo", names[-1], work)
+        latest = pack.find("org/demo", names[-1])
+        bundle = b"".join(pack.iter_bundle(latest))
+        pack.protect("org/demo", names[0], ['monthly'])
+        assert pack.find("org/demo", names[0]).protected == ['monthly']
+
+        # 删除一个：失效数据少于有效数据，只追加删除记录
+        assert pack.remove("org/demo", [names[1], "missing"]) == 1
+        live, total = pack.usage()
+        assert total > live and len(list(pack.path.glob('*.dat'))) == 1
+
+        # 再删除两个：失效数据超过有效数据，复制到新的打包文件
+        assert pack.remove("org/demo", names[2:4]) == 2
+        assert [p.name for p in pack.path.glob('*.dat')] == ["pack-000002.dat"]
+        assert pack.usage()[0] == pack.usage()[1]
+        assert [s.name for s in pack.snapshots("org/demo")] == [names[0], names[4]]
+        assert pack.find("org/demo", names[0]).protected == ['monthly']
+        assert b"".join(pack.iter_bundle(pack.find("org/demo", names[4]))) == bundle
+        lines = (pack.path / INDEX_FILE_NAME).read_text().splitlines()
+        assert len(lines) == 2
+
+        # 数据损坏时读出失败
+        data = pack.path / "pack-000002.dat"
+        raw = bytearray(data.read_bytes())
+        raw[-1] ^= 0xFF
+        data.write_bytes(bytes(raw))
+        try:
+            b"".join(pack.iter_bundle(pack.find("org/demo", names[4])))
+            assert False, "应该抛出 ValueError"
+        except ValueError:
+            pass
+
+        # 追加中断留下半行：下次追加前截掉，新记录不会接在半行后面而丢失
+        with open(pack.path / INDEX_FILE_NAME, 'a', encoding='utf-8') as f:
+            f.write('{"op": "add", "repo')
+        commit(work, "c6")
+        _add(pack, "org/demo", "20260106-000000", work)
+        reloaded = SmallRepoPack(root / "org")
+        assert reloaded.find("org/demo", "20260106-000000") is not None
+        assert len((pack.path / INDEX_FILE_NAME).read_text().splitlines()) == 3
+
+    print("[OK] 删除和整理正确")
+    return True
+
+
+def test_index_and_source_selection():
+    """测试引用索引同步和恢复来源选择同时识别打包的快照"""
+    print("\n" + "=" * 50)
+    print("测试 3: 索引和恢复选择")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root = tmp / "backup"
+        work = init(tmp / "work")
+        c0 = commit(work, "c0")
+        pack = open_pack(root / "org")
+        _add(pack, "org/demo", "20260101-000000", work)
+        commit(work, "c1")
+        _add(pack, "org/demo", "20260110-000000", work)
+
+        assert open_pack(root / "org") is pack
+        assert owner_packs(root) == [pack]
+        assert (root / "org" / PACK_DIR_NAME / INDEX_FILE_NAME).exists()
+
+        index = RefIndex(root)
+        assert index.sync()['added'] == 2
+        hits = index.find(c0)
+        assert [h['snapshot'] for h in hits] == ["20260101-000000"]
+
+        kind, source, taken = find_source(root / "org/demo", datetime(2026, 1, 5))
+        assert (kind, source) == ('packed', pack.path)
+        assert taken == datetime(2026, 1, 1)
+        assert find_source(root / "org/demo", datetime(2025, 12, 1))[0] == ''
+
+    print("[OK] 索引和恢复选择正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all(
+        [
+            test_add_and_restore(),
+            test_remove_and_compact(),
+            test_index_and_source_selection(),
+        ]
+    )
+    sys.exit(0 if success else 1)
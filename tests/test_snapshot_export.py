@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+快照导出测试脚本
+"""
+
+import io
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+from pathlib import Path
+
+from src.snapshot_export import TarLayout, iter_bundle, parse_range
+from tests.gitutil import GIT, init
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _make_snapshot(tmp: Path) -> Path:
+    """创建一个带备份元数据的快照（裸仓库）"""
+    work = tmp / "work"
+    init(work)
+    for i in range(3):
+        (work / "data.bin").write_bytes(os.urandom(3000 + i))
+        subprocess.run(GIT + ['-C', str(work), 'add', '.'], check=True)
+        subprocess.run(
+            GIT + ['-C', str(work), 'commit', '-q', '-m', f"c{i}"], check=True
+        )
+    snapshot = tmp / "snapshots" / "20260101-000000"
+    snapshot.parent.mkdir(parents=True)
+    subprocess.run(
+        GIT + ['clone', '-q', '--bare', str(work), str(snapshot)], check=True
+    )
+    (snapshot / ".snapshot_meta").write_text("commit_count=3\n")
+    return snapshot
+
+
+def test_tar_layout():
+    """测试 tar 包内容与快照一致，且不包含备份元数据"""
+    print("\n" + "=" * 50)
+    print("测试 1: tar 导出")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        snapshot = _make_snapshot(tmp)
+        layout = TarLayout(snapshot, "repo.git")
+
+        data = b''.join(layout.iter_bytes())
+        assert len(data) == layout.size and layout.size % tarfile.RECORDSIZE == 0
+
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            names = tar.getnames()
+            tar.extractall(tmp / "out")
+        assert "repo.git/HEAD" in names
+        assert "repo.git/.snapshot_meta" not in names
+
+        restored = tmp / "out" / "repo.git"
+        fsck = subprocess.run(
+            ['git', '-C', str(restored), 'fsck', '--no-progress'], capture_output=True
+        )
+        assert fsck.returncode == 0
+        for path in snapshot.rglob('*'):
+            rel = path.relative_to(snapshot)
+            if path.is_file() and str(rel) != ".snapshot_meta":
+                assert (restored / rel).read_bytes() == path.read_bytes()
+
+    print("[OK] tar 导出正确")
+    return True
+
+
+def test_range_and_resume():
+    """测试按区间输出、sendfile 写文件和断点续传"""
+    print("\n" + "=" * 50)
+    print("测试 2: 区间输出和续传")
+    print("=" * 50)
+
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-9", 100) == (0, 10)
+    assert parse_range("bytes=90-", 100) == (90, 100)
+    assert parse_range("bytes=-5", 100) == (95, 100)
+    assert parse_range("bytes=50-500", 100) == (50, 100)
+    for bad in ("bytes=100-", "bytes=0-1,5-6", "items=0-1", "bytes=a-b"):
+        try:
+            parse_range(bad, 100)
+            assert False, "应该抛出 ValueError"
+        except ValueError:
+            pass
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        layout = TarLayout(_make_snapshot(tmp))
+        full = b''.join(layout.iter_bytes())
+
+        # 任意区间（跨越头部、文件数据和填充）与整体切片一致
+        for start, end in ((0, 1), (500, 5000), (511, 513), (layout.size - 7, None)):
+            part = b''.join(layout.iter_bytes(start, end))
+            assert part == full[start:end]
+
+        # 写入真实文件（走 sendfile），中途截断后续传
+        out = tmp / "export.tar"
+        with open(out, 'wb') as f:
+            assert layout.write_to(f) == layout.size
+        assert out.read_bytes() == full
+
+        with open(out, 'r+b') as f:
+            f.truncate(layout.size // 2 + 3)
+            f.seek(0, io.SEEK_END)
+            layout.write_to(f, f.tell())
+        assert out.read_bytes() == full
+
+        # 没有文件描述符的输出
+        buffer = io.BytesIO()
+        layout.write_to(buffer, 100)
+        assert buffer.getvalue() == full[100:]
+
+    print("[OK] 区间输出和续传正确")
+    return True
+
+
+def test_bundle():
+    """测试直接从快照生成 bundle"""
+    print("\n" + "=" * 50)
+    print("测试 3: bundle 导出")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        snapshot = _make_snapshot(tmp)
+        bundle = tmp / "repo.bundle"
+        bundle.write_bytes(b''.join(iter_bundle(snapshot, chunk_size=512)))
+
+        clone = tmp / "clone"
+        subprocess.run(
+            ['git', 'clone', '-q', str(bundle), str(clone)], check=True
+        )
+        log = subprocess.run(
+            ['git', '-C', str(clone), 'log', '--format=%s'],
+            capture_output=True,
+            text=True,
+        ).stdout.split()
+        assert log == ["c2", "c1", "c0"]
+
+        empty = tmp / "empty.git"
+        subprocess.run(['git', 'init', '-q', '--bare', str(empty)], check=True)
+        try:
+            b''.join(iter_bundle(empty))
+            assert False, "应该抛出 RuntimeError"
+        except RuntimeError:
+            pass
+
+        # 提前结束读取时不残留 git 进程
+        stream = iter_bundle(snapshot, chunk_size=16)
+        next(stream)
+        stream.close()
+
+    print("[OK] bundle 导出正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all([test_tar_layout(), test_range_and_resume(), test_bundle()])
+    sys.exit(0 if success else 1)
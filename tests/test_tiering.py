@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+快照冷层测试脚本
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from src.integrity import Verifier
+from src.ref_index import RefIndex
+from src.refs import cached_ref_map
+from src.restore import RestoreEngine, find_source, plan_restore
+from src.snapshot_export import iter_bundle
+from src.tiering import (
+    COLD_BUNDLE_NAME,
+    ColdTier,
+    cold_bundle_path,
+    is_snapshot,
+    read_snapshot_meta,
+    snapshot_tier,
+)
+from tests.gitutil import GIT, commit, init, rev
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+NOW = datetime(2026, 3, 1)
+
+
+def _snapshot(work: Path, root: Path, repo: str, name: str) -> Path:
+    """把工作仓库克隆为快照（带元数据和引用表缓存）"""
+    snapshot = root / repo / "snapshots" / name
+    snapshot.parent.mkdir(parents=True, exist_ok=True)
+    subprocess.run(
+        GIT + ['clone', '-q', '--mirror', str(work), str(snapshot)], check=True
+    )
+    (snapshot / ".snapshot_meta").write_text(f"timestamp={name}\nrepo={repo}\n")
+    cached_ref_map(snapshot)
+    return snapshot
+
+
+def _setup(tmp: Path):
+    root = tmp / "backup"
+    work = tmp / "work"
+    init(work)
+    c0 = commit(work, "c0")
+    subprocess.run(GIT + ['-C', str(work), 'tag', 'v1'], check=True)
+    old = _snapshot(work, root, "org/demo", "20260101-000000")
+    c1 = commit(work, "c1")
+    middle = _snapshot(work, root, "org/demo", "20260110-000000")
+    latest = _snapshot(work, root, "org/demo", "20260228-000000")
+    return root, work, (c0, c1), (old, middle, latest)
+
+
+def test_compact_and_restore():
+    """测试转入冷层：存根、bundle 校验，恢复和导出对冷快照透明"""
+    print("\n" + "=" * 50)
+    print("测试 1: 转入冷层并恢复")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root, _, (c0, c1), (old, middle, latest) = _setup(tmp)
+        refs = cached_ref_map(middle)
+
+        tier = ColdTier(root, cold_after_days=30, max_per_run=1)
+        assert [s for _, s in tier.candidates(NOW)] == [old, middle]
+        stats = tier.run(NOW)
+        assert stats['compacted'] == 1 and stats['failed'] == 0
+        assert snapshot_tier(old) == 'cold' and snapshot_tier(middle) == 'hot'
+        assert tier.run(NOW)['compacted'] == 1
+        # 最新的快照总是保留为目录树
+        assert tier.candidates(NOW) == [] and snapshot_tier(latest) == 'hot'
+
+        meta = read_snapshot_meta(middle)
+        assert meta['tier'] == 'cold' and meta['repo'] == "org/demo"
+        assert meta['cold_bundle'] == COLD_BUNDLE_NAME
+        assert int(meta['cold_size']) == (middle / COLD_BUNDLE_NAME).stat().st_size
+        assert not (middle / "objects").exists() and is_snapshot(middle)
+        assert cached_ref_map(middle) == refs
+        assert not list(middle.parent.glob('.*'))
+
+        # 导出 bundle 直接输出冷层文件
+        exported = b"".join(iter_bundle(middle))
+        assert exported == cold_bundle_path(middle).read_bytes()
+
+        # 恢复冷快照时从 bundle 取回对象
+        repos = tmp / "repos"
+        live = repos / "org" / "demo.git"
+        subprocess.run(['git', 'init', '-q', '--bare', str(live)], check=True)
+        plan = plan_restore(root, repos, "org/demo", datetime(2026, 1, 15))
+        assert plan[0].source == middle
+        result = RestoreEngine(root).run(plan)[0]
+        assert result['ok'] and result['mode'] == 'cold-bundle'
+        assert rev(live, 'refs/heads/main') == c1
+        assert rev(live, 'refs/tags/v1') == c0
+
+    print("[OK] 转入冷层并恢复正确")
+    return True
+
+
+def test_cold_root_and_leftovers():
+    """测试独立的冷存储目录、孤立 bundle 清理和中断后的残留处理"""
+    print("\n" + "=" * 50)
+    print("测试 2: 冷存储目录和残留")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root, _, _, (old, middle, _) = _setup(tmp)
+        cold_root = tmp / "cold"
+
+        # 原目录树已换下但存根未就位：恢复原快照
+        hot = old.with_name(f".{old.name}.hot")
+        os.rename(old, hot)
+        (middle.with_name(f".{middle.name}.cold")).mkdir()
+
+        tier = ColdTier(root, cold_after_days=30, cold_root=cold_root)
+        stats = tier.run(NOW)
+        assert stats['compacted'] == 2 and not hot.exists()
+        assert not list(middle.parent.glob('.*'))
+        bundle = cold_bundle_path(old)
+        assert bundle == cold_root / "org/demo" / f"{old.name}.bundle"
+        assert bundle.exists() and not (old / COLD_BUNDLE_NAME).exists()
+
+        # 冷存储中的 bundle 仍然参与完整性校验
+        verifier = Verifier(root, workers=1)
+        expected = {item.expected[0][0] for item in verifier.collect()}
+        assert {str(bundle), str(cold_bundle_path(middle))} <= expected
+        assert verifier.run(full=True)['mismatches'] == []
+        with open(bundle, 'r+b') as f:
+            f.seek(-1, 2)
+            last = f.read(1)
+            f.seek(-1, 2)
+            f.write(bytes([last[0] ^ 0xFF]))
+        mismatches = verifier.run(full=True)['mismatches']
+        assert [m['path'] for m in mismatches] == [str(bundle)]
+        # bundle 在备份根目录之外，所属仓库随校验结果给出
+        assert mismatches[0]['repository'] == "org/demo"
+
+        # 快照被删除后，冷存储中的 bundle 随之清理
+        subprocess.run(['rm', '-rf', str(old)], check=True)
+        assert tier.run(NOW)['orphans'] == 1
+        assert not bundle.exists()
+        assert cold_bundle_path(middle).exists()
+
+        # 生成的 bundle 与快照引用不一致时，快照保持不变
+        try:
+            ColdTier._check_bundle(cold_bundle_path(middle), {'refs/heads/x': '0'})
+            assert False, "应该抛出 RuntimeError"
+        except RuntimeError:
+            pass
+
+    print("[OK] 冷存储目录和残留处理正确")
+    return True
+
+
+def test_index_and_source_selection():
+    """测试引用索引和恢复来源选择同时识别冷快照"""
+    print("\n" + "=" * 50)
+    print("测试 3: 索引和恢复选择")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root, _, (c0, _), (old, _, _) = _setup(tmp)
+        ColdTier(root, cold_after_days=30).run(NOW)
+        assert snapshot_tier(old) == 'cold'
+
+        index = RefIndex(root)
+        assert index.sync()['added'] == 3
+        snapshots = {h['snapshot'] for h in index.find(c0)}
+        assert old.name in snapshots
+
+        kind, source, taken = find_source(root / "org/demo", datetime(2026, 1, 5))
+        assert (kind, source) == ('snapshot', old)
+        assert taken == datetime(2026, 1, 1)
+
+    print("[OK] 索引和恢复选择正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all(
+        [
+            test_compact_and_restore(),
+            test_cold_root_and_leftovers(),
+            test_index_and_source_selection(),
+        ]
+    )
+    sys.exit(0 if success else 1)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跟踪历史与引用读取测试脚本
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from src.refs import read_ref_map, ref_fingerprint
+from src.tracking import (
+    HEADER,
+    RECORD,
+    TrackingHistory,
+    TrackingRecord,
+    load_latest_state,
+)
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_tracking_history():
+    """测试追加、读取与时间窗口查询"""
+    print("\n" + "=" * 50)
+    print("测试 1: 跟踪历史")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history = TrackingHistory(Path(tmp))
+        assert len(history) == 0
+        assert history.latest() is None
+
+        for day in range(10):
+            history.append(
+                TrackingRecord(1000 + day * 86400, 100 + day, 2048, 3, b"\x01" * 20)
+            )
+
+        assert len(history) == 10
+        assert history.path.stat().st_size == HEADER.size + 10 * RECORD.size
+        assert history.latest().commits == 109
+
+        records = history.read_all()
+        assert [r.commits for r in records] == list(range(100, 110))
+
+        window = history.window(since=1000 + 3 * 86400, until=1000 + 5 * 86400)
+        assert [r.commits for r in window] == [103, 104, 105]
+        assert history.window(since=10 ** 10) == []
+
+        # 写入中断留下的不完整记录：读取时忽略，下次追加前截掉
+        with open(history.path, 'ab') as f:
+            f.write(b"\xff" * 5)
+        assert len(history) == 10 and history.latest().commits == 109
+        history.append(TrackingRecord(1000 + 10 * 86400, 110, 2048, 3, b""))
+        assert history.path.stat().st_size == HEADER.size + 11 * RECORD.size
+        assert history.latest().timestamp == 1000 + 10 * 86400
+        assert [r.commits for r in history.read_all()][-2:] == [109, 110]
+
+    # 文件头不完整时重新写入文件头
+    with tempfile.TemporaryDirectory() as tmp:
+        history = TrackingHistory(Path(tmp))
+        history.path.write_bytes(b"GMB")
+        history.append(TrackingRecord(1000, 1, 1, 1, b""))
+        assert len(history) == 1 and history.latest().commits == 1
+
+    print("[OK] 跟踪历史测试通过")
+    return True
+
+
+def test_legacy_tracking_files():
+    """测试兼容旧版 .commit_tracking/.size_tracking"""
+    print("\n" + "=" * 50)
+    print("测试 2: 兼容旧版跟踪文件")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo_dir = Path(tmp)
+        assert load_latest_state(repo_dir) is None
+
+        (repo_dir / ".commit_tracking").write_text("42")
+        (repo_dir / ".size_tracking").write_text("1024")
+        state = load_latest_state(repo_dir)
+        assert state.commits == 42 and state.size_kb == 1024
+
+        # 新历史文件优先
+        TrackingHistory(repo_dir).append(TrackingRecord(1, 50, 2048, 1, b""))
+        assert load_latest_state(repo_dir).commits == 50
+
+    print("[OK] 旧版跟踪文件兼容")
+    return True
+
+
+def test_read_ref_map():
+    """测试直接解析 packed-refs 和松散引用"""
+    print("\n" + "=" * 50)
+    print("测试 3: 读取引用表")
+    print("=" * 50)
+
+    git = ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(tmp) / "work"
+        bare = Path(tmp) / "repo.git"
+        subprocess.run(git + ['init', '-q', '-b', 'main', str(work)], check=True)
+        subprocess.run(
+            git + ['-C', str(work), 'commit', '-q', '--allow-empty', '-m', 'init'],
+            check=True,
+        )
+        subprocess.run(git + ['-C', str(work), 'tag', '-a', 'v1', '-m', 'v1'])
+        subprocess.run(git + ['clone', '-q', '--mirror', str(work), str(bare)])
+        subprocess.run(git + ['-C', str(bare), 'pack-refs', '--all'], check=True)
+        subprocess.run(git + ['-C', str(bare), 'branch', 'loose', 'main'], check=True)
+
+        expected = {}
+        fmt = '--format=%(refname) %(objectname)'
+        output = subprocess.run(
+            ['git', '-C', str(bare), 'for-each-ref', fmt],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        for line in output.splitlines():
+            name, oid = line.split()
+            expected[name] = oid
+
+        refs = read_ref_map(bare)
+        assert refs == expected
+        assert 'refs/heads/loose' in refs and 'refs/tags/v1' in refs
+
+        fingerprint = ref_fingerprint(refs)
+        assert len(fingerprint) == 20
+        assert fingerprint == ref_fingerprint(dict(reversed(list(refs.items()))))
+        assert fingerprint != ref_fingerprint({})
+
+    print("[OK] 引用表读取正确")
+    return True
+
+
+if __name__ == '__main__':
+    success = all(
+        [test_tracking_history(), test_legacy_tracking_files(), test_read_ref_map()]
+    )
+    sys.exit(0 if success else 1)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+回收站测试脚本
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from src.trash import TrashQueue
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _make_snapshot(path: Path, files: int = 5):
+    """创建一个模拟快照目录"""
+    (path / "objects" / "pack").mkdir(parents=True)
+    (path / "refs" / "heads").mkdir(parents=True)
+    for i in range(files):
+        (path / "objects" / "pack" / f"pack-{i}.pack").write_bytes(b"x" * 4096)
+    (path / "HEAD").write_text("ref: refs/heads/main\n")
+
+
+def test_move_and_purge():
+    """测试移入回收站与后台删除"""
+    print("\n" + "=" * 50)
+    print("测试 1: 移入回收站与后台删除")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = Path(tmp) / "org" / "repo" / "snapshots" / "20260101-000000"
+        _make_snapshot(snapshot)
+
+        trash = TrashQueue(tmp, max_workers=2)
+        entry = trash.move(snapshot, "org-repo")
+
+        assert not snapshot.exists()
+        assert entry.parent == Path(tmp) / ".trash"
+        assert "org-repo-20260101-000000" in entry.name
+
+        entries, size_kb = trash.usage()
+        assert entries == 1 and size_kb > 0
+
+        trash.start()
+        assert trash.wait(10)
+        trash.shutdown()
+
+        assert trash.entries() == []
+        assert trash.purged_count == 1
+
+    print("[OK] 回收站删除成功")
+    return True
+
+
+def test_resume_after_restart():
+    """测试上次运行遗留的条目会在启动时继续删除"""
+    print("\n" + "=" * 50)
+    print("测试 2: 重启后继续删除")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ("a", "b"):
+            _make_snapshot(Path(tmp) / ".trash" / name)
+
+        trash = TrashQueue(tmp)
+        assert len(trash.entries()) == 2
+
+        trash.start()
+        assert trash.wait(10)
+        trash.shutdown()
+        assert trash.entries() == []
+
+    print("[OK] 遗留条目已删除")
+    return True
+
+
+def test_unlink_budget():
+    """测试 unlink 限速与中止"""
+    print("\n" + "=" * 50)
+    print("测试 3: 删除限速")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 5 个文件 + 1 个文件 + 4 个目录 + 条目本身 = 11 次操作
+        _make_snapshot(Path(tmp) / ".trash" / "slow")
+
+        trash = TrashQueue(tmp, max_workers=1, max_unlinks_per_second=20)
+        started = time.monotonic()
+        trash.start()
+        assert trash.wait(10)
+        trash.shutdown()
+        assert time.monotonic() - started >= 0.45
+
+        # 预算很低时中止，剩余内容留在回收站
+        _make_snapshot(Path(tmp) / ".trash" / "stopped")
+        trash = TrashQueue(tmp, max_workers=1, max_unlinks_per_second=2)
+        trash.start()
+        assert not trash.wait(0.2)
+        trash.shutdown()
+        assert len(trash.entries()) == 1
+
+    print("[OK] 限速测试通过")
+    return True
+
+
+if __name__ == '__main__':
+    success = all(
+        [test_move_and_purge(), test_resume_after_restart(), test_unlink_budget()]
+    )
+    sys.exit(0 if success else 1)
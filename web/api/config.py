@@ -87,6 +87,21 @@ class Settings(BaseSettings):
         # 3. 使用默认值
         return "/shared/backup"
 
+    @property
+    def GITEA_REPOS_ROOT(self) -> str:
+        """
+        Gitea 仓库目录（数据卷 + 仓库路径），用于生成恢复计划
+        优先级：环境变量 > config.yaml > 默认值
+        """
+        data_volume = os.environ.get('GITEA_DATA_VOLUME')
+        repos_path = os.environ.get('GITEA_REPOS_PATH')
+        if self._config_loader:
+            data_volume = data_volume or self._config_loader.get('gitea.data_volume')
+            repos_path = repos_path or self._config_loader.get('gitea.repos_path')
+        return str(
+            Path(data_volume or '/opt/gitea/gitea') / (repos_path or 'git/repositories')
+        )
+
     @property
     def BACKUP_BASE_PATH(self) -> str:
         """兼容旧代码：BACKUP_BASE_PATH 指向 BACKUP_ROOT"""
@@ -7,6 +7,7 @@ from .dashboard import router as dashboard_router
 from .repositories import router as repositories_router
 from .snapshots import router as snapshots_router
 from .reports import router as reports_router
+from .restore import router as restore_router
 from .system import router as system_router
 
 __all__ = [
@@ -15,5 +16,6 @@ __all__ = [
     "repositories_router",
     "snapshots_router",
     "reports_router",
+    "restore_router",
     "system_router",
 ]
@@ -4,8 +4,16 @@
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List, Optional
-
-from ..schemas import RepositoryInfo, RepositoryDetail, MessageResponse
+from datetime import datetime, timedelta
+
+from ..schemas import (
+    RepositoryInfo,
+    RepositoryDetail,
+    RepositoryHistoryPoint,
+    ArchiveInfo,
+    RefDiff,
+    MessageResponse,
+)
 from ...utils.auth import get_current_user
 from ..models import User
 from ..config import settings
@@ -41,6 +49,81 @@ async def list_repositories(
     return repositories
 
 
+@router.get(
+    "/{full_name:path}/history",
+    response_model=List[RepositoryHistoryPoint],
+    summary="获取仓库跟踪历史",
+)
+async def get_repository_history(
+    full_name: str,
+    days: int = 30,
+    current_user: User = Depends(get_current_user),
+    backup_service: BackupService = Depends(get_backup_service),
+):
+    """
+    获取仓库最近 N 天的提交数、大小和引用变化历史
+
+    - **full_name**: 仓库全名（格式：owner/repo）
+    - **days**: 天数（默认 30，0 表示全部）
+    """
+    since = datetime.now() - timedelta(days=days) if days > 0 else None
+    return backup_service.get_repository_history(full_name, since=since)
+
+
+@router.get(
+    "/{full_name:path}/archives",
+    response_model=List[ArchiveInfo],
+    summary="获取仓库归档列表",
+)
+async def get_repository_archives(
+    full_name: str,
+    include_refs: bool = False,
+    current_user: User = Depends(get_current_user),
+    backup_service: BackupService = Depends(get_backup_service),
+):
+    """
+    获取仓库的月度归档（从归档目录读取，不打开归档文件）：时间点、来源快照、
+    大小与压缩比、校验值、完整/增量及基准归档、引用的最新提交
+
+    - **full_name**: 仓库全名（格式：owner/repo）
+    - **include_refs**: 是否返回完整引用表（默认 False）
+    """
+    archives = backup_service.get_archives(full_name, include_refs=include_refs)
+    if archives is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"仓库 {full_name} 不存在"
+        )
+    return archives
+
+
+@router.get(
+    "/{full_name:path}/ref-diff", response_model=RefDiff, summary="对比快照引用"
+)
+async def get_repository_ref_diff(
+    full_name: str,
+    base: Optional[str] = None,
+    target: str = "live",
+    current_user: User = Depends(get_current_user),
+    backup_service: BackupService = Depends(get_backup_service),
+):
+    """
+    对比两个快照（或快照与在线仓库）的引用：新建、删除、快进、改写的引用，
+    以及每个被删除/改写的引用丢失的提交数
+
+    - **full_name**: 仓库全名（格式：owner/repo）
+    - **base**: 基准快照 ID（默认为 target 之前的最近快照）
+    - **target**: 目标快照 ID，或 live 表示在线仓库（默认 live）
+    """
+    result = backup_service.get_ref_diff(
+        full_name, base, target, settings.GITEA_REPOS_ROOT
+    )
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="快照或仓库不存在"
+        )
+    return result
+
+
 @router.get("/{full_name:path}", response_model=RepositoryDetail, summary="获取仓库详情")
 async def get_repository(
     full_name: str,
@@ -0,0 +1,57 @@
+"""
+批量恢复路由
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List
+
+from ..schemas import RestorePlanItem, RestoreResult
+from ...utils.auth import get_current_user
+from ..models import User
+from ..config import settings
+from ...services.backup_service import BackupService
+
+router = APIRouter(prefix="/restore", tags=["批量恢复"])
+
+
+def get_backup_service() -> BackupService:
+    """获取备份服务实例"""
+    return BackupService(
+        backup_base_path=settings.BACKUP_BASE_PATH,
+        config_path=settings.BACKUP_CONFIG_PATH,
+    )
+
+
+@router.get("/plan", response_model=List[RestorePlanItem], summary="生成恢复计划")
+async def get_restore_plan(
+    pattern: str,
+    at: str = "now",
+    current_user: User = Depends(get_current_user),
+    backup_service: BackupService = Depends(get_backup_service),
+):
+    """
+    为匹配的仓库选择时间点之前最近的快照或归档（不执行恢复）
+
+    Web 服务以只读方式挂载备份数据，执行恢复请在宿主机上运行：
+    `gitea_mirror_backup.py --restore PATTERN --at TIME`
+
+    - **pattern**: 仓库模式（owner、owner/repo，支持通配符）
+    - **at**: 时间点（now、20250126-120000、2025-01-26，默认 now）
+    """
+    try:
+        return backup_service.get_restore_plan(
+            pattern, at, settings.GITEA_REPOS_ROOT
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("/latest", response_model=List[RestoreResult], summary="最近一次恢复结果")
+async def get_latest_restore(
+    current_user: User = Depends(get_current_user),
+    backup_service: BackupService = Depends(get_backup_service),
+):
+    """
+    获取最近一次批量恢复中每个仓库的结果
+    """
+    return backup_service.get_latest_restore()
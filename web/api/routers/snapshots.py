@@ -2,14 +2,22 @@
 快照管理路由
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import Response, StreamingResponse
 from typing import List, Optional
 
-from ..schemas import SnapshotInfo, MessageResponse
+from ..schemas import (
+    SnapshotInfo,
+    SnapshotRefs,
+    SnapshotTree,
+    OidMatch,
+    MessageResponse,
+)
 from ...utils.auth import get_current_user, get_current_admin_user
 from ..models import User
 from ..config import settings
 from ...services.backup_service import BackupService
+from src.snapshot_export import parse_range
 
 router = APIRouter(prefix="/snapshots", tags=["快照管理"])
 
@@ -63,6 +71,27 @@ async def count_snapshots(
     return {"count": count}
 
 
+@router.get("/find", response_model=List[OidMatch], summary="查询包含提交的快照")
+async def find_oid(
+    oid: str,
+    deep: bool = False,
+    repository: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    backup_service: BackupService = Depends(get_backup_service),
+):
+    """
+    查询哪些快照还包含某个提交或标签（按时间从新到旧）
+
+    - **oid**: 对象 ID（至少 4 位）或引用名
+    - **deep**: 是否检查可达性（需要完整 ID，较慢）
+    - **repository**: 仓库范围（owner/repo，支持通配符，可选）
+    """
+    try:
+        return backup_service.find_oid(oid, deep, repository)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
 @router.get("/{snapshot_id}", response_model=SnapshotInfo, summary="获取快照详情")
 async def get_snapshot(
     snapshot_id: str,
@@ -85,6 +114,155 @@ async def get_snapshot(
     return snapshot
 
 
+@router.get("/{snapshot_id}/refs", response_model=SnapshotRefs, summary="快照引用列表")
+async def get_snapshot_refs(
+    snapshot_id: str,
+    repository: str,
+    current_user: User = Depends(get_current_user),
+    backup_service: BackupService = Depends(get_backup_service),
+):
+    """
+    列出快照中的分支和标签（直接读取快照的 packed-refs 和 refs/）
+
+    - **snapshot_id**: 快照 ID
+    - **repository**: 仓库全名（格式：owner/repo）
+    """
+    refs = backup_service.get_snapshot_refs(repository, snapshot_id)
+    if refs is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"快照 {snapshot_id} 不存在"
+        )
+    return refs
+
+
+@router.get("/{snapshot_id}/tree", response_model=SnapshotTree, summary="浏览快照目录")
+async def get_snapshot_tree(
+    snapshot_id: str,
+    repository: str,
+    ref: str = "HEAD",
+    path: str = "",
+    current_user: User = Depends(get_current_user),
+    backup_service: BackupService = Depends(get_backup_service),
+):
+    """
+    列出快照中某个引用下的目录（直接读取快照的 pack 文件，不复制快照）
+
+    - **snapshot_id**: 快照 ID
+    - **repository**: 仓库全名（格式：owner/repo）
+    - **ref**: 引用、分支名、标签名或提交 ID（默认 HEAD）
+    - **path**: 目录路径（默认根目录）
+    """
+    try:
+        tree = backup_service.get_snapshot_tree(repository, snapshot_id, ref, path)
+    except KeyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"不存在: {e.args[0]}"
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if tree is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"快照 {snapshot_id} 不存在"
+        )
+    return tree
+
+
+@router.get("/{snapshot_id}/blob", summary="读取快照中的文件")
+async def get_snapshot_blob(
+    snapshot_id: str,
+    repository: str,
+    path: str,
+    ref: str = "HEAD",
+    current_user: User = Depends(get_current_user),
+    backup_service: BackupService = Depends(get_backup_service),
+):
+    """
+    读取快照中某个引用下的文件内容（原始字节）
+
+    - **snapshot_id**: 快照 ID
+    - **repository**: 仓库全名（格式：owner/repo）
+    - **path**: 文件路径
+    - **ref**: 引用、分支名、标签名或提交 ID（默认 HEAD）
+    """
+    try:
+        content = backup_service.get_snapshot_blob(repository, snapshot_id, ref, path)
+    except KeyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"不存在: {e.args[0]}"
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if content is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"快照 {snapshot_id} 不存在"
+        )
+    return Response(content=content, media_type="application/octet-stream")
+
+
+@router.get("/{snapshot_id}/download", summary="下载快照")
+async def download_snapshot(
+    snapshot_id: str,
+    repository: str,
+    request: Request,
+    format: str = "tar",
+    current_user: User = Depends(get_current_user),
+    backup_service: BackupService = Depends(get_backup_service),
+):
+    """
+    流式下载快照（直接读取快照目录，不生成临时文件）
+
+    - **snapshot_id**: 快照 ID
+    - **repository**: 仓库全名（格式：owner/repo）
+    - **format**: tar（支持 Range 断点续传）或 bundle（由 git 实时生成）
+    """
+    if format not in ("tar", "bundle"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"不支持的格式: {format}"
+        )
+    filename = f"{repository.replace('/', '-')}-{snapshot_id}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+    if format == "bundle":
+        stream = backup_service.get_snapshot_bundle(repository, snapshot_id)
+        if stream is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"快照 {snapshot_id} 不存在",
+            )
+        headers["Accept-Ranges"] = "none"
+        return StreamingResponse(
+            stream, media_type="application/x-git-bundle", headers=headers
+        )
+
+    layout = backup_service.get_snapshot_tar(repository, snapshot_id)
+    if layout is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"快照 {snapshot_id} 不存在"
+        )
+    try:
+        byte_range = parse_range(request.headers.get("range"), layout.size)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail=str(e),
+            headers={"Content-Range": f"bytes */{layout.size}"},
+        )
+
+    start, end = byte_range or (0, layout.size)
+    headers["Accept-Ranges"] = "bytes"
+    headers["Content-Length"] = str(end - start)
+    status_code = status.HTTP_200_OK
+    if byte_range:
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{layout.size}"
+    return StreamingResponse(
+        layout.iter_bytes(start, end),
+        status_code=status_code,
+        media_type="application/x-tar",
+        headers=headers,
+    )
+
+
 @router.delete("/{snapshot_id}", response_model=MessageResponse, summary="删除快照")
 async def delete_snapshot(
     snapshot_id: str,
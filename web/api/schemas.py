@@ -192,6 +192,7 @@ class RepositoryInfo(BaseModel):
     last_backup_time: Optional[datetime] = None
     snapshot_count: int
     protected_snapshots: int = 0
+    archive_count: int = 0
     commit_count: int = 0
     disk_usage: int  # 字节
     status: str  # success, warning
@@ -204,6 +205,59 @@ class RepositoryDetail(RepositoryInfo):
     recent_logs: list[str]
 
 
+class RepositoryHistoryPoint(BaseModel):
+    """仓库跟踪历史记录"""
+
+    time: datetime
+    commit_count: int
+    disk_usage: int  # 字节
+    ref_count: int
+    ref_fingerprint: str
+
+
+class ArchiveInfo(BaseModel):
+    """月度归档（来自归档目录）"""
+
+    file: str
+    month: str
+    time: datetime  # 归档内容的时间点
+    created: Optional[datetime] = None
+    source: Optional[str] = None  # snapshot, container, catalog-sync
+    snapshot: Optional[str] = None
+    kind: str  # full, incremental
+    base: Optional[str] = None
+    size: int  # 字节
+    raw_size: Optional[int] = None
+    ratio: Optional[float] = None
+    mb_per_second: Optional[float] = None
+    compression: str = "none"
+    encrypted: bool = False
+    checksum: Optional[str] = None
+    ref_count: int = 0
+    tips: list[str] = []
+    refs: Optional[dict[str, str]] = None
+
+
+class RefDiffChange(BaseModel):
+    """单个引用的变化"""
+
+    ref: str
+    kind: str  # created, deleted, fast_forward, rewound
+    old: Optional[str] = None
+    new: Optional[str] = None
+    lost_commits: Optional[int] = None
+
+
+class RefDiff(BaseModel):
+    """两个快照（或快照与在线仓库）的引用对比"""
+
+    base: str
+    target: str
+    summary: dict[str, int]
+    lost_commits: Optional[int] = None
+    changes: list[RefDiffChange]
+
+
 # ============ 快照相关 ============
 
 
@@ -216,6 +270,79 @@ class SnapshotInfo(BaseModel):
     size: int  # 字节
     is_protected: bool = False
     status: str
+    tier: str = "hot"  # hot（目录树）、cold（bundle）或 packed（小仓库打包）
+
+
+class SnapshotRef(BaseModel):
+    """快照中的引用"""
+
+    name: str
+    sha: str
+
+
+class SnapshotRefs(BaseModel):
+    """快照引用列表"""
+
+    head: Optional[str] = None
+    refs: list[SnapshotRef]
+
+
+class SnapshotTreeEntry(BaseModel):
+    """目录中的一项"""
+
+    name: str
+    mode: str
+    type: str  # tree, blob, commit（子模块）
+    sha: str
+
+
+class SnapshotTree(BaseModel):
+    """快照中的目录"""
+
+    commit: str
+    path: str
+    entries: list[SnapshotTreeEntry]
+
+
+class OidMatch(BaseModel):
+    """包含某个提交/标签的快照"""
+
+    repository: str
+    snapshot: str
+    time: str
+    ref: Optional[str] = None  # 快速查询：指向该对象的引用
+    oid: Optional[str] = None
+    refs: list[str] = []  # 深度查询：能到达该提交的引用
+
+
+# ============ 恢复相关 ============
+
+
+class RestorePlanItem(BaseModel):
+    """单个仓库的恢复计划"""
+
+    repository: str
+    kind: Optional[str] = None  # snapshot, archive
+    source: Optional[str] = None
+    source_time: Optional[datetime] = None
+    dest: str
+
+
+class RestoreResult(BaseModel):
+    """单个仓库的恢复结果"""
+
+    run_id: str
+    time: datetime
+    repository: str
+    kind: Optional[str] = None
+    source: Optional[str] = None
+    source_time: Optional[datetime] = None
+    dest: str
+    mode: str
+    previous: Optional[str] = None
+    stage_seconds: float
+    ok: bool
+    error: str
 
 
 # ============ 报告相关 ============
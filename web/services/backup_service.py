@@ -3,10 +3,31 @@
 """
 
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterator, Optional
 from datetime import datetime
+from functools import lru_cache
 import subprocess
 
+from src.archive_catalog import read_catalog
+from src.gitobjects import ObjectStore, PackCache
+from src.ref_diff import compare_snapshots
+from src.ref_index import RefIndex
+from src.small_repos import open_pack
+from src.restore import load_latest_restore, parse_point_in_time, plan_restore
+from src.snapshot_export import TarLayout, iter_bundle
+from src.tiering import read_snapshot_meta, snapshot_tier
+from src.tracking import TrackingHistory, load_latest_state
+from src.trash import TrashQueue
+
+# 打开的 pack 在所有请求之间共享（快照不可变，索引只需解析一次）
+_pack_cache = PackCache()
+
+
+@lru_cache(maxsize=256)
+def _compare_snapshot_pair(base: str, target: str) -> Dict:
+    """两个快照的引用对比（快照不可变，结果可以一直缓存）"""
+    return compare_snapshots(Path(base), Path(target))
+
 
 class BackupService:
     """备份服务类 - 适配实际的备份目录结构"""
@@ -22,8 +43,7 @@ class BackupService:
                   ├── snapshots/
                   │   └── 20250126-120000/
                   ├── archives/
-                  ├── .commit_tracking
-                  ├── .size_tracking
+                  ├── .tracking_history
                   └── restore.sh
         """
         self.backup_base_path = Path(backup_base_path)
@@ -47,13 +67,17 @@ class BackupService:
             if not owner_dir.is_dir() or owner_dir.name.startswith('.'):
                 continue
 
+            # 小仓库打包的快照没有 snapshots 目录
+            packed = set(open_pack(owner_dir).repositories())
+
             # 遍历组织下的所有仓库目录
             for repo_dir in owner_dir.iterdir():
-                if not repo_dir.is_dir():
+                if not repo_dir.is_dir() or repo_dir.name.startswith('.'):
                     continue
 
                 # 检查是否有 snapshots 目录（标识这是一个备份仓库）
-                if (repo_dir / "snapshots").exists():
+                full_name = f"{owner_dir.name}/{repo_dir.name}"
+                if (repo_dir / "snapshots").exists() or full_name in packed:
                     repo_info = self._get_repo_info(owner_dir.name, repo_dir)
                     repos.append(repo_info)
 
@@ -66,25 +90,13 @@ class BackupService:
         repo_name = repo_dir.name
         full_name = f"{owner}/{repo_name}"
 
-        # 读取提交数跟踪文件
+        # 读取最近一次跟踪记录（只读历史文件末尾的一条定长记录）
         commit_count = 0
-        commit_tracking_file = repo_dir / ".commit_tracking"
-        if commit_tracking_file.exists():
-            try:
-                commit_count = int(commit_tracking_file.read_text().strip())
-            except Exception:
-                pass
-
-        # 读取大小跟踪文件
         repo_size = 0
-        size_tracking_file = repo_dir / ".size_tracking"
-        if size_tracking_file.exists():
-            try:
-                repo_size = (
-                    int(size_tracking_file.read_text().strip()) * 1024
-                )  # KB -> Bytes
-            except Exception:
-                pass
+        state = load_latest_state(repo_dir)
+        if state:
+            commit_count = state.commits
+            repo_size = state.size_kb * 1024  # KB -> Bytes
 
         # 统计快照数量和获取最新快照时间
         snapshot_count = 0
@@ -106,6 +118,17 @@ class BackupService:
                     latest_snapshot.stat().st_mtime
                 )
 
+        # 小仓库打包的快照
+        packed = open_pack(repo_dir.parent).snapshots(full_name)
+        if packed:
+            snapshot_count += len(packed)
+            protected_count += len([s for s in packed if s.protected])
+            if last_backup_time is None or packed[-1].time > last_backup_time:
+                last_backup_time = packed[-1].time
+
+        # 归档数量取自归档目录，不扫描归档文件
+        archive_count = len(read_catalog(repo_dir / "archives"))
+
         # 检查是否有异常告警
         has_alert = (repo_dir / ".alerts").exists()
 
@@ -117,11 +140,42 @@ class BackupService:
             "last_backup_time": last_backup_time,
             "snapshot_count": snapshot_count,
             "protected_snapshots": protected_count,
+            "archive_count": archive_count,
             "commit_count": commit_count,
             "disk_usage": repo_size,
             "status": "warning" if has_alert else "success",
         }
 
+    def get_repository_history(
+        self, repository: str, since: Optional[datetime] = None
+    ) -> List[Dict]:
+        """
+        获取仓库的跟踪历史（按时间窗口）
+
+        Args:
+            repository: 仓库全名 "owner/repo"
+            since: 起始时间（可选）
+
+        Returns:
+            跟踪记录列表
+        """
+        parts = repository.split('/')
+        if len(parts) != 2:
+            return []
+
+        history = TrackingHistory(self.backup_base_path / parts[0] / parts[1])
+        records = history.window(since=int(since.timestamp()) if since else None)
+        return [
+            {
+                "time": record.time,
+                "commit_count": record.commits,
+                "disk_usage": record.size_kb * 1024,
+                "ref_count": record.ref_count,
+                "ref_fingerprint": record.ref_fingerprint.hex(),
+            }
+            for record in records
+        ]
+
     def get_snapshots(
         self,
         repository: Optional[str] = None,
@@ -166,7 +220,7 @@ class BackupService:
                     continue
 
                 for repo_dir in owner_dir.iterdir():
-                    if not repo_dir.is_dir():
+                    if not repo_dir.is_dir() or repo_dir.name.startswith('.'):
                         continue
 
                     snapshot_basics.extend(
@@ -186,7 +240,9 @@ class BackupService:
         # 第四步：如果需要大小信息，只计算当前页的
         if include_size:
             for i, snapshot in enumerate(page_snapshots):
-                snapshot['size'] = self._calculate_snapshot_size(snapshot['_path'])
+                # 打包的快照没有目录，大小已知
+                if snapshot['_path'] is not None:
+                    snapshot['size'] = self._calculate_snapshot_size(snapshot['_path'])
                 del snapshot['_path']  # 删除内部使用的路径字段
         else:
             # 不计算大小，设为 0
@@ -200,14 +256,17 @@ class BackupService:
         self, owner: str, repo_name: str, repo_dir: Path
     ) -> List[Dict]:
         """获取单个仓库的所有快照"""
-        snapshots = []
+        snapshots = self._get_packed_snapshots(owner, repo_name, repo_dir)
+        for snapshot in snapshots:
+            del snapshot['_path']
         snapshots_dir = repo_dir / "snapshots"
 
         if not snapshots_dir.exists():
             return snapshots
 
         for snapshot_dir in snapshots_dir.iterdir():
-            if not snapshot_dir.is_dir():
+            # 以 . 开头的是分层过程中的临时目录
+            if not snapshot_dir.is_dir() or snapshot_dir.name.startswith('.'):
                 continue
 
             # 读取快照元数据
@@ -228,23 +287,28 @@ class BackupService:
             # 检查是否受保护
             is_protected = (snapshot_dir / ".protected").exists()
 
-            # 使用 du 命令快速获取目录大小（比 Python 递归快得多）
-            size = 0
-            try:
-                result = subprocess.run(
-                    ['du', '-sb', str(snapshot_dir)],
-                    capture_output=True,
-                    text=True,
-                    timeout=5,
-                )
-                if result.returncode == 0:
-                    size = int(result.stdout.split()[0])
-            except Exception:
-                # 如果 du 命令失败，使用目录的 stat 大小作为估算（不准确但很快）
+            tier = snapshot_tier(snapshot_dir) or 'hot'
+            if tier == 'cold':
+                # 冷层快照的大小即 bundle 大小（bundle 可能不在存根目录内）
+                size = self._calculate_snapshot_size(snapshot_dir)
+            else:
+                # 使用 du 命令快速获取目录大小（比 Python 递归快得多）
+                size = 0
                 try:
-                    size = snapshot_dir.stat().st_size
+                    result = subprocess.run(
+                        ['du', '-sb', str(snapshot_dir)],
+                        capture_output=True,
+                        text=True,
+                        timeout=5,
+                    )
+                    if result.returncode == 0:
+                        size = int(result.stdout.split()[0])
                 except Exception:
-                    size = 0
+                    # 如果 du 命令失败，使用目录的 stat 大小作为估算（不准确但很快）
+                    try:
+                        size = snapshot_dir.stat().st_size
+                    except Exception:
+                        size = 0
 
             snapshot_info = {
                 "id": snapshot_dir.name,
@@ -253,6 +317,7 @@ class BackupService:
                 "size": size,
                 "is_protected": is_protected,
                 "status": "protected" if is_protected else "success",
+                "tier": tier,
             }
             snapshots.append(snapshot_info)
 
@@ -262,14 +327,15 @@ class BackupService:
         self, owner: str, repo_name: str, repo_dir: Path
     ) -> List[Dict]:
         """快速获取单个仓库的所有快照基本信息（不计算大小）"""
-        snapshots = []
+        snapshots = self._get_packed_snapshots(owner, repo_name, repo_dir)
         snapshots_dir = repo_dir / "snapshots"
 
         if not snapshots_dir.exists():
             return snapshots
 
         for snapshot_dir in snapshots_dir.iterdir():
-            if not snapshot_dir.is_dir():
+            # 以 . 开头的是分层过程中的临时目录
+            if not snapshot_dir.is_dir() or snapshot_dir.name.startswith('.'):
                 continue
 
             # 只读取最基本的信息
@@ -297,16 +363,41 @@ class BackupService:
                 "created_at": created_at,
                 "is_protected": is_protected,
                 "status": "protected" if is_protected else "success",
+                "tier": snapshot_tier(snapshot_dir) or 'hot',
                 "_path": snapshot_dir,  # 保存路径用于后续计算大小
             }
             snapshots.append(snapshot_info)
 
         return snapshots
 
+    def _get_packed_snapshots(
+        self, owner: str, repo_name: str, repo_dir: Path
+    ) -> List[Dict]:
+        """小仓库打包文件中的快照（大小取自索引，不需要再计算）"""
+        return [
+            {
+                "id": snapshot.name,
+                "repository": snapshot.repository,
+                "created_at": snapshot.time,
+                "size": snapshot.size,
+                "is_protected": bool(snapshot.protected),
+                "status": "protected" if snapshot.protected else "success",
+                "tier": "packed",
+                "_path": None,
+            }
+            for snapshot in open_pack(repo_dir.parent).snapshots(
+                f"{owner}/{repo_name}"
+            )
+        ]
+
     def _calculate_snapshot_size(self, snapshot_path: Path) -> int:
         """计算单个快照的大小"""
         import platform
 
+        meta = read_snapshot_meta(snapshot_path)
+        if meta.get('tier') == 'cold' and meta.get('cold_size', '').isdigit():
+            return int(meta['cold_size'])
+
         # 在 Unix/Linux 系统上使用 du 命令（更快）
         if platform.system() != 'Windows':
             try:
@@ -358,13 +449,15 @@ class BackupService:
                     snapshots_dir = repo_dir / "snapshots"
                     if snapshots_dir.exists():
                         count = len([s for s in snapshots_dir.iterdir() if s.is_dir()])
+                    count += len(open_pack(repo_dir.parent).snapshots(repository))
         else:
             for owner_dir in self.backup_base_path.iterdir():
                 if not owner_dir.is_dir() or owner_dir.name.startswith('.'):
                     continue
 
+                count += len(open_pack(owner_dir).snapshots())
                 for repo_dir in owner_dir.iterdir():
-                    if not repo_dir.is_dir():
+                    if not repo_dir.is_dir() or repo_dir.name.startswith('.'):
                         continue
 
                     snapshots_dir = repo_dir / "snapshots"
@@ -419,6 +512,279 @@ class BackupService:
 
         return report_path.read_text(encoding="utf-8")
 
+    def _snapshot_path(
+        self, repository: str, snapshot_id: str, allow_cold: bool = False
+    ) -> Optional[Path]:
+        """
+        快照目录，仓库或快照不存在时返回 None
+
+        冷层快照只有存根（没有对象），仅在 allow_cold 时返回
+        """
+        parts = repository.split('/')
+        if len(parts) != 2 or any(p in ('', '.', '..') for p in parts):
+            return None
+        if '/' in snapshot_id or snapshot_id in ('', '.', '..'):
+            return None
+
+        snapshot_path = (
+            self.backup_base_path / parts[0] / parts[1] / "snapshots" / snapshot_id
+        )
+        tier = snapshot_tier(snapshot_path)
+        if tier != 'hot' and not (allow_cold and tier == 'cold'):
+            return None
+        return snapshot_path
+
+    def _snapshot_store(
+        self, repository: str, snapshot_id: str
+    ) -> Optional[ObjectStore]:
+        """打开快照的对象读取器，仓库或快照不存在时返回 None"""
+        snapshot_path = self._snapshot_path(repository, snapshot_id)
+        if snapshot_path is None:
+            return None
+        return ObjectStore(snapshot_path, _pack_cache)
+
+    def get_snapshot_tar(
+        self, repository: str, snapshot_id: str
+    ) -> Optional[TarLayout]:
+        """
+        快照的 tar 包布局（用于流式下载，支持按字节区间输出）
+
+        Returns:
+            TarLayout，快照不存在时为 None
+        """
+        snapshot_path = self._snapshot_path(repository, snapshot_id)
+        if snapshot_path is None:
+            return None
+        return TarLayout(snapshot_path, f"{repository.split('/')[1]}.git")
+
+    def get_snapshot_bundle(
+        self, repository: str, snapshot_id: str
+    ) -> Optional[Iterator[bytes]]:
+        """
+        直接从快照生成 git bundle 的数据流
+
+        Returns:
+            bundle 数据块迭代器，快照不存在时为 None
+        """
+        snapshot_path = self._snapshot_path(repository, snapshot_id, allow_cold=True)
+        if snapshot_path is not None:
+            return iter_bundle(snapshot_path)
+
+        # 小仓库的快照在 owner 的打包文件中
+        packed = self._packed_snapshot(repository, snapshot_id)
+        if packed is None or packed[1].size == 0:
+            return None
+        pack, snapshot = packed
+        return pack.iter_bundle(snapshot)
+
+    def _packed_snapshot(self, repository: str, snapshot_id: str):
+        """打包文件中的快照，返回 (pack, 快照)，不存在时为 None"""
+        parts = repository.split('/')
+        if len(parts) != 2 or parts[0] in ('', '.', '..'):
+            return None
+        owner_dir = self.backup_base_path / parts[0]
+        if not owner_dir.is_dir():
+            return None
+        pack = open_pack(owner_dir)
+        snapshot = pack.find(repository, snapshot_id)
+        return (pack, snapshot) if snapshot else None
+
+    def get_snapshot_refs(self, repository: str, snapshot_id: str) -> Optional[Dict]:
+        """
+        获取快照中的引用列表
+
+        Returns:
+            {"head": HEAD 指向的引用, "refs": [{"name", "sha"}]}，快照不存在时为 None
+        """
+        store = self._snapshot_store(repository, snapshot_id)
+        if store is None:
+            return None
+        refs = store.refs()
+        return {
+            "head": store.head(),
+            "refs": [{"name": name, "sha": refs[name]} for name in sorted(refs)],
+        }
+
+    def get_snapshot_tree(
+        self, repository: str, snapshot_id: str, ref: str = "HEAD", path: str = ""
+    ) -> Optional[Dict]:
+        """
+        列出快照中某个提交下的目录
+
+        Raises:
+            KeyError: 引用或路径不存在
+            ValueError: 路径不是目录
+
+        Returns:
+            {"commit", "path", "entries": [{"name", "mode", "type", "sha"}]}
+        """
+        store = self._snapshot_store(repository, snapshot_id)
+        if store is None:
+            return None
+        commit = store.resolve(ref)
+        entry = store.lookup(commit, path)
+        if entry.type != 'tree':
+            raise ValueError(f"不是目录: {path}")
+        # 目录在前，文件在后
+        entries = sorted(
+            store.tree(entry.sha), key=lambda e: (e.type != 'tree', e.name)
+        )
+        return {
+            "commit": commit,
+            "path": path.strip('/'),
+            "entries": [
+                {"name": e.name, "mode": e.mode, "type": e.type, "sha": e.sha}
+                for e in entries
+            ],
+        }
+
+    def get_snapshot_blob(
+        self, repository: str, snapshot_id: str, ref: str, path: str
+    ) -> Optional[bytes]:
+        """
+        读取快照中某个提交下的文件内容
+
+        Raises:
+            KeyError: 引用或路径不存在
+            ValueError: 路径不是文件
+        """
+        store = self._snapshot_store(repository, snapshot_id)
+        if store is None:
+            return None
+        entry = store.lookup(store.resolve(ref), path)
+        if entry.type != 'blob':
+            raise ValueError(f"不是文件: {path}")
+        return store.read(entry.sha)[1]
+
+    def find_oid(
+        self, query: str, deep: bool = False, repository: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        查询哪些快照还包含某个提交或标签（读取备份端维护的 .ref_index.db）
+
+        Raises:
+            ValueError: 深度查询的对象 ID 不完整
+        """
+        index = RefIndex(self.backup_base_path, read_only=True)
+        if not index.index_path.exists():
+            return []
+        if deep:
+            return index.find_reachable(query, repository)
+        return index.find(query, repository)
+
+    def get_ref_diff(
+        self,
+        repository: str,
+        base: Optional[str] = None,
+        target: str = "live",
+        repos_root: Optional[str] = None,
+    ) -> Optional[Dict]:
+        """
+        比较两个快照（或快照与在线仓库）的引用
+
+        Args:
+            repository: 仓库全名 "owner/repo"
+            base: 基准快照 ID（默认为 target 之前的最近快照）
+            target: 目标快照 ID，或 live 表示在线仓库
+            repos_root: Gitea 仓库目录（target 为 live 时需要）
+
+        Returns:
+            对比结果，快照或仓库不存在时为 None
+        """
+        parts = repository.split('/')
+        if len(parts) != 2 or any(p in ('', '.', '..') for p in parts):
+            return None
+        for snapshot_id in (base, None if target == "live" else target):
+            if snapshot_id is None:
+                continue
+            if '/' in snapshot_id or snapshot_id in ('', '.', '..'):
+                return None
+
+        snapshots_dir = self.backup_base_path / parts[0] / parts[1] / "snapshots"
+        if not snapshots_dir.exists():
+            return None
+        snapshot_ids = sorted(
+            s.name for s in snapshots_dir.iterdir() if (s / "objects").is_dir()
+        )
+
+        if target == "live":
+            if not repos_root:
+                return None
+            target_path = Path(repos_root) / parts[0] / f"{parts[1]}.git"
+        else:
+            target_path = snapshots_dir / target
+            snapshot_ids = [s for s in snapshot_ids if s < target]
+        if not base:
+            if not snapshot_ids:
+                return None
+            base = snapshot_ids[-1]
+        base_path = snapshots_dir / base
+
+        if not all((p / "objects").is_dir() for p in (base_path, target_path)):
+            return None
+        if target == "live":
+            return compare_snapshots(base_path, target_path, target_is_live=True)
+        return _compare_snapshot_pair(str(base_path), str(target_path))
+
+    def get_archives(
+        self, repository: str, include_refs: bool = False
+    ) -> Optional[List[Dict]]:
+        """
+        获取仓库的月度归档列表（只读取归档目录，不打开归档文件）
+
+        Args:
+            repository: 仓库全名 owner/repo
+            include_refs: 是否包含完整引用表（引用多的仓库可能很大）
+
+        Returns:
+            归档记录列表（从新到旧），仓库不存在时为 None
+        """
+        parts = repository.split('/')
+        if len(parts) != 2 or any(p in ('', '.', '..') for p in parts):
+            return None
+        repo_dir = self.backup_base_path / parts[0] / parts[1]
+        if not repo_dir.is_dir():
+            return None
+
+        archives = []
+        for record in reversed(read_catalog(repo_dir / "archives")):
+            record = dict(record)
+            if not include_refs:
+                record["refs"] = None
+            archives.append(record)
+        return archives
+
+    def get_restore_plan(self, pattern: str, at: str, repos_root: str) -> List[Dict]:
+        """
+        生成批量恢复计划（只读，执行恢复需要在宿主机上运行
+        gitea_mirror_backup.py --restore）
+
+        Args:
+            pattern: 仓库模式（owner、owner/repo，支持通配符）
+            at: 时间点（now、20250126-120000、2025-01-26）
+            repos_root: Gitea 仓库目录
+
+        Returns:
+            每个仓库的恢复来源
+        """
+        plan = plan_restore(
+            self.backup_base_path, Path(repos_root), pattern, parse_point_in_time(at)
+        )
+        return [
+            {
+                "repository": item.repository,
+                "kind": item.kind or None,
+                "source": item.source.name if item.source else None,
+                "source_time": item.source_time,
+                "dest": str(item.dest),
+            }
+            for item in plan
+        ]
+
+    def get_latest_restore(self) -> List[Dict]:
+        """获取最近一次批量恢复的结果"""
+        return load_latest_restore(self.backup_base_path)
+
     def trigger_backup(self, repository: Optional[str] = None) -> Dict:
         """
         触发备份任务
@@ -457,17 +823,26 @@ class BackupService:
             self.backup_base_path / owner / repo_name / "snapshots" / snapshot_id
         )
 
-        if not snapshot_path.exists() or not snapshot_path.is_dir():
-            return False
+        if not snapshot_path.is_dir():
+            # 小仓库的快照只需在打包文件的索引中标记删除
+            packed = self._packed_snapshot(repository, snapshot_id)
+            if packed is None or packed[1].protected:
+                return False
+            try:
+                packed[0].remove(repository, [snapshot_id])
+                return True
+            except Exception:
+                return False
 
         # 检查是否受保护
         if (snapshot_path / ".protected").exists():
             return False  # 不允许删除受保护的快照
 
         try:
-            import shutil
-
-            shutil.rmtree(snapshot_path)
+            # 移入回收站后立即返回，由下次备份运行的后台任务完成删除
+            TrashQueue(str(self.backup_base_path)).move(
+                snapshot_path, f"{owner}-{repo_name}"
+            )
             return True
         except Exception:
             return False